@@ -1,185 +1,1073 @@
+import io
+import os
+import sys
 import time
-import resource
-import re
+from collections import namedtuple
 
-class Compiler:
-    def __init__(self):
-        self.output = ""
+# Make the shared compilers package importable when run as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-    def tokenize(self, source_code):
-        # List of C keywords
-        keywords = {'auto', 'break', 'case', 'char', 'const', 'continue', 'default', 'do', 'double', 'else',
-                    'enum', 'extern', 'float', 'for', 'goto', 'if', 'int', 'long', 'register', 'return',
-                    'short', 'signed', 'sizeof', 'static', 'struct', 'switch', 'typedef', 'union', 'unsigned',
-                    'void', 'volatile', 'while'}
+from compilers import diagnostics, ir, lalr, lexgen, measure, preprocess, stream, tokens, trace
 
-        # List of C operators
-        operators = {'+', '-', '*', '/', '=', '==', '!=', '<', '>', '<=', '>=', '&&', '||', '!', '&', '|', '^',
-                    '~', '<<', '>>', '+=', '-=', '*=', '/=', '%=', '&=', '|=', '^=', '<<=', '>>=', ',', ';', ':',
-                    '(', ')', '[', ']', '{', '}', '.', '->', '++', '--', '?', '::', '...'}
+# List of C keywords
+KEYWORDS = {'auto', 'break', 'case', 'char', 'const', 'continue', 'default', 'do', 'double', 'else',
+            'enum', 'extern', 'float', 'for', 'goto', 'if', 'int', 'long', 'register', 'return',
+            'short', 'signed', 'sizeof', 'static', 'struct', 'switch', 'typedef', 'union', 'unsigned',
+            'void', 'volatile', 'while'}
 
-        # Split source code by whitespace
-        tokens = source_code.split()
+# List of C operators
+OPERATORS = ['+', '-', '*', '/', '%', '=', '==', '!=', '<', '>', '<=', '>=', '&&', '||', '!', '&', '|', '^',
+             '~', '<<', '>>', '+=', '-=', '*=', '/=', '%=', '&=', '|=', '^=', '<<=', '>>=', ',', ';', ':',
+             '(', ')', '[', ']', '{', '}', '.', '->', '++', '--', '?', '::', '...']
 
-        # List to store tokenized output
-        tokenized_output = []
+LEXER_SPEC = lexgen.LexerSpec('c', [
+    ('WHITESPACE', r'\s+'),
+    ('COMMENT', r'//[^\n]*'),
+    ('COMMENT', r'/\*([^*]|\*+[^*/])*\*+/'),
+    # Preprocessor directives, with backslash continuations; they are handled
+    # by compilers/preprocess.py before parsing
+    ('DIRECTIVE', r'#([^\\\n]|\\.|\\\r?\n)*'),
+    ('LITERAL', r'([0-9]+\.?[0-9]*|\.[0-9]+)([eE][+-]?[0-9]+)?[uUlLfF]*'),
+    ('LITERAL', r'0[xX][0-9a-fA-F]+[uUlL]*'),
+    ('LITERAL', r"'([^'\\\n]|\\.)*'"),
+    ('STRING_LITERAL', r'"([^"\\\n]|\\.)*"'),
+    ('IDENTIFIER', r'[A-Za-z_][A-Za-z0-9_]*'),
+] + [('OPERATOR', lexgen.literal(operator)) for operator in OPERATORS],
+    keywords={keyword: 'KEYWORD' for keyword in KEYWORDS},
+    skip={'WHITESPACE', 'COMMENT', 'DIRECTIVE'},
+    error='UNKNOWN',
+    literals={'LITERAL', 'STRING_LITERAL'})
 
-        for token in tokens:
-            # Check if the token is a keyword
-            if token in keywords:
-                tokenized_output.append(('KEYWORD', token))
-            # Check if the token is an operator
-            elif token in operators:
-                tokenized_output.append(('OPERATOR', token))
-            # Check if the token is a numeric literal
-            elif token.isdigit():
-                tokenized_output.append(('LITERAL', token))
-            # Check if the token is a string literal
-            elif token.startswith('"') and token.endswith('"'):
-                tokenized_output.append(('STRING_LITERAL', token))
-            # Check if the token is an identifier
-            elif token.isidentifier():
-                tokenized_output.append(('IDENTIFIER', token))
-            # Otherwise, treat it as an unknown token
+lexer = lexgen.build_lexer(LEXER_SPEC)
+
+OPENING_BRACKETS = {'(', '[', '{'}
+CLOSING_BRACKETS = {')': '(', ']': '[', '}': '{'}
+
+
+# Syntactic analysis
+#
+# An LALR(1) parser (see compilers/lalr.py) for a C99 subset: declarations,
+# function definitions, statements and the full expression grammar, without
+# K&R definitions and the GNU extensions. C needs to know which identifiers
+# name types, so every IDENTIFIER is classified as it is read: it is a
+# TYPE_NAME if a typedef declared it, if it is a standard type, or if another
+# identifier follows it, as in "uint8_t value" when the header declaring it
+# was not found. typedef names are registered as their declarators are
+# reduced, which is before the token after the declaration is read.
+#
+# The AST has FUNCTION_DECLARATION, DECLARATION, LOOP, IF, RETURN_STATEMENT
+# and STATEMENT nodes whose code is the list of their token values. The
+# statements of nested blocks are flattened into the enclosing body, a
+# switch is one STATEMENT and a label is a STATEMENT of its own.
+
+# Identifiers that C99 reads as keywords
+IDENTIFIER_KEYWORDS = {'inline', 'restrict'}
+
+GRAMMAR = lalr.Grammar('c', [
+    ('translation_unit', '', 'empty_list'),
+    ('translation_unit', 'translation_unit external_declaration', 'extend'),
+    ('external_declaration', 'function_definition', 'first'),
+    ('external_declaration', 'declaration', 'top_level_declaration'),
+    ('external_declaration', "';'", 'top_level_declaration'),
+    ('external_declaration', "error ';'", 'empty_list'),
+    ('external_declaration', "error '}'", 'empty_list'),
+    ('function_definition', 'declaration_specifiers declarator compound_statement', 'function_definition'),
+    # Implicit int, as in "main() { ... }"
+    ('function_definition', 'declarator compound_statement', 'implicit_int_function'),
+
+    # Declarations
+    ('declaration', "declaration_specifiers ';'", None),
+    ('declaration', "declaration_specifiers init_declarators ';'", None),
+    ('declaration', "'typedef' declaration_specifiers typedef_declarators ';'", None),
+    ('declaration_specifiers', 'declaration_specifier', None),
+    ('declaration_specifiers', 'declaration_specifiers declaration_specifier', None),
+    ('declaration_specifier', 'type_specifier', None),
+    ('declaration_specifier', 'type_qualifier', None),
+] + [('declaration_specifier', f"'{keyword}'", None) for keyword in ('extern', 'static', 'auto', 'register',
+                                                                      'inline')
+] + [('type_specifier', f"'{keyword}'", None) for keyword in ('void', 'char', 'short', 'int', 'long', 'float',
+                                                               'double', 'signed', 'unsigned')
+] + [
+    ('type_specifier', 'TYPE_NAME', None),
+    ('type_specifier', 'struct_specifier', None),
+    ('type_specifier', 'enum_specifier', None),
+    ('type_qualifier', "'const'", None),
+    ('type_qualifier', "'volatile'", None),
+    ('type_qualifier', "'restrict'", None),
+    ('init_declarators', 'init_declarator', None),
+    ('init_declarators', "init_declarators ',' init_declarator", None),
+    ('init_declarator', 'declarator', None),
+    ('init_declarator', "declarator '=' initializer", None),
+    ('typedef_declarators', 'declarator', 'typedef_name'),
+    ('typedef_declarators', "typedef_declarators ',' declarator", 'next_typedef_name'),
+
+    ('struct_specifier', "struct_keyword tag", None),
+    ('struct_specifier', "struct_keyword '{' struct_declarations '}'", None),
+    ('struct_specifier', "struct_keyword tag '{' struct_declarations '}'", None),
+    ('struct_keyword', "'struct'", None),
+    ('struct_keyword', "'union'", None),
+    ('tag', 'IDENTIFIER', None),
+    ('tag', 'TYPE_NAME', None),
+    ('struct_declarations', '', None),
+    ('struct_declarations', 'struct_declarations struct_declaration', None),
+    ('struct_declaration', "declaration_specifiers ';'", None),
+    ('struct_declaration', "declaration_specifiers member_declarators ';'", None),
+    ('struct_declaration', "error ';'", None),
+    ('member_declarators', 'member_declarator', None),
+    ('member_declarators', "member_declarators ',' member_declarator", None),
+    ('member_declarator', 'declarator', None),
+    ('member_declarator', "':' conditional", None),
+    ('member_declarator', "declarator ':' conditional", None),
+    ('enum_specifier', "'enum' tag", None),
+    ('enum_specifier', "'enum' '{' enumerators '}'", None),
+    ('enum_specifier', "'enum' '{' enumerators ',' '}'", None),
+    ('enum_specifier', "'enum' tag '{' enumerators '}'", None),
+    ('enum_specifier', "'enum' tag '{' enumerators ',' '}'", None),
+    ('enumerators', 'enumerator', None),
+    ('enumerators', "enumerators ',' enumerator", None),
+    ('enumerator', 'IDENTIFIER', None),
+    ('enumerator', "IDENTIFIER '=' conditional", None),
+
+    # A declarator's value is (name position, parameters span or None)
+    ('declarator', 'direct_declarator', None),
+    ('declarator', 'pointer direct_declarator', 'second'),
+    ('pointer', "'*'", None),
+    ('pointer', "'*' type_qualifiers", None),
+    ('pointer', "'*' pointer", None),
+    ('pointer', "'*' type_qualifiers pointer", None),
+    ('type_qualifiers', 'type_qualifier', None),
+    ('type_qualifiers', 'type_qualifiers type_qualifier', None),
+    ('direct_declarator', 'IDENTIFIER', 'declarator_name'),
+    ('direct_declarator', "'(' declarator ')'", 'second'),
+    ('direct_declarator', "direct_declarator '[' ']'", None),
+    ('direct_declarator', "direct_declarator '[' assignment ']'", None),
+    ('direct_declarator', "direct_declarator '(' ')'", 'function_declarator'),
+    ('direct_declarator', "direct_declarator '(' parameter_types ')'", 'function_declarator'),
+    ('parameter_types', 'parameters', None),
+    ('parameter_types', "parameters ',' '...'", None),
+    ('parameters', 'parameter', None),
+    ('parameters', "parameters ',' parameter", None),
+    ('parameter', 'declaration_specifiers', None),
+    ('parameter', 'declaration_specifiers declarator', None),
+    ('parameter', 'declaration_specifiers abstract_declarator', None),
+    ('abstract_declarator', 'pointer', None),
+    ('abstract_declarator', 'direct_abstract_declarator', None),
+    ('abstract_declarator', 'pointer direct_abstract_declarator', None),
+    ('direct_abstract_declarator', "'(' abstract_declarator ')'", None),
+    ('direct_abstract_declarator', "'[' ']'", None),
+    ('direct_abstract_declarator', "'[' assignment ']'", None),
+    ('direct_abstract_declarator', "direct_abstract_declarator '[' ']'", None),
+    ('direct_abstract_declarator', "direct_abstract_declarator '[' assignment ']'", None),
+    ('direct_abstract_declarator', "'(' ')'", None),
+    ('direct_abstract_declarator', "'(' parameter_types ')'", None),
+    ('direct_abstract_declarator', "direct_abstract_declarator '(' ')'", None),
+    ('direct_abstract_declarator', "direct_abstract_declarator '(' parameter_types ')'", None),
+    ('type_name', 'declaration_specifiers', None),
+    ('type_name', 'declaration_specifiers abstract_declarator', None),
+
+    ('initializer', 'assignment', None),
+    ('initializer', "'{' '}'", None),
+    ('initializer', "'{' initializers '}'", None),
+    ('initializer', "'{' initializers ',' '}'", None),
+    ('initializers', 'designated_initializer', None),
+    ('initializers', "initializers ',' designated_initializer", None),
+    ('designated_initializer', 'initializer', None),
+    ('designated_initializer', "designators '=' initializer", None),
+    ('designators', 'designator', None),
+    ('designators', 'designators designator', None),
+    ('designator', "'[' conditional ']'", None),
+    ('designator', "'.' member", None),
+
+    # Statements; the value of each is the list of its nodes
+    ('compound_statement', "'{' block_items '}'", 'second'),
+    ('compound_statement', "'{' block_items error '}'", 'second'),
+    ('block_items', '', 'empty_list'),
+    ('block_items', 'block_items block_item', 'extend'),
+    ('block_item', 'declaration', 'statement'),
+    ('block_item', 'statement', None),
+    ('statement', 'compound_statement', None),
+    ('statement', "';'", 'empty_list'),
+    ('statement', "expression ';'", 'statement'),
+    ('statement', "'return' ';'", 'return_statement'),
+    ('statement', "'return' expression ';'", 'return_statement'),
+    ('statement', "'break' ';'", 'statement'),
+    ('statement', "'continue' ';'", 'statement'),
+    ('statement', "'goto' IDENTIFIER ';'", 'statement'),
+    ('statement', "'if' '(' expression ')' statement %prec THEN", 'if_statement'),
+    ('statement', "'if' '(' expression ')' statement 'else' statement", 'if_statement'),
+    ('statement', "'while' '(' expression ')' statement", 'while_statement'),
+    ('statement', "'do' statement 'while' '(' expression ')' ';'", 'do_statement'),
+    ('statement', "'for' '(' for_init optional_expression ';' optional_expression ')' statement",
+     'for_statement'),
+    ('statement', "'switch' '(' expression ')' statement", 'switch_statement'),
+    ('statement', "IDENTIFIER ':' statement", 'labeled_statement'),
+    ('statement', "'case' conditional ':' statement", 'labeled_statement'),
+    ('statement', "'default' ':' statement", 'labeled_statement'),
+    ('statement', "error ';'", 'empty_list'),
+    ('for_init', "';'", None),
+    ('for_init', "expression ';'", None),
+    ('for_init', 'declaration', None),
+    ('optional_expression', '', None),
+    ('optional_expression', 'expression', None),
+
+    # Expressions
+    ('expression', 'assignment', None),
+    ('expression', "expression ',' assignment", None),
+    ('assignment', 'conditional', None),
+] + [('assignment', f"unary '{operator}' assignment", None)
+     for operator in ('=', '*=', '/=', '%=', '+=', '-=', '<<=', '>>=', '&=', '^=', '|=')
+] + [
+    ('conditional', 'binary', None),
+    ('conditional', "binary '?' expression ':' conditional", None),
+    ('binary', 'cast', None),
+] + [('binary', f"binary '{operator}' binary", None)
+     for operator in ('||', '&&', '|', '^', '&', '==', '!=', '<', '>', '<=', '>=', '<<', '>>', '+', '-',
+                      '*', '/', '%')
+] + [
+    ('cast', 'unary', None),
+    ('cast', "'(' type_name ')' cast", None),
+    ('unary', 'postfix', None),
+    ('unary', "'++' unary", None),
+    ('unary', "'--' unary", None),
+    ('unary', "'sizeof' unary", None),
+    ('unary', "'sizeof' '(' type_name ')'", None),
+] + [('unary', f"'{operator}' cast", None) for operator in ('&', '*', '+', '-', '~', '!')
+] + [
+    ('postfix', 'primary', None),
+    ('postfix', "postfix '[' expression ']'", None),
+    ('postfix', "postfix '(' ')'", None),
+    ('postfix', "postfix '(' arguments ')'", None),
+    ('postfix', "postfix '.' member", None),
+    ('postfix', "postfix '->' member", None),
+    ('postfix', "postfix '++'", None),
+    ('postfix', "postfix '--'", None),
+    # Compound literals
+    ('postfix', "'(' type_name ')' '{' initializers '}'", None),
+    ('postfix', "'(' type_name ')' '{' initializers ',' '}'", None),
+    ('arguments', 'assignment', None),
+    ('arguments', "arguments ',' assignment", None),
+    ('member', 'IDENTIFIER', None),
+    ('member', 'TYPE_NAME', None),
+    ('primary', 'IDENTIFIER', None),
+    ('primary', 'LITERAL', None),
+    ('primary', 'strings', None),
+    ('primary', "'(' expression ')'", None),
+    ('strings', 'STRING_LITERAL', None),
+    ('strings', 'strings STRING_LITERAL', None),
+], precedence=[
+    ('left', "'||'"),
+    ('left', "'&&'"),
+    ('left', "'|'"),
+    ('left', "'^'"),
+    ('left', "'&'"),
+    ('left', "'==' '!='"),
+    ('left', "'<' '>' '<=' '>='"),
+    ('left', "'<<' '>>'"),
+    ('left', "'+' '-'"),
+    ('left', "'*' '/' '%'"),
+    # else belongs to the innermost if
+    ('nonassoc', 'THEN'),
+    ('nonassoc', "'else'"),
+])
+
+parser = lalr.build_parser(GRAMMAR)
+
+
+def parameter_names(tokens):
+    # The name of each parameter is the last identifier before its ','
+    parameters = []
+    name = None
+    depth = 0
+    for token_type, value in tokens:
+        if token_type == 'OPERATOR':
+            if value in OPENING_BRACKETS:
+                depth += 1
+            elif value in CLOSING_BRACKETS:
+                depth -= 1
+            elif value == ',' and depth == 0:
+                if name:
+                    parameters.append(name)
+                name = None
+        elif token_type == 'IDENTIFIER' and depth == 0:
+            name = value
+    if name:
+        parameters.append(name)
+    return parameters
+
+
+class Parser(lalr.Actions):
+    # Builds the AST of a token list or TokenStream. A token's value is its
+    # position, so nodes take their code from the spans of their rules.
+    # typedefs is the set of type names, shared by the parsers of one
+    # translation unit when it is parsed a declaration at a time
+    def __init__(self, tokens, errors=None, typedefs=None, locate=None):
+        self.tokens = tokens
+        self.errors = errors if errors is not None else diagnostics.Diagnostics()
+        self.typedefs = typedefs if typedefs is not None else set(STANDARD_TYPES)
+        self.locate = locate if locate is not None else getattr(tokens, 'location', None)
+
+    def terminals(self):
+        # (terminal, position) pairs of the tokens, with identifiers
+        # classified when the parser reads them
+        terminal = parser.terminal
+        identifier = parser.column('IDENTIFIER')
+        type_name = parser.column('TYPE_NAME')
+        keywords = {name: parser.column(f"'{name}'") for name in IDENTIFIER_KEYWORDS}
+        typedefs = self.typedefs
+        tokens = iter(self.tokens)
+        current = next(tokens, None)
+        position = 0
+        while current is not None:
+            following = next(tokens, None)
+            token_type, value = current
+            if token_type == 'IDENTIFIER':
+                if value in keywords:
+                    column = keywords[value]
+                elif value in typedefs or (following is not None and following[0] == 'IDENTIFIER'):
+                    column = type_name
+                else:
+                    column = identifier
             else:
-                tokenized_output.append(('UNKNOWN', token))
+                column = terminal(token_type, value)
+            yield column, position
+            position += 1
+            current = following
 
-        return tokenized_output
+    def parse_translation_unit(self):
+        return parser.parse(self.terminals(), self, self.errors) or []
 
+    def location(self, position):
+        if self.locate is None:
+            return None, None
+        return self.locate(position)
 
-    def parse(self, tokens):
-        # Placeholder for syntactic analysis (parsing)
-        # For simplicity, we'll construct a basic abstract syntax tree (AST)
-        ast = []
+    def text(self, value):
+        return self.tokens[value][1]
 
-        # Check if tokens list is empty
-        if not tokens:
-            print("Error: Empty input tokens list.")
-            return ast
+    def values(self, start, end):
+        return [value for _, value in self.tokens[start:end]]
+
+    # Lists of nodes
+
+    def empty_list(self, start, end, *symbols):
+        return []
+
+    def first(self, start, end, node):
+        return [node]
+
+    def extend(self, start, end, nodes, more):
+        nodes.extend(more)
+        return nodes
+
+    def second(self, start, end, first, second, *rest):
+        return second
+
+    # Declarations
 
-        # Current index in the tokens list
-        current_index = 0
+    def top_level_declaration(self, start, end, *symbols):
+        # Without its ';'
+        return [('DECLARATION', self.values(start, end - 1))]
 
-        # Loop through the tokens
-        while current_index < len(tokens):
-            token = tokens[current_index]
+    def function_definition(self, start, end, specifiers, declarator, body):
+        name, parameters = declarator
+        names = parameter_names(self.tokens[parameters[0]:parameters[1]]) if parameters else []
+        return ('FUNCTION_DECLARATION', self.text(name), names, body, self.values(start, name))
 
-            # If token is a loop (for simplicity, consider only 'for' loops)
-            if token[1] == 'for':
-                # Find the index of '(' and ')'
-                start_index = current_index + 1  # Start from the next token
-                end_index = tokens.index('{', start_index) if '{' in tokens[start_index:] else len(tokens)
+    def implicit_int_function(self, start, end, declarator, body):
+        return self.function_definition(start, end, None, declarator, body)
 
-                # Extract loop condition
-                loop_condition = [str(t[1]) if isinstance(t, tuple) else t for t in tokens[start_index + 1:end_index]]
+    def declarator_name(self, start, end, name):
+        return name, None
 
-                # Find the start of the loop body
-                body_start_index = end_index if '{' in tokens[start_index:] else start_index
+    def function_declarator(self, start, end, declarator, open_paren, *rest):
+        # The innermost parameter list is the function's
+        name, parameters = declarator
+        if parameters is None:
+            parameters = (open_paren + 1, end - 1)
+        return name, parameters
 
-                # Find the end of the loop body
-                body_end_index = tokens.index('}', body_start_index) if '}' in tokens[body_start_index:] else len(tokens)
+    def typedef_name(self, start, end, declarator):
+        self.typedefs.add(self.text(declarator[0]))
 
-                # Extract loop body
-                loop_body = tokens[body_start_index + 1: body_end_index]
+    def next_typedef_name(self, start, end, names, comma, declarator):
+        self.typedefs.add(self.text(declarator[0]))
+
+    # Statements
+
+    def statement(self, start, end, *symbols):
+        # Without its ';'
+        return [('STATEMENT', self.values(start, end - 1))]
+
+    def return_statement(self, start, end, *symbols):
+        return [('RETURN_STATEMENT', self.values(start + 1, end - 1))]
+
+    def if_statement(self, start, end, keyword, open_paren, condition, close_paren, then_body,
+                     else_keyword=None, else_body=None):
+        return [('IF', self.values(start + 2, close_paren), then_body, else_body or [])]
+
+    def while_statement(self, start, end, keyword, open_paren, condition, close_paren, body):
+        return [('LOOP', self.values(start + 2, close_paren), body)]
+
+    def do_statement(self, start, end, keyword, body, while_keyword, open_paren, condition, close_paren,
+                     semicolon):
+        return [('LOOP', self.values(open_paren + 1, close_paren), body)]
+
+    def for_statement(self, start, end, keyword, open_paren, initializer, condition, semicolon, step,
+                      close_paren, body):
+        return [('LOOP', self.values(start + 2, close_paren), body)]
+
+    def switch_statement(self, start, end, *symbols):
+        return [('STATEMENT', self.values(start, end))]
+
+    def labeled_statement(self, start, end, *symbols):
+        # The label up to its ':', then the labeled statement
+        colon = symbols[-2]
+        return [('STATEMENT', self.values(start, colon + 1))] + symbols[-1]
+
+
+def count_nodes(nodes):
+    # Number of AST nodes, nested bodies included
+    total = 0
+    for node in nodes:
+        total += 1
+        if node[0] == 'FUNCTION_DECLARATION':
+            total += count_nodes(node[3])
+        elif node[0] == 'LOOP':
+            total += count_nodes(node[2])
+        elif node[0] == 'IF':
+            total += count_nodes(node[2]) + count_nodes(node[3])
+    return total
+
+
+# Semantic analysis
+#
+# One walk over the AST with a scoped symbol table. Each name maps to a stack
+# of its visible declarations, innermost last, and each scope remembers the
+# names it declared, so declaring, looking up and leaving a scope cost the
+# same at any nesting depth. Diagnostics are collected and written out in
+# batches rather than printed one by one.
+
+TYPE_SPECIFIERS = {'void', 'char', 'short', 'int', 'long', 'float', 'double', 'signed', 'unsigned'}
+QUALIFIERS = {'auto', 'const', 'extern', 'inline', 'register', 'static', 'typedef', 'volatile'}
+TAG_KEYWORDS = {'struct', 'union', 'enum'}
+
+# Types and names the system #include lines, which the preprocessor does not
+# search for, would have declared
+STANDARD_TYPES = {'FILE', 'bool', 'size_t', 'ptrdiff_t', 'time_t', 'clock_t', 'int8_t', 'int16_t', 'int32_t',
+                  'int64_t', 'uint8_t', 'uint16_t', 'uint32_t', 'uint64_t'}
+STANDARD_NAMES = STANDARD_TYPES | {
+    'NULL', 'EOF', 'true', 'false', 'stdin', 'stdout', 'stderr', 'errno',
+    'INT_MAX', 'INT_MIN', 'RAND_MAX', 'EXIT_SUCCESS', 'EXIT_FAILURE',
+    'printf', 'scanf', 'sprintf', 'snprintf', 'sscanf', 'fprintf', 'fscanf', 'puts', 'putchar', 'getchar',
+    'gets', 'fgets', 'fputs', 'fopen', 'fclose', 'fread', 'fwrite', 'fflush', 'perror',
+    'malloc', 'calloc', 'realloc', 'free', 'exit', 'abort', 'atoi', 'atof', 'atol', 'abs', 'rand', 'srand',
+    'qsort', 'strlen', 'strcpy', 'strncpy', 'strcmp', 'strncmp', 'strcat', 'strncat', 'strchr', 'strstr',
+    'memset', 'memcpy', 'memmove', 'memcmp', 'isdigit', 'isalpha', 'isspace', 'isupper', 'islower',
+    'toupper', 'tolower', 'sqrt', 'pow', 'fabs', 'floor', 'ceil', 'sin', 'cos', 'tan', 'log', 'exp',
+    'time', 'clock', 'assert',
+}
+
+# Diagnostics held before they are written out
+DIAGNOSTIC_BATCH = 64
+
+# kind is 'variable', 'function' or 'type'; type is the declared type text;
+# parameters is the parameter count of a function, or None when unknown
+Symbol = namedtuple('Symbol', ['kind', 'type', 'parameters'])
+
+
+def is_identifier(value):
+    return (value[0].isalpha() or value[0] == '_') and value not in KEYWORDS
+
+
+def split_top_level(values, separator):
+    # Split a value list at separators outside brackets
+    parts = [[]]
+    depth = 0
+    for value in values:
+        if value in OPENING_BRACKETS:
+            depth += 1
+        elif value in CLOSING_BRACKETS:
+            depth -= 1
+        elif value == separator and depth == 0:
+            parts.append([])
+            continue
+        parts[-1].append(value)
+    return parts
+
+
+def closing_index(values, index):
+    # Index of the bracket closing the one at index, or len(values)
+    depth = 0
+    for position in range(index, len(values)):
+        if values[position] in OPENING_BRACKETS:
+            depth += 1
+        elif values[position] in CLOSING_BRACKETS:
+            depth -= 1
+            if depth == 0:
+                return position
+    return len(values)
+
+
+def parameter_count(values):
+    # Number of parameters in the values between a declarator's brackets
+    if not values or values == ['void']:
+        return 0
+    if '...' in values:
+        return None
+    return len(split_top_level(values, ','))
+
+
+class SymbolTable:
+    def __init__(self):
+        self.symbols = {}
+        self.scopes = [[]]
 
-                # Construct loop node for AST
-                loop_node = ('LOOP', loop_condition, loop_body)
+    def enter(self):
+        self.scopes.append([])
 
-                # Add loop node to AST
-                ast.append(loop_node)
+    def leave(self):
+        symbols = self.symbols
+        for name in self.scopes.pop():
+            stack = symbols[name]
+            stack.pop()
+            if not stack:
+                del symbols[name]
 
-                # Move current_index to the end of the loop body
-                current_index = body_end_index
+    def declare(self, name, symbol):
+        self.symbols.setdefault(name, []).append(symbol)
+        self.scopes[-1].append(name)
 
-            # Increment current_index
-            current_index += 1
+    def lookup(self, name):
+        stack = self.symbols.get(name)
+        return stack[-1] if stack else None
 
-        return ast
 
+class SemanticAnalyzer:
+    def __init__(self, out=None):
+        self.out = out
+        self.table = SymbolTable()
+        self.diagnostics = []
+        self.counts = {'Error': 0, 'Warning': 0}
+        # Calls to names not declared yet, checked once the whole unit is seen:
+        # (name, argument count, calling function)
+        self.unresolved = []
+        self.defined = set()
+        # The function being checked: name, return type and whether a return
+        # statement was seen; and the names already reported in it
+        self.function = None
+        self.returns = False
+        self.reported = set()
 
+    def report(self, severity, message):
+        self.diagnostics.append((severity, message))
+        self.counts[severity] += 1
+        if len(self.diagnostics) >= DIAGNOSTIC_BATCH:
+            self.flush()
 
-    def check_semantics(self, parsed_ast):
-        # Placeholder for semantic analysis
-        # For simplicity, check if each function declaration has a return statement
-        for node in parsed_ast:
+    def flush(self):
+        if self.diagnostics:
+            out = self.out or sys.stdout
+            out.write(''.join(f'{severity}: {message}\n' for severity, message in self.diagnostics))
+            self.diagnostics = []
+
+    def where(self):
+        return f" in function '{self.function[0]}'" if self.function else ''
+
+    # Declarations
+
+    def declaration(self, values):
+        # Declares the names of a declaration and checks its initializers;
+        # returns False when values is not a declaration
+        specifiers = []
+        typedef = False
+        index = 0
+        count = len(values)
+        while index < count:
+            value = values[index]
+            if value in TYPE_SPECIFIERS or value in QUALIFIERS:
+                typedef = typedef or value == 'typedef'
+                if value not in QUALIFIERS:
+                    specifiers.append(value)
+                index += 1
+            elif value in TAG_KEYWORDS:
+                specifiers.append(value)
+                index += 1
+                if index < count and is_identifier(values[index]):
+                    specifiers.append(values[index])
+                    index += 1
+                if index < count and values[index] == '{':
+                    index = self.tag_body(value, values, index)
+            elif not specifiers and is_identifier(value) and self.is_type(value):
+                specifiers.append(value)
+                index += 1
+            else:
+                break
+        if not specifiers:
+            return False
+        base_type = ' '.join(specifiers)
+        if index == count:
+            return True
+        for declarator in split_top_level(values[index:], ','):
+            self.declarator(declarator, base_type, typedef)
+        return True
+
+    def tag_body(self, keyword, values, index):
+        # Skips a struct, union or enum body at index; enumerators are
+        # declared as int constants. Returns the index after the body
+        end = closing_index(values, index)
+        if keyword == 'enum':
+            for enumerator in split_top_level(values[index + 1:end], ','):
+                if enumerator and is_identifier(enumerator[0]):
+                    self.table.declare(enumerator[0], Symbol('variable', 'int', None))
+                    self.uses(enumerator[2:])
+        return end + 1
+
+    def declarator(self, values, base_type, typedef):
+        # '*', qualifiers and grouping brackets come before the name
+        index = 0
+        pointer = False
+        while index < len(values) and not is_identifier(values[index]):
+            pointer = pointer or values[index] == '*'
+            index += 1
+        if index == len(values):
+            return
+        name = values[index]
+        index += 1
+        function = False
+        function_pointer = False
+        parameters = None
+        if index < len(values) and values[index] == ')':
+            # A function pointer such as (*name)(int)
+            function_pointer = pointer = True
+        elif index < len(values) and values[index] == '(':
+            function = True
+            close = closing_index(values, index)
+            parameters = parameter_count(values[index + 1:close])
+            index = close + 1
+        if index < len(values) and values[index] == '[':
+            pointer = True
+        declared_type = base_type + ' *' if pointer else base_type
+        if typedef:
+            self.table.declare(name, Symbol('type', declared_type, None))
+        elif function:
+            self.table.declare(name, Symbol('function', declared_type, parameters))
+        else:
+            self.table.declare(name, Symbol('variable', declared_type, None))
+        # Array sizes and initializers use names; the parameter names of a
+        # function pointer do not
+        rest = values[index:]
+        if function_pointer:
+            rest = rest[rest.index('=') + 1:] if '=' in rest else []
+        self.uses(rest)
+
+    def is_type(self, name):
+        if name in STANDARD_TYPES:
+            return True
+        symbol = self.table.lookup(name)
+        return symbol is not None and symbol.kind == 'type'
+
+    # Uses
+
+    def uses(self, values):
+        # Checks every identifier read in values and every call made
+        calls = []  # [callee or None, commas, has arguments] per open bracket
+        previous = None
+        for index, value in enumerate(values):
+            if value in OPENING_BRACKETS:
+                callee = None
+                if value == '(' and previous is not None and is_identifier(previous) and \
+                        (index < 2 or values[index - 2] not in ('.', '->')):
+                    callee = previous
+                calls.append([callee, 0, False])
+            elif value in CLOSING_BRACKETS:
+                if calls:
+                    callee, commas, has_arguments = calls.pop()
+                    if callee is not None:
+                        self.call(callee, commas + 1 if has_arguments else 0)
+                    if calls:
+                        calls[-1][2] = True
+            elif value == ',' and calls:
+                calls[-1][1] += 1
+            else:
+                if calls:
+                    calls[-1][2] = True
+                if is_identifier(value) and previous not in ('.', '->', 'goto') and \
+                        not (index + 1 < len(values) and values[index + 1] == '('):
+                    self.use(value)
+            previous = value
+
+    def use(self, name):
+        if self.table.lookup(name) is None and name not in STANDARD_NAMES and name not in self.reported:
+            self.reported.add(name)
+            self.report('Error', f"Undeclared identifier '{name}'{self.where()}")
+
+    def call(self, name, arguments):
+        symbol = self.table.lookup(name)
+        if symbol is None:
+            if name not in STANDARD_NAMES:
+                self.unresolved.append((name, arguments, self.function[0] if self.function else None))
+        elif symbol.kind == 'variable' and symbol.type is not None and not symbol.type.endswith('*'):
+            self.report('Error', f"Called object '{name}' is not a function{self.where()}")
+        else:
+            self.check_arguments(name, symbol, arguments, self.where())
+
+    def check_arguments(self, name, symbol, arguments, where):
+        if symbol.kind == 'function' and symbol.parameters is not None and symbol.parameters != arguments:
+            self.report('Error', f"Function '{name}' takes {symbol.parameters} arguments "
+                                 f"but is called with {arguments}{where}")
+
+    # The AST walk
+
+    def analyze(self, nodes):
+        for node in nodes:
             if node[0] == 'FUNCTION_DECLARATION':
-                function_name = node[1]
-                parameters = node[2]
+                self.function_declaration(node)
+            elif node[0] == 'DECLARATION':
+                if not self.declaration(node[1]):
+                    self.uses(node[1])
+            else:
+                self.statement(node)
 
-                # Check if the function has a return statement
-                has_return = False
-                for sub_node in parsed_ast:
-                    if sub_node[0] == 'RETURN_STATEMENT':
-                        has_return = True
-                        break
+    def function_declaration(self, node):
+        _, name, parameters, body, return_type = node
+        return_type = ' '.join(value for value in return_type if value not in QUALIFIERS) or 'int'
+        if name in self.defined:
+            self.report('Error', f"Redefinition of function '{name}'")
+        self.defined.add(name)
+        # A prototype already declared it, with its exact parameter count
+        symbol = self.table.lookup(name)
+        if symbol is None or symbol.kind != 'function':
+            self.table.declare(name, Symbol('function', return_type, len(parameters)))
+        self.function = (name, return_type)
+        self.returns = False
+        self.reported = set()
+        self.table.enter()
+        for parameter in parameters:
+            # Parameter types are not kept by the parser
+            self.table.declare(parameter, Symbol('variable', None, None))
+        self.body(body)
+        self.table.leave()
+        if not self.returns and return_type != 'void' and name != 'main':
+            self.report('Warning', f"Function '{name}' does not have a return statement.")
+        self.function = None
+        self.reported = set()
 
-                if not has_return:
-                    print(f"Warning: Function '{function_name}' does not have a return statement.")
+    def body(self, nodes):
+        for node in nodes:
+            self.statement(node)
 
-    def generate_intermediate_code(self, parsed_ast):
-        # Placeholder for intermediate code generation
-        # For simplicity, generate intermediate code for each node in the parsed AST
-        intermediate_code = []
+    def statement(self, node):
+        kind = node[0]
+        if kind == 'STATEMENT':
+            values = node[1]
+            # A label is not a use
+            if len(values) > 1 and values[1] == ':' and is_identifier(values[0]):
+                values = values[2:]
+            if values and not self.declaration(values):
+                self.uses(values)
+        elif kind == 'RETURN_STATEMENT':
+            self.return_statement(node[1])
+        elif kind == 'LOOP':
+            self.table.enter()
+            # The first clause of a for loop may declare its counter
+            clauses = split_top_level(node[1], ';')
+            if len(clauses) == 3 and self.declaration(clauses[0]):
+                clauses = clauses[1:]
+            for clause in clauses:
+                self.uses(clause)
+            self.body(node[2])
+            self.table.leave()
+        elif kind == 'IF':
+            self.uses(node[1])
+            for branch in (node[2], node[3]):
+                self.table.enter()
+                self.body(branch)
+                self.table.leave()
+
+    def return_statement(self, values):
+        self.returns = True
+        self.uses(values)
+        if self.function is None:
+            return
+        name, return_type = self.function
+        if return_type == 'void' and values:
+            self.report('Error', f"Function '{name}' is declared void but returns a value")
+        elif return_type != 'void' and not values:
+            self.report('Warning', f"Function '{name}' returns no value")
+        elif len(values) == 1 and values[0].startswith('"') and not return_type.endswith('*'):
+            self.report('Error', f"Function '{name}' returns a string but is declared '{return_type}'")
+
+    def finish(self):
+        # Calls to functions defined after the caller are checked now
+        for name, arguments, caller in self.unresolved:
+            symbol = self.table.lookup(name)
+            where = f" in function '{caller}'" if caller else ''
+            if symbol is None:
+                self.report('Error', f"Call to undeclared function '{name}'{where}")
+            else:
+                self.check_arguments(name, symbol, arguments, where)
+        self.unresolved = []
+        self.flush()
+        return self.counts
+
+
+class DeclarationSplitter:
+    # Finds where top-level declarations end, one token at a time: at a ';'
+    # or at the '}' closing a function body at bracket depth zero. Struct,
+    # union, enum and initializer braces run on to their ';'. At the end of
+    # a declaration the splitter is back in its initial state
+    def __init__(self):
+        self.depth = 0
+        self.function_body = False
+        self.previous = None
+
+    def ends_declaration(self, token_type, value):
+        if token_type != 'OPERATOR':
+            self.previous = value
+            return False
+        ends = False
+        if value in OPENING_BRACKETS:
+            if self.depth == 0 and value == '{':
+                self.function_body = self.previous == ')'
+            self.depth += 1
+        elif value in CLOSING_BRACKETS:
+            self.depth = max(self.depth - 1, 0)
+            ends = self.depth == 0 and value == '}' and self.function_body
+        elif value == ';' and self.depth == 0:
+            ends = True
+        if ends:
+            self.function_body = False
+        self.previous = value
+        return ends
+
+
+class Compiler:
+    def __init__(self, verbose=True, include_dirs=None, out=None):
+        self.output = ""
+        # Print the parsed AST and intermediate code while compiling
+        self.verbose = verbose
+        # Verbose output and diagnostics go to out, else to stdout
+        self.out = out
+        self.include_dirs = preprocess.include_path(include_dirs)
+        # Headers the last tokenized source included, path -> (mtime_ns, size)
+        self.depends = {}
 
-        print("Parsed AST:")
-        print(parsed_ast)
+    @trace.traced('lex', 'tokens')
+    def tokenize(self, source_code, path=None):
+        # Lexical analysis through the shared DFA lexer (maximal munch, so
+        # operators like '<<=' and '->' no longer need surrounding spaces),
+        # with #include, macros and conditionals applied. The result is a
+        # compact TokenStream whose items are (type, value)
+        token_stream, self.depends = preprocess.preprocess(lexer, source_code, path, self.include_dirs)
+        return token_stream
 
-        for node in parsed_ast:
+    @trace.traced('parse', 'ast_nodes', count_nodes)
+    def parse(self, tokens, errors=None):
+        # Syntactic analysis: build an AST of FUNCTION_DECLARATION,
+        # DECLARATION, LOOP, IF, RETURN_STATEMENT and STATEMENT nodes in a
+        # single pass; all the syntax errors are raised together at the end
+        if not tokens:
+            self.write("Error: Empty input tokens list.\n")
+            return []
+
+        parser = Parser(tokens, errors)
+        parsed_ast = parser.parse_translation_unit()
+        parser.errors.check()
+        return parsed_ast
+
+    def check_semantics(self, parsed_ast, analyzer=None, out=None):
+        # The streaming pipeline passes the analyzer it shares between
+        # declarations and finishes it itself. Diagnostics go to out, else
+        # to stdout
+        if analyzer is not None:
+            analyzer.analyze(parsed_ast)
+            return None
+        analyzer = SemanticAnalyzer(out)
+        analyzer.analyze(parsed_ast)
+        return analyzer.finish()
+
+    @trace.traced('ir', 'ir_instructions', len)
+    def generate_intermediate_code(self, parsed_ast):
+        # The IR keeps the structure of the AST: FUNCTION, LOOP and IF open a
+        # nested body that END closes, and statements carry their source text
+        program = ir.Program()
+        self.generate_nodes(parsed_ast, program)
+        return program
+
+    def generate_nodes(self, nodes, program):
+        # Nested bodies are emitted recursively between an opener and END
+        for node in nodes:
             if node[0] == 'LOOP':
-                loop_condition = ' '.join(node[1])
-                loop_body = ' '.join([str(t[1]) if isinstance(t, tuple) else t for t in node[2]])
-                intermediate_code.append(f"LOOP ({loop_condition}) {{ {loop_body} }}")
+                program.emit(ir.LOOP, ' '.join(node[1]))
+                self.generate_nodes(node[2], program)
+                program.emit(ir.END)
+            elif node[0] == 'IF':
+                program.emit(ir.IF, ' '.join(node[1]))
+                self.generate_nodes(node[2], program)
+                if node[3]:
+                    program.emit(ir.ELSE)
+                    self.generate_nodes(node[3], program)
+                program.emit(ir.END)
             elif node[0] == 'FUNCTION_DECLARATION':
-                function_name = node[1]
-                parameters = node[2]
-                intermediate_code.append(f"FUNCTION {function_name} ({', '.join(parameters)})")
+                program.emit(ir.FUNCTION, node[1], *node[2])
+                self.generate_nodes(node[3], program)
+                program.emit(ir.END, ir.FUNCTION)
             elif node[0] == 'RETURN_STATEMENT':
-                expression = ' '.join(node[1])
-                intermediate_code.append(f"RETURN {expression}")
+                program.emit(ir.RETURN, ' '.join(node[1]))
+            elif node[0] == 'STATEMENT':
+                program.emit(ir.STATEMENT, ' '.join(node[1]))
+
+    def compile(self, source_code, cache=None, path=None):
+        # An unchanged source is served from the compile cache without being
+        # lexed or parsed, as long as the headers it includes are unchanged.
+        # The semantic diagnostics are kept with the entry and written again
+        if cache is not None:
+            key = cache.key(source_code, 'c' + preprocess.cache_tag(source_code, path, self.include_dirs))
+            entry = cache.get(key)
+            if entry is not None:
+                self.write(entry.get('output') or '')
+                return entry['ir']
 
-        print("Intermediate code:")
-        print(intermediate_code)
+        tokens = self.tokenize(source_code, path)
+        parsed_ast = self.parse(tokens, diagnostics.Diagnostics(path))
+        # Traced here rather than on the method, which the streaming pipeline
+        # calls once per declaration
+        with trace.span('semantic'):
+            if cache is None:
+                self.check_semantics(parsed_ast, out=self.out)
+            else:
+                report = io.StringIO()
+                self.check_semantics(parsed_ast, out=report)
+                output = report.getvalue()
+                self.write(output)
+        intermediate_code = self.generate_intermediate_code(parsed_ast)
+        if self.verbose:
+            # Written here rather than in the traced phases, so printing a
+            # large AST is not timed as part of them
+            self.write(f"Parsed AST:\n{parsed_ast}\n"
+                       f"Intermediate code:\n{list(ir.iter_lines(intermediate_code, structured=True))}\n")
 
-        return "\n".join(intermediate_code)
+        if cache is not None:
+            cache.put(key, tokens, parsed_ast, intermediate_code, self.depends, output)
+        return intermediate_code
 
+    def write(self, text):
+        (self.out or sys.stdout).write(text)
 
+    def split_declarations(self, tokens):
+        # Group a token iterator into top-level declarations
+        group = []
+        splitter = DeclarationSplitter()
+        for token in tokens:
+            group.append(token)
+            if splitter.ends_declaration(token[0], token[1]):
+                yield group
+                group = []
+        if group:
+            yield group
+
+    def compile_stream(self, tokens, result_file, path=None):
+        # Streaming pipeline: parse, check and generate one top-level
+        # declaration at a time and write its IR straight to result_file,
+        # so only the current declaration is held in memory. Syntax errors
+        # are raised together at the end
+        first_line = True
+        program = ir.Program()
+        analyzer = SemanticAnalyzer()
+        errors = diagnostics.Diagnostics(path)
+        # MappedTokens locate the tokens of the current declaration
+        locate = getattr(tokens, 'location', None)
+        # typedef names declared so far
+        typedefs = set(STANDARD_TYPES)
+        with trace.span('compile_stream') as counters:
+            declarations = 0
+            instructions = 0
+            for group in self.split_declarations(tokens):
+                parsed_ast = Parser(group, errors, typedefs, locate).parse_translation_unit()
+                if locate is not None:
+                    tokens.clear()
+                self.check_semantics(parsed_ast, analyzer)
+                self.generate_nodes(parsed_ast, program)
+                intermediate_code = program.take()
+                first_line = ir.write(intermediate_code, result_file, structured=True, first_line=first_line)
+                declarations += 1
+                instructions += len(intermediate_code)
+            analyzer.finish()
+            counters['declarations'] = declarations
+            counters['ir_instructions'] = instructions
+        errors.check()
 
-    def compile(self, source_code):
-        tokens = self.tokenize(source_code)
-        parsed_ast = self.parse(tokens)
-        self.check_semantics(parsed_ast)
-        intermediate_code = self.generate_intermediate_code(parsed_ast)
-        return intermediate_code
+
+class MappedTokens:
+    # Preprocessed Token views of a bytes-like buffer such as an mmap, for
+    # the streaming pipeline. The start offsets of the tokens yielded since
+    # the last clear() are kept, so errors in the declaration being compiled
+    # can be located
+    def __init__(self, data, path=None, include_dirs=None):
+        self.data = data
+        self.path = path
+        self.include_dirs = include_dirs
+        self.lines = stream.LineCounter(data)
+        self.starts = []
+
+    def __iter__(self):
+        data = self.data
+        kinds = lexer.kinds
+        starts = self.starts
+        for kind, start, end, text in preprocess.iter_spans(lexer, data, self.path, self.include_dirs):
+            starts.append(start)
+            yield tokens.Token(kinds[kind], text if text is not None else bytes(data[start:end]).decode('utf-8'))
+
+    def clear(self):
+        del self.starts[:]
+
+    def location(self, index):
+        # index counts from the first token since the last clear()
+        return self.lines.locate(self.starts[index])
 
 def measure_time_and_memory(func):
     def wrapper(*args, **kwargs):
-        start_time = time.time()
-        start_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start_time = time.perf_counter()
+        start_memory = measure.max_rss_kilobytes()
         result = func(*args, **kwargs)
-        end_time = time.time()
-        end_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
-        print(f"Time taken: {end_time - start_time} seconds")
-        print(f"Memory consumption: {end_memory - start_memory} bytes")
+        end_time = time.perf_counter()
+        end_memory = measure.max_rss_kilobytes()
+        print(f"Time taken: {end_time - start_time:.6f} seconds")
+        # Growth of the peak resident set size during the call
+        print(f"Memory consumption: {end_memory - start_memory} KB")
         return result
     return wrapper
 
-@measure_time_and_memory
-def compile_c_file(file_path):
+# Compile one file and write its intermediate code; this is the entry point
+# used by the batch driver, so it prints only diagnostics unless verbose is set
+def compile_file(file_path, result_file_path, streaming=None, verbose=False, cache=None, include_dirs=None):
+    compiler = Compiler(verbose, include_dirs)
+
+    # Large inputs are lexed from a memory map and compiled declaration by
+    # declaration instead of being read into memory
+    if stream.should_stream(file_path, streaming):
+        with stream.map_source(file_path) as data, stream.open_output(result_file_path) as result_file:
+            compiler.compile_stream(MappedTokens(data, file_path, compiler.include_dirs), result_file, file_path)
+        return None
+
     with open(file_path, 'r') as file:
         source_code = file.read()
 
-    compiler = Compiler()
-    intermediate_code = compiler.compile(source_code)
+    intermediate_code = compiler.compile(source_code, cache, file_path)
     
     # Write intermediate code to a result file
-    result_file_path = "result.txt"
-    with open(result_file_path, "w") as result_file:
-        result_file.write(intermediate_code)
-    
-    print(f"Intermediate code written to {result_file_path}")
+    with trace.span('write') as counters, stream.open_output(result_file_path) as result_file:
+        ir.write(intermediate_code, result_file, structured=True)
+        counters['bytes_written'] = result_file.tell()
+
+    return intermediate_code
 
+@measure_time_and_memory
+def compile_c_file(file_path, result_file_path="result.txt", streaming=None, cache=None):
+    intermediate_code = compile_file(file_path, result_file_path, streaming, verbose=True, cache=cache)
+    print(f"Intermediate code written to {result_file_path}")
     return intermediate_code
 
 # Example usage
 if __name__ == "__main__":
-    intermediate_code = compile_c_file("example.c")
+    intermediate_code = compile_c_file("example.c", streaming="--stream" in sys.argv or None)
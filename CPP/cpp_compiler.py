@@ -1,100 +1,1219 @@
+import io
+import os
 import time
-import resource
 import sys
+from array import array
 
-# Token class to store token information
-class Token:
-    def __init__(self, type, value):
-        self.type = type
-        self.value = value
+# Make the shared compilers package importable when run as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compilers import diagnostics, ir, lalr, lexgen, measure, passes, preprocess, stream, trace
+
+KEYWORDS = {'auto', 'bool', 'break', 'case', 'catch', 'char', 'class', 'const', 'continue', 'default',
+            'delete', 'do', 'double', 'else', 'enum', 'extern', 'false', 'float', 'for', 'if', 'inline',
+            'int', 'long', 'namespace', 'new', 'private', 'protected', 'public', 'return', 'short',
+            'signed', 'sizeof', 'static', 'struct', 'switch', 'template', 'this', 'throw', 'true', 'try',
+            'typedef', 'typename', 'unsigned', 'using', 'virtual', 'void', 'while'}
+
+OPERATORS = ['+', '-', '*', '/', '%', '=', '==', '!=', '<', '>', '<=', '>=', '&&', '||', '!', '&', '|', '^',
+             '~', '<<', '>>', '+=', '-=', '*=', '/=', '%=', '&=', '|=', '^=', '<<=', '>>=', ',', ';', ':',
+             '(', ')', '[', ']', '.', '->', '++', '--', '?', '::', '...', '.*', '->*']
+
+LEXER_SPEC = lexgen.LexerSpec('cpp', [
+    ('WHITESPACE', r'\s+'),
+    ('COMMENT', r'//[^\n]*'),
+    ('COMMENT', r'/\*([^*]|\*+[^*/])*\*+/'),
+    ('DIRECTIVE', r'#([^\\\n]|\\.|\\\r?\n)*'),
+    ('INTEGER', r'[0-9]+'),
+    ('NUMBER', r'([0-9]+\.[0-9]*|\.[0-9]+)([eE][+-]?[0-9]+)?[fFlL]?'),
+    ('STRING', r'"([^"\\\n]|\\.)*"'),
+    ('STRING', r"'([^'\\\n]|\\.)*'"),
+    ('IDENTIFIER', r'[A-Za-z_][A-Za-z0-9_]*'),
+    ('BRACE', r'[{}]'),
+] + [('OPERATOR', lexgen.literal(operator)) for operator in OPERATORS],
+    keywords={keyword: 'KEYWORD' for keyword in KEYWORDS},
+    skip={'WHITESPACE', 'COMMENT', 'DIRECTIVE'},
+    error='UNKNOWN',
+    literals={'INTEGER', 'NUMBER', 'STRING'})
+
+lexer = lexgen.build_lexer(LEXER_SPEC)
+
+# Macros every translation unit starts with
+PREDEFINED_MACROS = {'__cplusplus': '201703L'}
 
 # Lexical Analyzer function
-def lex(file):
-    tokens = []
-    line_number = 0
-
-    for line in file:
-        line_number += 1
-        words = line.split()
-        for word in words:
-            token = Token('', word)
-
-            # Simple categorization for demo purpose
-            if word in ["for", "int", "return"]:
-                token.type = "KEYWORD"
-            elif word in ["{", "}"]:
-                token.type = "BRACE"
-            elif word in ["=", "<", ";"]:
-                token.type = "OPERATOR"
-            elif word.isdigit():
-                token.type = "INTEGER"
+@trace.traced('lex', 'tokens')
+def lex(file, path=None, include_dirs=None, depends=None):
+    # Categorization is done by the shared DFA lexer, and #include, macros
+    # and conditionals by the preprocessor; the headers read are added to
+    # depends. Tokens are stored in a compact TokenStream, whose kind and
+    # symbol arrays the code generator reads without making Token views
+    token_stream, headers = preprocess.preprocess(lexer, file.read(), path, include_dirs, PREDEFINED_MACROS)
+    if depends is not None:
+        depends.update(headers)
+    return token_stream
+
+# Syntax and Intermediate Code Generator
+#
+# An LALR(1) grammar (see compilers/lalr.py) of the C++ subset the frontend
+# lowers: functions, global and local declarations, the statements and the
+# expressions. Its actions lower each construct to stack code as the parser
+# reduces it. Each token is classified as the parser reads it:
+#   - a name such as std::cout or obj.field is one IDENTIFIER
+#   - where a declaration can start, a name followed by a declarator, as in
+#     "Point p" or "std::vector<int> *v", is one TYPE_NAME, template
+#     arguments included
+#   - there, class, struct, enum and union definitions, typedef, using,
+#     template and namespace declarations, which generate no code, are each
+#     one OPAQUE token, up to their ';' or closing '}'
+# Parameter lists, catch clauses and the operands of sizeof, throw and
+# delete are balanced token runs, which generate no code either.
+
+# Keywords that can start or continue the type of a declaration
+TYPE_KEYWORDS = {'auto', 'bool', 'char', 'class', 'const', 'double', 'enum', 'extern', 'float', 'inline',
+                 'int', 'long', 'short', 'signed', 'static', 'struct', 'typename', 'unsigned', 'virtual',
+                 'void'}
+
+# Declarations read as OPAQUE tokens, where a declaration can start
+SKIPPED_KEYWORDS = {'using', 'typedef', 'template', 'namespace', 'class', 'struct', 'enum', 'union'}
+
+# Keywords that name a type by its tag, as in struct Point p
+TAG_KEYWORDS = {'class', 'struct', 'enum', 'union'}
+
+# Tokens after which a declaration can start: the '(' of a for loop, the ')'
+# of a condition and the '{' of a block are found with the bracket stacks
+DECLARATION_PREFIXES = {';', '}', 'else', 'do'} | TYPE_KEYWORDS
+
+# Keywords whose parenthesized condition is followed by a statement
+CONDITION_KEYWORDS = {'if', 'for', 'while', 'switch', 'catch'}
+
+# Tokens after which a '{' opens a block rather than an initializer list
+BLOCK_PREFIXES = {';', ')', '}', 'else', 'do', 'try'}
+
+# '&&' and '||' are lowered to jumps by rules of their own
+BINARY_PRECEDENCE = [
+    ('left', "'|'"),
+    ('left', "'^'"),
+    ('left', "'&'"),
+    ('left', "'==' '!='"),
+    ('left', "'<' '>' '<=' '>='"),
+    ('left', "'<<' '>>'"),
+    ('left', "'+' '-'"),
+    ('left', "'*' '/' '%'"),
+]
+
+# Tokens of a balanced run other than its brackets and ';'
+RUN_TOKENS = (['IDENTIFIER', 'TYPE_NAME', 'OPAQUE', 'INTEGER', 'NUMBER', 'STRING']
+              + [f"'{keyword}'" for keyword in sorted(KEYWORDS)]
+              + [f"'{operator}'" for operator in OPERATORS if operator not in ('(', ')', '[', ']', ';')])
+
+ASSIGNMENTS = ('=', '+=', '-=', '*=', '/=', '%=', '&=', '|=', '^=', '<<=', '>>=')
+
+GRAMMAR = lalr.Grammar('cpp', [
+    ('program', '', None),
+    ('program', 'program top_level', None),
+    ('top_level', "';'", None),
+    ('top_level', 'OPAQUE', None),
+    # Namespace members are compiled as if they were global
+    ('top_level', "'namespace' IDENTIFIER '{' program '}'", None),
+    ('top_level', 'function_head compound_statement', 'function'),
+    ('top_level', "function_head ';'", 'prototype'),
+    ('top_level', "specifiers global_declarators ';'", 'global_declaration'),
+    ('top_level', "error ';'", None),
+    ('top_level', "error '}'", None),
+    ('function_head', "specifiers declarator_name '(' inner ')'", 'function_head'),
+
+    # Declarations
+    ('specifiers', 'specifier', None),
+    ('specifiers', 'specifiers specifier', None),
+    ('specifier', 'type_keyword', None),
+    ('specifier', 'TYPE_NAME', None),
+    ('specifier', "'union'", None),
+] + [('type_keyword', f"'{keyword}'", None) for keyword in sorted(TYPE_KEYWORDS)] + [
+    ('keyword_specifiers', 'type_keyword', None),
+    ('keyword_specifiers', 'keyword_specifiers type_keyword', None),
+    ('declarator_name', 'pointers IDENTIFIER', 'declarator_name'),
+    ('pointers', '', None),
+    ('pointers', "pointers '*'", None),
+    ('pointers', "pointers '&'", None),
+    ('pointers', "pointers '&&'", None),
+    ('dimensions', '', 'no_dimensions'),
+    ('dimensions', "dimensions '[' ']'", None),
+    ('dimensions', "dimensions '[' expression ']'", 'dimension'),
+    # A global's initializer cannot be a constructor call, which reads as a
+    # prototype
+    ('global_declarators', 'declarator_name dimensions global_initializer', 'init_declarator'),
+    ('global_declarators', "global_declarators ',' init_declarator", None),
+    ('global_initializer', '', None),
+    ('global_initializer', "'=' assignment", 'initializer'),
+    ('global_initializer', "'=' initializer_list", 'initializer'),
+    ('global_initializer', 'initializer_list', 'initializer'),
+    ('declaration', "specifiers init_declarators ';'", None),
+    ('init_declarators', 'init_declarator', None),
+    ('init_declarators', "init_declarators ',' init_declarator", None),
+    ('init_declarator', 'declarator_name dimensions global_initializer', 'init_declarator'),
+    ('init_declarator', "declarator_name dimensions '(' arguments ')'", 'constructor_declarator'),
+    ('initializer_list', "'{' '}'", 'empty_initializer_list'),
+    ('initializer_list', "'{' initializers '}'", 'initializer_list'),
+    ('initializer_list', "'{' initializers ',' '}'", 'initializer_list'),
+    ('initializers', 'initializer', 'first_argument'),
+    ('initializers', "initializers ',' initializer", 'next_argument'),
+    ('initializer', 'assignment', None),
+    ('initializer', 'initializer_list', None),
+
+    # Statements. The code before the body of a compound statement is
+    # emitted by its head, which is reduced before the body is read; the
+    # heads of blocks, for loops and switches also open a scope
+    ('compound_statement', "block_start statements '}'", 'block'),
+    ('compound_statement', "block_start statements error '}'", 'block'),
+    ('block_start', "'{'", 'block_start'),
+    ('statements', '', None),
+    ('statements', 'statements statement', None),
+    ('statement', 'compound_statement', None),
+    ('statement', "';'", None),
+    ('statement', 'OPAQUE', None),
+    ('statement', 'declaration', None),
+    ('statement', "expression ';'", 'expression_statement'),
+    ('statement', 'if_head statement %prec THEN', 'if_statement'),
+    ('statement', 'if_else_head statement', 'if_else_statement'),
+    ('statement', 'for_head statement', 'for_statement'),
+    ('statement', 'range_for_head statement', 'range_for_statement'),
+    ('statement', 'while_head statement', 'while_statement'),
+    ('statement', "do_body 'while' '(' expression ')' ';'", 'do_statement'),
+    ('statement', "switch_body '}'", 'switch_statement'),
+    ('statement', "'break' ';'", 'break_statement'),
+    ('statement', "'continue' ';'", 'continue_statement'),
+    ('statement', "'return' ';'", 'return_statement'),
+    ('statement', "'return' expression ';'", 'return_statement'),
+    ('statement', "'try' compound_statement handlers", None),
+    ('statement', "'throw' run ';'", None),
+    ('statement', "'delete' run ';'", None),
+    ('statement', "error ';'", None),
+    ('if_head', "'if' '(' expression ')'", 'if_head'),
+    ('if_else_head', "if_head statement 'else'", 'if_else_head'),
+    ('for_open', "'for' '('", 'block_start'),
+    ('for_start', "for_open for_initializer", 'for_start'),
+    ('for_condition', "for_start optional_expression ';'", 'for_condition'),
+    ('for_head', "for_condition optional_effects ')'", 'for_head'),
+    ('range_for_head', "for_open specifiers declarator_name ':' expression ')'", 'range_for_head'),
+    ('while_start', "'while'", 'while_start'),
+    ('while_head', "while_start '(' expression ')'", 'while_head'),
+    ('do_head', "'do'", 'do_head'),
+    ('do_body', 'do_head statement', 'do_body'),
+    ('switch_head', "'switch' '(' expression ')' '{'", 'switch_head'),
+    ('switch_body', 'switch_head', None),
+    ('switch_body', 'switch_body statement', None),
+    ('switch_body', "switch_body case_start conditional ':'", 'case_label'),
+    ('switch_body', "switch_body 'default' ':'", 'default_label'),
+    ('case_start', "'case'", 'case_start'),
+    ('for_initializer', "';'", None),
+    ('for_initializer', "effects ';'", None),
+    ('for_initializer', 'declaration', None),
+    ('optional_expression', '', None),
+    ('optional_expression', 'expression', 'condition'),
+    ('optional_effects', '', None),
+    ('optional_effects', 'effects', None),
+    # Expressions evaluated for their effects, as in the initialization and
+    # step of a for loop
+    ('effects', 'assignment', 'effect'),
+    ('effects', "effects ',' assignment", 'effect'),
+    ('handlers', '', None),
+    ('handlers', 'handlers catch_head compound_statement', 'handler'),
+    ('catch_head', "'catch' '(' inner ')'", 'catch_head'),
+
+    # Expressions
+    ('expression', 'assignment', None),
+    ('assignment', 'conditional', None),
+] + [('assignment', f"unary '{operator}' assignment", 'assignment') for operator in ASSIGNMENTS] + [
+    ('conditional', 'logical_or', None),
+    ('conditional', 'condition_then conditional', 'conditional'),
+    ('condition_test', "logical_or '?'", 'condition_test'),
+    ('condition_then', "condition_test expression ':'", 'condition_then'),
+    ('logical_or', 'logical_and', None),
+    ('logical_or', 'or_chain logical_and', 'logical_or'),
+    ('or_chain', "logical_and '||'", 'or_start'),
+    ('or_chain', "or_chain logical_and '||'", 'or_next'),
+    ('logical_and', 'binary', None),
+    ('logical_and', 'and_chain binary', 'logical_and'),
+    ('and_chain', "binary '&&'", 'and_start'),
+    ('and_chain', "and_chain binary '&&'", 'and_next'),
+    ('binary', 'unary', None),
+] + [('binary', f"binary {operator} binary", 'binary')
+       for _, operators in BINARY_PRECEDENCE for operator in operators.split()] + [
+    ('unary', 'postfix', None),
+] + [('unary', f"'{operator}' unary", 'unary') for operator in ('-', '!', '~')] + [
+    # Unary plus, address-of and dereference keep the value
+] + [('unary', f"'{operator}' unary", 'keep') for operator in ('+', '&', '*')] + [
+] + [('unary', f"'{operator}' unary", 'increment') for operator in ('++', '--')] + [
+    ('unary', "'(' keyword_specifiers pointers ')' unary", 'keep'),
+    ('unary', "'sizeof' '(' inner ')'", 'sizeof'),
+    ('unary', "'sizeof' IDENTIFIER", 'sizeof'),
+    ('postfix', 'primary', None),
+    ('postfix', "postfix '[' expression ']'", 'index'),
+    ('postfix', "postfix '++'", 'postfix_increment'),
+    ('postfix', "postfix '--'", 'postfix_increment'),
+    ('primary', 'INTEGER', 'integer'),
+    ('primary', 'NUMBER', 'number'),
+    ('primary', 'strings', 'string'),
+    ('primary', "'true'", 'boolean'),
+    ('primary', "'false'", 'boolean'),
+    ('primary', "'this'", 'this'),
+    ('primary', 'IDENTIFIER', 'name'),
+    ('primary', "IDENTIFIER '(' arguments ')'", 'call'),
+    # Functional cast such as int(x)
+    ('primary', "type_keyword '(' expression ')'", 'keep'),
+    ('primary', "'(' expression ')'", 'parenthesized'),
+    ('primary', "'new' new_type %prec NEW", 'new_object'),
+    ('primary', "'new' new_type '[' expression ']'", 'new_array'),
+    ('primary', "'new' new_type '(' arguments ')'", 'new_object'),
+    ('new_type', 'keyword_specifiers', 'type_text'),
+    ('new_type', 'IDENTIFIER', 'type_text'),
+    ('arguments', '', 'no_arguments'),
+    ('arguments', 'argument_list', None),
+    ('argument_list', 'assignment', 'first_argument'),
+    ('argument_list', "argument_list ',' assignment", 'next_argument'),
+    ('strings', 'STRING', 'string_text'),
+    ('strings', 'strings STRING', 'join_strings'),
+
+    # Balanced runs
+    ('run', '', None),
+    ('run', 'run run_item', None),
+] + [('run_item', token, None) for token in RUN_TOKENS] + [
+    ('run_item', "'(' inner ')'", None),
+    ('run_item', "'[' inner ']'", None),
+    ('inner', '', None),
+    ('inner', 'inner run_item', None),
+    ('inner', "inner ';'", None),
+    ('inner', "inner '{' inner '}'", None),
+], precedence=BINARY_PRECEDENCE + [
+    # new T[n] takes the brackets
+    ('nonassoc', 'NEW'),
+    ('nonassoc', "'['"),
+    # else belongs to the innermost if
+    ('nonassoc', 'THEN'),
+    ('nonassoc', "'else'"),
+])
+
+parser = lalr.build_parser(GRAMMAR)
+
+
+def literal_columns(texts):
+    # Grammar columns of the keywords and operators with these texts
+    return {parser.column(f"'{text}'") for text in texts}
+
+
+# Assignment operator -> arithmetic opcode (None for plain '=')
+ASSIGNMENT_OPERATORS = {'=': None, '+=': ir.ADD, '-=': ir.SUB, '*=': ir.MUL, '/=': ir.DIV, '%=': ir.MOD,
+                        '&=': ir.BIT_AND, '|=': ir.BIT_OR, '^=': ir.BIT_XOR, '<<=': ir.SHIFT_LEFT,
+                        '>>=': ir.SHIFT_RIGHT}
+
+# Binary operator -> opcode; comparisons become COMPARE op
+BINARY_OPERATORS = {'|': ir.BIT_OR, '^': ir.BIT_XOR, '&': ir.BIT_AND,
+                    '==': ir.COMPARE, '!=': ir.COMPARE,
+                    '<': ir.COMPARE, '<=': ir.COMPARE, '>': ir.COMPARE, '>=': ir.COMPARE,
+                    '<<': ir.SHIFT_LEFT, '>>': ir.SHIFT_RIGHT,
+                    '+': ir.ADD, '-': ir.SUB,
+                    '*': ir.MUL, '/': ir.DIV, '%': ir.MOD}
+
+UNARY_OPERATORS = {'-': ir.NEG, '!': ir.NOT, '~': ir.BIT_NOT}
+
+OUTPUT_STREAMS = {'cout', 'cerr', 'clog', 'std::cout', 'std::cerr', 'std::clog'}
+INPUT_STREAMS = {'cin', 'std::cin'}
+LINE_ENDS = {'endl', 'std::endl'}
+
+
+class CodeGenerator(lalr.Actions):
+    # Lowers the program to stack code as the parser reduces it, reading the
+    # kinds and symbols of the TokenStream directly. Globals are initialized
+    # before any function. Syntax errors are reported to errors (see
+    # compilers/diagnostics.py); after one, statements resume past the next
+    # ';' or at the '}' of their block.
+    #
+    # The value of an expression says what its code can still become:
+    #   ('variable', name, load)            LOAD name at instructions[load]
+    #   ('element', name, load, indices)    the code from instructions[load]
+    #                                       indexes name, with the code of
+    #                                       each index at a (start, end)
+    #                                       slice followed by its INDEX
+    #   ('discard', start, end)             the value is dropped by deleting
+    #                                       instructions[start:end]
+    #   ('output',) and ('input',)          cout and cin, which << and >>
+    #                                       print to and read from
+    # and is None for any other value. An action only rewrites code after
+    # the start of its own, so the values still on the parser stack stay
+    # valid
+    def __init__(self, tokens, errors=None):
+        self.stream = tokens
+        self.errors = errors if errors is not None else diagnostics.Diagnostics()
+        # Grammar column of each token as the lexer read it
+        self.columns = parser.stream_columns(tokens)
+        # Index of the first token of each terminal read
+        self.indices = array('I')
+        self.program = ir.Program()
+        self.global_code = []
+        # Where the code after the last function starts
+        self.function_end = 0
+        # (continue label or None, break label) of the enclosing loops and
+        # switches, innermost last
+        self.targets = []
+        # Loops whose continue label was jumped to
+        self.continued = set()
+        # Local variables in scope: a dict per enclosing block, innermost
+        # last, from each name declared in it to the variable holding it.
+        # A local hiding a global or another local is stored as name.1,
+        # name.2, ... so the two stay apart
+        self.scopes = []
+        self.global_names = set()
+        self.hidden_counts = {}
+
+        self.identifier = parser.column('IDENTIFIER')
+        self.semicolon = parser.column("';'")
+        self.open_brace = parser.column("'{'")
+        self.close_brace = parser.column("'}'")
+        self.open_paren = parser.column("'('")
+        self.close_paren = parser.column("')'")
+        self.less = parser.column("'<'")
+        self.greater = parser.column("'>'")
+        self.shift_right = parser.column("'>>'")
+        self.comma = parser.column("','")
+        self.equals = parser.column("'='")
+        self.namespace = parser.column("'namespace'")
+        self.for_keyword = parser.column("'for'")
+        self.members = literal_columns(['::', '.', '->'])
+        self.pointers = literal_columns(['*', '&', '&&'])
+        self.tags = literal_columns(TAG_KEYWORDS)
+        self.closing = {opening: closing for opening, closing in
+                        zip(map(parser.column, ("'('", "'['", "'{'")), map(parser.column, ("')'", "']'", "'}'")))}
+        self.type_stops = literal_columns([';', '{', '}', '(', ')', '=']) | {parser.column('STRING')}
+
+    def generate(self):
+        parser.parse(self.terminals(), self, self.errors)
+        self.program.instructions = self.global_code + self.program.instructions
+        return self.program
+
+    def location(self, position):
+        if position >= len(self.indices):
+            return None, None
+        return self.stream.location(self.indices[position])
+
+    def text(self, value):
+        return self.stream.value(value)
+
+    def error(self, message, position):
+        index = self.indices[position]
+        self.errors.error(f"{message} but found", *self.stream.location(index), self.stream.value(index))
+
+    # Tokens
+
+    def terminals(self):
+        # (column, index) of each terminal: its grammar column and the index
+        # of its first token
+        columns = self.columns
+        count = len(columns)
+        identifier = self.identifier
+        type_name = parser.column('TYPE_NAME')
+        opaque = parser.column('OPAQUE')
+        skipped = literal_columns(SKIPPED_KEYWORDS)
+        prefixes = literal_columns(DECLARATION_PREFIXES)
+        block_prefixes = literal_columns(BLOCK_PREFIXES)
+        conditions = literal_columns(CONDITION_KEYWORDS)
+        semicolon = self.semicolon
+        open_brace = self.open_brace
+        close_brace = self.close_brace
+        open_paren = self.open_paren
+        close_paren = self.close_paren
+        indices = self.indices
+        # Whether each open '(' holds a condition and each open '{' a block
+        parens = []
+        braces = []
+        declaration_start = True
+        # Columns of the last two terminals read
+        previous = earlier = None
+        index = 0
+        while index < count:
+            column = columns[index]
+            start = index
+            if column == identifier:
+                index = self.name_end(index)
+                end = self.type_end(index) if declaration_start else None
+                if end is not None:
+                    index = end
+                    column = type_name
+            elif column in skipped and declaration_start and not self.is_declared(index):
+                index = self.run_end(index)
+                column = opaque
+            else:
+                index += 1
+
+            indices.append(start)
+            yield column, start
+
+            if column == opaque or column in prefixes:
+                declaration_start = True
+                if column == close_brace and braces:
+                    braces.pop()
+            elif column == open_brace:
+                # '{' opens a block after a ')', a block or a statement, and
+                # an initializer list otherwise
+                block = (previous is None or previous in block_prefixes
+                         or (previous == open_brace and (not braces or braces[-1]))
+                         or (previous == identifier and earlier == self.namespace))
+                braces.append(block)
+                declaration_start = block
+            elif column == open_paren:
+                parens.append(previous in conditions)
+                declaration_start = previous == self.for_keyword
+            elif column == close_paren:
+                declaration_start = parens.pop() if parens else False
+            else:
+                declaration_start = False
+            earlier = previous
+            previous = semicolon if column == opaque else column
+
+    def name_text(self, index):
+        # Text of the name starting at index
+        return ''.join(map(self.stream.value, range(index, self.name_end(index))))
+
+    def name_end(self, index):
+        # Past a name such as a, std::cout or obj.field starting at index
+        columns = self.columns
+        index += 1
+        while index + 1 < len(columns) and columns[index] in self.members and columns[index + 1] == self.identifier:
+            index += 2
+        return index
+
+    def type_end(self, index):
+        # End of the type whose name ends at index, with its template arguments,
+        # when a declarator follows it; else None
+        columns = self.columns
+        end = index
+        if end < len(columns) and columns[end] == self.less:
+            # Template arguments, if the angle brackets balance before
+            # anything that cannot appear in a type
+            depth = 0
+            position = end
+            while position < len(columns):
+                column = columns[position]
+                if column == self.less:
+                    depth += 1
+                elif column == self.greater:
+                    depth -= 1
+                elif column == self.shift_right:
+                    depth -= 2
+                elif column in self.type_stops:
+                    return None
+                position += 1
+                if depth <= 0:
+                    break
+            if depth != 0:
+                return None
+            end = position
+        position = end
+        while position < len(columns) and columns[position] in self.pointers:
+            position += 1
+        if position < len(columns) and columns[position] == self.identifier:
+            return end
+        return None
+
+    def is_declared(self, index):
+        # struct Point p; declares a variable and namespace n { ... } holds
+        # declarations
+        columns = self.columns
+        if index + 2 >= len(columns) or columns[index + 1] != self.identifier:
+            return False
+        if columns[index] == self.namespace:
+            return columns[index + 2] == self.open_brace
+        return columns[index] in self.tags and columns[index + 2] == self.identifier
+
+    def run_end(self, index):
+        # Past the next ';' or braced block at this level
+        columns = self.columns
+        while index < len(columns):
+            column = columns[index]
+            if column in self.closing:
+                index = self.matching(index) + 1
+                if column == self.open_brace and (index >= len(columns) or columns[index] != self.semicolon):
+                    return index
+            elif column == self.semicolon:
+                return index + 1
+            else:
+                index += 1
+        return index
+
+    def matching(self, index):
+        # Index of the bracket closing the one at index, or of the last token
+        columns = self.columns
+        opening = columns[index]
+        closing = self.closing[opening]
+        depth = 0
+        for position in range(index, len(columns)):
+            if columns[position] == opening:
+                depth += 1
+            elif columns[position] == closing:
+                depth -= 1
+                if depth == 0:
+                    return position
+        return len(columns) - 1
+
+    def parameters(self, start, end):
+        # The name of each parameter in tokens start to end is its last
+        # identifier outside brackets and before any default value
+        columns = self.columns
+        openings = set(self.closing) | {self.less}
+        closings = set(self.closing.values()) | {self.greater}
+        names = []
+        name = None
+        depth = 0
+        in_default = False
+        for position in range(start, end):
+            column = columns[position]
+            if column in openings:
+                depth += 1
+            elif column in closings:
+                depth -= 1
+            elif depth == 0 and column == self.comma:
+                if name is not None:
+                    names.append(name)
+                name = None
+                in_default = False
+            elif depth == 0 and column == self.equals:
+                in_default = True
+            elif depth == 0 and not in_default and column == self.identifier:
+                name = self.stream.value(position)
+        if name is not None:
+            names.append(name)
+        return names
+
+    # Top level
+
+    def function_head(self, start, end, specifiers, name, open_paren, parameters, close_paren):
+        parameters = self.parameters(open_paren + 1, close_paren)
+        self.program.emit(ir.FUNCTION, name, *parameters)
+        self.scopes = [{parameter: parameter for parameter in parameters}]
+        self.hidden_counts.clear()
+
+    def function(self, start, end, head, body):
+        instructions = self.program.instructions
+        if not instructions or instructions[-1].opcode != ir.RETURN:
+            self.program.emit(ir.PUSH, 0)
+            self.program.emit(ir.RETURN)
+        self.function_end = len(instructions)
+        # Loops, switches and blocks an error left open
+        self.targets.clear()
+        self.scopes = []
+
+    def prototype(self, start, end, head, semicolon):
+        del self.program.instructions[-1]
+        self.scopes = []
+
+    def global_declaration(self, start, end, specifiers, declarators, semicolon):
+        # Global variables: their initialization runs before main
+        instructions = self.program.instructions
+        self.global_code.extend(instructions[self.function_end:])
+        del instructions[self.function_end:]
+
+    # Declarations
+
+    def declarator_name(self, start, end, pointers, name):
+        return self.name_text(name)
+
+    def declare(self, name):
+        # The variable holding a name declared here
+        if not self.scopes:
+            self.global_names.add(name)
+            return name
+        variable = name
+        if name in self.global_names or any(name in scope for scope in self.scopes):
+            count = self.hidden_counts.get(name, 0) + 1
+            self.hidden_counts[name] = count
+            variable = f'{name}.{count}'
+        self.scopes[-1][name] = variable
+        return variable
+
+    def variable(self, name):
+        for scope in reversed(self.scopes):
+            variable = scope.get(name)
+            if variable is not None:
+                return variable
+        return name
+
+    def no_dimensions(self, start, end):
+        # (start, end) of the code of the dimensions, and how many were given
+        size = len(self.program.instructions)
+        return size, size, 0
+
+    def dimension(self, start, end, dimensions, open_bracket, size, close_bracket):
+        return dimensions[0], len(self.program.instructions), dimensions[2] + 1
+
+    def initializer(self, start, end, *symbols):
+        return True
+
+    def init_declarator(self, start, end, name, dimensions, initializer):
+        # Array dimensions are only evaluated when there is no initializer
+        # to give the contents
+        dimensions_start, dimensions_end, count = dimensions
+        name = self.declare(name)
+        if initializer:
+            del self.program.instructions[dimensions_start:dimensions_end]
+            self.program.emit(ir.STORE, name)
+        elif count:
+            self.program.emit(ir.NEW_ARRAY, count)
+            self.program.emit(ir.STORE, name)
+
+    def constructor_declarator(self, start, end, name, dimensions, open_paren, count, close_paren):
+        # Constructor arguments; a single one is the initial value
+        del self.program.instructions[dimensions[0]:dimensions[1]]
+        if count != 1:
+            self.program.emit(ir.ARRAY, count)
+        self.program.emit(ir.STORE, self.declare(name))
+
+    def empty_initializer_list(self, start, end, open_brace, close_brace):
+        self.program.emit(ir.ARRAY, 0)
+
+    def initializer_list(self, start, end, open_brace, count, *close):
+        self.program.emit(ir.ARRAY, count)
+
+    # Statements
+
+    def block_start(self, start, end, *symbols):
+        self.scopes.append({})
+
+    def block(self, start, end, *symbols):
+        self.scopes.pop()
+
+    def expression_statement(self, start, end, expression, semicolon):
+        self.discard(expression)
+
+    def effect(self, start, end, *symbols):
+        self.discard(symbols[-1])
+
+    def discard(self, value):
+        # Assignments and increments store without leaving a value, and cout
+        # and cin leave none; any other value is popped
+        kind = value[0] if value is not None else None
+        if kind == 'discard':
+            del self.program.instructions[value[1]:value[2]]
+        elif kind not in ('output', 'input'):
+            self.program.emit(ir.POP)
+
+    def if_head(self, start, end, keyword, open_paren, condition, close_paren):
+        false_label = self.program.new_label('IF_FALSE')
+        self.program.emit(ir.JUMP_IF_FALSE, false_label)
+        return false_label
+
+    def if_statement(self, start, end, false_label, body):
+        self.program.label(false_label)
+
+    def if_else_head(self, start, end, false_label, body, keyword):
+        end_label = self.program.new_label('IF_END')
+        self.program.emit(ir.JUMP, end_label)
+        self.program.label(false_label)
+        return end_label
+
+    def if_else_statement(self, start, end, end_label, body):
+        self.program.label(end_label)
+
+    def for_start(self, start, end, scope, initializer):
+        labels = (self.program.new_label('LOOP_START'), self.program.new_label('LOOP_BODY_START'),
+                  self.program.new_label('LOOP_BODY_END'), self.program.new_label('LOOP_CONTINUE'))
+        self.program.label(labels[0])
+        return labels
+
+    def condition(self, start, end, expression):
+        return True
+
+    def for_condition(self, start, end, labels, condition, semicolon):
+        if condition:
+            self.program.emit(ir.JUMP_IF_FALSE, labels[2])
+        return labels, len(self.program.instructions)
+
+    def for_head(self, start, end, condition, effects, close_paren):
+        # The step is taken out to be placed after the body
+        labels, step_start = condition
+        instructions = self.program.instructions
+        step = instructions[step_start:]
+        del instructions[step_start:]
+        self.program.label(labels[1])
+        self.targets.append((labels[3], labels[2]))
+        return labels, step
+
+    def for_statement(self, start, end, head, body):
+        labels, step = head
+        self.leave_loop()
+        self.program.instructions.extend(step)
+        self.program.emit(ir.JUMP, labels[0])
+        self.program.label(labels[2])
+        self.scopes.pop()
+
+    def range_for_head(self, start, end, scope, specifiers, name, colon, items, close_paren):
+        # for (auto x : items) walks the items by index through hidden
+        # variables x.items and x.index
+        name = self.declare(name)
+        items = f'{name}.items'
+        position = f'{name}.index'
+        self.program.emit(ir.STORE, items)
+        self.program.emit(ir.PUSH, 0)
+        self.program.emit(ir.STORE, position)
+
+        labels = (self.program.new_label('LOOP_START'), self.program.new_label('LOOP_BODY_START'),
+                  self.program.new_label('LOOP_BODY_END'), self.program.new_label('LOOP_CONTINUE'))
+        self.program.label(labels[0])
+        self.program.emit(ir.LOAD, position)
+        self.program.emit(ir.LOAD, items)
+        self.program.emit(ir.CALL, 'len', 1)
+        self.program.emit(ir.COMPARE, '<')
+        self.program.emit(ir.JUMP_IF_FALSE, labels[2])
+        self.program.label(labels[1])
+        self.program.emit(ir.LOAD, items)
+        self.program.emit(ir.LOAD, position)
+        self.program.emit(ir.INDEX)
+        self.program.emit(ir.STORE, name)
+        self.targets.append((labels[3], labels[2]))
+        return position, labels
+
+    def range_for_statement(self, start, end, head, body):
+        position, labels = head
+        self.leave_loop()
+        self.program.emit(ir.LOAD, position)
+        self.program.emit(ir.PUSH, 1)
+        self.program.emit(ir.ADD)
+        self.program.emit(ir.STORE, position)
+        self.program.emit(ir.JUMP, labels[0])
+        self.program.label(labels[2])
+        self.scopes.pop()
+
+    def leave_loop(self):
+        # The continue label is placed after the body only if it is used
+        continue_label, end_label = self.targets.pop()
+        if continue_label in self.continued:
+            self.program.label(continue_label)
+
+    def while_start(self, start, end, keyword):
+        labels = (self.program.new_label('LOOP_START'), self.program.new_label('LOOP_BODY_START'),
+                  self.program.new_label('LOOP_BODY_END'))
+        self.program.label(labels[0])
+        return labels
+
+    def while_head(self, start, end, labels, open_paren, condition, close_paren):
+        self.program.emit(ir.JUMP_IF_FALSE, labels[2])
+        self.program.label(labels[1])
+        self.targets.append((labels[0], labels[2]))
+        return labels
+
+    def while_statement(self, start, end, labels, body):
+        self.targets.pop()
+        self.program.emit(ir.JUMP, labels[0])
+        self.program.label(labels[2])
+
+    def do_head(self, start, end, keyword):
+        start_label = self.program.new_label('LOOP_START')
+        end_label = self.program.new_label('LOOP_BODY_END')
+        continue_label = self.program.new_label('LOOP_CONTINUE')
+        self.program.label(start_label)
+        self.targets.append((continue_label, end_label))
+        return start_label, end_label
+
+    def do_body(self, start, end, labels, body):
+        self.leave_loop()
+        return labels
+
+    def do_statement(self, start, end, labels, keyword, open_paren, condition, close_paren, semicolon):
+        self.program.emit(ir.JUMP_IF_TRUE, labels[0])
+        self.program.label(labels[1])
+
+    def switch_head(self, start, end, keyword, open_paren, expression, close_paren, open_brace):
+        # Compares the value with each case in turn, then falls through the
+        # case bodies in source order like C++ does. The comparisons are
+        # gathered as the cases are read and placed before the bodies at the
+        # end. The switch is [value, where the comparisons go, (comparison
+        # code, label) of each case, default label or None, end label]
+        value = self.program.new_temporary('switch.value')
+        self.program.emit(ir.STORE, value)
+        end_label = self.program.new_label('SWITCH_END')
+        self.targets.append((None, end_label))
+        self.scopes.append({})
+        return [value, len(self.program.instructions), [], None, end_label]
+
+    def case_start(self, start, end, keyword):
+        return len(self.program.instructions)
+
+    def case_label(self, start, end, switch, case_start, case_value, colon):
+        instructions = self.program.instructions
+        code = instructions[case_start:]
+        del instructions[case_start:]
+        label = self.program.new_label('CASE')
+        switch[2].append((code, label))
+        self.program.label(label)
+        return switch
+
+    def default_label(self, start, end, switch, keyword, colon):
+        switch[3] = self.program.new_label('DEFAULT')
+        self.program.label(switch[3])
+        return switch
+
+    def switch_statement(self, start, end, switch, close_brace):
+        value, dispatch_start, cases, default_label, end_label = switch
+        self.targets.pop()
+        self.scopes.pop()
+        dispatch = []
+        for code, label in cases:
+            dispatch.append(ir.Instr(ir.LOAD, (value,)))
+            dispatch.extend(code)
+            dispatch.append(ir.Instr(ir.COMPARE, ('==',)))
+            dispatch.append(ir.Instr(ir.JUMP_IF_TRUE, (label,)))
+        dispatch.append(ir.Instr(ir.JUMP, (default_label or end_label,)))
+        self.program.instructions[dispatch_start:dispatch_start] = dispatch
+        self.program.label(end_label)
+
+    def jump_target(self, kind, position):
+        # kind 0 is continue, 1 is break
+        for targets in reversed(self.targets):
+            if targets[kind] is not None:
+                return targets[kind]
+        self.error(f"{'continue' if kind == 0 else 'break'} outside a loop", position)
+        return None
+
+    def break_statement(self, start, end, keyword, semicolon):
+        label = self.jump_target(1, start)
+        if label is not None:
+            self.program.emit(ir.JUMP, label)
+
+    def continue_statement(self, start, end, keyword, semicolon):
+        label = self.jump_target(0, start)
+        if label is not None:
+            self.continued.add(label)
+            self.program.emit(ir.JUMP, label)
+
+    def return_statement(self, start, end, keyword, *rest):
+        if len(rest) == 1:
+            self.program.emit(ir.PUSH, 0)
+        self.program.emit(ir.RETURN)
+
+    def catch_head(self, start, end, keyword, open_paren, parameter, close_paren):
+        return len(self.program.instructions)
+
+    def handler(self, start, end, handlers, handler_start, body):
+        # The protected block runs; handlers are never entered
+        del self.program.instructions[handler_start:]
+
+    # Expressions
+
+    def assignment(self, start, end, target, operator, value):
+        opcode = ASSIGNMENT_OPERATORS[self.stream.value(operator)]
+        return self.assign(target, opcode, start)
+
+    def assign(self, target, opcode, position):
+        # Stores the value just emitted into target, whose code comes before
+        # it; opcode combines the two for compound assignments. The value of
+        # the assignment is the value stored
+        instructions = self.program.instructions
+        kind = target[0] if target is not None else None
+        if kind == 'variable':
+            if opcode is None:
+                del instructions[target[2]]
             else:
-                token.type = "IDENTIFIER"
-            
-            tokens.append(token)
-    
-    return tokens
-
-# Syntactical Analyzer function
-def parse(tokens):
-    # Simplified parsing for demo purpose
-    for token in tokens:
-        if token.value == "for":
-            return True
-    return False
+                self.program.emit(opcode)
+            self.program.emit(ir.DUP)
+            self.program.emit(ir.STORE, target[1])
+            return 'discard', len(instructions) - 2, len(instructions) - 1
+        if kind == 'element':
+            # a[i][j] = v: push a[i] and j, then the value, then STORE_INDEX
+            load = target[2]
+            last = target[3][-1][1]
+            element = instructions[load:last + 1]
+            if opcode is None:
+                del instructions[last]
+            else:
+                instructions[last:last + 1] = self.copy(element)
+                self.program.emit(opcode)
+            self.program.emit(ir.STORE_INDEX)
+            reload = len(instructions)
+            instructions.extend(self.copy(element))
+            return 'discard', reload, len(instructions)
+        self.error("Expected a variable", position)
+        return None
+
+    def copy(self, code):
+        # New instructions doing what code does, with labels of their own
+        labels = {}
+        for instruction in code:
+            if instruction.opcode == ir.LABEL:
+                label = instruction.operands[0]
+                labels[label] = self.program.new_label(label + '_COPY')
+        copies = []
+        for instruction in code:
+            operands = instruction.operands
+            if operands and operands[0] in labels and (instruction.opcode == ir.LABEL
+                                                       or instruction.opcode in ir.JUMPS):
+                operands = (labels[operands[0]],) + operands[1:]
+            copies.append(ir.Instr(instruction.opcode, operands))
+        return copies
+
+    def condition_test(self, start, end, condition, question):
+        else_label = self.program.new_label('CONDITION_FALSE')
+        end_label = self.program.new_label('CONDITION_END')
+        self.program.emit(ir.JUMP_IF_FALSE, else_label)
+        return else_label, end_label
+
+    def condition_then(self, start, end, labels, value, colon):
+        self.program.emit(ir.JUMP, labels[1])
+        self.program.label(labels[0])
+        return labels[1]
+
+    def conditional(self, start, end, end_label, value):
+        self.program.label(end_label)
+
+    # Short-circuit: the right operand of && runs only if the left is true,
+    # and that of || only if the left is false
+
+    def and_start(self, start, end, left, operator):
+        false_label = self.program.new_label('AND_FALSE')
+        end_label = self.program.new_label('AND_END')
+        self.program.emit(ir.JUMP_IF_FALSE, false_label)
+        return false_label, end_label
+
+    def and_next(self, start, end, labels, right, operator):
+        self.program.emit(ir.JUMP_IF_FALSE, labels[0])
+        return labels
+
+    def logical_and(self, start, end, labels, right):
+        false_label, end_label = labels
+        self.program.emit(ir.JUMP_IF_FALSE, false_label)
+        self.program.emit(ir.PUSH, 1)
+        self.program.emit(ir.JUMP, end_label)
+        self.program.label(false_label)
+        self.program.emit(ir.PUSH, 0)
+        self.program.label(end_label)
+
+    def or_start(self, start, end, left, operator):
+        true_label = self.program.new_label('OR_TRUE')
+        end_label = self.program.new_label('OR_END')
+        self.program.emit(ir.JUMP_IF_TRUE, true_label)
+        return true_label, end_label
+
+    def or_next(self, start, end, labels, right, operator):
+        self.program.emit(ir.JUMP_IF_TRUE, labels[0])
+        return labels
+
+    def logical_or(self, start, end, labels, right):
+        true_label, end_label = labels
+        self.program.emit(ir.JUMP_IF_TRUE, true_label)
+        self.program.emit(ir.PUSH, 0)
+        self.program.emit(ir.JUMP, end_label)
+        self.program.label(true_label)
+        self.program.emit(ir.PUSH, 1)
+        self.program.label(end_label)
+
+    def binary(self, start, end, left, operator, right):
+        operator = self.stream.value(operator)
+        kind = left[0] if left is not None else None
+        if kind == 'output' and operator == '<<':
+            # cout << a << b prints each operand in turn
+            self.program.emit(ir.PRINT)
+            return left
+        if kind == 'input' and operator == '>>':
+            # cin >> a >> b reads each variable in turn
+            self.program.emit(ir.CALL, 'read', 0)
+            self.discard(self.assign(right, None, start))
+            return left
+        opcode = BINARY_OPERATORS[operator]
+        if opcode == ir.COMPARE:
+            self.program.emit(ir.COMPARE, operator)
+        else:
+            self.program.emit(opcode)
+
+    def unary(self, start, end, operator, operand):
+        self.program.emit(UNARY_OPERATORS[self.stream.value(operator)])
+
+    def keep(self, start, end, *symbols):
+        # Unary plus, address-of, dereference and casts keep the value
+        return None
+
+    def increment(self, start, end, operator, operand):
+        # ++x and --x leave the new value
+        self.program.emit(ir.PUSH, 1)
+        opcode = ir.ADD if self.stream.value(operator) == '++' else ir.SUB
+        return self.assign(operand, opcode, start)
+
+    def postfix_increment(self, start, end, operand, operator):
+        # x++ and x-- leave the value loaded before the increment
+        opcode = ir.ADD if self.stream.value(operator) == '++' else ir.SUB
+        kind = operand[0] if operand is not None else None
+        instructions = self.program.instructions
+        if kind == 'variable':
+            load = operand[2]
+            self.program.emit(ir.LOAD, operand[1])
+            self.program.emit(ir.PUSH, 1)
+            self.program.emit(opcode)
+            self.program.emit(ir.STORE, operand[1])
+            return 'discard', load, load + 1
+        if kind == 'element':
+            load = operand[2]
+            last = operand[3][-1][1]
+            element = instructions[load:last + 1]
+            instructions.extend(self.copy(element[:-1]))
+            instructions.extend(self.copy(element))
+            self.program.emit(ir.PUSH, 1)
+            self.program.emit(opcode)
+            self.program.emit(ir.STORE_INDEX)
+            return 'discard', load, last + 1
+        self.error("Expected a variable", start)
+        return None
+
+    def sizeof(self, start, end, *symbols):
+        self.program.emit(ir.CALL, 'sizeof', 0)
+
+    def index(self, start, end, array, open_bracket, index, close_bracket):
+        index_end = len(self.program.instructions)
+        self.program.emit(ir.INDEX)
+        kind = array[0] if array is not None else None
+        if kind == 'variable':
+            return 'element', array[1], array[2], [(array[2] + 1, index_end)]
+        if kind == 'element':
+            indices = array[3]
+            indices.append((indices[-1][1] + 1, index_end))
+            return array
+        return None
+
+    def integer(self, start, end, value):
+        self.program.emit(ir.PUSH, int(self.stream.value(value)))
+
+    def number(self, start, end, value):
+        self.program.emit(ir.PUSH, float(self.stream.value(value).rstrip('fFlL')))
+
+    def string_text(self, start, end, value):
+        return self.stream.value(value)
+
+    def join_strings(self, start, end, text, value):
+        # Adjacent string literals are one string
+        return text[:-1] + self.stream.value(value)[1:]
+
+    def string(self, start, end, text):
+        self.program.emit(ir.PUSH, text)
+
+    def boolean(self, start, end, value):
+        self.program.emit(ir.PUSH, 1 if self.stream.value(value) == 'true' else 0)
+
+    def this(self, start, end, keyword):
+        self.program.emit(ir.LOAD, 'this')
+
+    def name(self, start, end, value):
+        name = self.name_text(value)
+        if name in OUTPUT_STREAMS:
+            return ('output',)
+        if name in INPUT_STREAMS:
+            return ('input',)
+        if name in LINE_ENDS:
+            self.program.emit(ir.PUSH, '"\\n"')
+        elif name in ('nullptr', 'NULL'):
+            self.program.emit(ir.PUSH, 0)
+        else:
+            name = self.variable(name)
+            self.program.emit(ir.LOAD, name)
+            return 'variable', name, len(self.program.instructions) - 1
+        return None
+
+    def call(self, start, end, name, open_paren, count, close_paren):
+        self.program.emit(ir.CALL, self.name_text(name), count)
+
+    def parenthesized(self, start, end, open_paren, expression, close_paren):
+        return expression
+
+    def type_text(self, start, end, value):
+        return self.name_text(value)
+
+    def new_object(self, start, end, keyword, type_name, *arguments):
+        # new T(args) is a constructor call
+        self.program.emit(ir.CALL, type_name, arguments[1] if arguments else 0)
+
+    def new_array(self, start, end, keyword, type_name, open_bracket, size, close_bracket):
+        # new T[n] is a zero-filled array
+        self.program.emit(ir.NEW_ARRAY, 1)
+
+    def no_arguments(self, start, end):
+        return 0
+
+    def first_argument(self, start, end, value):
+        return 1
+
+    def next_argument(self, start, end, count, comma, value):
+        return count + 1
+
 
 # Intermediate Code Generator function
-def generate_intermediate_code(tokens):
-    # Simplified intermediate code generation for demo purpose
-    code = []
-    for token in tokens:
-        if token.value == "for":
-            code.append(f"LOOP_START:")
-        elif token.value == "{":
-            code.append(f"LOOP_BODY_START:")
-        elif token.value == "}":
-            code.append(f"LOOP_BODY_END:")
-        elif token.type == "IDENTIFIER":
-            code.append(f"LOAD {token.value}")
-        elif token.type == "INTEGER":
-            code.append(f"PUSH {token.value}")
-        elif token.value == "=":
-            code.append(f"STORE")
-        elif token.value == "<":
-            code.append(f"COMPARE")
-            code.append(f"JUMP_IF_FALSE LOOP_BODY_END")
-    return "\n".join(code)
+@trace.traced('ir', 'ir_instructions', len)
+def generate_intermediate_code(tokens, errors=None):
+    # Parses and lowers the whole program to stack code (see compilers/ir.py)
+    # in one pass; all the syntax errors are raised together at the end
+    generator = CodeGenerator(tokens, errors)
+    program = generator.generate()
+    generator.errors.check()
+    return program
 
-def main():
-    start_time = time.time()
-    start_mem = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+# Compile one file and write its intermediate code without console output;
+# used by the batch driver. optimize is True, False, or a passes.PassManager
+# that collects the optimizer statistics
+def compile_file(source_path, output_path, cache=None, optimize=True, include_dirs=None):
+    with open(source_path, "r") as file:
+        source_code = file.read()
+    include_dirs = preprocess.include_path(include_dirs)
 
-    try:
-        with open("example.cpp", "r") as file:
-            tokens = lex(file)
+    # An unchanged source is served from the compile cache without being
+    # lexed or parsed, as long as the headers it includes are unchanged
+    entry = None
+    if cache is not None:
+        key = cache.key(source_code, 'cpp-' + passes.cache_tag(optimize)
+                        + preprocess.cache_tag(source_code, source_path, include_dirs))
+        entry = cache.get(key)
 
-            if not parse(tokens):
-                print("Error: Unable to parse the source code!")
-                return
-            
-            intermediate_code = generate_intermediate_code(tokens)
+    if entry is not None:
+        intermediate_code = entry['ir']
+    else:
+        depends = {}
+        tokens = lex(io.StringIO(source_code), source_path, include_dirs, depends)
 
-            # Write intermediate code to result.txt
-            with open("result.txt", "w") as result_file:
-                result_file.write(intermediate_code)
+        intermediate_code = generate_intermediate_code(tokens, diagnostics.Diagnostics(source_path))
+
+        if optimize:
+            intermediate_code = passes.manager_for(optimize).run(intermediate_code)
+
+        if cache is not None:
+            cache.put(key, tokens, None, intermediate_code, depends)
+
+    with trace.span('write') as counters, stream.open_output(output_path) as result_file:
+        ir.write(intermediate_code, result_file)
+        counters['bytes_written'] = result_file.tell()
+
+    return intermediate_code
+
+def main():
+    start_time = time.perf_counter()
+    start_mem = measure.max_rss_kilobytes()
+
+    # -O0 writes the intermediate code as generated
+    optimizer = passes.PassManager() if "-O0" not in sys.argv else None
+
+    try:
+        # Write intermediate code to result.txt
+        compile_file("example.cpp", "result.txt", optimize=optimizer or False)
 
-            end_time = time.time()
-            end_mem = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        end_time = time.perf_counter()
+        end_mem = measure.max_rss_kilobytes()
 
-            elapsed_time = end_time - start_time
-            mem_consumed = end_mem - start_mem
+        elapsed_time = end_time - start_time
+        mem_consumed = end_mem - start_mem
 
-            print("Intermediate code generated successfully!")
-            print(f"Time taken: {elapsed_time} seconds")
-            print(f"Memory consumed: {mem_consumed} kilobytes")
+        print("Intermediate code generated successfully!")
+        print(f"Time taken: {elapsed_time:.6f} seconds")
+        print(f"Memory consumed: {mem_consumed} KB")
+        if optimizer is not None:
+            for line in optimizer.summary():
+                print(line)
 
     except FileNotFoundError:
         print("Error opening file!")
+    except SyntaxError as error:
+        print(f"Error: {error}")
 
 if __name__ == "__main__":
     main()
@@ -1,175 +1,1272 @@
-import re
-import os.path
+import os
+import sys
 import time
-import resource
+
+# Make the shared compilers package importable when run as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compilers import diagnostics, ir, lalr, lexgen, measure, passes, stream, trace
+
+KEYWORDS = {'and', 'array', 'begin', 'case', 'const', 'div', 'do', 'downto', 'else', 'end', 'for',
+            'function', 'if', 'mod', 'not', 'of', 'or', 'procedure', 'program', 'record', 'repeat',
+            'then', 'to', 'type', 'until', 'var', 'while'}
+
+OPERATORS = [':=', '+', '-', '*', '/', '=', '<>', '<', '>', '<=', '>=', '(', ')', '[', ']',
+             ';', ':', ',', '.', '..', '^', '@']
+
+LEXER_SPEC = lexgen.LexerSpec('pascal', [
+    ('WHITESPACE', r'\s+'),
+    ('COMMENT', r'//[^\n]*'),
+    ('COMMENT', r'\{[^}]*\}'),
+    ('COMMENT', r'\(\*([^*]|\*+[^*)])*\*+\)'),
+    ('NUMBER', r'[0-9]+(\.[0-9]+)?([eE][+-]?[0-9]+)?'),
+    ('STRING', r"'([^'\n]|'')*'"),
+    ('IDENTIFIER', r'[A-Za-z_][A-Za-z0-9_]*'),
+] + [('OPERATOR', lexgen.literal(operator)) for operator in OPERATORS],
+    # Pascal does not tell case apart, so BEGIN and Begin are keywords too
+    keywords={keyword: 'KEYWORD' for keyword in KEYWORDS},
+    fold_keywords=True,
+    # Characters no rule matches are UNKNOWN tokens, reported by the parser
+    skip={'WHITESPACE', 'COMMENT'},
+    error='UNKNOWN',
+    literals={'NUMBER', 'STRING'})
+
+lexer = lexgen.build_lexer(LEXER_SPEC)
 
 # Step 1: Lexical Analysis
+@trace.traced('lex', 'tokens')
 def tokenize(code):
-    keywords = {'for', 'to', 'do', 'begin', 'end'}
-    operators = {'+', '-', '*', '/'}
-    tokens = []
-    code = re.findall(r'\b\w+\b|[\+\-\*/]', code)
-    for token in code:
-        if token in keywords:
-            tokens.append(('KEYWORD', token))
-        elif token in operators:
-            tokens.append(('OPERATOR', token))
-        elif token.isdigit():
-            tokens.append(('NUMBER', token))
-        else:
-            tokens.append(('IDENTIFIER', token))
-    return tokens
+    # Returns a compact TokenStream whose items are (type, value) tuples
+    return lexer.tokenize(code)
 
 # Step 2: Syntactic Analysis (Parsing)
-def parse(tokens):
-    i = 0
-    n = len(tokens)
-    while i < n:
-        if tokens[i][1] == 'for':
-            # Expecting a loop construct: for <identifier> := <number> to <number> do
-            loop_tokens = []
-            j = i + 1  # Start from the token after 'for'
-            while j < n and tokens[j][1] != 'do':
-                loop_tokens.append(tokens[j])
-                j += 1
-            loop_tokens.append(tokens[j])  # Include 'do' keyword
-            print("Loop tokens:", loop_tokens)  # Debugging print statement
-            # Check if loop tokens form a valid loop construct
-            if (
-                len(loop_tokens) == 7 and
-                loop_tokens[0][0] == 'IDENTIFIER' and  # Check for loop variable
-                loop_tokens[1][1] == ':=' and  # Check for assignment operator
-                loop_tokens[2][0] == 'NUMBER' and  # Check for start value
-                loop_tokens[3][1] == 'to' and  # Check for 'to' keyword
-                loop_tokens[4][0] == 'NUMBER' and  # Check for end value
-                loop_tokens[5][1] == 'do'  # Check for 'do' keyword
-            ):
-                print(f'Found loop construct:')
-                print(f'Loop variable: {loop_tokens[0][1]}')
-                print(f'Start value: {loop_tokens[2][1]}')
-                print(f'End value: {loop_tokens[4][1]}')
-                i = j + 1  # Skip the loop construct
-                # Parse loop body (tokens until 'end')
-                while i < n and tokens[i][1] != 'end':
-                    print(tokens[i])  # Print loop body
-                    i += 1
-                print(f'End of loop')
-            else:
-                # print(f'Error: Invalid loop construct')
+#
+# An LALR(1) parser (see compilers/lalr.py) builds the AST in one pass over
+# the tokens; semantic analysis and code generation both walk the AST and
+# never look at the tokens again. Nodes are tuples, as in the C frontend:
+#   ('PROGRAM', name, declarations, body)
+#   ('VAR', names, type), ('CONST', name, value), ('TYPE', name, type)
+#   ('ROUTINE', kind, name, parameters, result, declarations, body)
+#   ('BLOCK', statements)
+#   ('FOR', variable, start, direction, end, body)
+#   ('WHILE', condition, body), ('REPEAT', statements, condition)
+#   ('IF', condition, then, else), ('CASE', selector, branches, else)
+#   ('WITH', records, body), ('ASSIGN', target, value), ('STATEMENT', values)
+# Expressions and types are lists of their (type, value) tokens. Parameters
+# are VAR nodes, with a fourth item 'var' when passed by reference, a forward
+# declaration has no body and a missing else branch is None.
+#
+# The grammar only gives expressions and types their bracket structure: an
+# expression is a run of operands and operators up to a ';', ':=', ':' or
+# keyword outside brackets, and a type a run of tokens up to its ';'.
+#
+# Syntax errors are collected (see compilers/diagnostics.py): after one, the
+# statement list resumes at the next ';', 'end', 'else' or 'until', and the
+# declaration list past the next ';'.
+
+GRAMMAR = lalr.Grammar('pascal', [
+    ('program', "heading declarations block '.'", 'program'),
+    ('heading', '', None),
+    ('heading', "'program' IDENTIFIER ';'", 'heading'),
+    # Program parameters such as (input, output) are ignored
+    ('heading', "'program' IDENTIFIER '(' inner ')' ';'", 'heading'),
+
+    # Declarations
+    ('declarations', '', 'empty_list'),
+    ('declarations', 'declarations section', 'extend'),
+    ('declarations', 'declarations routine', 'append'),
+    ('section', "'var' var_list %prec SECTION", 'section'),
+    ('section', "'const' const_list %prec SECTION", 'section'),
+    ('section', "'type' type_list %prec SECTION", 'section'),
+    # Sections such as uses and label are skipped
+    ('section', "'uses' expression ';'", 'empty_list'),
+    ('section', "'label' expression ';'", 'empty_list'),
+    ('section', "error ';'", 'empty_list'),
+    ('var_list', 'var', 'first'),
+    ('var_list', 'var_list var', 'append'),
+    ('var', "names ':' type ';'", 'var'),
+    ('var', "error ';'", None),
+    ('const_list', 'const', 'first'),
+    ('const_list', 'const_list const', 'append'),
+    ('const', "IDENTIFIER '=' expression ';'", 'const'),
+    # The type of a typed constant is not needed
+    ('const', "IDENTIFIER ':' type '=' expression ';'", 'typed_const'),
+    ('const', "error ';'", None),
+    ('type_list', 'type_declaration', 'first'),
+    ('type_list', 'type_list type_declaration', 'append'),
+    ('type_declaration', "IDENTIFIER '=' type ';'", 'type_declaration'),
+    ('type_declaration', "error ';'", None),
+    ('names', 'IDENTIFIER', 'first'),
+    ('names', "names ',' IDENTIFIER", 'append_separated'),
+
+    ('routine', "routine_head ';' 'forward' ';'", 'forward'),
+    ('routine', "routine_head ';' declarations block ';'", 'routine'),
+    ('routine_head', 'routine_kind IDENTIFIER parameters result', 'routine_head'),
+    ('routine_kind', "'procedure'", None),
+    ('routine_kind', "'function'", None),
+    ('parameters', '', 'empty_list'),
+    ('parameters', "'(' ')'", 'empty_list'),
+    ('parameters', "'(' parameter_list ')'", 'parameters'),
+    ('parameters', "'(' parameter_list ';' ')'", 'parameters'),
+    ('parameter_list', 'parameter', 'first'),
+    ('parameter_list', "parameter_list ';' parameter", 'append_separated'),
+    ('parameter', 'names', 'untyped_parameter'),
+    ('parameter', "names ':' type", 'var'),
+    ('parameter', "'var' parameter", 'reference_parameter'),
+    ('parameter', "'const' parameter", 'second'),
+    ('result', '', 'empty_list'),
+    ('result', "':' type", 'second'),
+
+    # Statements; the empty statement is None and left out of the lists
+    ('block', "'begin' statements 'end'", 'block'),
+    ('statements', 'statement', 'first'),
+    ('statements', "statements ';' statement", 'append_separated'),
+    ('statement', '', None),
+    ('statement', 'block', None),
+    ('statement', "'for' IDENTIFIER ':=' expression direction expression 'do' statement", 'for_statement'),
+    ('direction', "'to'", None),
+    ('direction', "'downto'", None),
+    ('statement', "'while' expression 'do' statement", 'while_statement'),
+    ('statement', "'repeat' statements 'until' expression", 'repeat_statement'),
+    ('statement', "'if' expression 'then' statement %prec THEN", 'if_statement'),
+    ('statement', "'if' expression 'then' statement 'else' statement", 'if_else_statement'),
+    ('statement', "'case' expression 'of' branches 'end'", 'case_statement'),
+    ('statement', "'with' expression 'do' statement", 'with_statement'),
+    ('statement', "expression ':=' expression", 'assignment'),
+    ('statement', 'expression', 'call'),
+    ('statement', 'error', None),
+
+    # (branches, else statements)
+    ('branches', '', 'no_branches'),
+    ('branches', 'branch_list', 'branches'),
+    ('branches', "branch_list ';'", 'branches'),
+    ('branches', "'else' statements", 'else_branches'),
+    ('branches', "branch_list 'else' statements", 'branches'),
+    ('branches', "branch_list ';' 'else' statements", 'branches_after_semicolon'),
+    ('branch_list', 'branch', 'first'),
+    ('branch_list', "branch_list ';' branch", 'append_separated'),
+    ('branch', "expression ':' statement", 'branch'),
+
+    # Token runs
+    ('expression', 'operands', 'token_run'),
+    ('operands', 'operand', None),
+    ('operands', 'operands operand', None),
+    ('operands', "operands '='", None),
+    ('operand', 'IDENTIFIER', None),
+    ('operand', 'NUMBER', None),
+    ('operand', 'STRING', None),
+    ('operand', "'(' inner ')'", None),
+    ('operand', "'[' inner ']'", None),
+] + [('operand', f"'{operator}'", None) for operator in ['+', '-', '*', '/', '<>', '<', '>', '<=', '>=', ',',
+                                                         '.', '..', '^', '@', 'and', 'or', 'not', 'div', 'mod']
+] + [
+    # Within brackets, as in write(x:8:2) or record constants
+    ('inner', '', None),
+    ('inner', 'inner operand', None),
+    ('inner', "inner '='", None),
+    ('inner', "inner ':'", None),
+    ('inner', "inner ';'", None),
+    ('type', 'type_operands', 'token_run'),
+    ('type_operands', 'type_operand', None),
+    ('type_operands', 'type_operands type_operand', None),
+    ('type_operand', 'operand', None),
+    ('type_operand', "':'", None),
+    ('type_operand', "'of'", None),
+    ('type_operand', "'array'", None),
+    ('type_operand', "'procedure'", None),
+    ('type_operand', "'function'", None),
+    ('type_operand', "'record' fields 'end'", None),
+    ('fields', '', None),
+    ('fields', 'fields type_operand', None),
+    ('fields', "fields ';'", None),
+    ('fields', "fields '='", None),
+    ('fields', "fields 'case'", None),
+], precedence=[
+    # An error after a declaration of a section is in that section
+    ('nonassoc', 'SECTION'),
+    ('nonassoc', 'error'),
+    # else belongs to the innermost if
+    ('nonassoc', 'THEN'),
+    ('nonassoc', "'else'"),
+])
+
+parser = lalr.build_parser(GRAMMAR)
+
+# Directives and keywords the lexer reads as identifiers; matched in any case
+DIRECTIVES = ('forward', 'label', 'uses', 'with')
+
+
+class Parser(lalr.Actions):
+    # Actions building the AST nodes; a token's value is its text, and runs
+    # of tokens are sliced from the stream by their span
+    invalid_message = "Invalid character"
+
+    def __init__(self, tokens, errors=None):
+        self.tokens = tokens
+        self.errors = errors if errors is not None else diagnostics.Diagnostics()
+
+    def terminals(self):
+        # (terminal, text) pairs of the tokens. Keywords not written in
+        # lowercase are looked up, and passed to the actions, in lowercase
+        columns = parser.stream_columns(self.tokens)
+        identifier = parser.column('IDENTIFIER')
+        directives = {name: parser.column(f"'{name}'") for name in DIRECTIVES}
+        value = self.tokens.value
+        for index, column in enumerate(columns):
+            text = value(index)
+            if column == identifier:
+                column = directives.get(text.lower(), column)
+            elif column == lalr.INVALID and text.lower() in KEYWORDS:
+                text = text.lower()
+                column = parser.terminal('KEYWORD', text)
+            yield column, text
+
+    def parse_program(self):
+        return parser.parse(self.terminals(), self, self.errors)
+
+    def location(self, position):
+        if position >= len(self.tokens):
+            return None, None
+        return self.tokens.location(position)
+
+    # Lists
+
+    def empty_list(self, start, end, *symbols):
+        return []
+
+    def first(self, start, end, item):
+        return [item] if item is not None else []
+
+    def append(self, start, end, items, item):
+        if item is not None:
+            items.append(item)
+        return items
+
+    def append_separated(self, start, end, items, separator, item):
+        return self.append(start, end, items, item)
+
+    def extend(self, start, end, items, more):
+        items.extend(more)
+        return items
+
+    def second(self, start, end, first, second):
+        return second
+
+    def token_run(self, start, end, *symbols):
+        # The tokens of the span, without the invalid ones already reported
+        return [token for token in self.tokens[start:end] if token[0] != 'UNKNOWN']
+
+    # Declarations
+
+    def program(self, start, end, name, declarations, body, dot):
+        return ('PROGRAM', name, declarations, body)
+
+    def heading(self, start, end, keyword, name, *rest):
+        return name
+
+    def section(self, start, end, keyword, declarations):
+        return declarations
+
+    def var(self, start, end, names, colon, var_type, semicolon=None):
+        return ('VAR', names, var_type)
+
+    def untyped_parameter(self, start, end, names):
+        return ('VAR', names, [])
+
+    def reference_parameter(self, start, end, keyword, parameter):
+        return ('VAR', parameter[1], parameter[2], 'var')
+
+    def const(self, start, end, name, equals, value, semicolon):
+        return ('CONST', name, value)
+
+    def typed_const(self, start, end, name, colon, const_type, equals, value, semicolon):
+        return ('CONST', name, value)
+
+    def type_declaration(self, start, end, name, equals, declared_type, semicolon):
+        return ('TYPE', name, declared_type)
+
+    def routine_head(self, start, end, kind, name, parameters, result):
+        return kind, name, parameters, result
+
+    def parameters(self, start, end, open_paren, parameters, *rest):
+        return parameters
+
+    def forward(self, start, end, head, semicolon, directive, last_semicolon):
+        return ('ROUTINE', *head, [], None)
+
+    def routine(self, start, end, head, semicolon, declarations, body, last_semicolon):
+        return ('ROUTINE', *head, declarations, body)
+
+    # Statements
+
+    def block(self, start, end, begin, statements, end_keyword):
+        return ('BLOCK', statements)
+
+    def for_statement(self, start, end, keyword, variable, assign, first, direction, last, do, body):
+        return ('FOR', variable, first, direction, last, body)
+
+    def while_statement(self, start, end, keyword, condition, do, body):
+        return ('WHILE', condition, body)
+
+    def repeat_statement(self, start, end, keyword, statements, until, condition):
+        return ('REPEAT', statements, condition)
+
+    def if_statement(self, start, end, keyword, condition, then, then_branch):
+        return ('IF', condition, then_branch, None)
+
+    def if_else_statement(self, start, end, keyword, condition, then, then_branch, else_keyword, else_branch):
+        return ('IF', condition, then_branch, else_branch)
+
+    def case_statement(self, start, end, keyword, selector, of, branches, end_keyword):
+        return ('CASE', selector, *branches)
+
+    def with_statement(self, start, end, keyword, records, do, body):
+        return ('WITH', records, body)
+
+    def assignment(self, start, end, target, assign, value):
+        return ('ASSIGN', target, value)
+
+    def call(self, start, end, values):
+        return ('STATEMENT', values)
+
+    def no_branches(self, start, end):
+        return [], None
+
+    def branches(self, start, end, branch_list, *rest):
+        # branch_list [';'] ['else' statements]
+        return branch_list, rest[-1] if len(rest) > 1 else None
+
+    def else_branches(self, start, end, else_keyword, statements):
+        return [], statements
+
+    def branches_after_semicolon(self, start, end, branch_list, semicolon, else_keyword, statements):
+        return branch_list, statements
+
+    def branch(self, start, end, labels, colon, statement):
+        return (labels, statement)
+
+
+def statements_of(node):
+    # Statements directly nested in a statement node
+    kind = node[0]
+    if kind == 'BLOCK':
+        return node[1]
+    if kind == 'FOR':
+        return [node[5]]
+    if kind in ('WHILE', 'WITH'):
+        return [node[2]]
+    if kind == 'REPEAT':
+        return node[1]
+    if kind == 'IF':
+        return [node[2], node[3]]
+    if kind == 'CASE':
+        return [statement for _, statement in node[2]] + (node[3] or [])
+    return []
+
+def count_nodes(node):
+    # Number of AST nodes, declarations and nested statements included
+    if node is None:
+        return 0
+    kind = node[0]
+    if kind == 'PROGRAM':
+        return 1 + sum(count_nodes(declaration) for declaration in node[2]) + count_nodes(node[3])
+    if kind == 'ROUTINE':
+        return (1 + len(node[3]) + sum(count_nodes(declaration) for declaration in node[5])
+                + count_nodes(node[6]))
+    return 1 + sum(count_nodes(statement) for statement in statements_of(node))
+
+@trace.traced('parse', 'ast_nodes', count_nodes)
+def parse(tokens, errors=None):
+    # All the syntax errors are raised together at the end
+    parser = Parser(tokens, errors)
+    ast = parser.parse_program()
+    parser.errors.check()
+    return ast
+
+# Step 3: Semantic Analysis
+#
+# Walks the AST with one scope per routine. Errors are printed and returned;
+# code generation still runs, as before
+
+def declare(scope, name, kind, errors, where):
+    key = name.lower()
+    if key in scope:
+        errors.append(f'Duplicate declaration of "{name}" in {where}')
+    scope[key] = kind
+
+def declare_all(scope, declarations, errors, where):
+    for declaration in declarations:
+        kind = declaration[0]
+        if kind == 'VAR':
+            for name in declaration[1]:
+                declare(scope, name, 'variable', errors, where)
+        elif kind == 'CONST':
+            declare(scope, declaration[1], 'constant', errors, where)
+        elif kind == 'TYPE':
+            declare(scope, declaration[1], 'type', errors, where)
+        elif kind == 'ROUTINE':
+            # A forward declaration and its definition share one name
+            scope.setdefault(declaration[2].lower(), 'routine')
+
+def lookup(scopes, name):
+    # Kind of the innermost declaration of name, or None
+    key = name.lower()
+    for scope in reversed(scopes):
+        if key in scope:
+            return scope[key]
+    return None
+
+def check_bound(scopes, bound, errors, where):
+    # Bounds that are a single number or name are checked; the others are
+    # expressions left to the code generator
+    if len(bound) != 1:
+        return
+    token_type, value = bound[0]
+    if token_type == 'NUMBER' and not value.isdigit():
+        errors.append(f'Invalid loop bound "{value}" in {where}: not an integer')
+    elif token_type == 'IDENTIFIER' and lookup(scopes, value) not in ('variable', 'constant'):
+        errors.append(f'Loop bound "{value}" in {where} is not a declared variable or constant')
+
+def check_statement(node, scopes, loop_variables, errors, where):
+    if node is None:
+        return
+    kind = node[0]
+    if kind == 'FOR':
+        _, variable, start, direction, end, body = node
+        if lookup(scopes, variable) != 'variable':
+            errors.append(f'Loop variable "{variable}" in {where} is not a declared variable')
+        check_bound(scopes, start, errors, where)
+        check_bound(scopes, end, errors, where)
+        check_statement(body, scopes, loop_variables | {variable.lower()}, errors, where)
+        return
+    if kind == 'ASSIGN' and len(node[1]) == 1:
+        name = node[1][0][1]
+        if name.lower() in loop_variables:
+            errors.append(f'Assignment to loop variable "{name}" in {where}')
+        elif lookup(scopes, name) == 'constant':
+            errors.append(f'Assignment to constant "{name}" in {where}')
+    for statement in statements_of(node):
+        check_statement(statement, scopes, loop_variables, errors, where)
+
+def check_routine(declarations, body, scopes, errors, where):
+    for declaration in declarations:
+        if declaration[0] == 'ROUTINE' and declaration[6] is not None:
+            _, kind, name, parameters, _, routine_declarations, routine_body = declaration
+            scope = {}
+            # A function returns its value by assigning to its name
+            if kind == 'function':
+                scope[name.lower()] = 'variable'
+            routine_where = f'{kind} {name}'
+            declare_all(scope, parameters, errors, routine_where)
+            declare_all(scope, routine_declarations, errors, routine_where)
+            check_routine(routine_declarations, routine_body, scopes + [scope], errors, routine_where)
+    check_statement(body, scopes, frozenset(), errors, where)
+
+@trace.traced('semantic')
+def semantic_analysis(ast):
+    _, name, declarations, body = ast
+    errors = []
+    where = f'program {name}' if name else 'the program'
+    scope = {}
+    declare_all(scope, declarations, errors, where)
+    check_routine(declarations, body, [scope], errors, where)
+    for error in errors:
+        print(f'Error: {error}')
+    return errors
+
+
+# Step 4: Intermediate Code Generation
+#
+# The program body is the code before the first FUNCTION, so the variables
+# it declares are the globals (see compilers/vm.py); it sets each of them to
+# 0 first, as Pascal does. Routines follow as FUNCTIONs, a nested routine
+# after the one declaring it and named outer.inner; a local that has the
+# name of a global is renamed routine.name the same way. Names are
+# lowercase, since Pascal does not tell case apart.
+#
+# For loops and assignments of a single number or name are register code;
+# other expressions, conditions and calls are stack code, which the
+# optimizer and the machine take in the same function. Constants with a
+# literal value are substituted where they are used, the others are stored
+# once at the start of their scope. Arrays with constant bounds are
+# zero-filled arrays indexed from their lower bound.
+#
+# Statements with no IR form, such as with, record and pointer access, calls
+# to undeclared routines and field widths in write, are reported as errors
+# (see compilers/diagnostics.py) and raised together at the end.
+
+# Operators by precedence level, loosest first
+RELATIONS = {'=': '==', '<>': '!=', '<': '<', '<=': '<=', '>': '>', '>=': '>='}
+ADDING_OPERATORS = {'+': ir.ADD, '-': ir.SUB, 'or': ir.BIT_OR}
+MULTIPLYING_OPERATORS = {'*': ir.MUL, '/': ir.DIV, 'div': ir.DIV, 'mod': ir.MOD, 'and': ir.BIT_AND}
+
+BOOLEANS = {'true': 1, 'false': 0}
+
+# Standard functions lowered to stack code on their argument
+STANDARD_FUNCTIONS = {
+    'sqr': [(ir.DUP,), (ir.MUL,)],
+    'odd': [(ir.PUSH, 2), (ir.MOD,), (ir.PUSH, 0), (ir.COMPARE, '!=')],
+    'succ': [(ir.PUSH, 1), (ir.ADD,)],
+    'pred': [(ir.PUSH, 1), (ir.SUB,)],
+}
+
+# What a variable, parameter or function result can be read and assigned as
+ASSIGNABLE = ('variable', 'result')
+
+
+class Unsupported(Exception):
+    # Raised on a construct with no IR form; the statement around it is
+    # reported
+    pass
+
+
+def token_text(tokens):
+    return ' '.join(value for _, value in tokens)
+
+def number_value(value):
+    return int(value) if value.isdigit() else float(value)
+
+def string_constant(value):
+    # 'It''s' becomes "It's", with the escapes the IR strings use
+    body = value[1:-1].replace("''", "'").replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{body}"'
+
+def split_top_level(tokens, separator):
+    # Splits a token run at separators outside brackets
+    parts = [[]]
+    depth = 0
+    for token in tokens:
+        if token[0] == 'OPERATOR':
+            if token[1] in ('(', '['):
+                depth += 1
+            elif token[1] in (')', ']'):
+                depth -= 1
+            elif token[1] == separator and depth == 0:
+                parts.append([])
+                continue
+        parts[-1].append(token)
+    return parts
+
+def closing_index(tokens, index):
+    # Index of the bracket closing the one at index, or len(tokens)
+    depth = 0
+    for position in range(index, len(tokens)):
+        token = tokens[position]
+        if token[0] == 'OPERATOR' and token[1] in ('(', '['):
+            depth += 1
+        elif token[0] == 'OPERATOR' and token[1] in (')', ']'):
+            depth -= 1
+            if depth == 0:
+                return position
+    return len(tokens)
+
+def split_call(tokens):
+    # (name, argument token runs) of name or name(arguments); the arguments
+    # are None without brackets
+    if not tokens or tokens[0][0] != 'IDENTIFIER':
+        raise Unsupported
+    if len(tokens) == 1:
+        return tokens[0][1], None
+    if tokens[1] != ('OPERATOR', '(') or closing_index(tokens, 1) != len(tokens) - 1:
+        raise Unsupported
+    arguments = tokens[2:-1]
+    return tokens[0][1], split_top_level(arguments, ',') if arguments else []
+
+def node_text(node):
+    # Source of a statement, or of its head when it has a body, for errors
+    kind = node[0]
+    if kind == 'ASSIGN':
+        return token_text(node[1] + [('OPERATOR', ':=')] + node[2])
+    if kind == 'STATEMENT':
+        return token_text(node[1])
+    if kind == 'FOR':
+        _, variable, start, direction, end, _ = node
+        return f'for {variable} := {token_text(start)} {direction} {token_text(end)}'
+    if kind == 'REPEAT':
+        return f'until {token_text(node[2])}'
+    return f'{kind.lower()} {token_text(node[1])}'
+
+def load_operand(program, operand, register):
+    # Numbers go into the register code as constants, variables as names
+    if isinstance(operand, str):
+        program.emit(ir.MOVE, operand, register)
+    else:
+        program.emit(ir.LOAD_CONSTANT, operand, register)
+
+
+class CodeGenerator:
+    # Walks the AST once, emitting into one ir.Program. Errors are reported
+    # to errors
+    def __init__(self, errors=None):
+        self.errors = errors if errors is not None else diagnostics.Diagnostics()
+        self.program = ir.Program()
+        # One dict per scope, the globals first: lowercase name -> (kind, IR
+        # name, detail). kind is 'variable', 'result' (of the function being
+        # generated, detail the function's IR name), 'array' (detail the
+        # lower bounds), 'constant' (detail the value, or None when it is
+        # stored), 'routine' or 'type' (detail its tokens)
+        self.scopes = [{}]
+        # (IR name, ROUTINE node, scopes) of each routine with a body
+        self.routines = []
+        # IR names of the routine being generated and of its result, None in
+        # the program body and in procedures
+        self.routine = None
+        self.result = None
+        # [continue label, break label] of each loop around the statement,
+        # made when first jumped to
+        self.loops = []
+        # Label exit jumps to in the program body, made the same way
+        self.exit_label = None
+        # Expression being lowered and the position in it
+        self.tokens = []
+        self.index = 0
+
+    def generate(self, ast):
+        self.declare(ast[2])
+        self.statement(ast[3])
+        if self.exit_label is not None:
+            self.program.label(self.exit_label)
+        # Generating a routine adds the routines nested in it
+        for name, node, scopes in self.routines:
+            self.generate_routine(name, node, scopes)
+        return self.program
+
+    def generate_routine(self, name, node, scopes):
+        _, kind, _, parameters, _, declarations, body = node
+        self.scopes = scopes + [{}]
+        self.routine = name
+        self.result = None
+        self.loops = []
+        scope = self.scopes[-1]
+        names = []
+        for parameter in parameters:
+            if len(parameter) > 3:
+                self.errors.error('Unsupported var parameter of', None, None, f'{kind} {node[2]}')
+            for parameter_name in parameter[1]:
+                names.append(self.local_name(parameter_name))
+                scope[parameter_name.lower()] = ('variable', names[-1], None)
+        if kind == 'function':
+            # The result is assigned to the function's name or to Result
+            self.result = self.local_name('result')
+            scope['result'] = scope[node[2].lower()] = ('result', self.result, name)
+        self.program.emit(ir.FUNCTION, name, *names)
+        self.declare(declarations)
+        self.statement(body)
+        self.leave()
+
+    def leave(self):
+        # Returns from the routine being generated
+        if self.result is not None:
+            self.program.emit(ir.LOAD, self.result)
+        else:
+            self.program.emit(ir.PUSH, 0)
+        self.program.emit(ir.RETURN)
+
+    # Declarations
+
+    def local_name(self, name):
+        key = name.lower()
+        if self.routine is not None and key in self.scopes[0]:
+            return f'{self.routine}.{key}'
+        return key
+
+    def declare(self, declarations):
+        # Enters the declarations in the innermost scope, emitting what they
+        # need at the start of its code
+        scope = self.scopes[-1]
+        for declaration in declarations:
+            kind, name = declaration[0], declaration[1]
+            try:
+                if kind == 'TYPE':
+                    scope[name.lower()] = ('type', None, declaration[2])
+                elif kind == 'CONST':
+                    self.declare_constant(scope, name, declaration[2])
+                elif kind == 'VAR':
+                    for variable in name:
+                        self.declare_variable(scope, variable, declaration[2])
+                elif kind == 'ROUTINE':
+                    self.declare_routine(scope, declaration)
+            except Unsupported:
+                name = declaration[2] if kind == 'ROUTINE' else name
+                self.errors.error('Unsupported declaration of', None, None,
+                                  ', '.join(name) if isinstance(name, list) else name)
+
+    def declare_constant(self, scope, name, value):
+        known = self.constant_value(value)
+        scope[name.lower()] = ('constant', self.local_name(name), known)
+        if known is None:
+            self.expression(value)
+            self.program.emit(ir.STORE, scope[name.lower()][1])
+
+    def declare_variable(self, scope, name, variable_type):
+        ir_name = self.local_name(name)
+        bounds = self.array_bounds(variable_type)
+        if bounds:
+            scope[name.lower()] = ('array', ir_name, [low for low, _ in bounds])
+            for low, high in bounds:
+                self.program.emit(ir.PUSH, high - low + 1)
+            self.program.emit(ir.NEW_ARRAY, len(bounds))
+            self.program.emit(ir.STORE, ir_name)
+            return
+        scope[name.lower()] = ('variable', ir_name, None)
+        if self.routine is None:
+            self.program.emit(ir.LOAD_CONSTANT, 0, ir_name)
+
+    def declare_routine(self, scope, node):
+        key = node[2].lower()
+        name = key if self.routine is None else f'{self.routine}.{key}'
+        # A forward declaration and its definition share one name
+        scope.setdefault(key, ('routine', name, None))
+        if node[6] is not None:
+            self.routines.append((name, node, list(self.scopes)))
+
+    def array_bounds(self, variable_type):
+        # (low, high) of each dimension of an array type, [] for other types
+        while len(variable_type) == 1 and variable_type[0][0] == 'IDENTIFIER':
+            entry = self.resolve(variable_type[0][1])
+            if entry is None or entry[0] != 'type':
                 break
+            variable_type = entry[2]
+        bounds = []
+        while variable_type and variable_type[0][1].lower() == 'array':
+            if len(variable_type) < 2 or variable_type[1] != ('OPERATOR', '['):
+                raise Unsupported
+            close = closing_index(variable_type, 1)
+            for dimension in split_top_level(variable_type[2:close], ','):
+                limits = split_top_level(dimension, '..')
+                if len(limits) != 2:
+                    raise Unsupported
+                low, high = (self.constant_value(limit) for limit in limits)
+                if not isinstance(low, int) or not isinstance(high, int) or high < low:
+                    raise Unsupported
+                bounds.append((low, high))
+            if close + 1 >= len(variable_type) or variable_type[close + 1][1].lower() != 'of':
+                raise Unsupported
+            variable_type = variable_type[close + 2:]
+        return bounds
+
+    def constant_value(self, tokens):
+        # Value of a signed number or of a constant with a known value, else
+        # None
+        sign = 1
+        if len(tokens) == 2 and tokens[0] in (('OPERATOR', '-'), ('OPERATOR', '+')):
+            sign = -1 if tokens[0][1] == '-' else 1
+            tokens = tokens[1:]
+        if len(tokens) != 1:
+            return None
+        token_type, value = tokens[0]
+        if token_type == 'NUMBER':
+            return sign * number_value(value)
+        if token_type == 'IDENTIFIER':
+            entry = self.resolve(value)
+            if entry is not None and entry[0] == 'constant' and entry[2] is not None:
+                return sign * entry[2]
+        return None
+
+    def resolve(self, name, call=False):
+        # Entry of the innermost declaration of name, or None. Variables of
+        # an enclosing routine live in its frame, out of reach of the nested
+        # routine's FUNCTION
+        key = name.lower()
+        innermost = len(self.scopes) - 1
+        for depth in range(innermost, -1, -1):
+            entry = self.scopes[depth].get(key)
+            if entry is None:
+                continue
+            if call and entry[0] == 'result':
+                return ('routine', entry[2], None)
+            if 0 < depth < innermost and (entry[0] in ASSIGNABLE + ('array',) or
+                                          entry[0] == 'constant' and entry[2] is None):
+                raise Unsupported
+            return entry
+        return None
+
+    # Statements
+
+    def statement(self, node):
+        if node is None:
+            return
+        kind = node[0]
+        try:
+            if kind == 'BLOCK':
+                for statement in node[1]:
+                    self.statement(statement)
+            elif kind == 'FOR':
+                self.for_statement(node)
+            elif kind == 'WHILE':
+                self.while_statement(node)
+            elif kind == 'REPEAT':
+                self.repeat_statement(node)
+            elif kind == 'IF':
+                self.if_statement(node)
+            elif kind == 'CASE':
+                self.case_statement(node)
+            elif kind == 'ASSIGN':
+                self.assign(node[1], node[2])
+            elif kind == 'STATEMENT':
+                self.call_statement(node[1])
+            else:
+                # Records, and so with, have no IR form
+                raise Unsupported
+        except Unsupported:
+            self.errors.error('Unsupported statement', None, None, node_text(node))
+
+    def for_statement(self, node):
+        _, variable, start, direction, end, body = node
+        variable = self.variable(variable)
+        start_label = self.program.new_label('LOOP_START')
+        end_label = self.program.new_label('END_LOOP')
+        end_register = self.program.new_temporary('endValue')
+        self.program.comment('Start of loop')
+        # Initial and final values are loaded once, before the test
+        self.load(start, variable)
+        self.load(end, end_register)
+        self.program.label(start_label)
+        self.program.emit(ir.COMPARE, variable, end_register)
+        # 'to' runs while the variable is at most the final value
+        self.program.emit(ir.JUMP_IF_GREATER if direction == 'to' else ir.JUMP_IF_LESS, end_label)
+        self.program.comment('Loop body goes here')
+        continue_label = self.loop_body(body, None, end_label)
+        self.program.comment('End of loop')
+        if continue_label is not None:
+            self.program.label(continue_label)
+        self.program.emit(ir.INCREMENT if direction == 'to' else ir.DECREMENT, variable)
+        self.program.emit(ir.JUMP, start_label)
+        self.program.label(end_label)
+
+    def while_statement(self, node):
+        start_label = self.program.new_label('LOOP_START')
+        end_label = self.program.new_label('END_LOOP')
+        self.program.label(start_label)
+        self.expression(node[1])
+        self.program.emit(ir.JUMP_IF_FALSE, end_label)
+        self.loop_body(node[2], start_label, end_label)
+        self.program.emit(ir.JUMP, start_label)
+        self.program.label(end_label)
+
+    def repeat_statement(self, node):
+        start_label = self.program.new_label('LOOP_START')
+        self.program.label(start_label)
+        self.loops.append([None, None])
+        for statement in node[1]:
+            self.statement(statement)
+        continue_label, end_label = self.loops.pop()
+        if continue_label is not None:
+            self.program.label(continue_label)
+        # The loop runs until the condition holds
+        self.expression(node[2])
+        self.program.emit(ir.JUMP_IF_FALSE, start_label)
+        if end_label is not None:
+            self.program.label(end_label)
+
+    def loop_body(self, body, continue_label, end_label):
+        # Generates body with the loop's jump targets; returns the continue
+        # label if one had to be made
+        self.loops.append([continue_label, end_label])
+        self.statement(body)
+        return self.loops.pop()[0]
+
+    def loop_target(self, kind):
+        # Label of the innermost loop that break (1) or continue (0) jumps to
+        if not self.loops:
+            raise Unsupported
+        targets = self.loops[-1]
+        if targets[kind] is None:
+            targets[kind] = self.program.new_label('END_LOOP' if kind else 'LOOP_CONTINUE')
+        return targets[kind]
+
+    def if_statement(self, node):
+        _, condition, then_branch, else_branch = node
+        false_label = self.program.new_label('IF_FALSE')
+        self.expression(condition)
+        self.program.emit(ir.JUMP_IF_FALSE, false_label)
+        self.statement(then_branch)
+        if else_branch is None:
+            self.program.label(false_label)
+            return
+        end_label = self.program.new_label('IF_END')
+        self.program.emit(ir.JUMP, end_label)
+        self.program.label(false_label)
+        self.statement(else_branch)
+        self.program.label(end_label)
+
+    def case_statement(self, node):
+        # The selector is stored once and tested against each label in turn
+        _, selector, branches, else_statements = node
+        value = self.program.new_temporary('caseValue')
+        self.expression(selector)
+        self.program.emit(ir.STORE, value)
+        branch_labels = []
+        for labels, _ in branches:
+            branch_labels.append(self.program.new_label('CASE'))
+            for label in split_top_level(labels, ','):
+                limits = split_top_level(label, '..')
+                if len(limits) > 2:
+                    raise Unsupported
+                self.program.emit(ir.LOAD, value)
+                self.expression(limits[0])
+                if len(limits) == 1:
+                    self.program.emit(ir.COMPARE, '==')
+                else:
+                    self.program.emit(ir.COMPARE, '>=')
+                    self.program.emit(ir.LOAD, value)
+                    self.expression(limits[1])
+                    self.program.emit(ir.COMPARE, '<=')
+                    self.program.emit(ir.BIT_AND)
+                self.program.emit(ir.JUMP_IF_TRUE, branch_labels[-1])
+        else_label = self.program.new_label('CASE_ELSE') if else_statements else None
+        end_label = self.program.new_label('CASE_END')
+        self.program.emit(ir.JUMP, else_label or end_label)
+        for label, (_, statement) in zip(branch_labels, branches):
+            self.program.label(label)
+            self.statement(statement)
+            self.program.emit(ir.JUMP, end_label)
+        if else_label is not None:
+            self.program.label(else_label)
+            for statement in else_statements:
+                self.statement(statement)
+        self.program.label(end_label)
+
+    def call_statement(self, values):
+        # A procedure call, declared or standard
+        name, arguments = split_call(values)
+        key = name.lower()
+        entry = self.resolve(key, call=True)
+        if entry is not None:
+            if entry[0] != 'routine':
+                raise Unsupported
+            for argument in arguments or []:
+                self.expression(argument)
+            self.program.emit(ir.CALL, entry[1], len(arguments or []))
+            self.program.emit(ir.POP)
+        elif key in ('write', 'writeln'):
+            for argument in arguments or []:
+                if len(split_top_level(argument, ':')) > 1:
+                    # Field widths have no IR form
+                    raise Unsupported
+                self.expression(argument)
+                self.program.emit(ir.PRINT)
+            if key == 'writeln':
+                self.program.emit(ir.PUSH, '"\\n"')
+                self.program.emit(ir.PRINT)
+        elif key in ('read', 'readln'):
+            # Each variable takes the next input value; the rest of the
+            # line readln skips has no IR form
+            for argument in arguments or []:
+                self.store(argument, lambda: self.program.emit(ir.CALL, 'read', 0))
+        elif key in ('inc', 'dec'):
+            if not arguments or len(arguments) > 2:
+                raise Unsupported
+            target = arguments[0]
+            if len(arguments) == 1 and len(target) == 1:
+                self.program.emit(ir.INCREMENT if key == 'inc' else ir.DECREMENT, self.variable(target[0][1]))
+                return
+            amount = arguments[1] if len(arguments) == 2 else [('NUMBER', '1')]
+            operator = ('OPERATOR', '+' if key == 'inc' else '-')
+            self.assign(target, target + [operator, ('OPERATOR', '(')] + amount + [('OPERATOR', ')')])
+        elif key in ('break', 'continue') and arguments is None:
+            self.program.emit(ir.JUMP, self.loop_target(1 if key == 'break' else 0))
+        elif key == 'exit':
+            self.exit(arguments)
         else:
-            print(tokens[i])
-            i += 1
+            raise Unsupported
 
-# Step 3: Semantic Analysis
-def semantic_analysis(tokens):
-    i = 0
-    n = len(tokens)
-    while i < n:
-        if tokens[i][1] == 'for':
-            # Expecting a loop construct: for <identifier> := <number> to <number> do
-            if (
-                tokens[i+1][0] == 'IDENTIFIER' and
-                tokens[i+2][1] == ':=' and
-                tokens[i+3][0] == 'NUMBER' and
-                tokens[i+4][1] == 'to' and
-                tokens[i+5][0] == 'NUMBER' and
-                tokens[i+6][1] == 'do'
-            ):
-                loop_variable = tokens[i+1][1]
-                start_value = tokens[i+3][1]
-                end_value = tokens[i+5][1]
-                # Check if loop variable is valid
-                if not loop_variable.isalpha():
-                    print(f'Error: Invalid loop variable "{loop_variable}"')
-                    break
-                # Check if start and end values are integers
-                if not start_value.isdigit():
-                    print(f'Error: Invalid start value "{start_value}"')
-                    break
-                if not end_value.isdigit():
-                    print(f'Error: Invalid end value "{end_value}"')
-                    break
-                i += 7  # Skip the loop construct
-                # Perform semantic analysis on loop body (tokens until 'end')
-                while i < n and tokens[i][1] != 'end':
-                    # Here, you can add more semantic checks as needed
-                    i += 1
+    def exit(self, arguments):
+        if arguments:
+            # exit(value) sets the result of a function first
+            if len(arguments) != 1 or self.result is None:
+                raise Unsupported
+            self.load(arguments[0], self.result)
+        if self.routine is not None:
+            self.leave()
+            return
+        if self.exit_label is None:
+            self.exit_label = self.program.new_label('PROGRAM_END')
+        self.program.emit(ir.JUMP, self.exit_label)
+
+    def variable(self, name):
+        # IR name of a variable that can be read and assigned as a register
+        entry = self.resolve(name)
+        if entry is None or entry[0] not in ASSIGNABLE:
+            raise Unsupported
+        return entry[1]
+
+    def operand(self, tokens):
+        # Register code operand of a single number or variable, else None
+        value = self.constant_value(tokens)
+        if value is not None:
+            return value
+        if len(tokens) == 1 and tokens[0][0] == 'IDENTIFIER':
+            entry = self.resolve(tokens[0][1])
+            if entry is not None and (entry[0] in ASSIGNABLE or entry[0] == 'constant'):
+                return entry[1]
+        return None
+
+    def load(self, tokens, register):
+        # Sets register to the value of an expression
+        operand = self.operand(tokens)
+        if operand is not None:
+            load_operand(self.program, operand, register)
+        else:
+            self.expression(tokens)
+            self.program.emit(ir.STORE, register)
+
+    def assign(self, target, value):
+        if len(target) == 1 and target[0][0] == 'IDENTIFIER':
+            self.load(value, self.variable(target[0][1]))
+        else:
+            self.store(target, lambda: self.expression(value))
+
+    def store(self, target, emit_value):
+        # Stores the value emit_value pushes into a variable or an array
+        # element
+        if len(target) == 1 and target[0][0] == 'IDENTIFIER':
+            emit_value()
+            self.program.emit(ir.STORE, self.variable(target[0][1]))
+            return
+        entry = self.resolve(target[0][1]) if target[0][0] == 'IDENTIFIER' else None
+        if entry is None or entry[0] != 'array':
+            raise Unsupported
+        self.begin(target)
+        self.index = 1
+        self.element(entry, store=True)
+        self.end()
+        emit_value()
+        self.program.emit(ir.STORE_INDEX)
+
+    # Expressions, as stack code pushing their value
+
+    def expression(self, tokens):
+        self.begin(tokens)
+        self.relation()
+        self.end()
+
+    def begin(self, tokens):
+        self.tokens = tokens
+        self.index = 0
+
+    def end(self):
+        if self.index != len(self.tokens):
+            raise Unsupported
+
+    def peek(self):
+        # Text of the next operator or keyword, else None
+        if self.index < len(self.tokens) and self.tokens[self.index][0] in ('OPERATOR', 'KEYWORD'):
+            return self.tokens[self.index][1].lower()
+        return None
+
+    def next(self):
+        if self.index >= len(self.tokens):
+            raise Unsupported
+        self.index += 1
+        return self.tokens[self.index - 1]
+
+    def expect(self, value):
+        if self.peek() != value:
+            raise Unsupported
+        self.index += 1
+
+    def relation(self):
+        self.simple_expression()
+        operator = self.peek()
+        if operator in RELATIONS:
+            self.index += 1
+            self.simple_expression()
+            self.program.emit(ir.COMPARE, RELATIONS[operator])
+
+    def simple_expression(self):
+        self.term()
+        while self.peek() in ADDING_OPERATORS:
+            operator = self.next()[1].lower()
+            self.term()
+            self.program.emit(ADDING_OPERATORS[operator])
+
+    def term(self):
+        self.factor()
+        while self.peek() in MULTIPLYING_OPERATORS:
+            operator = self.next()[1].lower()
+            if operator == '/':
+                # / always divides as reals
+                self.program.emit(ir.PUSH, 1.0)
+                self.program.emit(ir.MUL)
+            self.factor()
+            self.program.emit(MULTIPLYING_OPERATORS[operator])
+
+    def factor(self):
+        token_type, value = self.next()
+        if token_type == 'NUMBER':
+            self.program.emit(ir.PUSH, number_value(value))
+        elif token_type == 'STRING':
+            self.program.emit(ir.PUSH, string_constant(value))
+        elif token_type == 'IDENTIFIER':
+            self.name(value)
+        elif value == '(':
+            self.relation()
+            self.expect(')')
+        elif value.lower() == 'not':
+            self.factor()
+            self.program.emit(ir.NOT)
+        elif value in ('-', '+'):
+            self.factor()
+            if value == '-':
+                self.program.emit(ir.NEG)
+        else:
+            raise Unsupported
+
+    def name(self, name):
+        key = name.lower()
+        if self.peek() == '(':
+            entry = self.resolve(key, call=True)
+            if entry is not None and entry[0] != 'routine':
+                raise Unsupported
+            self.index += 1
+            count = 0
+            while self.peek() != ')':
+                if count:
+                    self.expect(',')
+                self.relation()
+                count += 1
+            self.index += 1
+            if entry is not None:
+                self.program.emit(ir.CALL, entry[1], count)
+            elif key in STANDARD_FUNCTIONS and count == 1:
+                for instruction in STANDARD_FUNCTIONS[key]:
+                    self.program.emit(*instruction)
             else:
-                # print(f'Error: Invalid loop construct')
-                break
+                raise Unsupported
+            return
+        entry = self.resolve(key)
+        if entry is None:
+            if key not in BOOLEANS:
+                raise Unsupported
+            self.program.emit(ir.PUSH, BOOLEANS[key])
+        elif entry[0] == 'routine':
+            self.program.emit(ir.CALL, entry[1], 0)
+        elif entry[0] == 'constant' and entry[2] is not None:
+            self.program.emit(ir.PUSH, entry[2])
+        elif entry[0] == 'array':
+            self.element(entry, store=False)
+        elif entry[0] == 'type':
+            raise Unsupported
         else:
-            i += 1
+            self.program.emit(ir.LOAD, entry[1])
 
+    def element(self, entry, store):
+        # Pushes the array and the indexes after its name, counted from the
+        # lower bounds; the last index is left for STORE_INDEX when storing
+        lows = entry[2]
+        self.program.emit(ir.LOAD, entry[1])
+        dimension = 0
+        while self.peek() == '[':
+            self.index += 1
+            while True:
+                if dimension == len(lows):
+                    raise Unsupported
+                if dimension:
+                    self.program.emit(ir.INDEX)
+                self.relation()
+                if lows[dimension]:
+                    self.program.emit(ir.PUSH, lows[dimension])
+                    self.program.emit(ir.SUB)
+                dimension += 1
+                if self.peek() != ',':
+                    break
+                self.index += 1
+            self.expect(']')
+        # Whole arrays are not copied or passed
+        if dimension == 0:
+            raise Unsupported
+        if not store:
+            self.program.emit(ir.INDEX)
 
-# Step 4: Intermediate Code Generation
-def generate_intermediate_code(tokens):
-    intermediate_code = []
-    # Generate intermediate code based on the tokens
-    for token_type, token_value in tokens:
-        if token_type == 'KEYWORD' and token_value == 'for':
-            # Start of loop
-            intermediate_code.append('// Start of loop')
-            intermediate_code.append('LOOP_START:')
-            # Load initial value of loop variable into a register
-            intermediate_code.append(f'    LOAD_CONSTANT {tokens[2][1]}, {tokens[0][1]}')
-            # Load end value of loop into a register
-            intermediate_code.append(f'    LOAD_CONSTANT {tokens[4][1]}, endValue')
-            # Comparison to check if loop should continue
-            intermediate_code.append('    COMPARE i, endValue')
-            # Jump to end of loop if end condition is met
-            intermediate_code.append('    JUMP_IF_GREATER_EQUAL END_LOOP')
-            # Loop body
-            intermediate_code.append('    // Loop body goes here')
-        elif token_type == 'KEYWORD' and token_value == 'end':
-            # End of loop
-            intermediate_code.append('// End of loop')
-            intermediate_code.append('    INCREMENT i')
-            intermediate_code.append('    JUMP LOOP_START')
-            intermediate_code.append('')
-            intermediate_code.append('END_LOOP:')
-    return '\n'.join(intermediate_code)
-
-# Function to measure memory usage
-def get_memory_usage():
-    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
-
-# Read Pascal code from file
-file_name = 'example.pas'
-if os.path.exists(file_name):
-    with open(file_name, 'r') as file:
+@trace.traced('ir', 'ir_instructions', len)
+def generate_intermediate_code(ast, errors=None):
+    # All the unsupported statements are raised together at the end
+    generator = CodeGenerator(errors)
+    program = generator.generate(ast)
+    generator.errors.check()
+    return program
+
+# Compile one file and write its intermediate code; used by the batch
+# driver. The tokens are parsed once into an AST that the later steps walk;
+# verbose reports its size. optimize is True, False, or a
+# passes.PassManager that collects the optimizer statistics
+def compile_file(source_path, output_path, verbose=False, cache=None, optimize=True):
+    with open(source_path, 'r') as file:
         pascal_code = file.read()
 
-    # Measure start time
-    start_time = time.time()
+    # An unchanged source is served from the compile cache without being
+    # lexed or parsed; the semantic errors are kept with the entry and
+    # printed again
+    entry = None
+    if cache is not None:
+        key = cache.key(pascal_code, 'pascal-' + passes.cache_tag(optimize))
+        entry = cache.get(key)
+
+    if entry is not None:
+        sys.stdout.write(entry.get('output') or '')
+        intermediate_code = entry['ir']
+    else:
+        # Tokenize the code
+        tokens = tokenize(pascal_code)
 
-    # Tokenize the code
-    tokens = tokenize(pascal_code)
+        # Parse the tokens
+        ast = parse(tokens, diagnostics.Diagnostics(source_path))
+        if verbose:
+            print(f"Parsed {count_nodes(ast)} AST nodes")
 
-    # Parse the tokens
-    parse(tokens)
+        # Perform semantic analysis
+        errors = semantic_analysis(ast)
 
-    # Perform semantic analysis
-    semantic_analysis(tokens)
+        # Generate intermediate code
+        intermediate_code = generate_intermediate_code(ast, diagnostics.Diagnostics(source_path))
 
-    # Generate intermediate code
-    intermediate_code = generate_intermediate_code(tokens)
+        # Optimize it
+        if optimize:
+            intermediate_code = passes.manager_for(optimize).run(intermediate_code)
+
+        if cache is not None:
+            cache.put(key, tokens, ast, intermediate_code,
+                      output=''.join(f'Error: {error}\n' for error in errors))
 
     # Write intermediate code to a file
-    with open('result.txt', 'w') as f:
-        f.write(intermediate_code)
+    with trace.span('write') as counters, stream.open_output(output_path) as f:
+        ir.write(intermediate_code, f)
+        counters['bytes_written'] = f.tell()
+
+    return intermediate_code
+
+def main():
+    # Read Pascal code from file
+    file_name = 'example.pas'
+    if not os.path.exists(file_name):
+        print(f"Error: File '{file_name}' not found")
+        return
+
+    # Measure start time and peak memory so far
+    start_time = time.perf_counter()
+    start_memory = measure.max_rss_kilobytes()
+
+    # -O0 writes the intermediate code as generated
+    optimizer = passes.PassManager() if "-O0" not in sys.argv else None
+    compile_file(file_name, 'result.txt', verbose=True, optimize=optimizer or False)
 
     # Measure end time
-    end_time = time.time()
+    end_time = time.perf_counter()
 
     # Calculate time taken
     time_taken = end_time - start_time
 
-    # Calculate memory consumed
-    memory_consumed = get_memory_usage()
+    # Calculate memory consumed as the growth of the peak resident set size
+    memory_consumed = measure.max_rss_kilobytes() - start_memory
 
     print("Intermediate code written to result.txt")
-    print(f"Time taken: {time_taken} seconds")
-    print(f"Memory consumed: {memory_consumed} bytes")
-else:
-    print(f"Error: File '{file_name}' not found")
+    print(f"Time taken: {time_taken:.6f} seconds")
+    print(f"Memory consumed: {memory_consumed} KB")
+    if optimizer is not None:
+        for line in optimizer.summary():
+            print(line)
+
+# Only compile when run as a script, not when imported
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import sys
+import time
+
+from rust_compiler import tokenize
+
+# The corpus generator and fit are shared with the full benchmark suite,
+# python -m compilers.benchmark
+from compilers.benchmark import generate_source, growth_exponent
+
+
+def time_tokenize(source_code, repeats=3):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        tokenize(source_code)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main():
+    # Sizes in megabytes can be given on the command line
+    if len(sys.argv) > 1:
+        sizes = [int(float(arg) * 1024 * 1024) for arg in sys.argv[1:]]
+    else:
+        sizes = [256 * 1024, 1024 * 1024, 4 * 1024 * 1024]
+
+    times = []
+    for size in sizes:
+        source_code = generate_source('rust', size)
+        elapsed = time_tokenize(source_code)
+        times.append(elapsed)
+        megabytes = len(source_code) / (1024 * 1024)
+        print(f"{megabytes:8.2f} MB  {elapsed:8.3f} seconds  {megabytes / elapsed:8.2f} MB/s")
+
+    if len(sizes) > 1:
+        print(f"Growth exponent: {growth_exponent(sizes, times):.2f} (1.00 is linear)")
+
+
+if __name__ == "__main__":
+    main()
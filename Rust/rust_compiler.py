@@ -1,6 +1,11 @@
-import re
+import os
+import sys
 import time
-import resource
+
+# Make the shared compilers package importable when run as a script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compilers import diagnostics, ir, lalr, lexgen, measure, passes, stream, trace
 
 class TokenType:
     # Define existing token types
@@ -17,129 +22,345 @@ class TokenType:
     COMMA = 'COMMA'
     # Define new token type for function
     FN = 'FN'
+    # Characters no rule matches
+    ERROR = 'ERROR'
 
 # Update token definitions to include 'fn' keyword
 token_defs = [
-    # Updated token definition for function
-    (TokenType.FN, r'\bfn\b'), # Using \b to match word boundary to ensure it's a whole word
     # Existing token definitions
-    (TokenType.FOR, r'for'),
     (TokenType.IDENTIFIER, r'[a-zA-Z_][a-zA-Z0-9_]*'),
     (TokenType.OPEN_PAREN, r'\('),
     (TokenType.CLOSE_PAREN, r'\)'),
     (TokenType.OPEN_BRACE, r'\{'),
     (TokenType.CLOSE_BRACE, r'\}'),
     (TokenType.SEMICOLON, r';'),
-    (TokenType.RANGE, r'\d+\.\.\d+'),
-    (TokenType.STRING_LITERAL, r'"(?:\\.|[^"\\])*"'),
+    (TokenType.RANGE, r'[0-9]+\.\.[0-9]+'),
+    (TokenType.STRING_LITERAL, r'"([^"\\]|\\.)*"'),
     (TokenType.NOT, r'!'),
     (TokenType.COMMA, r',')
 ]
 
+# Keywords are identifiers with their own token type, so 'format' is one
+# identifier rather than 'for' followed by 'mat'
+keywords = {
+    'fn': TokenType.FN,
+    'for': TokenType.FOR,
+}
+
+lexer = lexgen.build_lexer(lexgen.LexerSpec(
+    'rust',
+    [('WHITESPACE', r'\s+'), ('COMMENT', r'//[^\n]*')] + token_defs,
+    keywords=keywords,
+    skip={'WHITESPACE', 'COMMENT'},
+    error=TokenType.ERROR,
+    literals={TokenType.STRING_LITERAL},
+))
+
 
+@trace.traced('lex', 'tokens')
 def tokenize(source_code):
-    tokens = []
-    while source_code:
-        # Skip whitespace and comments
-        if source_code.startswith('//'):
-            comment_end = source_code.find('\n')
-            if comment_end == -1:  # Handle case where comment extends to end of file
-                break
-            source_code = source_code[comment_end + 1:].lstrip()
-            continue
-        
-        # Tokenize based on token definitions
-        for token_type, pattern in token_defs:
-            match = re.match(pattern, source_code)
-            if match:
-                token = match.group(0)
-                if token_type != TokenType.RANGE:  # Skip RANGE token, as it's just a separator
-                    tokens.append((token_type, token))
-                source_code = source_code[len(token):].lstrip()
-                print("Found token:", token)  # Print found token
-                break
-        else:
-            print("Invalid token:", source_code)  # Print invalid token
-            raise SyntaxError('Invalid token: ' + source_code)
-    return tokens
+    # Compact TokenStream whose items are (type, value) tuples. Characters no
+    # rule matches become ERROR tokens, which the code generator reports
+    return lexer.tokenize(source_code)
+
+
+def iter_tokens(source_code):
+    # Lazily yield (type, value, line, column) tuples from a str or a
+    # bytes-like buffer such as an mmap. Tokens are scanned as they are asked
+    # for, and lines are counted on from the previous token. A character no
+    # rule matches raises a CompileError at its position
+    data = source_code.encode('utf-8') if isinstance(source_code, str) else source_code
+    kinds = lexer.kinds
+    lines = stream.LineCounter(data)
+    for kind, start, end in lexer.scan(data):
+        value = bytes(data[start:end]).decode('utf-8')
+        line, column = lines.locate(start)
+        if kind == lexer.error_kind:
+            raise diagnostics.CompileError([diagnostics.Diagnostic(line, column, CodeGenerator.invalid_message,
+                                                                   diagnostics.snippet(value))])
+        yield kinds[kind], value, line, column
+
+
+# Syntax of the accepted language, which is what the lexer knows: functions,
+# for loops over integer ranges, and function and macro calls. Statements
+# that fail to parse resume past the next ';' or at the '}' of their block,
+# and functions at the next 'fn'
+GRAMMAR = lalr.Grammar('rust', [
+    ('program', '', None),
+    ('program', 'program function', None),
+    ('program', 'program error', None),
+
+    ('function', 'function_head block', 'function'),
+    ('function_head', 'FN IDENTIFIER OPEN_PAREN parameters CLOSE_PAREN', 'function_head'),
+    ('parameters', '', 'empty_list'),
+    ('parameters', 'parameter_list', None),
+    ('parameters', 'parameter_list COMMA', None),
+    ('parameter_list', 'IDENTIFIER', 'first_parameter'),
+    ('parameter_list', 'parameter_list COMMA IDENTIFIER', 'next_parameter'),
+
+    ('block', 'OPEN_BRACE statements CLOSE_BRACE', None),
+    ('statements', '', None),
+    ('statements', 'statements statement', None),
+    ('statement', 'for_loop', None),
+    ('statement', 'block', None),
+    ('statement', 'SEMICOLON', None),
+    # A call evaluated for its effect; the ';' is optional
+    ('statement', 'expression SEMICOLON', 'discard'),
+    ('statement', 'expression %prec EXPRESSION', 'discard'),
+    ('statement', 'error %prec EXPRESSION', None),
+    ('statement', 'error SEMICOLON', None),
+
+    ('for_loop', 'loop_head block', 'for_loop'),
+    ('loop_head', 'FOR IDENTIFIER IDENTIFIER RANGE', 'loop_head'),
+
+    ('expression', 'STRING_LITERAL', 'string'),
+    ('expression', 'name', 'load'),
+    ('expression', 'name OPEN_PAREN arguments CLOSE_PAREN', 'call'),
+    ('name', 'IDENTIFIER', None),
+    # Macros keep their '!', as in println!
+    ('name', 'IDENTIFIER NOT', 'macro_name'),
+    ('arguments', '', 'no_arguments'),
+    ('arguments', 'argument_list', None),
+    ('arguments', 'argument_list COMMA', None),
+    ('argument_list', 'expression', 'first_argument'),
+    ('argument_list', 'argument_list COMMA expression', 'next_argument'),
+], precedence=[
+    # A statement takes the ';' after it, if any
+    ('nonassoc', 'EXPRESSION'),
+    ('nonassoc', 'SEMICOLON'),
+])
+
+parser = lalr.build_parser(GRAMMAR)
+
+
+# Intermediate Code Generator
+class CodeGenerator(lalr.Actions):
+    # Lowers functions to stack code as the parser reduces them (see
+    # compilers/lalr.py), reading one token of lookahead from the token
+    # iterator, so a streamed source is never held in memory. The code of a
+    # function is emitted before its body is parsed, at its head, and that of
+    # a loop around its body. Errors are reported to errors (see
+    # compilers/diagnostics.py)
+    invalid_message = "Invalid token"
+
+    def __init__(self, tokens, errors=None):
+        self.source = tokens
+        # TokenStreams and MappedTokens locate their tokens
+        self.locate = getattr(tokens, 'location', None)
+        self.errors = errors if errors is not None else diagnostics.Diagnostics()
+        self.program = ir.Program()
+
+    def terminals(self):
+        # (terminal, text) pairs of the tokens
+        if hasattr(self.source, 'kinds'):
+            return zip(parser.stream_columns(self.source), map(self.source.value, range(len(self.source))))
+        terminal = parser.terminal
+        return ((terminal(token_type, value), value) for token_type, value in self.source)
+
+    def items(self):
+        # Lowers one function per step
+        for _ in parser.run(self.terminals(), self, self.errors, 'function'):
+            yield
+
+    def location(self, position):
+        if self.locate is None:
+            return None, None
+        return self.locate(position)
+
+    # Functions
+
+    def function_head(self, start, end, fn, name, open_paren, parameters, close_paren):
+        self.program.emit(ir.FUNCTION, name, *parameters)
+
+    def function(self, start, end, head, block):
+        self.program.emit(ir.PUSH, 0)
+        self.program.emit(ir.RETURN)
+
+    def empty_list(self, start, end):
+        return []
+
+    def first_parameter(self, start, end, name):
+        return [name]
+
+    def next_parameter(self, start, end, parameters, comma, name):
+        parameters.append(name)
+        return parameters
+
+    # Statements
+
+    def discard(self, start, end, expression, semicolon=None):
+        self.program.emit(ir.POP)
+
+    def loop_head(self, start, end, keyword, variable, in_keyword, bounds):
+        # for i in a..b { ... } counts i from a up to b - 1
+        if in_keyword != 'in':
+            self.errors.error("Expected 'in' but found", *self.location(start + 2), in_keyword)
+        start_value, end_value = bounds.split('..')
+        start_label = self.program.new_label('LOOP_START')
+        body_label = self.program.new_label('LOOP_BODY_START')
+        end_label = self.program.new_label('LOOP_BODY_END')
+        self.program.emit(ir.PUSH, int(start_value))
+        self.program.emit(ir.STORE, variable)
+        self.program.label(start_label)
+        self.program.emit(ir.LOAD, variable)
+        self.program.emit(ir.PUSH, int(end_value))
+        self.program.emit(ir.COMPARE, '<')
+        self.program.emit(ir.JUMP_IF_FALSE, end_label)
+        self.program.label(body_label)
+        return variable, start_label, end_label
+
+    def for_loop(self, start, end, head, block):
+        variable, start_label, end_label = head
+        self.program.emit(ir.LOAD, variable)
+        self.program.emit(ir.PUSH, 1)
+        self.program.emit(ir.ADD)
+        self.program.emit(ir.STORE, variable)
+        self.program.emit(ir.JUMP, start_label)
+        self.program.label(end_label)
+
+    # Expressions
+
+    def string(self, start, end, value):
+        self.program.emit(ir.PUSH, value)
+
+    def load(self, start, end, name):
+        self.program.emit(ir.LOAD, name)
+
+    def call(self, start, end, name, open_paren, count, close_paren):
+        self.program.emit(ir.CALL, name, count)
+
+    def macro_name(self, start, end, name, bang):
+        return name + '!'
+
+    def no_arguments(self, start, end):
+        return 0
+
+    def first_argument(self, start, end, expression):
+        return 1
+
+    def next_argument(self, start, end, count, comma, expression):
+        return count + 1
 
 
 # Intermediate Code Generator function
-def generate_intermediate_code(tokens):
-    # Initialize intermediate code
-    intermediate_code = ""
-    # Flag to track if we are inside a loop
-    inside_loop = False
-    
-    # Iterate through tokens
-    for token_type, token_value in tokens:
-        # Check if the token is 'for' keyword
-        if token_type == TokenType.FOR:
-            # Start of loop
-            intermediate_code += "LOOP_START:\n"
-            inside_loop = True
-        # Check if the token is '{'
-        elif token_type == TokenType.OPEN_BRACE:
-            # Start of loop body
-            intermediate_code += "LOOP_BODY_START:\n"
-        # Check if the token is '}'
-        elif token_type == TokenType.CLOSE_BRACE:
-            # End of loop body
-            intermediate_code += "LOOP_BODY_END:\n"
-        # Check if the token is an identifier (variable)
-        elif token_type == TokenType.IDENTIFIER:
-            # Load the variable value
-            intermediate_code += f"LOAD {token_value}\n"
-        # Check if the token is an integer
-        elif token_type == TokenType.RANGE:
-            # Push the integer value
-            intermediate_code += f"PUSH {token_value}\n"
-        # Check if the token is '='
-        elif token_type == TokenType.NOT:
-            # Store the value
-            intermediate_code += "STORE\n"
-        # Check if the token is '<'
-        elif token_type == TokenType.COMMA:
-            # Compare values
-            intermediate_code += "COMPARE\n"
-            # Jump to loop body end if false
-            intermediate_code += "JUMP_IF_FALSE LOOP_BODY_END\n"
-    
-    # Return the generated intermediate code
-    return intermediate_code
+@trace.traced('ir', 'ir_instructions', len)
+def generate_intermediate_code(tokens, errors=None):
+    # Lowers the whole program to stack code (see compilers/ir.py); all the
+    # syntax errors are raised together at the end
+    generator = CodeGenerator(tokens, errors)
+    for _ in generator.items():
+        pass
+    generator.errors.check()
+    return generator.program
 
 
-# Main compiler function
-def compile_rust(source_file, output_file):
-    start_time = time.time()
-    start_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
-    
+# Yields the instructions one function at a time so they can be streamed
+def iter_intermediate_code(tokens, errors=None):
+    generator = CodeGenerator(tokens, errors)
+    for _ in generator.items():
+        yield generator.program.take()
+    generator.errors.check()
+
+
+class MappedTokens:
+    # (type, value) pairs straight from a bytes-like buffer such as an mmap.
+    # Only the start of the latest token is kept: with one token of
+    # lookahead, that is the token the code generator is at
+    def __init__(self, data):
+        self.data = data
+        self.lines = stream.LineCounter(data)
+        self.start = 0
+
+    def __iter__(self):
+        data = self.data
+        kinds = lexer.kinds
+        for kind, start, end in lexer.scan(data):
+            self.start = start
+            yield kinds[kind], bytes(data[start:end]).decode('utf-8')
+
+    def location(self, index):
+        return self.lines.locate(self.start)
+
+
+# Compile one file and write its intermediate code without console output;
+# used by the batch driver. optimize is True, False, or a passes.PassManager
+# that collects the optimizer statistics
+def compile_file(source_file, output_file, streaming=None, cache=None, optimize=True):
+    optimizer = passes.manager_for(optimize) if optimize else None
+    if stream.should_stream(source_file, streaming):
+        # Lex from a memory map and write the IR of each function as soon as
+        # it is generated
+        with stream.map_source(source_file) as data, stream.open_output(output_file) as f, \
+                trace.span('compile_stream') as counters:
+            instructions = 0
+            first_line = True
+            for function in iter_intermediate_code(MappedTokens(data), diagnostics.Diagnostics(source_file)):
+                if optimizer is not None:
+                    function = optimizer.run_instructions(function)
+                first_line = ir.write(function, f, first_line=first_line)
+                instructions += len(function)
+            counters['ir_instructions'] = instructions
+        return None
+
     # Load Rust source code
     with open(source_file, 'r') as f:
         rust_code = f.read()
 
-    # Lexical analysis
-    tokens = tokenize(rust_code)
-    
-    # Generate intermediate code
-    intermediate_code = generate_intermediate_code(tokens)
-    
+    # An unchanged source is served from the compile cache without being
+    # lexed again
+    entry = None
+    if cache is not None:
+        key = cache.key(rust_code, 'rust-' + passes.cache_tag(optimize))
+        entry = cache.get(key)
+
+    if entry is not None:
+        intermediate_code = entry['ir']
+    else:
+        # Lexical analysis
+        tokens = tokenize(rust_code)
+
+        # Generate intermediate code
+        intermediate_code = generate_intermediate_code(tokens, diagnostics.Diagnostics(source_file))
+
+        # Optimization
+        if optimizer is not None:
+            intermediate_code = optimizer.run(intermediate_code)
+
+        if cache is not None:
+            cache.put(key, tokens, None, intermediate_code)
+
     # Write intermediate code to output file
-    with open(output_file, 'w') as f:
-        f.write(intermediate_code)
+    with trace.span('write') as counters, stream.open_output(output_file) as f:
+        ir.write(intermediate_code, f)
+        counters['bytes_written'] = f.tell()
+
+    return intermediate_code
+
+
+# Main compiler function
+def compile_rust(source_file, output_file, streaming=None, cache=None, optimize=True):
+    start_time = time.perf_counter()
+    start_memory = measure.max_rss_kilobytes()
+
+    optimizer = passes.PassManager() if optimize else None
+    compile_file(source_file, output_file, streaming, cache, optimizer or False)
     
-    end_time = time.time()
-    end_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    end_time = time.perf_counter()
+    end_memory = measure.max_rss_kilobytes()
     
     # Calculate time and memory consumed
     elapsed_time = end_time - start_time
     memory_consumed = end_memory - start_memory
     
-    print(f"Compilation completed in {elapsed_time} seconds")
+    print(f"Compilation completed in {elapsed_time:.6f} seconds")
     print(f"Memory consumed: {memory_consumed} KB")
+    if optimizer is not None:
+        for line in optimizer.summary():
+            print(line)
 
 # Run the compiler
 if __name__ == "__main__":
     source_file = "example.rs"
     output_file = "result.txt"
-    compile_rust(source_file, output_file)
+    compile_rust(source_file, output_file, streaming="--stream" in sys.argv or None,
+                 optimize="-O0" not in sys.argv)
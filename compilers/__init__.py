@@ -0,0 +1,69 @@
+import importlib
+import os
+import sys
+
+# Shared infrastructure of the C, C++, Pascal and Rust frontends, and a
+# registry that loads a frontend the first time it is used:
+#
+#   import compilers
+#   compilers.compile_file('example.pas', 'example.pas.ir')
+#
+# Importing the package does no work. A frontend module, and with it its
+# lexer and the optimizer, is imported when a file in its language is first
+# compiled; its lexer tables are loaded when it first lexes. The command
+# line entry point is python -m compilers (see compilers/__main__.py).
+
+# Language -> frontend module
+FRONTENDS = {
+    'c': 'C.c_compiler',
+    'cpp': 'CPP.cpp_compiler',
+    'pascal': 'Pascal.pascal_compiler',
+    'rust': 'Rust.rust_compiler',
+}
+
+# File extension -> language
+EXTENSIONS = {
+    '.c': 'c',
+    '.cpp': 'cpp',
+    '.cc': 'cpp',
+    '.cxx': 'cpp',
+    '.pas': 'pascal',
+    '.rs': 'rust',
+}
+
+# Languages whose frontends run the optimization passes (see
+# compilers/passes.py), and those with a streaming pipeline for large inputs
+OPTIMIZING = {'cpp', 'pascal', 'rust'}
+STREAMING = {'c', 'rust'}
+
+# The frontend packages (C, CPP, Pascal, Rust) live next to this package
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Frontends imported so far in this process, by language
+loaded = {}
+
+
+def language_for(path):
+    return EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+
+def frontend(language):
+    module = loaded.get(language)
+    if module is None:
+        if language not in FRONTENDS:
+            raise ValueError(f"unknown language {language!r}")
+        if ROOT not in sys.path:
+            sys.path.insert(0, ROOT)
+        module = importlib.import_module(FRONTENDS[language])
+        loaded[language] = module
+    return module
+
+
+def compile_file(path, output_path, language=None, **options):
+    # Compiles one file with the frontend of its extension, or of language,
+    # and returns its intermediate code; options go to the frontend's
+    # compile_file
+    language = language or language_for(path)
+    if language is None:
+        raise ValueError(f"no frontend for {path}")
+    return frontend(language).compile_file(path, output_path, **options)
@@ -0,0 +1,109 @@
+import importlib
+import os
+import sys
+import types
+
+import compilers
+from compilers import diagnostics
+
+# Single command line entry point for the compilers and their tools.
+#
+#   python -m compilers compile [-o OUTPUT] [-O0] [--stream] [--max-errors N] FILE...
+#   python -m compilers COMMAND [ARGS...]
+#
+# compile runs the frontend of each file's extension in this process, writing
+# <file>.ir next to it unless -o names the output of a single file. Every
+# other command is one of the tools below and takes that tool's arguments.
+# Only the modules a command needs are imported, so startup costs about as
+# much as importing the one frontend in use.
+
+# Command -> tool module in this package
+COMMANDS = {
+    'batch': 'batch',
+    'bench': 'benchmark',
+    'chunked': 'chunked',
+    'client': 'client',
+    'incremental': 'incremental',
+    'irbin': 'irbin',
+    'jit': 'jit',
+    'preprocess': 'preprocess',
+    'serve': 'server',
+    'vm': 'vm',
+}
+
+OUTPUT_SUFFIX = '.ir'
+
+
+def usage():
+    return (f"usage: python -m compilers compile [-o OUTPUT] [-O0] [--stream] [--max-errors N] FILE...\n"
+            f"       python -m compilers {{{','.join(sorted(COMMANDS))}}} [ARGS...]")
+
+
+def parse_compile_arguments(argv):
+    import argparse
+    parser = argparse.ArgumentParser(prog='python -m compilers compile',
+                                     description='Compile C, C++, Pascal and Rust files to intermediate code.')
+    parser.add_argument('inputs', nargs='+', help='source files')
+    parser.add_argument('-o', '--output', default=None,
+                        help='output file, when compiling a single input (default: <input>.ir)')
+    parser.add_argument('-O', dest='optimize', type=int, choices=[0, 1], default=1,
+                        help='-O0 writes the intermediate code unoptimized (default: -O1)')
+    parser.add_argument('--stream', dest='streaming', action='store_const', const=True, default=None,
+                        help='always use the streaming pipeline where supported')
+    parser.add_argument('--max-errors', type=int, default=None,
+                        help='syntax errors reported per file before giving up, 0 for all')
+    args = parser.parse_args(argv)
+    if args.output and len(args.inputs) > 1:
+        parser.error('-o needs a single input')
+    return args
+
+
+def compile_main(argv):
+    if argv and not any(arg.startswith('-') for arg in argv):
+        # A plain list of files skips argparse, which with its dependencies
+        # takes longer to import than a frontend
+        args = types.SimpleNamespace(inputs=argv, output=None, optimize=1, streaming=None, max_errors=None)
+    else:
+        args = parse_compile_arguments(argv)
+    if args.max_errors is not None:
+        os.environ['COMPILERS_MAX_ERRORS'] = str(args.max_errors)
+
+    status = 0
+    for path in args.inputs:
+        language = compilers.language_for(path)
+        if language is None:
+            print(f"{path}: no frontend for this extension", file=sys.stderr)
+            status = 1
+            continue
+        options = {}
+        if language in compilers.STREAMING:
+            options['streaming'] = args.streaming
+        if language in compilers.OPTIMIZING:
+            options['optimize'] = bool(args.optimize)
+        try:
+            compilers.compile_file(path, args.output or path + OUTPUT_SUFFIX, language, **options)
+        except (OSError, SyntaxError, ValueError) as error:
+            # Diagnostics already name the file
+            located = isinstance(error, diagnostics.CompileError) and error.path
+            print(error if located else f"{path}: {error}", file=sys.stderr)
+            status = 1
+    return status
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ('-h', '--help'):
+        print(usage(), file=sys.stderr if not argv else sys.stdout)
+        return 2 if not argv else 0
+    command, rest = argv[0], argv[1:]
+    if command == 'compile':
+        return compile_main(rest)
+    if command not in COMMANDS:
+        print(f"Error: unknown command {command!r}\n{usage()}", file=sys.stderr)
+        return 2
+    module = importlib.import_module(f'compilers.{COMMANDS[command]}')
+    return module.main(rest)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
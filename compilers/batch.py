@@ -0,0 +1,234 @@
+import argparse
+import glob
+import os
+import sys
+import time
+
+import compilers
+from compilers import diagnostics, irbin, trace
+
+# Batch driver: compile many files in any of the four languages in parallel.
+#
+#   python -m compilers.batch [-j WORKERS] [--chunksize N] [-o OUTPUT_DIR] [-O0]
+#                             [--binary] [--max-errors N] [--cache-dir DIR] [--trace TRACE_JSON]
+#                             PATH_OR_GLOB...
+#
+# The frontend is picked by file extension. Each input gets its own output,
+# written next to it as <input>.ir or mirrored under OUTPUT_DIR; --binary
+# writes <input>.irb, the binary container of compilers/irbin.py. -O0 turns
+# off the optimization passes of the C++, Pascal and Rust frontends. A file
+# with syntax errors fails with all of them, up to --max-errors per file
+# (see compilers/diagnostics.py). With a cache directory, unchanged files are
+# served from the compile cache. With a trace file, every worker records its
+# compile phases and the merged Chrome trace is written at the end.
+
+# File extension -> frontend module, from the registry in compilers/__init__.py
+FRONTENDS = {extension: compilers.FRONTENDS[language] for extension, language in compilers.EXTENSIONS.items()}
+
+# Language of each frontend module
+LANGUAGES = {module_name: language for language, module_name in compilers.FRONTENDS.items()}
+
+OUTPUT_SUFFIX = '.ir'
+
+# Frontends that run the optimization passes (see compilers/passes.py)
+OPTIMIZING_FRONTENDS = {compilers.FRONTENDS[language] for language in compilers.OPTIMIZING}
+
+# Frontends with a streaming pipeline for large inputs
+STREAMING_FRONTENDS = {compilers.FRONTENDS[language] for language in compilers.STREAMING}
+
+# Compile cache of this process, opened by the first job that uses it
+process_cache = None
+
+
+def frontend_for(path):
+    return FRONTENDS.get(os.path.splitext(path)[1].lower())
+
+
+def load_frontend(module_name):
+    return compilers.frontend(LANGUAGES[module_name])
+
+
+def expand_inputs(patterns):
+    # Files, directories (searched recursively) and glob patterns, keeping
+    # only extensions a frontend handles; duplicates are dropped
+    paths = []
+    seen = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            candidates = []
+            for root, _, files in os.walk(pattern):
+                candidates.extend(os.path.join(root, name) for name in sorted(files))
+        elif glob.has_magic(pattern):
+            candidates = sorted(glob.glob(pattern, recursive=True))
+        else:
+            candidates = [pattern]
+        for path in candidates:
+            if frontend_for(path) and os.path.isfile(path) and path not in seen:
+                seen.add(path)
+                paths.append(path)
+    return paths
+
+
+def output_path_for(path, output_dir, common_root, suffix=OUTPUT_SUFFIX):
+    if output_dir is None:
+        return path + suffix
+    relative_path = os.path.relpath(os.path.abspath(path), common_root)
+    return os.path.join(output_dir, relative_path + suffix)
+
+
+def open_cache(cache_dir, cache_size):
+    global process_cache
+    if process_cache is None or process_cache.directory != cache_dir:
+        from compilers.cache import CompileCache
+        process_cache = CompileCache(cache_dir, cache_size)
+    return process_cache
+
+
+def compile_one(job):
+    # Runs in a worker process; returns (path, bytes, seconds, error, cached,
+    # events) where cached is True for a cache hit, False for a miss and None
+    # when no cache is used, and events are the trace events of this compile
+    path, output_path, streaming, optimize, cache_dir, cache_size, tracing = job
+    if not tracing:
+        return compile_job(path, output_path, streaming, optimize, cache_dir, cache_size) + ([],)
+    with trace.recording() as tracer:
+        with trace.span('compile', path=path) as counters:
+            result = compile_job(path, output_path, streaming, optimize, cache_dir, cache_size)
+            counters['bytes'] = result[1]
+            if result[4] is not None:
+                counters['cache_hit'] = int(result[4])
+    return result + (tracer.events,)
+
+
+def compile_job(path, output_path, streaming, optimize, cache_dir, cache_size):
+    start = time.perf_counter()
+    cached = None
+    try:
+        size = os.path.getsize(path)
+        directory = os.path.dirname(output_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        module_name = frontend_for(path)
+        frontend = load_frontend(module_name)
+        options = {}
+        if streaming is not None:
+            options['streaming'] = streaming
+        if not optimize and module_name in OPTIMIZING_FRONTENDS:
+            options['optimize'] = False
+        cache = None
+        if cache_dir is not None and not streaming:
+            cache = open_cache(cache_dir, cache_size)
+            options['cache'] = cache
+            hits = cache.hits
+        frontend.compile_file(path, output_path, **options)
+        if cache is not None:
+            cached = cache.hits > hits
+    except Exception as error:
+        return path, 0, time.perf_counter() - start, f'{type(error).__name__}: {error}', cached
+    return path, size, time.perf_counter() - start, None, cached
+
+
+def make_jobs(paths, output_dir, streaming, optimize=True, cache_dir=None, cache_size=None, tracing=False,
+              suffix=OUTPUT_SUFFIX):
+    common_root = None
+    if output_dir is not None and paths:
+        common_root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths])
+    # Largest files first so a big file does not start last and hold up the
+    # whole batch
+    paths = sorted(paths, key=os.path.getsize, reverse=True)
+    # Only streaming frontends get the flag
+    return [(path, output_path_for(path, output_dir, common_root, suffix),
+             streaming if frontend_for(path) in STREAMING_FRONTENDS else None,
+             optimize, cache_dir, cache_size, tracing)
+            for path in paths]
+
+
+def run_batch(paths, workers=None, chunksize=1, output_dir=None, streaming=None,
+              cache_dir=None, cache_size=None, optimize=True, suffix=OUTPUT_SUFFIX):
+    # Workers trace their compiles whenever this process is tracing; their
+    # events are merged into its tracer
+    if cache_dir is not None:
+        cache_dir = os.path.abspath(cache_dir)
+    jobs = make_jobs(paths, output_dir, streaming, optimize, cache_dir, cache_size, trace.enabled(), suffix)
+    start = time.perf_counter()
+    with trace.span('batch', files=len(jobs)):
+        if workers == 1:
+            results = [compile_one(job) for job in jobs]
+        else:
+            # Imported here so a single-process run does not pay for it
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(compile_one, jobs, chunksize=chunksize))
+    elapsed = time.perf_counter() - start
+    if trace.enabled():
+        for result in results:
+            trace.tracer.extend(result[5])
+    return results, elapsed
+
+
+def print_summary(results, elapsed):
+    failures = [(path, error) for path, _, _, error, _, _ in results if error]
+    for path, error in failures:
+        print(f"{path}: {error}", file=sys.stderr)
+    compiled = len(results) - len(failures)
+    total_bytes = sum(size for _, size, _, _, _, _ in results)
+    megabytes = total_bytes / (1024 * 1024)
+    rate = elapsed if elapsed > 0 else float('inf')
+    print(f"Compiled {compiled} of {len(results)} files ({megabytes:.2f} MB) in {elapsed:.3f} seconds")
+    print(f"Throughput: {len(results) / rate:.1f} files/s, {megabytes / rate:.2f} MB/s")
+    lookups = [cached for _, _, _, _, cached, _ in results if cached is not None]
+    if lookups:
+        hits = sum(lookups)
+        print(f"Cache: {hits} hits, {len(lookups) - hits} misses ({100 * hits / len(lookups):.1f}% hit rate)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compile many C, C++, Pascal and Rust files in parallel.')
+    parser.add_argument('inputs', nargs='+', help='files, directories or glob patterns')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='worker processes (default: one per CPU)')
+    parser.add_argument('--chunksize', type=int, default=8,
+                        help='files handed to a worker at a time')
+    parser.add_argument('-o', '--output-dir', default=None,
+                        help='write outputs under this directory instead of next to the inputs')
+    parser.add_argument('--stream', dest='streaming', action='store_const', const=True, default=None,
+                        help='always use the streaming pipeline where supported')
+    parser.add_argument('-O', dest='optimize', type=int, choices=[0, 1], default=1,
+                        help='-O0 writes the intermediate code unoptimized (default: -O1)')
+    parser.add_argument('--binary', action='store_true',
+                        help=f'write binary IR ({irbin.SUFFIX}, see compilers/irbin.py) instead of text')
+    parser.add_argument('--max-errors', type=int, default=None,
+                        help=f'syntax errors reported per file before giving up, 0 for all '
+                             f'(default: {diagnostics.DEFAULT_MAX_ERRORS})')
+    parser.add_argument('--cache-dir', default=None,
+                        help='reuse compile results for unchanged files from this directory')
+    parser.add_argument('--cache-size', type=int, default=256,
+                        help='compile cache size limit in MB; with several processes sharing the '
+                             'directory, what the others store between two scans can exceed it (default: 256)')
+    parser.add_argument('--trace', default=None,
+                        help='write a Chrome trace of every compile phase to this file')
+    args = parser.parse_args(argv)
+
+    paths = expand_inputs(args.inputs)
+    if not paths:
+        print("Error: no input files found", file=sys.stderr)
+        return 2
+
+    # Workers inherit the environment
+    if args.max_errors is not None:
+        os.environ['COMPILERS_MAX_ERRORS'] = str(args.max_errors)
+    if args.trace and not trace.enabled():
+        trace.start()
+    results, elapsed = run_batch(paths, args.workers, args.chunksize, args.output_dir, args.streaming,
+                                 args.cache_dir, args.cache_size * 1024 * 1024, bool(args.optimize),
+                                 irbin.SUFFIX if args.binary else OUTPUT_SUFFIX)
+    print_summary(results, elapsed)
+    if args.trace:
+        trace.tracer.write(args.trace)
+        trace.write_summary(trace.tracer.summary(), sys.stdout)
+        print(f"Trace written to {args.trace}")
+    return 1 if any(error for _, _, _, error, _, _ in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
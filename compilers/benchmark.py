@@ -0,0 +1,521 @@
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from compilers import ir, jit, passes, vm
+
+# Per-phase benchmark suite for the four frontends.
+#
+#   python -m compilers.benchmark run [--sizes 1K,1M,...] [--languages c,rust]
+#                                     [--repeat N] [-o results.json] [--baseline old.json]
+#   python -m compilers.benchmark compare old.json new.json [--threshold 0.10]
+#   python -m compilers.benchmark execute [--repeat N]
+#
+# Synthetic sources of each size are generated for every language and each
+# compile phase (lex, parse, semantic, ir, optimize, write) is timed on its
+# own with perf_counter_ns, keeping the best of several runs. Peak allocations
+# per phase come from a separate run under tracemalloc, since tracing slows
+# everything down. A least-squares fit of log(time) against log(size) gives
+# the growth exponent of each phase (1.00 is linear). Results are saved as
+# JSON so two commits can be compared and regressions reported.
+#
+# execute runs loop-heavy programs on the bytecode machine (see
+# compilers/vm.py) and with its compiling tier (see compilers/jit.py), and
+# reports the throughput of each and the speedup.
+
+RESULTS_VERSION = 1
+
+LANGUAGES = ['c', 'cpp', 'pascal', 'rust']
+
+DEFAULT_SIZES = [1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024, 100 * 1024 * 1024]
+
+# Sizes below this are dominated by fixed costs and left out of the fit
+MIN_FIT_SIZE = 64 * 1024
+
+# A run slower than this is not repeated
+REPEAT_BUDGET_NS = 1_000_000_000
+
+# Phases faster than this in the baseline are too noisy to compare
+MIN_COMPARED_NS = 1_000_000
+
+# The frontend packages (C, CPP, Pascal, Rust) live next to this package
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+# Synthetic corpora: a header, one unit repeated until the target size is
+# reached, and a footer
+
+TEMPLATES = {
+    'c': ('#include <stdio.h>\n\n', '''int function_{n}(int count)
+{{
+    int sum = 0;
+    // Loop {n} adds up the first count numbers
+    for (int i = 0; i < count; ++i)
+    {{
+        if (i % 2 == 0)
+        {{
+            sum += i * {n};
+        }}
+        else
+        {{
+            sum -= i;
+        }}
+    }}
+    printf("function_{n}: %d\\n", sum);
+    return sum;
+}}
+
+''', ''),
+    'cpp': ('#include <iostream>\nusing namespace std;\n\n', '''int function_{n}(int count) {{
+    int sum = 0;
+    // Loop {n} adds up the first count numbers
+    for (int i = 0; i < count; i++) {{
+        sum = sum + i * {n};
+        cout << "function_{n}: " << sum << endl;
+    }}
+    return sum;
+}}
+
+''', ''),
+    'pascal': ('program Benchmark;\n\nvar\n  i, total: Integer;\n\nbegin\n', '''  // Loop {n} adds up the numbers up to {n}
+  for i := 1 to {n} do
+  begin
+    total := total + i;
+    writeln('Loop {n} iteration ', i);
+  end;
+
+''', 'end.\n'),
+    'rust': ('', '''fn function_{n}() {{
+    // Loop {n} prints a range of numbers
+    for i in 1..{n} {{
+        println!("{{}} {{}}", i, "value {n}");
+    }}
+}}
+
+''', ''),
+}
+
+
+def generate_source(language, size):
+    header, unit, footer = TEMPLATES[language]
+    parts = [header]
+    length = len(header) + len(footer)
+    n = 0
+    while length < size:
+        part = unit.format(n=n)
+        parts.append(part)
+        length += len(part)
+        n += 1
+    parts.append(footer)
+    return ''.join(parts)
+
+
+# Phase runners. Each compiles source_code into output_path the same way the
+# frontend's compile_file does, wrapping every phase in phase(name)
+
+def run_c(source_code, output_path, phase):
+    from C import c_compiler
+    compiler = c_compiler.Compiler(verbose=False)
+    with phase('lex'):
+        tokens = compiler.tokenize(source_code)
+    with phase('parse'):
+        parsed_ast = compiler.parse(tokens)
+    with phase('semantic'):
+        compiler.check_semantics(parsed_ast)
+    with phase('ir'):
+        intermediate_code = compiler.generate_intermediate_code(parsed_ast)
+    with phase('write'):
+        with open(output_path, 'w') as result_file:
+            ir.write(intermediate_code, result_file, structured=True)
+
+
+def run_cpp(source_code, output_path, phase):
+    from CPP import cpp_compiler
+    with phase('lex'):
+        tokens = cpp_compiler.lex(io.StringIO(source_code))
+    with phase('ir'):
+        intermediate_code = cpp_compiler.generate_intermediate_code(tokens)
+    with phase('optimize'):
+        passes.PassManager().run(intermediate_code)
+    with phase('write'):
+        with open(output_path, 'w') as result_file:
+            ir.write(intermediate_code, result_file)
+
+
+def run_pascal(source_code, output_path, phase):
+    from Pascal import pascal_compiler
+    with phase('lex'):
+        tokens = pascal_compiler.tokenize(source_code)
+    with phase('parse'):
+        ast = pascal_compiler.parse(tokens)
+    with phase('semantic'):
+        pascal_compiler.semantic_analysis(ast)
+    with phase('ir'):
+        intermediate_code = pascal_compiler.generate_intermediate_code(ast)
+    with phase('optimize'):
+        passes.PassManager().run(intermediate_code)
+    with phase('write'):
+        with open(output_path, 'w') as result_file:
+            ir.write(intermediate_code, result_file)
+
+
+def run_rust(source_code, output_path, phase):
+    from Rust import rust_compiler
+    with phase('lex'):
+        tokens = rust_compiler.tokenize(source_code)
+    with phase('ir'):
+        intermediate_code = rust_compiler.generate_intermediate_code(tokens)
+    with phase('optimize'):
+        passes.PassManager().run(intermediate_code)
+    with phase('write'):
+        with open(output_path, 'w') as result_file:
+            ir.write(intermediate_code, result_file)
+
+
+RUNNERS = {'c': run_c, 'cpp': run_cpp, 'pascal': run_pascal, 'rust': run_rust}
+
+
+class PhaseTimer:
+    # Collects nanoseconds, and peak traced bytes when tracing, per phase
+    def __init__(self, tracing=False):
+        self.tracing = tracing
+        self.times = {}
+        self.peaks = {}
+        self.run_baseline = tracemalloc.get_traced_memory()[0] if tracing else 0
+
+    @contextlib.contextmanager
+    def __call__(self, name):
+        if self.tracing:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter_ns()
+        yield
+        self.times[name] = time.perf_counter_ns() - start
+        if self.tracing:
+            peak = tracemalloc.get_traced_memory()[1]
+            # Peak above what was live when the phase started, and above what
+            # was live when the whole compile started
+            self.peaks[name] = (peak - baseline, peak - self.run_baseline)
+
+
+def benchmark_one(language, source_code, output_path, repeat):
+    runner = RUNNERS[language]
+
+    # Timing runs, best of repeat per phase
+    best = {}
+    for attempt in range(repeat):
+        timer = PhaseTimer()
+        runner(source_code, output_path, timer)
+        for name, elapsed in timer.times.items():
+            best[name] = min(best.get(name, elapsed), elapsed)
+        if sum(timer.times.values()) > REPEAT_BUDGET_NS:
+            break
+
+    # Memory run
+    tracemalloc.start()
+    try:
+        timer = PhaseTimer(tracing=True)
+        runner(source_code, output_path, timer)
+    finally:
+        tracemalloc.stop()
+
+    phases = {name: {'ns': best[name], 'peak_bytes': timer.peaks[name][0]} for name in best}
+    return {
+        'size': len(source_code.encode('utf-8')),
+        'phases': phases,
+        'total_ns': sum(best.values()),
+        'peak_bytes': max(total_peak for _, total_peak in timer.peaks.values()),
+    }
+
+
+# Least-squares slope of log(time) against log(size); 1.0 means linear
+def growth_exponent(sizes, times):
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(max(t, 1e-9)) for t in times]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    numerator = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    denominator = sum((x - mean_x) ** 2 for x in xs)
+    return numerator / denominator
+
+
+def fit_exponents(runs):
+    # Exponent per phase and for the total, or None with fewer than two sizes
+    fitted = [run for run in runs if run['size'] >= MIN_FIT_SIZE]
+    if len(fitted) < 2:
+        fitted = runs
+    if len(fitted) < 2:
+        return {}
+    sizes = [run['size'] for run in fitted]
+    exponents = {name: growth_exponent(sizes, [run['phases'][name]['ns'] for run in fitted])
+                 for name in fitted[0]['phases']}
+    exponents['total'] = growth_exponent(sizes, [run['total_ns'] for run in fitted])
+    return exponents
+
+
+# Loop-heavy programs for the execute command
+PROGRAMS = {
+    'cpp': ('.cpp', '''int collatz(int n) {
+    int steps = 0;
+    while (n != 1) {
+        if (n % 2 == 0) {
+            n = n / 2;
+        } else {
+            n = 3 * n + 1;
+        }
+        steps++;
+    }
+    return steps;
+}
+int main() {
+    int longest = 0;
+    for (int i = 1; i < 3000; i++) {
+        int steps = collatz(i);
+        if (steps > longest) {
+            longest = steps;
+        }
+    }
+    int sum = 0;
+    for (int j = 0; j < 300000; j++) {
+        sum = sum + j * 3;
+    }
+    cout << longest << " " << sum << endl;
+    return 0;
+}
+'''),
+    'pascal': ('.pas', '''program Loops;
+var
+  i, j, k: Integer;
+begin
+  for i := 1 to 200 do
+  begin
+    for j := 1 to 100 do
+    begin
+      for k := 10 downto 1 do
+      begin
+      end;
+    end;
+  end;
+end.
+'''),
+}
+
+
+def benchmark_execution(language, directory, repeat):
+    suffix, source_code = PROGRAMS[language]
+    path = os.path.join(directory, 'program' + suffix)
+    with open(path, 'w') as f:
+        f.write(source_code)
+    program = vm.compile_program(path)
+    interpreted = vm.run_program(program, repeat, io.StringIO())
+    compiled = jit.run_program(program, repeat, io.StringIO())
+    instructions = interpreted.instructions()
+    return {
+        'instructions': instructions,
+        'interpreter_ns': int(interpreted.seconds * 1e9),
+        'jit_ns': int(compiled.seconds * 1e9),
+        'compiled_functions': compiled.compiled,
+    }
+
+
+def format_execution(language, run):
+    interpreter = run['interpreter_ns'] / 1e9
+    compiled = run['jit_ns'] / 1e9
+    return (f"{language:<7} {run['instructions']:>10} instructions  "
+            f"interpreter {interpreter * 1000:9.2f} ms {run['instructions'] / interpreter / 1e6:7.2f} M/s  "
+            f"jit {compiled * 1000:9.2f} ms {run['instructions'] / compiled / 1e6:7.2f} M/s  "
+            f"speedup {interpreter / compiled:.2f}x")
+
+
+def run_execution(languages, repeat, report=print):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for language in languages:
+            results[language] = run = benchmark_execution(language, directory, repeat)
+            report(format_execution(language, run))
+    return results
+
+
+def git_commit():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def run_suite(languages, sizes, repeat, report=print):
+    results = {
+        'version': RESULTS_VERSION,
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'languages': {},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        output_path = os.path.join(directory, 'result.txt')
+        for language in languages:
+            runs = []
+            for size in sizes:
+                source_code = generate_source(language, size)
+                run = benchmark_one(language, source_code, output_path, repeat)
+                runs.append(run)
+                report(format_run(language, run))
+            exponents = fit_exponents(runs)
+            if exponents:
+                report(f"{language:<7} growth exponents: " +
+                       ', '.join(f"{name} {value:.2f}" for name, value in exponents.items()))
+            results['languages'][language] = {'runs': runs, 'exponents': exponents}
+    return results
+
+
+def format_size(size):
+    for unit, scale in (('MB', 1024 * 1024), ('KB', 1024)):
+        if size >= scale:
+            return f"{size / scale:.1f} {unit}"
+    return f"{size} B"
+
+
+def format_run(language, run):
+    megabytes = run['size'] / (1024 * 1024)
+    seconds = run['total_ns'] / 1e9
+    phases = '  '.join(f"{name} {values['ns'] / 1e6:.2f} ms" for name, values in run['phases'].items())
+    return (f"{language:<7} {format_size(run['size']):>9}  {seconds:8.3f} s  "
+            f"{megabytes / seconds if seconds else float('inf'):7.2f} MB/s  "
+            f"peak {format_size(run['peak_bytes'])}  [{phases}]")
+
+
+def parse_size(text):
+    units = {'K': 1024, 'M': 1024 * 1024, 'G': 1024 * 1024 * 1024}
+    text = text.strip().upper().rstrip('B')
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def compare(baseline, current, threshold=0.10):
+    # Returns (lines, regressions) comparing each phase of each run that both
+    # result sets contain; a regression is a time or peak memory more than
+    # threshold above the baseline
+    lines = []
+    regressions = 0
+    for language, current_results in current['languages'].items():
+        baseline_results = baseline['languages'].get(language)
+        if baseline_results is None:
+            continue
+        baseline_runs = {run['size']: run for run in baseline_results['runs']}
+        for run in current_results['runs']:
+            old_run = baseline_runs.get(run['size'])
+            if old_run is None:
+                continue
+            for name, values in run['phases'].items():
+                old_values = old_run['phases'].get(name)
+                if old_values is None or old_values['ns'] < MIN_COMPARED_NS:
+                    continue
+                time_ratio = values['ns'] / old_values['ns']
+                memory_ratio = (values['peak_bytes'] / old_values['peak_bytes']
+                                if old_values['peak_bytes'] > 0 else 1.0)
+                regressed = time_ratio > 1 + threshold or memory_ratio > 1 + threshold
+                if regressed:
+                    regressions += 1
+                lines.append(f"{'REGRESSION' if regressed else 'ok':<10} {language:<7} "
+                             f"{format_size(run['size']):>9} {name:<9} time x{time_ratio:.2f}  "
+                             f"memory x{memory_ratio:.2f}")
+        old_exponents = baseline_results.get('exponents', {})
+        for name, value in current_results.get('exponents', {}).items():
+            if name in old_exponents:
+                lines.append(f"{'':<10} {language:<7} {'exponent':>9} {name:<9} "
+                             f"{old_exponents[name]:.2f} -> {value:.2f}")
+    return lines, regressions
+
+
+def load_results(path):
+    with open(path) as f:
+        results = json.load(f)
+    if results.get('version') != RESULTS_VERSION:
+        raise ValueError(f"{path}: unsupported results version {results.get('version')}")
+    return results
+
+
+def report_comparison(baseline, current, threshold):
+    lines, regressions = compare(baseline, current, threshold)
+    print(f"Compared against {baseline.get('commit') or 'baseline'}:")
+    for line in lines:
+        print(line)
+    print(f"{regressions} regression(s) above {threshold:.0%}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the compile phases of every frontend.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run the benchmark suite')
+    run_parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+                            help='comma separated input sizes such as 1K,10M (default: 1K to 100M)')
+    run_parser.add_argument('--languages', default=','.join(LANGUAGES),
+                            help='comma separated subset of ' + ', '.join(LANGUAGES))
+    run_parser.add_argument('--repeat', type=int, default=3,
+                            help='timing runs per input, the best is kept (default: 3)')
+    run_parser.add_argument('-o', '--output', default=None, help='save results as JSON')
+    run_parser.add_argument('--baseline', default=None, help='compare with earlier JSON results')
+    run_parser.add_argument('--threshold', type=float, default=0.10,
+                            help='slowdown counted as a regression (default: 0.10)')
+
+    compare_parser = commands.add_parser('compare', help='compare two saved results')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.10,
+                                help='slowdown counted as a regression (default: 0.10)')
+
+    execute_parser = commands.add_parser('execute', help='compare the interpreter and the jit')
+    execute_parser.add_argument('--languages', default=','.join(PROGRAMS),
+                                help='comma separated subset of ' + ', '.join(PROGRAMS))
+    execute_parser.add_argument('--repeat', type=int, default=3,
+                                help='runs per program, the best is kept (default: 3)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'execute':
+        languages = [language.strip() for language in args.languages.split(',') if language.strip()]
+        unknown = [language for language in languages if language not in PROGRAMS]
+        if unknown:
+            parser.error(f"unknown language(s): {', '.join(unknown)}")
+        run_execution(languages, max(args.repeat, 1))
+        return 0
+
+    if args.command == 'compare':
+        return 1 if report_comparison(load_results(args.baseline), load_results(args.current),
+                                      args.threshold) else 0
+
+    languages = [language.strip() for language in args.languages.split(',') if language.strip()]
+    unknown = [language for language in languages if language not in RUNNERS]
+    if unknown:
+        parser.error(f"unknown language(s): {', '.join(unknown)}")
+    sizes = [parse_size(size) for size in args.sizes.split(',') if size.strip()]
+
+    baseline = load_results(args.baseline) if args.baseline else None
+    results = run_suite(languages, sizes, max(args.repeat, 1))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    if baseline is not None:
+        return 1 if report_comparison(baseline, results, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
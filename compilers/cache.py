@@ -0,0 +1,150 @@
+import hashlib
+import os
+import pickle
+import tempfile
+
+from compilers import lexgen, preprocess
+
+# On-disk cache of compile results keyed by content.
+#
+# The key is a SHA-256 of the frontend name, COMPILER_VERSION and the source
+# bytes, so an unchanged file compiled by the same compiler is a hit and is
+# never lexed or parsed again. Each entry holds the token stream, the AST
+# (None for frontends without one), the final IR and the diagnostics the
+# compile wrote out, which a hit writes again, and for a C or C++ file the
+# headers it included: the entry only counts as a hit while none of them
+# has changed. Entries are written
+# atomically, so concurrent batch workers can share one directory, and the
+# least recently used entries are evicted when the directory grows past its
+# size limit.
+
+# Bump whenever a frontend's tokens, AST or IR change so stale entries miss
+COMPILER_VERSION = 12
+
+DEFAULT_DIRECTORY = os.path.join(lexgen.CACHE_DIR, 'compile')
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Stores between two scans of the cache directory. In between, its size is
+# kept up to date from this process's own stores, and a store that takes it
+# past the limit evicts at once; the scans pick up what other processes
+# sharing the directory have written
+EVICTION_INTERVAL = 64
+
+
+class CompileCache:
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory or DEFAULT_DIRECTORY
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.stores_since_eviction = 0
+        # Bytes in the directory as of the last scan plus the stores since,
+        # None before the first scan
+        self.total = None
+
+    def key(self, source, frontend):
+        if isinstance(source, str):
+            source = source.encode('utf-8')
+        digest = hashlib.sha256()
+        digest.update(f'{frontend}\0{COMPILER_VERSION}\0'.encode('utf-8'))
+        digest.update(source)
+        return digest.hexdigest()
+
+    def path(self, key):
+        # Two-level layout keeps directories small
+        return os.path.join(self.directory, key[:2], key[2:] + '.pickle')
+
+    def get(self, key):
+        # Returns the entry dict or None
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+            # A damaged entry is dropped and counts as a miss
+            self.remove(path)
+            self.misses += 1
+            return None
+        depends = entry.get('depends')
+        if depends and not preprocess.dependencies_current(depends):
+            # A header changed; the next put replaces the entry
+            self.misses += 1
+            return None
+        # The modification time records the last use for LRU eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return entry
+
+    def put(self, key, tokens=None, ast=None, ir=None, depends=None, output=None):
+        # depends maps header paths to their (mtime_ns, size); output is the
+        # text of the semantic diagnostics
+        path = self.path(key)
+        entry = {'tokens': tokens, 'ast': ast, 'ir': ir, 'depends': depends, 'output': output}
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write a private temporary file, then rename it into place so
+            # readers never see a partial entry
+            handle, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(handle, 'wb') as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+                size = f.tell()
+            # A replaced entry no longer counts
+            try:
+                size -= os.path.getsize(path)
+            except OSError:
+                pass
+            os.replace(temporary_path, path)
+        except OSError:
+            # Caching is best effort
+            return
+        self.stores += 1
+        self.stores_since_eviction += 1
+        if self.total is not None:
+            self.total += size
+        if self.total is None or self.total > self.max_bytes or self.stores_since_eviction >= EVICTION_INTERVAL:
+            self.evict()
+
+    def evict(self):
+        # Delete least recently used entries until the cache fits max_bytes
+        self.stores_since_eviction = 0
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.tmp'):
+                    # Another worker is still writing this one
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    info = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((info.st_mtime, info.st_size, path))
+                total += info.st_size
+        if total > self.max_bytes:
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                if self.remove(path):
+                    self.evictions += 1
+                total -= size
+        self.total = total
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'stores': self.stores, 'evictions': self.evictions}
@@ -0,0 +1,261 @@
+from compilers import ir
+
+# Control-flow and data-flow analysis of the linear IR (see compilers/ir.py),
+# shared by the optimization passes (compilers/passes.py) and the loop
+# passes (compilers/loops.py).
+#
+# A function's instructions are split into basic blocks in layout order. A
+# block starts at a label and ends after a jump or RETURN; its successors
+# are the jump target and, unless the jump is unconditional, the next block.
+# Passes rewrite the blocks in place and lay them out again.
+
+# Stack instructions that push one value and have no other effect, so a
+# value they compute and nobody uses can be dropped with their inputs. DIV,
+# MOD and INDEX can fail and stay
+PURE_OPCODES = {ir.PUSH, ir.LOAD, ir.DUP, ir.ADD, ir.SUB, ir.MUL, ir.NEG, ir.NOT, ir.BIT_AND,
+                ir.BIT_OR, ir.BIT_XOR, ir.BIT_NOT, ir.SHIFT_LEFT, ir.SHIFT_RIGHT, ir.COMPARE,
+                ir.ARRAY}
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def is_variable(operand):
+    # Register code operands are variable names or numbers
+    return isinstance(operand, str)
+
+
+def is_pure(instr):
+    return instr.opcode in PURE_OPCODES and (instr.opcode != ir.COMPARE or len(instr.operands) == 1)
+
+
+# Basic blocks and the control-flow graph
+
+class Block:
+    def __init__(self, index):
+        self.index = index
+        self.labels = []
+        self.instructions = []
+        self.successors = []
+        self.predecessors = []
+
+
+def build_blocks(instructions):
+    # Splits instructions into basic blocks in layout order and links them
+    blocks = [Block(0)]
+    for instr in instructions:
+        block = blocks[-1]
+        if instr.opcode == ir.LABEL:
+            if block.instructions:
+                block = Block(len(blocks))
+                blocks.append(block)
+            block.labels.append(instr.operands[0])
+            continue
+        block.instructions.append(instr)
+        if instr.opcode in ir.JUMPS or instr.opcode == ir.RETURN:
+            blocks.append(Block(len(blocks)))
+    if len(blocks) > 1 and not blocks[-1].labels and not blocks[-1].instructions:
+        blocks.pop()
+
+    targets = {label: block for block in blocks for label in block.labels}
+    for block in blocks:
+        last = block.instructions[-1] if block.instructions else None
+        following = blocks[block.index + 1] if block.index + 1 < len(blocks) else None
+        if last is not None and last.opcode in ir.JUMPS:
+            target = targets.get(last.operands[0])
+            if target is not None:
+                block.successors.append(target)
+            if last.opcode != ir.JUMP and following is not None:
+                block.successors.append(following)
+        elif (last is None or last.opcode != ir.RETURN) and following is not None:
+            block.successors.append(following)
+        for successor in block.successors:
+            successor.predecessors.append(block)
+    return blocks
+
+
+def layout(blocks):
+    instructions = []
+    for block in blocks:
+        instructions.extend(ir.Instr(ir.LABEL, (label,)) for label in block.labels)
+        instructions.extend(block.instructions)
+    return instructions
+
+
+def reverse_postorder(blocks):
+    # The blocks reachable from the entry, each before its successors except
+    # along loop back edges
+    order = []
+    visited = [False] * len(blocks)
+    visited[0] = True
+    stack = [(blocks[0], iter(blocks[0].successors))]
+    while stack:
+        block, successors = stack[-1]
+        for successor in successors:
+            if not visited[successor.index]:
+                visited[successor.index] = True
+                stack.append((successor, iter(successor.successors)))
+                break
+        else:
+            stack.pop()
+            order.append(block)
+    order.reverse()
+    return order
+
+
+def dominators(order):
+    # Immediate dominator of each reachable block, by block index; the entry
+    # is its own. The iterative algorithm of Cooper, Harvey and Kennedy,
+    # which settles in two sweeps over the structured code the generators
+    # produce
+    position = {block.index: number for number, block in enumerate(order)}
+    idom = {order[0].index: order[0].index}
+
+    def intersect(a, b):
+        while a != b:
+            while position[a] > position[b]:
+                a = idom[a]
+            while position[b] > position[a]:
+                b = idom[b]
+        return a
+
+    changed = True
+    while changed:
+        changed = False
+        for block in order[1:]:
+            new = None
+            for predecessor in block.predecessors:
+                if predecessor.index in idom:
+                    new = predecessor.index if new is None else intersect(predecessor.index, new)
+            if idom.get(block.index) != new:
+                idom[block.index] = new
+                changed = True
+    return idom
+
+
+def dominates(idom, a, b):
+    # Whether every path from the entry to block b passes block a
+    while b != a:
+        parent = idom[b]
+        if parent == b:
+            return False
+        b = parent
+    return True
+
+
+# Variables
+
+def variables(instructions):
+    names = set()
+    for instr in instructions:
+        opcode = instr.opcode
+        if opcode == ir.LOAD or opcode == ir.STORE or opcode == ir.INCREMENT or opcode == ir.DECREMENT:
+            names.add(instr.operands[0])
+        elif (opcode == ir.LOAD_CONSTANT or opcode == ir.MOVE
+              or (opcode == ir.COMPARE and len(instr.operands) == 2)):
+            names.update(operand for operand in instr.operands if is_variable(operand))
+    return names
+
+
+def defined_variable(instr):
+    # The variable an instruction writes, or None
+    opcode = instr.opcode
+    if opcode == ir.STORE or opcode == ir.INCREMENT or opcode == ir.DECREMENT:
+        return instr.operands[0]
+    if opcode == ir.LOAD_CONSTANT or opcode == ir.MOVE:
+        return instr.operands[1]
+    return None
+
+
+def used_variables(instr, escaping):
+    # The variables an instruction reads
+    opcode = instr.opcode
+    if opcode == ir.LOAD or opcode == ir.INCREMENT or opcode == ir.DECREMENT:
+        return instr.operands[:1]
+    if opcode == ir.MOVE:
+        return instr.operands[:1] if is_variable(instr.operands[0]) else ()
+    if opcode == ir.COMPARE and len(instr.operands) == 2:
+        return [operand for operand in instr.operands if is_variable(operand)]
+    if opcode == ir.CALL:
+        return escaping
+    return ()
+
+
+def liveness(order, escaping):
+    # Backward data flow over the reachable blocks: the variables that may
+    # still be read on entry to and exit from each block, by block index
+    generated = {}
+    killed = {}
+    for block in order:
+        uses = set()
+        definitions = set()
+        for instr in reversed(block.instructions):
+            name = defined_variable(instr)
+            if name is not None:
+                uses.discard(name)
+                definitions.add(name)
+            uses.update(used_variables(instr, escaping))
+        generated[block.index] = uses
+        killed[block.index] = definitions
+    live_in = {block.index: set() for block in order}
+    live_out = {}
+    # Only blocks whose successors changed are visited again
+    dirty = {block.index for block in order}
+    while dirty:
+        for block in reversed(order):
+            if block.index not in dirty:
+                continue
+            dirty.discard(block.index)
+            if block.successors:
+                out = set().union(*(live_in[successor.index] for successor in block.successors))
+            else:
+                # Leaving the function
+                out = set(escaping)
+            live_out[block.index] = out
+            block_in = generated[block.index] | (out - killed[block.index])
+            if block_in != live_in[block.index]:
+                live_in[block.index] = block_in
+                dirty.update(predecessor.index for predecessor in block.predecessors
+                             if predecessor.index in live_in)
+    return live_in, live_out
+
+
+class Function:
+    # One function's instructions without its FUNCTION line, the variables
+    # that outlive it, and where passes get names for new variables
+    # (new_temporary of the ir.Program being optimized). Passes that change
+    # the code assign new instructions, which drops every cached analysis; a
+    # pass that changes nothing leaves them for the next one
+    def __init__(self, instructions, escaping, new_temporary=None):
+        self.instructions = instructions
+        self.escaping = escaping
+        self.new_temporary = new_temporary
+        self.analyzed = None
+        self.analyses = {}
+
+    def analysis(self, name, compute):
+        # compute(self), computed once per version of the instructions
+        if self.analyzed is not self.instructions:
+            self.analyzed = self.instructions
+            self.analyses = {}
+        if name not in self.analyses:
+            self.analyses[name] = compute(self)
+        return self.analyses[name]
+
+    def control_flow(self):
+        # (blocks in layout order, reachable blocks in reverse postorder)
+        return self.analysis('control_flow', control_flow)
+
+    def liveness(self):
+        # (live on entry, live on exit) by block index
+        return self.analysis('liveness', lambda function: liveness(function.control_flow()[1],
+                                                                   function.escaping))
+
+    def dominators(self):
+        return self.analysis('dominators', lambda function: dominators(function.control_flow()[1]))
+
+
+def control_flow(function):
+    blocks = build_blocks(function.instructions)
+    return blocks, reverse_postorder(blocks)
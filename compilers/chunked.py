@@ -0,0 +1,232 @@
+import argparse
+import os
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from compilers import lexgen, tokens
+
+# Parallel lexing of one large source file.
+#
+#   python -m compilers.chunked [-j WORKERS] [--chunks N] FILE
+#
+# The source is copied once into a shared memory block and cut into chunks
+# at newlines. Each worker process lexes one chunk from its start, over the
+# whole block so a token may run past the chunk end, and stops at the first
+# token that starts at or after the chunk end. It returns the kinds, global
+# offsets and symbol ids of its tokens, its own symbol names and the line
+# starts of its chunk.
+#
+# A newline inside a block comment or string is not a safe place to start
+# lexing, and which newlines are safe is only known after lexing what comes
+# before them. So the chunks are stitched speculatively: the tokens of a
+# chunk are kept from the first one that starts where the tokens before it
+# stop, because the lexer is back in its initial state at every token start
+# and lexes everything after that point the same way. When a chunk started
+# inside a comment or string, its first tokens do not line up, and the text
+# up to the first token that does is lexed again here. The result is the
+# TokenStream Lexer.stream returns for the whole source, with its line
+# table already filled in.
+#
+# The command lexes FILE both ways, checks that the results are identical
+# and prints the speedup.
+
+# Sources smaller than this are lexed in this process
+PARALLEL_THRESHOLD = 1024 * 1024
+
+
+class Chunk:
+    __slots__ = ('start', 'end', 'stop', 'kinds', 'starts', 'ends', 'symbol_ids', 'names', 'line_starts')
+
+    def __init__(self, start, end, stop, kinds, starts, ends, symbol_ids, names, line_starts):
+        # Nominal range of the chunk, and where its tokens stop
+        self.start = start
+        self.end = end
+        self.stop = stop
+        self.kinds = kinds
+        self.starts = starts
+        self.ends = ends
+        self.symbol_ids = symbol_ids
+        # Symbol id in this chunk -> name
+        self.names = names
+        # Starts of the lines that begin inside start:end
+        self.line_starts = line_starts
+
+
+def lex_chunk(job):
+    # Runs in a worker process
+    spec, block_name, size, start, end = job
+    lexer = lexgen.build_lexer(spec)
+    # The block was created before the pool, so this process shares the
+    # creator's resource tracker and attaching does not register it twice
+    block = shared_memory.SharedMemory(name=block_name)
+    try:
+        data = block.buf[:size]
+        offset_type = 'I' if size < 2 ** 32 else 'Q'
+        kinds = array('B')
+        starts = array(offset_type)
+        ends = array(offset_type)
+        symbol_ids = array('i')
+        symbols = tokens.SymbolTable()
+        intern = symbols.intern
+        literal_kinds = lexer.literal_kinds
+        # The chunk is lexed from a private copy, which is cheaper to scan
+        # and cut texts from than the shared buffer, until a token needs to
+        # look past the copy; from there on the shared buffer is used
+        text = bytes(data[start:end])
+        resume = end
+        for kind, token_start, token_end, examined in lexer.scan(text, 0, None, True):
+            if examined >= len(text):
+                resume = start + token_start
+                break
+            kinds.append(kind)
+            starts.append(start + token_start)
+            ends.append(start + token_end)
+            symbol_ids.append(-1 if kind in literal_kinds else intern(text[token_start:token_end]))
+        stop = size
+        for kind, token_start, token_end in lexer.scan(data, resume):
+            if token_start >= end:
+                stop = token_start
+                break
+            kinds.append(kind)
+            starts.append(token_start)
+            ends.append(token_end)
+            symbol_ids.append(-1 if kind in literal_kinds else intern(bytes(data[token_start:token_end])))
+        line_starts = array('Q')
+        position = text.find(b'\n')
+        while position != -1:
+            line_starts.append(start + position + 1)
+            position = text.find(b'\n', position + 1)
+        del data
+    finally:
+        block.close()
+    return Chunk(start, end, stop, kinds, starts, ends, symbol_ids, symbols.names, line_starts)
+
+
+def chunk_bounds(data, count):
+    # Split points just after a newline near every 1/count of the source
+    bounds = [0]
+    for index in range(1, count):
+        position = data.find(b'\n', max(len(data) * index // count, bounds[-1]))
+        if position == -1:
+            break
+        if position + 1 < len(data) and position + 1 > bounds[-1]:
+            bounds.append(position + 1)
+    bounds.append(len(data))
+    return bounds
+
+
+def tokenize(lexer, source, workers=None, chunks=None):
+    # TokenStream of the whole source, the same as lexer.stream(source)
+    data = source.encode('utf-8') if isinstance(source, str) else bytes(source)
+    workers = workers or os.cpu_count() or 1
+    if len(data) < PARALLEL_THRESHOLD or (workers == 1 and not chunks):
+        return lexer.stream(data)
+    bounds = chunk_bounds(data, chunks or workers)
+
+    block = shared_memory.SharedMemory(create=True, size=len(data))
+    try:
+        block.buf[:len(data)] = data
+        jobs = [(lexer.spec, block.name, len(data), start, end) for start, end in zip(bounds, bounds[1:])]
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+            results = list(executor.map(lex_chunk, jobs))
+    finally:
+        block.close()
+        block.unlink()
+    return stitch(lexer, data, results)
+
+
+def stitch(lexer, data, results):
+    token_stream = tokens.TokenStream(data, lexer.kinds)
+    intern = token_stream.symbols.intern
+    literal_kinds = lexer.literal_kinds
+    line_starts = array('Q', [0])
+    # Where the tokens stitched so far stop: a token start, or the end
+    position = 0
+    for chunk in results:
+        line_starts.extend(chunk.line_starts)
+        if position >= chunk.stop:
+            # The tokens so far already cover this chunk
+            continue
+        first = bisect_left(chunk.starts, position)
+        if position != chunk.start and not (first < len(chunk.starts) and chunk.starts[first] == position):
+            # The chunk started inside a token: lex again from position up to
+            # the first token start the chunk shares, or past the chunk
+            first = None
+            for kind, start, end in lexer.scan(data, position):
+                if start >= chunk.stop:
+                    position = start
+                    break
+                first = bisect_left(chunk.starts, start)
+                if first < len(chunk.starts) and chunk.starts[first] == start:
+                    break
+                first = None
+                token_stream.append(kind, start, end,
+                                    -1 if kind in literal_kinds else intern(bytes(data[start:end])))
+            else:
+                position = len(data)
+            if first is None:
+                continue
+        # Chunk symbol ids -> stream symbol ids; -1 maps to the -1 at the end
+        mapping = [intern(name.encode('utf-8')) for name in chunk.names]
+        mapping.append(-1)
+        token_stream.kinds.extend(chunk.kinds[first:])
+        token_stream.starts.extend(chunk.starts[first:])
+        token_stream.ends.extend(chunk.ends[first:])
+        token_stream.symbol_ids.extend(array('i', map(mapping.__getitem__, chunk.symbol_ids[first:])))
+        position = chunk.stop
+    token_stream.line_starts = line_starts
+    return token_stream
+
+
+def same_tokens(left, right):
+    return (left.kinds == right.kinds and left.starts == right.starts and left.ends == right.ends
+            and [left.value(index) for index in range(len(left))] == [right.value(index) for index in range(len(right))])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Lex one large source file on several cores.')
+    parser.add_argument('input', help='C, C++, Pascal or Rust file')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='worker processes (default: one per CPU)')
+    parser.add_argument('--chunks', type=int, default=None,
+                        help='chunks to split the file into (default: one per worker)')
+    args = parser.parse_args(argv)
+
+    from compilers import batch
+    module_name = batch.frontend_for(args.input)
+    if module_name is None:
+        print(f"Error: no frontend for {args.input}", file=sys.stderr)
+        return 2
+    lexer = batch.load_frontend(module_name).lexer
+    try:
+        with open(args.input, 'rb') as f:
+            data = f.read()
+    except OSError as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+    workers = args.workers or os.cpu_count() or 1
+
+    start = time.perf_counter()
+    serial = lexer.stream(data)
+    serial_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    parallel = tokenize(lexer, data, workers, args.chunks or workers)
+    parallel_seconds = time.perf_counter() - start
+
+    matches = same_tokens(serial, parallel) and all(
+        serial.line(index) == parallel.line(index) for index in range(0, len(serial), 97))
+    megabytes = len(data) / (1024 * 1024)
+    print(f"{args.input}: {megabytes:.2f} MB, {len(serial)} tokens")
+    print(f"1 process: {serial_seconds:.3f} s ({megabytes / serial_seconds:.2f} MB/s)")
+    print(f"{workers} workers, {args.chunks or workers} chunks: {parallel_seconds:.3f} s "
+          f"({megabytes / parallel_seconds:.2f} MB/s, {serial_seconds / parallel_seconds:.2f}x)")
+    print(f"Tokens match single-process lexing: {'yes' if matches else 'NO'}")
+    return 0 if matches else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
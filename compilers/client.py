@@ -0,0 +1,125 @@
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+
+# Thin client for the compile server (compilers/server.py). It only needs the
+# standard library, so it starts quickly and can stand in for running a
+# frontend script:
+#
+#   python -m compilers.client [-o OUTPUT] [-O0] [--stream] [--timing] FILE...
+#   python -m compilers.client --stats | --ping | --shutdown
+#
+# All files go to the server on one connection and are compiled
+# concurrently. Each output is written next to its input as <input>.ir, or
+# to OUTPUT for a single file, as the batch driver does. What a frontend
+# prints is printed here.
+
+DEFAULT_SOCKET = os.environ.get('COMPILERS_SOCKET',
+                                os.path.join(tempfile.gettempdir(), f'compilers-{os.getuid()}.sock'))
+
+
+def request_all(socket_path, requests):
+    # Sends every request on one connection and yields the responses in the
+    # order the server finishes them
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall(b''.join(json.dumps(request).encode('utf-8') + b'\n' for request in requests))
+        client.shutdown(socket.SHUT_WR)
+        with client.makefile('rb') as responses:
+            for line in responses:
+                yield json.loads(line)
+
+
+def request(socket_path, message):
+    for response in request_all(socket_path, [message]):
+        return response
+    raise ConnectionError("the compile server closed the connection")
+
+
+def compile_files(socket_path, paths, output=None, optimize=True, streaming=None, timing=False):
+    # Returns the number of files that failed
+    requests = []
+    for index, path in enumerate(paths):
+        message = {'op': 'compile', 'id': index, 'path': os.path.abspath(path), 'optimize': optimize}
+        if output is not None:
+            message['output'] = os.path.abspath(output)
+        if streaming is not None:
+            message['streaming'] = streaming
+        requests.append(message)
+    failures = 0
+    for response in request_all(socket_path, requests):
+        path = paths[response['id']] if 'id' in response else '?'
+        if response.get('output'):
+            sys.stdout.write(response['output'])
+        if not response['ok']:
+            failures += 1
+            print(f"{path}: {response['error']}", file=sys.stderr)
+        elif timing:
+            cached = ' (cached)' if response['cached'] else ''
+            print(f"{path}: {response['latency_ms']:.3f} ms (queue {response['queue_ms']:.3f} ms, "
+                  f"compile {response['compile_ms']:.3f} ms){cached}")
+    return failures
+
+
+def print_stats(stats):
+    print(f"Uptime {stats['uptime_seconds']:.1f} s, {stats['requests']} requests, {stats['errors']} errors, "
+          f"{stats['in_flight']} in flight")
+    lookups = stats['cache_hits'] + stats['cache_misses']
+    if lookups:
+        print(f"Cache: {stats['cache_hits']} hits, {stats['cache_misses']} misses "
+              f"({100 * stats['cache_hits'] / lookups:.1f}% hit rate)")
+    if stats['languages']:
+        print(f"{'language':<10}{'requests':>10}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for language, row in stats['languages'].items():
+        print(f"{language:<10}{row['requests']:>10}{row['mean_ms']:>10.3f}{row['p50_ms']:>10.3f}"
+              f"{row['p95_ms']:>10.3f}{row['max_ms']:>10.3f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compile files on a running compile server.')
+    parser.add_argument('inputs', nargs='*', help='C, C++, Pascal or Rust files')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET,
+                        help=f'Unix socket of the server (default: {DEFAULT_SOCKET})')
+    parser.add_argument('-o', '--output', default=None,
+                        help='output file when compiling a single input')
+    parser.add_argument('-O', dest='optimize', type=int, choices=[0, 1], default=1,
+                        help='-O0 writes the intermediate code unoptimized (default: -O1)')
+    parser.add_argument('--stream', dest='streaming', action='store_const', const=True, default=None,
+                        help='always use the streaming pipeline where supported')
+    parser.add_argument('--timing', action='store_true',
+                        help='print the latency of every compile')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--stats', action='store_true', help='print the server latency metrics')
+    group.add_argument('--ping', action='store_true', help='check that the server is running')
+    group.add_argument('--shutdown', action='store_true', help='stop the server')
+    args = parser.parse_args(argv)
+
+    if args.output is not None and len(args.inputs) != 1:
+        parser.error('-o needs exactly one input')
+    if not args.inputs and not (args.stats or args.ping or args.shutdown):
+        parser.error('nothing to do: give input files, --stats, --ping or --shutdown')
+
+    try:
+        if args.stats:
+            print_stats(request(args.socket, {'op': 'stats'})['stats'])
+        elif args.ping:
+            request(args.socket, {'op': 'ping'})
+            print(f"Compile server is running on {args.socket}")
+        elif args.shutdown:
+            request(args.socket, {'op': 'shutdown'})
+        if args.inputs:
+            failures = compile_files(args.socket, args.inputs, args.output, bool(args.optimize),
+                                     args.streaming, args.timing)
+            return 1 if failures else 0
+    except (FileNotFoundError, ConnectionRefusedError):
+        print(f"Error: no compile server on {args.socket} (start one with python -m compilers.server)",
+              file=sys.stderr)
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
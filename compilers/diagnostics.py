@@ -0,0 +1,105 @@
+import os
+from collections import namedtuple
+
+# Syntax error reporting shared by the frontends.
+#
+# Lexers and parsers recover from errors instead of stopping at the first
+# one. A character no lexer rule matches becomes an error token that the
+# parser reports and skips. A parser that cannot go on reports the error and
+# resumes after the statement it was in, as compilers/lalr.py describes.
+#
+# Every error of a pass is collected as a Diagnostic with its line, column and
+# a snippet of at most SNIPPET_WIDTH characters of the offending text, so a
+# bad byte in a large generated input costs one short line instead of a copy
+# of the rest of the file. At the end of the pass the errors are raised
+# together as one CompileError. An error beyond the first max_errors stops
+# the pass early with those; the cap comes from the caller, else from
+# COMPILERS_MAX_ERRORS, else DEFAULT_MAX_ERRORS, and 0 means no cap.
+
+DEFAULT_MAX_ERRORS = 20
+
+SNIPPET_WIDTH = 40
+
+# line and column are 1-based and None when the position is not known;
+# snippet is None when there is no offending text, as at the end of input
+Diagnostic = namedtuple('Diagnostic', ['line', 'column', 'message', 'snippet'])
+
+
+def max_errors(limit=None):
+    if limit is not None:
+        return limit
+    try:
+        return int(os.environ.get('COMPILERS_MAX_ERRORS', DEFAULT_MAX_ERRORS))
+    except ValueError:
+        return DEFAULT_MAX_ERRORS
+
+
+def snippet(text, width=SNIPPET_WIDTH):
+    # The first line of text, cut to width characters
+    cut = text[:width + 1]
+    if isinstance(cut, (bytes, bytearray, memoryview)):
+        cut = bytes(cut).decode('utf-8', 'replace')
+    newline = cut.find('\n')
+    if newline != -1:
+        return cut[:newline] + '...'
+    if len(cut) > width:
+        return cut[:width] + '...'
+    return cut
+
+
+def format_diagnostic(diagnostic, path=None):
+    line, column, message, text = diagnostic
+    where = path or '<input>'
+    if line is not None:
+        where += f':{line}:{column}' if column is not None else f':{line}'
+    if text is not None:
+        return f'{where}: {message} {text!r}'
+    return f'{where}: {message}'
+
+
+class CompileError(SyntaxError):
+    def __init__(self, diagnostics, path=None, truncated=False):
+        self.diagnostics = sorted(diagnostics, key=lambda diagnostic: (diagnostic.line or 0,
+                                                                       diagnostic.column or 0))
+        self.path = path
+        self.truncated = truncated
+        super().__init__(self.report())
+
+    def lines(self):
+        lines = [format_diagnostic(diagnostic, self.path) for diagnostic in self.diagnostics]
+        if self.truncated:
+            lines.append(f'{self.path or "<input>"}: stopped after {len(self.diagnostics)} errors')
+        return lines
+
+    def report(self):
+        return '\n'.join(self.lines())
+
+    def __str__(self):
+        return self.report()
+
+    def __reduce__(self):
+        # For errors that cross a process pool
+        return CompileError, (self.diagnostics, self.path, self.truncated)
+
+
+class Diagnostics:
+    # The errors of one pass over one source
+    def __init__(self, path=None, limit=None):
+        self.path = path
+        self.limit = max_errors(limit)
+        self.errors = []
+
+    def __len__(self):
+        return len(self.errors)
+
+    def error(self, message, line=None, column=None, text=None):
+        # An error past the cap stops the pass with the first limit errors;
+        # a source with exactly limit errors still reports them all
+        if self.limit and len(self.errors) >= self.limit:
+            raise CompileError(self.errors, self.path, truncated=True)
+        self.errors.append(Diagnostic(line, column, message, snippet(text) if text is not None else None))
+
+    def check(self):
+        # Raises the errors reported so far, if any
+        if self.errors:
+            raise CompileError(self.errors, self.path)
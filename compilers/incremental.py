@@ -0,0 +1,442 @@
+import argparse
+import bisect
+import io
+import itertools
+import os
+import random
+import sys
+import time
+
+from compilers import batch, diagnostics, ir, tokens
+
+# Incremental recompiles for editor and watch workflows.
+#
+#   python -m compilers.incremental [--watch] [--interval SECONDS] [-o OUTPUT] FILE
+#   python -m compilers.incremental --edits N FILE
+#
+# A Document keeps a source file split into units, one per top-level
+# declaration, each with its own tokens, AST and IR. An edit (a byte range
+# and its replacement) is applied to the text and re-lexed from the start of
+# the unit it falls in: unit starts are token starts at bracket depth zero,
+# so the lexer and the declaration splitter both restart there in their
+# initial state. Each unit also remembers how far the lexer looked while
+# lexing it, since a failed longer match (an unterminated comment or
+# string) reads ahead; an edit inside that lookahead re-lexes the unit too,
+# so the restart can be a few units before the edit. Lexing stops as soon as a unit boundary lands on the
+# shifted start of an old unit past the edit, because everything from there
+# on lexes exactly as before. Only the units in between are parsed and
+# lowered again; the others keep their tokens, AST and IR, and just move.
+#
+# Token positions are relative to their unit, so nothing after an edit is
+# rewritten. The IR of the document is the IR of its units in order.
+#
+# How C parses a unit depends on the typedef names declared before it. Each
+# unit records the names it declares and the type names it was parsed with.
+# When the rebuilt units change which names are declared, the later units
+# using one of those names are checked, and parsed again from their tokens
+# if it is no longer a type name there, or has become one, as a full
+# compile would see it.
+#
+# --watch polls FILE and turns each change into one edit (the differing
+# middle between the common prefix and suffix of the old and new text),
+# rewriting OUTPUT after every save. --edits replays N random keystrokes on
+# FILE and compares their latency with compiling the whole file.
+
+
+class CFrontend:
+    # How a C source is split, parsed, lowered and checked one top-level
+    # declaration at a time, as the C streaming pipeline does
+    def __init__(self):
+        self.module = batch.load_frontend('C.c_compiler')
+        self.lexer = self.module.lexer
+        self.compiler = self.module.Compiler(verbose=False)
+        self.structured = True
+        self.standard_types = frozenset(self.module.STANDARD_TYPES)
+
+    def splitter(self):
+        return self.module.DeclarationSplitter()
+
+    def parse(self, token_stream, type_names):
+        # A unit being edited is often incomplete: its syntax errors are
+        # recovered from and not reported. type_names gets the typedefs the
+        # unit declares
+        errors = diagnostics.Diagnostics(limit=0)
+        return self.module.Parser(token_stream, errors, type_names).parse_translation_unit()
+
+    def generate(self, ast):
+        program = ir.Program()
+        self.compiler.generate_nodes(ast, program)
+        return program.take()
+
+    def check(self, asts):
+        out = io.StringIO()
+        analyzer = self.module.SemanticAnalyzer(out)
+        for ast in asts:
+            analyzer.analyze(ast)
+        analyzer.finish()
+        return out.getvalue().splitlines()
+
+
+class TypeNames(set):
+    # The type names a unit is parsed with, recording those the unit
+    # declares
+    def __init__(self, names):
+        super().__init__(names)
+        self.declared = set()
+
+    def add(self, name):
+        super().add(name)
+        self.declared.add(name)
+
+
+# Language -> frontend with a declaration splitter
+FRONTENDS = {'c': CFrontend}
+
+# Source extension -> language
+EXTENSIONS = {'.c': 'c'}
+
+
+class Unit:
+    __slots__ = ('start', 'examined', 'tokens', 'ast', 'ir', 'types', 'declared')
+
+    def __init__(self, start, examined, token_stream, ast, instructions, types, declared):
+        self.start = start
+        # Furthest byte the lexer read to lex this unit
+        self.examined = examined
+        self.tokens = token_stream
+        self.ast = ast
+        self.ir = instructions
+        # Type names declared before the unit when it was parsed, and the
+        # typedef names it declares
+        self.types = types
+        self.declared = declared
+
+
+class Document:
+    def __init__(self, source, language='c'):
+        self.frontend = FRONTENDS[language]()
+        self.data = bytearray(source.encode('utf-8') if isinstance(source, str) else source)
+        # One symbol table for every unit, so a name is interned once
+        self.symbols = tokens.SymbolTable()
+        self.units = []
+        self.starts = []
+        self.reach = []
+        # typedef name -> units declaring it
+        self.declared_by = {}
+        # What the last edit did
+        self.relexed_bytes = 0
+        self.rebuilt_units = 0
+        self.reused_units = 0
+        self.rebuild(0, 0, 0, 0)
+
+    # Views of the whole document
+
+    def text(self):
+        return self.data.decode('utf-8')
+
+    def ast(self):
+        return [node for unit in self.units for node in unit.ast]
+
+    def intermediate_code(self):
+        return [instr for unit in self.units for instr in unit.ir]
+
+    def write(self, out):
+        ir.write(self.intermediate_code(), out, structured=self.frontend.structured)
+
+    def diagnostics(self):
+        # The semantic checks need the whole program, but only walk the ASTs
+        return self.frontend.check(unit.ast for unit in self.units)
+
+    def offset(self, line, column):
+        # Byte offset of a 1-based line and character column
+        start = 0
+        for _ in range(line - 1):
+            start = self.data.index(b'\n', start) + 1
+        end = self.data.find(b'\n', start)
+        text = self.data[start:end if end != -1 else len(self.data)].decode('utf-8')
+        return start + len(text[:column - 1].encode('utf-8'))
+
+    # Editing
+
+    def edit(self, start, end, replacement):
+        # Replace the bytes start:end with replacement (a str or bytes).
+        # Returns the range of unit indexes that were rebuilt
+        if isinstance(replacement, str):
+            replacement = replacement.encode('utf-8')
+        if not 0 <= start <= end <= len(self.data):
+            raise ValueError(f"edit range {start}:{end} is outside the document (0:{len(self.data)})")
+        # The unit holding start is rebuilt from its beginning, and so is
+        # every unit before it whose lexing looked at start or beyond
+        first = max(bisect.bisect_right(self.starts, start) - 1, 0)
+        first = min(first, bisect.bisect_left(self.reach, start))
+        restart = self.starts[first]
+        self.data[start:end] = replacement
+        delta = len(replacement) - (end - start)
+        return self.rebuild(first, restart, start + len(replacement), delta)
+
+    def rebuild(self, first, restart, new_end, delta):
+        # Re-lex from restart (the start of unit first) into new units until a
+        # unit boundary at or after new_end matches the start of an old unit
+        lexer = self.frontend.lexer
+        kinds = lexer.kinds
+        data = self.data
+        old_starts = self.starts
+        old_index = first
+        splitter = self.frontend.splitter()
+        new_units = []
+        spans = []
+        unit_start = restart
+        closed = False
+        resume = None
+        examined = restart
+        # Type names before the next rebuilt unit
+        types = self.types_before(restart)
+        for kind, start, end, examined in lexer.scan(data, restart, lookahead=True):
+            if closed:
+                # start is the boundary after the unit just closed
+                old_start = start - delta
+                while old_index < len(old_starts) and old_starts[old_index] < old_start:
+                    old_index += 1
+                if start >= new_end and old_index < len(old_starts) and old_starts[old_index] == old_start:
+                    resume = old_index
+                    unit_end = start
+                    break
+                new_units.append(self.build_unit(unit_start, start, examined, spans, types))
+                if new_units[-1].declared:
+                    types = types | new_units[-1].declared
+                unit_start = start
+                spans = []
+            spans.append((kind, start, end))
+            token_type = kinds[kind]
+            value = data[start:end].decode('utf-8') if token_type == 'OPERATOR' else None
+            closed = splitter.ends_declaration(token_type, value)
+        if resume is None:
+            # Lexed to the end of the text, which the last unit depends on
+            resume = len(self.units)
+            unit_end = examined = len(data)
+        if spans or not new_units:
+            new_units.append(self.build_unit(unit_start, unit_end, examined, spans, types))
+        self.relexed_bytes = unit_end - restart
+        self.rebuilt_units = len(new_units)
+        self.reused_units = len(self.units) - (resume - first)
+
+        # Units after the rebuilt ones keep everything but move by delta
+        if delta:
+            for unit in self.units[resume:]:
+                unit.start += delta
+                unit.examined += delta
+        old_units = self.units[first:resume]
+        self.units[first:resume] = new_units
+        self.starts = [unit.start for unit in self.units]
+        # How far the lexer looked for any unit up to each one
+        self.reach = list(itertools.accumulate((unit.examined for unit in self.units), max))
+        self.retype(old_units, new_units, first + len(new_units))
+        return range(first, first + len(new_units))
+
+    def build_unit(self, start, end, examined, spans, types):
+        # Tokens relative to the unit, its AST and its IR
+        token_stream = self.frontend.lexer.stream(bytes(self.data[start:end]), self.symbols,
+                                                  [(kind, token_start - start, token_end - start)
+                                                   for kind, token_start, token_end in spans])
+        type_names = TypeNames(types)
+        ast = self.frontend.parse(token_stream, type_names)
+        return Unit(start, examined, token_stream, ast, self.frontend.generate(ast), types,
+                    frozenset(type_names.declared))
+
+    # typedef scopes
+
+    def types_before(self, start):
+        # Type names declared by the units starting before start
+        return self.frontend.standard_types.union(
+            name for name, units in self.declared_by.items() if any(unit.start < start for unit in units))
+
+    def declare(self, unit, names):
+        for name in unit.declared:
+            self.declared_by[name].discard(unit)
+        unit.declared = names
+        for name in names:
+            self.declared_by.setdefault(name, set()).add(unit)
+
+    def retype(self, old_units, new_units, index):
+        # Records the typedefs the rebuilt units declare. If the names
+        # declared changed, each unit from index on that uses one of them is
+        # parsed again when it is a type name there and was not, or the
+        # other way around
+        old_names = set()
+        for unit in old_units:
+            old_names.update(unit.declared)
+            self.declare(unit, frozenset())
+        new_names = set()
+        for unit in new_units:
+            new_names.update(unit.declared)
+            for name in unit.declared:
+                self.declared_by.setdefault(name, set()).add(unit)
+        changed = old_names ^ new_names
+        names = self.symbols.names
+        while changed and index < len(self.units):
+            unit = self.units[index]
+            used = changed.intersection(names[symbol] for symbol in set(unit.tokens.symbol_ids) if symbol >= 0)
+            if used:
+                types = self.types_before(unit.start)
+                if any((name in types) != (name in unit.types) for name in used):
+                    changed |= self.reparse(unit, types)
+            index += 1
+
+    def reparse(self, unit, types):
+        # Parses and lowers unit again from its tokens with the type names
+        # types; returns the typedef names it stopped or started declaring
+        type_names = TypeNames(types)
+        unit.ast = self.frontend.parse(unit.tokens, type_names)
+        unit.ir = self.frontend.generate(unit.ast)
+        unit.types = types
+        declared = frozenset(type_names.declared)
+        changed = unit.declared ^ declared
+        self.declare(unit, declared)
+        self.rebuilt_units += 1
+        return changed
+
+
+def common_prefix(old, new):
+    # Length of the common prefix, by binary search over slice comparisons
+    low, high = 0, min(len(old), len(new))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if old[low:middle] == new[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def common_suffix(old, new, limit):
+    # Length of the common suffix, at most limit bytes
+    low, high = 0, min(len(old), len(new)) - limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if old[len(old) - middle:len(old) - low] == new[len(new) - middle:len(new) - low]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def difference(old, new):
+    # The single edit (start, end, replacement) turning old into new
+    prefix = common_prefix(old, new)
+    suffix = common_suffix(old, new, prefix)
+    return prefix, len(old) - suffix, new[prefix:len(new) - suffix]
+
+
+def language_for(path):
+    language = EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if language is None:
+        raise ValueError(f"no incremental frontend for {path} (supported: {', '.join(sorted(EXTENSIONS))})")
+    return language
+
+
+def write_output(document, output_path):
+    with open(output_path, 'w') as f:
+        document.write(f)
+
+
+def watch(path, output_path, interval):
+    with open(path, 'rb') as f:
+        source = f.read()
+    start = time.perf_counter()
+    document = Document(source, language_for(path))
+    write_output(document, output_path)
+    print(f"Compiled {path} ({len(document.units)} units) in {(time.perf_counter() - start) * 1000:.3f} ms")
+    modified = os.stat(path).st_mtime_ns
+    while True:
+        time.sleep(interval)
+        try:
+            current = os.stat(path).st_mtime_ns
+            if current == modified:
+                continue
+            modified = current
+            with open(path, 'rb') as f:
+                source = f.read()
+        except OSError:
+            continue
+        start = time.perf_counter()
+        edit_start, edit_end, replacement = difference(bytes(document.data), source)
+        if edit_start == edit_end and not replacement:
+            continue
+        document.edit(edit_start, edit_end, replacement)
+        write_output(document, output_path)
+        print(f"Recompiled {document.rebuilt_units} of {len(document.units)} units "
+              f"({document.relexed_bytes} bytes re-lexed) in {(time.perf_counter() - start) * 1000:.3f} ms")
+
+
+# Bytes a replayed keystroke types or deletes
+TYPED = b'abcdefghijklmnopqrstuvwxyz_0123456789 \n'
+
+
+def replay_edits(path, count, seed=0):
+    # Random keystrokes, timed against a full compile of the same text: a
+    # letter, digit or blank typed or deleted anywhere. Punctuation is left
+    # alone, since a stray brace or quote merges the rest of the file into
+    # one declaration until it is closed again
+    with open(path, 'rb') as f:
+        source = f.read()
+    language = language_for(path)
+    start = time.perf_counter()
+    document = Document(source, language)
+    full_ms = (time.perf_counter() - start) * 1000
+    generator = random.Random(seed)
+    latencies = []
+    relexed = 0
+    for _ in range(count):
+        position = generator.randrange(len(document.data) + 1)
+        if generator.random() < 0.5 and position < len(document.data) and document.data[position] in TYPED:
+            edit = (position, position + 1, b'')
+        else:
+            edit = (position, position, bytes([generator.choice(TYPED)]))
+        start = time.perf_counter()
+        document.edit(*edit)
+        latencies.append((time.perf_counter() - start) * 1000)
+        relexed += document.relexed_bytes
+    # The incremental result must match compiling the edited text afresh
+    fresh = Document(bytes(document.data), language)
+    matches = fresh.intermediate_code() == document.intermediate_code()
+    latencies.sort()
+    print(f"{path}: {len(document.data)} bytes, {len(document.units)} units, full compile {full_ms:.3f} ms")
+    print(f"{count} edits: mean {sum(latencies) / count:.3f} ms, p50 {latencies[count // 2]:.3f} ms, "
+          f"p95 {latencies[min(count - 1, count * 95 // 100)]:.3f} ms, max {latencies[-1]:.3f} ms, "
+          f"{relexed / count:.0f} bytes re-lexed per edit")
+    print(f"Result matches a full compile: {'yes' if matches else 'NO'}")
+    return 0 if matches else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Recompile a source file incrementally as it is edited.')
+    parser.add_argument('input', help='source file (C)')
+    parser.add_argument('-o', '--output', default=None,
+                        help='intermediate code file (default: INPUT.ir)')
+    parser.add_argument('--watch', action='store_true',
+                        help='recompile every time the file is saved')
+    parser.add_argument('--interval', type=float, default=0.2,
+                        help='seconds between checks for changes when watching')
+    parser.add_argument('--edits', type=int, default=0,
+                        help='replay this many random edits and report their latency')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.edits:
+            return replay_edits(args.input, args.edits)
+        output_path = args.output or args.input + batch.OUTPUT_SUFFIX
+        if args.watch:
+            watch(args.input, output_path, args.interval)
+        else:
+            with open(args.input, 'rb') as f:
+                write_output(Document(f.read(), language_for(args.input)), output_path)
+    except (OSError, ValueError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,308 @@
+import operator
+import sys
+
+# Linear intermediate representation shared by the frontends.
+#
+# A program is a flat list of Instr records, each an opcode and a tuple of
+# operands. Opcodes and label names are interned strings, so comparing them
+# is a pointer check and every occurrence shares one object. Text is only
+# produced at the end, by a serializer that streams lines to a file.
+#
+# The C++ and Rust frontends emit stack code:
+#
+#   PUSH c               push the constant c (a number or a quoted string)
+#   LOAD x               push the value of variable x
+#   STORE x              pop into variable x
+#   DUP / POP            duplicate / discard the top of the stack
+#   ADD SUB MUL DIV MOD  pop b, pop a, push a op b (DIV and MOD truncate toward
+#                        zero on integers, as in C)
+#   NEG NOT BIT_NOT      unary operators on the top of the stack
+#   BIT_AND BIT_OR BIT_XOR SHIFT_LEFT SHIFT_RIGHT
+#   COMPARE op           pop b, pop a, push 1 if a op b else 0
+#   JUMP L               jump to label L
+#   JUMP_IF_FALSE L      pop, jump to L if the value is 0
+#   JUMP_IF_TRUE L       pop, jump to L if the value is not 0
+#   INDEX                pop i, pop a, push a[i]
+#   STORE_INDEX          pop v, pop i, pop a, set a[i] = v
+#   ARRAY n              pop n values, push them as one array
+#   NEW_ARRAY n          pop n dimensions, push a zero-filled array
+#   CALL f, n            pop n arguments, call f, push its result
+#   PRINT                pop and print a value
+#   RETURN               pop the return value and leave the function
+#   FUNCTION f, a, b     start of function f taking parameters a and b
+#
+# The Pascal frontend emits register code over named variables for its for
+# loops and simple assignments, and stack code for the rest:
+#
+#   LOAD_CONSTANT c, r   r = c
+#   MOVE a, r            r = a
+#   COMPARE a, b         set the condition flags from a - b, where a and b are
+#                        variables or constants
+#   JUMP_IF_GREATER L, JUMP_IF_GREATER_EQUAL L, JUMP_IF_LESS L,
+#   JUMP_IF_LESS_EQUAL L jump on the flags
+#   INCREMENT r / DECREMENT r
+#
+# The flags are read only by the conditional jumps right after a COMPARE.
+# Constants are Python numbers and variables are names; string constants
+# keep their quotes.
+#
+# The C frontend keeps its structured form, where FUNCTION, LOOP and IF open
+# a nested body closed by END (ELSE switches to the else branch), and RETURN
+# and STATEMENT carry source text.
+#
+# Labels are LABEL instructions. Program.new_label hands out a fresh name per
+# construct (LOOP_START, LOOP_START_1, ...), so every jump has exactly one
+# target. Program.new_temporary names compiler temporaries the same way; they
+# are never read after the program ends, which lets the optimizer drop them.
+
+# Stack code
+PUSH = 'PUSH'
+LOAD = 'LOAD'
+STORE = 'STORE'
+DUP = 'DUP'
+POP = 'POP'
+ADD = 'ADD'
+SUB = 'SUB'
+MUL = 'MUL'
+DIV = 'DIV'
+MOD = 'MOD'
+NEG = 'NEG'
+NOT = 'NOT'
+BIT_AND = 'BIT_AND'
+BIT_OR = 'BIT_OR'
+BIT_XOR = 'BIT_XOR'
+BIT_NOT = 'BIT_NOT'
+SHIFT_LEFT = 'SHIFT_LEFT'
+SHIFT_RIGHT = 'SHIFT_RIGHT'
+COMPARE = 'COMPARE'
+JUMP = 'JUMP'
+JUMP_IF_FALSE = 'JUMP_IF_FALSE'
+JUMP_IF_TRUE = 'JUMP_IF_TRUE'
+INDEX = 'INDEX'
+STORE_INDEX = 'STORE_INDEX'
+ARRAY = 'ARRAY'
+NEW_ARRAY = 'NEW_ARRAY'
+CALL = 'CALL'
+PRINT = 'PRINT'
+RETURN = 'RETURN'
+FUNCTION = 'FUNCTION'
+
+# Register code
+LOAD_CONSTANT = 'LOAD_CONSTANT'
+MOVE = 'MOVE'
+JUMP_IF_GREATER = 'JUMP_IF_GREATER'
+JUMP_IF_GREATER_EQUAL = 'JUMP_IF_GREATER_EQUAL'
+JUMP_IF_LESS = 'JUMP_IF_LESS'
+JUMP_IF_LESS_EQUAL = 'JUMP_IF_LESS_EQUAL'
+INCREMENT = 'INCREMENT'
+DECREMENT = 'DECREMENT'
+
+# Structured code
+LOOP = 'LOOP'
+IF = 'IF'
+ELSE = 'ELSE'
+END = 'END'
+STATEMENT = 'STATEMENT'
+
+# Pseudo instructions
+LABEL = 'LABEL'
+COMMENT = 'COMMENT'
+
+# Instructions whose first operand is a label they may jump to
+JUMPS = {JUMP, JUMP_IF_FALSE, JUMP_IF_TRUE, JUMP_IF_GREATER, JUMP_IF_GREATER_EQUAL,
+         JUMP_IF_LESS, JUMP_IF_LESS_EQUAL}
+
+# Conditional jumps of the register code, which read the flags
+FLAG_JUMPS = {JUMP_IF_GREATER, JUMP_IF_GREATER_EQUAL, JUMP_IF_LESS, JUMP_IF_LESS_EQUAL}
+
+# Operators of the stack COMPARE
+COMPARISONS = ('==', '!=', '<', '<=', '>', '>=')
+
+COMPARE_OPERATORS = {'==': operator.eq, '!=': operator.ne, '<': operator.lt,
+                     '<=': operator.le, '>': operator.gt, '>=': operator.ge}
+
+# a op b is not (a negated op b), and is (b swapped op a)
+NEGATED_COMPARISONS = {'==': '!=', '!=': '==', '<': '>=', '<=': '>', '>': '<=', '>=': '<'}
+SWAPPED_COMPARISONS = {'==': '==', '!=': '!=', '<': '>', '<=': '>=', '>': '<', '>=': '<='}
+
+# Conditional jump -> the jump taken in exactly the other case
+INVERTED_JUMPS = {JUMP_IF_FALSE: JUMP_IF_TRUE, JUMP_IF_TRUE: JUMP_IF_FALSE,
+                  JUMP_IF_GREATER: JUMP_IF_LESS_EQUAL, JUMP_IF_LESS_EQUAL: JUMP_IF_GREATER,
+                  JUMP_IF_LESS: JUMP_IF_GREATER_EQUAL, JUMP_IF_GREATER_EQUAL: JUMP_IF_LESS}
+
+# Stack code opcode -> (values popped, values pushed); ARRAY, NEW_ARRAY and
+# CALL pop their count operand instead (see stack_effect)
+STACK_EFFECTS = {
+    PUSH: (0, 1), LOAD: (0, 1), STORE: (1, 0), DUP: (1, 2), POP: (1, 0),
+    ADD: (2, 1), SUB: (2, 1), MUL: (2, 1), DIV: (2, 1), MOD: (2, 1),
+    BIT_AND: (2, 1), BIT_OR: (2, 1), BIT_XOR: (2, 1), SHIFT_LEFT: (2, 1), SHIFT_RIGHT: (2, 1),
+    NEG: (1, 1), NOT: (1, 1), BIT_NOT: (1, 1), COMPARE: (2, 1),
+    JUMP: (0, 0), JUMP_IF_FALSE: (1, 0), JUMP_IF_TRUE: (1, 0),
+    INDEX: (2, 1), STORE_INDEX: (3, 0), PRINT: (1, 0), RETURN: (1, 0),
+    FUNCTION: (0, 0), LABEL: (0, 0), COMMENT: (0, 0),
+}
+
+
+class Instr:
+    __slots__ = ('opcode', 'operands')
+
+    def __init__(self, opcode, operands=()):
+        self.opcode = opcode
+        self.operands = operands
+
+    def __eq__(self, other):
+        return (isinstance(other, Instr) and self.opcode == other.opcode
+                and self.operands == other.operands)
+
+    def __hash__(self):
+        return hash((self.opcode, self.operands))
+
+    def __repr__(self):
+        return f'Instr({self.opcode!r}, {self.operands!r})'
+
+    # Pickle support, since the compile cache stores whole programs
+    def __getstate__(self):
+        return self.opcode, self.operands
+
+    def __setstate__(self, state):
+        self.opcode, self.operands = state
+
+
+class Program:
+    def __init__(self):
+        self.instructions = []
+        # Label base name -> number of labels handed out with that base
+        self.label_counts = {}
+        # Variables introduced by the compiler rather than the source
+        self.temporaries = set()
+
+    def __len__(self):
+        return len(self.instructions)
+
+    def __iter__(self):
+        return iter(self.instructions)
+
+    def emit(self, opcode, *operands):
+        self.instructions.append(Instr(opcode, operands))
+
+    def label(self, name):
+        self.instructions.append(Instr(LABEL, (name,)))
+
+    def comment(self, text):
+        self.instructions.append(Instr(COMMENT, (text,)))
+
+    def new_label(self, base):
+        # LOOP_START, then LOOP_START_1, LOOP_START_2, ...
+        count = self.label_counts.get(base, 0)
+        self.label_counts[base] = count + 1
+        return sys.intern(base if count == 0 else f'{base}_{count}')
+
+    def new_temporary(self, base):
+        name = self.new_label(base)
+        self.temporaries.add(name)
+        return name
+
+    def take(self):
+        # Hands over the instructions emitted so far and starts a new list;
+        # label numbering carries on, so streamed pieces never clash
+        instructions = self.instructions
+        self.instructions = []
+        return instructions
+
+
+# Text form
+
+INDENT = '    '
+
+# Lines written to the output file per write call
+WRITE_BATCH = 4096
+
+
+def format_instr(instr):
+    opcode = instr.opcode
+    if opcode == LABEL:
+        return f'{instr.operands[0]}:'
+    if opcode == COMMENT:
+        return f'// {instr.operands[0]}'
+    if opcode == FUNCTION:
+        return 'FUNCTION ' + ', '.join(str(operand) for operand in instr.operands)
+    if instr.operands:
+        return INDENT + opcode + ' ' + ', '.join(str(operand) for operand in instr.operands)
+    return INDENT + opcode
+
+
+def format_structured(instr, depth):
+    # Returns (line, depth after the line) for the C structured form
+    opcode = instr.opcode
+    operands = instr.operands
+    indent = INDENT * depth
+    if opcode == FUNCTION:
+        return f'{indent}FUNCTION {operands[0]} ({", ".join(operands[1:])})', depth + 1
+    if opcode == LOOP:
+        return f'{indent}LOOP ({operands[0]}) {{', depth + 1
+    if opcode == IF:
+        return f'{indent}IF ({operands[0]}) {{', depth + 1
+    if opcode == ELSE:
+        return f'{INDENT * (depth - 1)}}} ELSE {{', depth
+    if opcode == END:
+        # The end of a function body has no closing line
+        if operands and operands[0] == FUNCTION:
+            return None, depth - 1
+        return f'{INDENT * (depth - 1)}}}', depth - 1
+    if opcode == RETURN:
+        return f'{indent}RETURN {operands[0]}', depth
+    if opcode == STATEMENT:
+        return f'{indent}{operands[0]}', depth
+    return indent + format_instr(instr).lstrip(), depth
+
+
+def iter_lines(instructions, structured=False):
+    # Lines of text without newlines, produced one instruction at a time
+    if not structured:
+        for instr in instructions:
+            yield format_instr(instr)
+        return
+    depth = 0
+    for instr in instructions:
+        line, depth = format_structured(instr, depth)
+        if line is not None:
+            yield line
+
+
+def write(instructions, out, structured=False, first_line=True):
+    # Streams the text form to the file-like out, in batches of lines, with
+    # a newline between lines and none at the end. Returns whether nothing
+    # was written, to be passed back as first_line when writing in pieces.
+    # out may also be an irbin.Writer, which stores the binary form instead
+    if hasattr(out, 'write_instructions'):
+        return out.write_instructions(instructions, structured, first_line)
+    batch = []
+    for line in iter_lines(instructions, structured):
+        batch.append(line)
+        if len(batch) >= WRITE_BATCH:
+            out.write(('' if first_line else '\n') + '\n'.join(batch))
+            first_line = False
+            batch = []
+    if batch:
+        out.write(('' if first_line else '\n') + '\n'.join(batch))
+        first_line = False
+    return first_line
+
+
+def to_text(instructions, structured=False):
+    return '\n'.join(iter_lines(instructions, structured))
+
+
+def stack_effect(instr):
+    # (values popped, values pushed) of a stack code instruction
+    opcode = instr.opcode
+    if opcode == ARRAY or opcode == NEW_ARRAY:
+        return instr.operands[0], 1
+    if opcode == CALL:
+        return instr.operands[1], 1
+    return STACK_EFFECTS[opcode]
+
+
+def count_instructions(instructions):
+    # Real instructions, leaving out labels and comments
+    return sum(1 for instr in instructions if instr.opcode != LABEL and instr.opcode != COMMENT)
@@ -0,0 +1,351 @@
+import collections
+import mmap
+import struct
+import sys
+
+from compilers import ir
+
+# Binary container for the intermediate code.
+#
+#   python -m compilers.irbin dump [-o OUTPUT] FILE.irb
+#   python -m compilers.irbin stats FILE.irb...
+#
+# An output path ending in .irb gets this format instead of the text form
+# (see stream.open_output); the text form stays available through dump. All
+# numbers are little-endian and every table of numbers starts on an 8-byte
+# boundary:
+#
+#   header      magic, format version, flags, the count of every section and
+#               the size of the string data
+#   opcodes     u32 string index per opcode used in the file; records refer
+#               to opcodes by their position here
+#   records     one fixed-width record per instruction: u16 opcode, u16
+#               operand count, u32 index of its first operand
+#   operands    one 5-byte slot per operand: a u8 tag and an i32 integer or
+#               the u32 index of a string (a name, a quoted constant, or the
+#               digits of a float or of an integer too large for 32 bits)
+#   labels      u32 string index and u32 instruction index of every LABEL
+#   strings     u32 end offset of each string, then the UTF-8 string data
+#
+# A Reader maps the file and decodes nothing up front: records and operands
+# are unpacked from the mapping when asked for, strings are decoded once and
+# interned, and the label table gives jump targets without a scan.
+
+MAGIC = b'CIRB'
+
+# Bump when the layout changes; readers refuse other versions
+FORMAT_VERSION = 1
+
+SUFFIX = '.irb'
+
+# Flags
+STRUCTURED = 1
+
+HEADER = struct.Struct('<4sHHIIIIII')
+RECORD = struct.Struct('<HHI')
+INT_OPERAND = struct.Struct('<Bi')
+STRING_OPERAND = struct.Struct('<BI')
+LABEL = struct.Struct('<II')
+
+# Operand tags
+INT = 0
+FLOAT = 1
+STRING = 2
+BIG_INT = 3
+
+INT_MIN = -2 ** 31
+INT_MAX = 2 ** 31 - 1
+
+# Offsets into the string data are 32-bit
+MAX_STRING_BYTES = 2 ** 32 - 1
+
+
+def is_binary(path):
+    return path.endswith(SUFFIX)
+
+
+def aligned(size):
+    return (size + 7) & ~7
+
+
+def layout(opcode_count, instruction_count, operand_count, label_count, string_count):
+    # Offsets of the sections after the header, and where the string data
+    # starts
+    opcodes = HEADER.size
+    records = opcodes + aligned(4 * opcode_count)
+    operands = records + RECORD.size * instruction_count
+    labels = operands + aligned(INT_OPERAND.size * operand_count)
+    string_ends = labels + LABEL.size * label_count
+    string_data = string_ends + 4 * string_count
+    return opcodes, records, operands, labels, string_ends, string_data
+
+
+class Writer:
+    # Collects instructions in their binary form, which is much smaller than
+    # Instr objects, and writes the file on close. write_instructions can be
+    # called once per streamed piece, so ir.write accepts a Writer as out
+    def __init__(self, out, structured=False):
+        self.out = out
+        self.structured = structured
+        self.string_ids = {}
+        self.string_data = bytearray()
+        self.string_ends = []
+        self.opcode_ids = {}
+        self.opcode_strings = []
+        self.records = bytearray()
+        self.operands = bytearray()
+        self.operand_count = 0
+        self.labels = bytearray()
+        self.label_count = 0
+        self.instruction_count = 0
+        self.closed = False
+
+    def string(self, text):
+        index = self.string_ids.get(text)
+        if index is None:
+            index = len(self.string_ends)
+            self.string_ids[text] = index
+            self.string_data += text.encode('utf-8')
+            if len(self.string_data) > MAX_STRING_BYTES:
+                raise ValueError("more than 4 GB of strings in binary IR")
+            self.string_ends.append(len(self.string_data))
+        return index
+
+    def write_instructions(self, instructions, structured=False, first_line=True):
+        # Same contract as ir.write: returns whether nothing was written yet
+        self.structured = self.structured or structured
+        records = self.records
+        operands = self.operands
+        for instr in instructions:
+            opcode = self.opcode_ids.get(instr.opcode)
+            if opcode is None:
+                opcode = len(self.opcode_strings)
+                self.opcode_ids[instr.opcode] = opcode
+                self.opcode_strings.append(self.string(instr.opcode))
+            records += RECORD.pack(opcode, len(instr.operands), self.operand_count)
+            for operand in instr.operands:
+                operands += self.pack_operand(operand)
+            self.operand_count += len(instr.operands)
+            if instr.opcode == ir.LABEL:
+                self.labels += LABEL.pack(self.string(instr.operands[0]), self.instruction_count)
+                self.label_count += 1
+            self.instruction_count += 1
+        return first_line and not self.instruction_count
+
+    def pack_operand(self, operand):
+        if isinstance(operand, str):
+            return STRING_OPERAND.pack(STRING, self.string(operand))
+        if isinstance(operand, int):
+            if INT_MIN <= operand <= INT_MAX:
+                return INT_OPERAND.pack(INT, operand)
+            return STRING_OPERAND.pack(BIG_INT, self.string(str(operand)))
+        if isinstance(operand, float):
+            # repr gives back the same float
+            return STRING_OPERAND.pack(FLOAT, self.string(repr(operand)))
+        raise TypeError(f"cannot store the operand {operand!r} in binary IR")
+
+    def header(self):
+        return HEADER.pack(MAGIC, FORMAT_VERSION, STRUCTURED if self.structured else 0, len(self.opcode_strings),
+                           self.instruction_count, self.operand_count, self.label_count, len(self.string_ends),
+                           len(self.string_data))
+
+    def tell(self):
+        # Size of the file once written
+        return layout(len(self.opcode_strings), self.instruction_count, self.operand_count, self.label_count,
+                      len(self.string_ends))[-1] + len(self.string_data)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        out = self.out
+        out.write(self.header())
+        opcodes = struct.pack(f'<{len(self.opcode_strings)}I', *self.opcode_strings)
+        out.write(opcodes + bytes(aligned(len(opcodes)) - len(opcodes)))
+        out.write(self.records)
+        out.write(self.operands + bytes(aligned(len(self.operands)) - len(self.operands)))
+        out.write(self.labels)
+        out.write(struct.pack(f'<{len(self.string_ends)}I', *self.string_ends))
+        out.write(self.string_data)
+        out.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_writer(path, structured=False):
+    return Writer(open(path, 'wb'), structured)
+
+
+def write(instructions, path, structured=False):
+    # Returns the size of the file
+    with open_writer(path, structured) as writer:
+        writer.write_instructions(instructions)
+        return writer.tell()
+
+
+class Reader:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            try:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ValueError(f"{path}: empty file, not binary IR") from None
+        self.view = memoryview(self.map)
+        if len(self.view) < HEADER.size:
+            self.close()
+            raise ValueError(f"{path}: not a binary IR file")
+        (magic, version, flags, opcode_count, self.instruction_count, self.operand_count, self.label_count,
+         string_count, string_bytes) = HEADER.unpack_from(self.view)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path}: not a binary IR file")
+        if version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"{path}: binary IR version {version}, this reader understands {FORMAT_VERSION}")
+        self.structured = bool(flags & STRUCTURED)
+        (self.opcodes_offset, self.records_offset, self.operands_offset, self.labels_offset,
+         self.string_ends_offset, self.string_data_offset) = layout(opcode_count, self.instruction_count,
+                                                                    self.operand_count, self.label_count,
+                                                                    string_count)
+        if len(self.view) < self.string_data_offset + string_bytes:
+            self.close()
+            raise ValueError(f"{path}: truncated binary IR file")
+        self.string_count = string_count
+        self.strings = [None] * string_count
+        self.opcodes = [self.string(index) for index, in
+                        struct.iter_unpack('<I', self.view[self.opcodes_offset:self.opcodes_offset + 4 * opcode_count])]
+        self.label_targets = None
+
+    def __len__(self):
+        return self.instruction_count
+
+    def close(self):
+        if self.view is not None:
+            self.view.release()
+            self.view = None
+            self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def string(self, index):
+        text = self.strings[index]
+        if text is None:
+            start = struct.unpack_from('<I', self.view, self.string_ends_offset + 4 * (index - 1))[0] if index else 0
+            end = struct.unpack_from('<I', self.view, self.string_ends_offset + 4 * index)[0]
+            base = self.string_data_offset
+            text = sys.intern(str(self.view[base + start:base + end], 'utf-8'))
+            self.strings[index] = text
+        return text
+
+    def operand(self, index):
+        offset = self.operands_offset + INT_OPERAND.size * index
+        tag, value = INT_OPERAND.unpack_from(self.view, offset)
+        if tag == INT:
+            return value
+        value = STRING_OPERAND.unpack_from(self.view, offset)[1]
+        if tag == STRING:
+            return self.string(value)
+        if tag == FLOAT:
+            return float(self.string(value))
+        return int(self.string(value))
+
+    def opcode(self, index):
+        return self.opcodes[RECORD.unpack_from(self.view, self.records_offset + RECORD.size * index)[0]]
+
+    def instruction(self, index):
+        opcode, count, first = RECORD.unpack_from(self.view, self.records_offset + RECORD.size * index)
+        return ir.Instr(self.opcodes[opcode], tuple(self.operand(first + k) for k in range(count)))
+
+    def records(self):
+        # (opcode id, operand count, first operand) per instruction, straight
+        # from the mapping; opcode ids index self.opcodes
+        return RECORD.iter_unpack(self.view[self.records_offset:self.operands_offset])
+
+    def __iter__(self):
+        opcodes = self.opcodes
+        operand = self.operand
+        for opcode, count, first in self.records():
+            if count == 0:
+                yield ir.Instr(opcodes[opcode])
+            elif count == 1:
+                yield ir.Instr(opcodes[opcode], (operand(first),))
+            else:
+                yield ir.Instr(opcodes[opcode], tuple(operand(first + k) for k in range(count)))
+
+    def opcode_counts(self):
+        # Instructions per opcode. The opcode ids are read through a strided
+        # view of the records, so nothing is allocated per instruction
+        counts = [0] * len(self.opcodes)
+        records = self.view[self.records_offset:self.operands_offset]
+        if sys.byteorder == 'little':
+            for opcode in records.cast('H')[::RECORD.size // 2]:
+                counts[opcode] += 1
+        else:
+            for opcode, _, _ in RECORD.iter_unpack(records):
+                counts[opcode] += 1
+        return {self.opcodes[opcode]: count for opcode, count in enumerate(counts)}
+
+    def label(self, name):
+        # Index of the LABEL instruction that defines name
+        if self.label_targets is None:
+            self.label_targets = {self.string(string_index): instruction_index
+                                  for string_index, instruction_index in
+                                  LABEL.iter_unpack(self.view[self.labels_offset:self.string_ends_offset])}
+        return self.label_targets[name]
+
+
+def load(path):
+    # The instructions of a binary IR file as a list of Instr
+    with Reader(path) as reader:
+        return list(reader)
+
+
+def main(argv=None):
+    # Imported here: the frontends import this module on every run
+    import argparse
+    parser = argparse.ArgumentParser(description='Inspect binary intermediate code files.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    dump = commands.add_parser('dump', help='print the text form')
+    dump.add_argument('input', help='.irb file')
+    dump.add_argument('-o', '--output', default=None, help='write the text form here instead')
+    stats = commands.add_parser('stats', help='print sizes and opcode counts')
+    stats.add_argument('inputs', nargs='+', help='.irb files')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'dump':
+            with Reader(args.input) as reader:
+                if args.output is None:
+                    ir.write(reader, sys.stdout, reader.structured)
+                    print()
+                else:
+                    with open(args.output, 'w') as out:
+                        ir.write(reader, out, reader.structured)
+            return 0
+        totals = collections.Counter()
+        for path in args.inputs:
+            with Reader(path) as reader:
+                print(f"{path}: {len(reader.view)} bytes, {len(reader)} instructions, "
+                      f"{reader.operand_count} operands, {reader.label_count} labels, "
+                      f"{reader.string_count} strings")
+                totals.update(reader.opcode_counts())
+        width = max(len(opcode) for opcode in totals) if totals else 0
+        for opcode, count in totals.most_common():
+            print(f"  {opcode:<{width}} {count:>10}")
+    except (OSError, ValueError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
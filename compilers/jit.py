@@ -0,0 +1,637 @@
+import argparse
+import hashlib
+import io
+import math
+import sys
+import time
+
+from compilers import passes, vm
+
+# Compiling tier of the bytecode machine (see compilers/vm.py).
+#
+#   python -m compilers.jit [-O0] [--repeat N] [--threshold N] FILE
+#
+# A JitMachine runs a function as Python instead of interpreting it once
+# the function is hot: on its first call if it has a loop, otherwise on its
+# HOT_CALLS-th call. The translator turns the function's bytecode into the
+# source of one Python function and compile() turns that into a code
+# object, cached by a hash of the bytecode, so every machine and every call
+# after the first reuses it.
+#
+# The generated function keeps each variable in a Python local and turns the
+# stack into expressions: LOAD sum; LOAD j; PUSH 3; MUL; ADD; STORE sum
+# becomes sum = sum + j * 3, one CPython statement instead of six trips
+# through the dispatch loop. Control flow becomes a while loop over the
+# basic blocks that start at jump targets; a jump sets the next block and
+# continues the loop. Values left on the stack across a jump are passed in
+# locals named after their depth. Expressions are put off until their value
+# is used, but anything that is not a plain variable or constant is
+# evaluated before the next side effect, so a program writes the same output
+# and fails at the same point as it does on the interpreter.
+#
+# Code the translator cannot handle, such as a label reached with different
+# stack depths, stays on the interpreter. So does a function longer than
+# MAX_INSTRUCTIONS, whose source would take longer to compile than it saves.
+
+# Calls after which a function without loops is compiled
+HOT_CALLS = 2
+
+# Bytecode instructions beyond which a function is always interpreted
+MAX_INSTRUCTIONS = 20000
+
+# Compiled code objects kept, by bytecode hash
+MAX_CACHED = 256
+
+# Bytecode opcode -> (values popped, values pushed); CALL, ARRAY and
+# NEW_ARRAY pop their count instead
+STACK_EFFECTS = {
+    vm.LOAD: (0, 1), vm.PUSH: (0, 1), vm.STORE: (1, 0), vm.LOAD_GLOBAL: (0, 1),
+    vm.STORE_GLOBAL: (1, 0), vm.DUP: (1, 2), vm.POP: (1, 0), vm.NEG: (1, 1), vm.NOT: (1, 1),
+    vm.BIT_NOT: (1, 1), vm.JUMP: (0, 0), vm.JUMP_IF_FALSE: (1, 0), vm.JUMP_IF_TRUE: (1, 0),
+    vm.INDEX: (2, 1), vm.STORE_INDEX: (3, 0), vm.PRINT: (1, 0), vm.RETURN: (1, 0),
+    vm.MOVE: (0, 0), vm.SET_FLAGS: (0, 0), vm.POP_FLAGS: (2, 0), vm.INCREMENT: (0, 0),
+    vm.DECREMENT: (0, 0), vm.HALT: (0, 0),
+}
+for opcode in range(vm.ADD, vm.GREATER_EQUAL + 1):
+    STACK_EFFECTS.setdefault(opcode, (2, 1))
+for opcode in (vm.JUMP_IF_GREATER, vm.JUMP_IF_GREATER_EQUAL, vm.JUMP_IF_LESS, vm.JUMP_IF_LESS_EQUAL):
+    STACK_EFFECTS[opcode] = (0, 0)
+
+# Python operator of each binary opcode whose meaning carries over
+BINARY_OPERATORS = {vm.ADD: '+', vm.SUB: '-', vm.MUL: '*', vm.BIT_AND: '&', vm.BIT_OR: '|',
+                    vm.BIT_XOR: '^', vm.SHIFT_LEFT: '<<', vm.SHIFT_RIGHT: '>>'}
+
+COMPARISON_OPERATORS = {vm.EQUAL: '==', vm.NOT_EQUAL: '!=', vm.LESS: '<', vm.LESS_EQUAL: '<=',
+                        vm.GREATER: '>', vm.GREATER_EQUAL: '>='}
+
+FLAG_OPERATORS = {vm.JUMP_IF_GREATER: '>', vm.JUMP_IF_GREATER_EQUAL: '>=',
+                  vm.JUMP_IF_LESS: '<', vm.JUMP_IF_LESS_EQUAL: '<='}
+
+# Instructions after which the next one is only reached by a jump
+ENDS = {vm.JUMP, vm.RETURN, vm.HALT}
+
+JUMPS = set(vm.JUMP_OPCODES.values())
+
+# Kinds of symbolic stack entries: a variable, temporary or constant that
+# can be read any time; an expression not yet evaluated; and a condition,
+# an expression that is True or False where the program wants 1 or 0
+SIMPLE = 'simple'
+EXPRESSION = 'expression'
+CONDITION = 'condition'
+
+# cache key -> code object of the generated module
+compiled_code = {}
+cache_hits = 0
+cache_misses = 0
+
+
+class Unsupported(Exception):
+    pass
+
+
+def divide(a, b):
+    if type(a) is int and type(b) is int:
+        return passes.truncating_divide(a, b)
+    return a / b
+
+
+def modulo(a, b):
+    if type(a) is int and type(b) is int:
+        return a - b * passes.truncating_divide(a, b)
+    return math.fmod(a, b)
+
+
+def cache_key(code, shared):
+    # Everything the generated source depends on
+    digest = hashlib.sha256()
+    digest.update(code.words.tobytes())
+    digest.update(repr((code.name is None, code.parameters, sorted(code.slots.items(), key=repr),
+                        [count for _, count in code.calls], sorted(shared))).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def shared_globals(module):
+    # Slots of the top level frame that some function reads or writes
+    shared = set()
+    for code in module.codes[1:]:
+        words = code.words
+        for pc in range(0, len(words), vm.WIDTH):
+            if words[pc] == vm.LOAD_GLOBAL or words[pc] == vm.STORE_GLOBAL:
+                shared.add(words[pc + 1])
+    return shared
+
+
+def has_loop(code):
+    words = code.words
+    return any(words[pc] in JUMPS and words[pc + 1] <= pc
+               for pc in range(0, len(words), vm.WIDTH))
+
+
+# Translation
+
+class Translator:
+    def __init__(self, code, shared):
+        self.code = code
+        self.words = code.words
+        self.top_level = code.name is None
+        # Frame slot -> Python literal of the constants, and the slots of
+        # variables
+        self.constants = {}
+        self.variables = []
+        for key, slot in code.slots.items():
+            if isinstance(key, tuple):
+                if isinstance(key[1], float) and not math.isfinite(key[1]):
+                    raise Unsupported('a constant without a Python literal')
+                self.constants[slot] = repr(key[1])
+            else:
+                self.variables.append(slot)
+        self.variables.sort()
+        # Top level variables the functions use live in the globals list
+        self.shared = shared if self.top_level else set()
+        self.lines = []
+        # IR line of each generated line, for errors
+        self.ir_lines = []
+        self.temporaries = 0
+        self.targets = set()
+        self.stack = []
+        self.flags = None
+        self.loop = None
+
+    def emit(self, text, depth, pc):
+        self.lines.append('    ' * depth + text)
+        self.ir_lines.append(self.code.lines[pc // vm.WIDTH] + 1)
+
+    def jump_targets(self):
+        words = self.words
+        targets = {0}
+        for pc in range(0, len(words), vm.WIDTH):
+            if words[pc] in JUMPS:
+                targets.add(words[pc + 1])
+        return targets
+
+    def entry_depths(self, targets):
+        # Stack depth on entry to each reachable block
+        words = self.words
+        size = len(words)
+        depths = {0: 0}
+        work = [0]
+        while work:
+            pc = work.pop()
+            depth = depths[pc]
+            while True:
+                op = words[pc]
+                popped, pushed = self.effect(op, words[pc + 1])
+                if popped > depth:
+                    raise Unsupported('stack underflow')
+                depth += pushed - popped
+                if op in JUMPS:
+                    self.reach(depths, work, words[pc + 1], depth)
+                pc += vm.WIDTH
+                if op in ENDS or pc >= size:
+                    break
+                if pc in targets:
+                    self.reach(depths, work, pc, depth)
+                    break
+        return depths
+
+    def reach(self, depths, work, target, depth):
+        known = depths.get(target)
+        if known is None:
+            depths[target] = depth
+            work.append(target)
+        elif known != depth:
+            raise Unsupported('a label is reached with different stack depths')
+
+    def effect(self, op, arg):
+        if op == vm.CALL:
+            return self.code.calls[arg][1], 1
+        if op == vm.ARRAY or op == vm.NEW_ARRAY:
+            return arg, 1
+        return STACK_EFFECTS[op]
+
+    # Operands
+
+    def slot(self, slot):
+        # Entry reading frame slot
+        if slot in self.constants:
+            return (self.constants[slot], SIMPLE, None)
+        if slot in self.shared:
+            return (f'G[{slot}]', EXPRESSION, None)
+        return (f'v{slot}', SIMPLE, slot)
+
+    def target(self, slot):
+        # Python target of a store to frame slot
+        return f'G[{slot}]' if slot in self.shared else f'v{slot}'
+
+    def value(self, entry):
+        text, kind, _ = entry
+        if kind == CONDITION:
+            return f'(1 if {text} else 0)'
+        return text
+
+    def condition(self, entry):
+        text, kind, _ = entry
+        return text if kind == CONDITION else f'{text} != 0'
+
+    def pop(self):
+        return self.stack.pop()
+
+    def temporary(self, text, depth, pc):
+        name = f't{self.temporaries}'
+        self.temporaries += 1
+        self.emit(f'{name} = {text}', depth, pc)
+        return (name, SIMPLE, None)
+
+    def settle(self, depth, pc, written=None):
+        # Evaluates the pending expressions before a side effect, and copies
+        # out reads of the variable about to be written
+        for index, entry in enumerate(self.stack):
+            if entry[1] != SIMPLE or (written is not None and entry[2] == written):
+                self.stack[index] = self.temporary(self.value(entry), depth, pc)
+
+    def leave(self, target, depth, pc, falls=False):
+        # Passes the stack to the block at target and goes there
+        names = [f's{index}' for index in range(len(self.stack))]
+        values = [self.value(entry) for entry in self.stack]
+        moved = [(name, value) for name, value in zip(names, values) if name != value]
+        if moved:
+            self.emit(', '.join(name for name, _ in moved) + ' = ' +
+                      ', '.join(value for _, value in moved), depth, pc)
+        if target == self.loop:
+            self.emit('continue', depth, pc)
+            return
+        self.emit(f'label = {target}', depth, pc)
+        if self.loop is not None:
+            # Out of the block's own loop; the dispatch goes on from there
+            self.emit('break', depth, pc)
+        elif not falls:
+            self.emit('continue', depth, pc)
+
+    def finish(self, depth, pc):
+        # Hands the top level variables back to the globals list
+        if self.top_level:
+            for slot in self.variables:
+                if slot not in self.shared:
+                    self.emit(f'G[{slot}] = v{slot}', depth, pc)
+
+    # Generation
+
+    def translate(self):
+        code = self.code
+        words = self.words
+        if len(code) > MAX_INSTRUCTIONS:
+            raise Unsupported('function too long')
+        targets = self.targets = self.jump_targets()
+        depths = self.entry_depths(targets)
+        leaders = sorted(depths)
+
+        self.emit('def run(frame):', 1, 0)
+        for slot in self.variables:
+            if slot not in self.shared:
+                self.emit(f'v{slot} = frame[{slot}]', 2, 0)
+        self.emit('left = right = None', 2, 0)
+        self.emit('label = 0', 2, 0)
+        self.emit('while True:', 2, 0)
+        for leader in leaders:
+            self.emit(f'if label == {leader}:', 3, leader)
+            self.block(leader, depths[leader], targets, depths)
+        return self.lines
+
+    def block(self, pc, depth, targets, depths):
+        words = self.words
+        size = len(words)
+        self.stack = [(f's{index}', SIMPLE, None) for index in range(depth)]
+        self.flags = None
+        indent = 4
+        # A block that jumps back to its own start, as a rotated loop does,
+        # runs in a while loop of its own, so the back edge skips the
+        # dispatch on label
+        self.loop = pc if self.jumps_to_itself(pc, targets) else None
+        if self.loop is not None:
+            self.emit('while True:', indent, pc)
+            indent += 1
+        while True:
+            op = words[pc]
+            arg = words[pc + 1]
+            self.instruction(op, arg, words[pc + 2], pc, indent)
+            pc += vm.WIDTH
+            if op in ENDS:
+                return
+            if pc >= size:
+                raise Unsupported('code runs off its end')
+            if pc in targets:
+                # Falls into the next block
+                self.leave(pc, indent, pc - vm.WIDTH, falls=True)
+                return
+
+    def jumps_to_itself(self, start, targets):
+        words = self.words
+        pc = start
+        while pc < len(words):
+            op = words[pc]
+            if op in JUMPS and words[pc + 1] == start:
+                return True
+            pc += vm.WIDTH
+            if op in ENDS or pc in targets:
+                return False
+        return False
+
+    def instruction(self, op, arg, arg2, pc, depth):
+        stack = self.stack
+        if op <= vm.PUSH:
+            stack.append(self.slot(arg))
+        elif op == vm.STORE:
+            value = self.pop()
+            self.settle(depth, pc, arg)
+            self.emit(f'{self.target(arg)} = {self.value(value)}', depth, pc)
+        elif op in BINARY_OPERATORS:
+            b = self.pop()
+            a = self.pop()
+            stack.append((f'({self.value(a)} {BINARY_OPERATORS[op]} {self.value(b)})', EXPRESSION, None))
+        elif op in COMPARISON_OPERATORS:
+            b = self.pop()
+            a = self.pop()
+            stack.append((f'({self.value(a)} {COMPARISON_OPERATORS[op]} {self.value(b)})',
+                          CONDITION, None))
+        elif op == vm.JUMP_IF_FALSE or op == vm.JUMP_IF_TRUE:
+            condition = self.condition(self.pop())
+            if op == vm.JUMP_IF_FALSE:
+                condition = f'not ({condition})'
+            self.settle(depth, pc)
+            self.emit(f'if {condition}:', depth, pc)
+            self.leave(arg, depth + 1, pc)
+        elif op == vm.JUMP:
+            self.settle(depth, pc)
+            self.leave(arg, depth, pc)
+        elif op == vm.LOAD_GLOBAL:
+            stack.append((f'G[{arg}]', EXPRESSION, None))
+        elif op == vm.STORE_GLOBAL:
+            value = self.pop()
+            self.settle(depth, pc)
+            self.emit(f'G[{arg}] = {self.value(value)}', depth, pc)
+        elif op == vm.DUP:
+            entry = self.pop()
+            if entry[1] != SIMPLE:
+                entry = self.temporary(self.value(entry), depth, pc)
+            stack.append(entry)
+            stack.append(entry)
+        elif op == vm.POP:
+            entry = self.pop()
+            if entry[1] != SIMPLE:
+                # Still evaluated, in case it fails
+                self.emit(self.value(entry), depth, pc)
+        elif op == vm.DIV or op == vm.MOD:
+            b = self.pop()
+            a = self.pop()
+            function = 'divide' if op == vm.DIV else 'modulo'
+            # Evaluated where they are, since they fail on a zero divisor
+            self.settle(depth, pc)
+            stack.append(self.temporary(f'{function}({self.value(a)}, {self.value(b)})', depth, pc))
+        elif op == vm.NEG or op == vm.BIT_NOT:
+            entry = self.pop()
+            stack.append((f'({"-" if op == vm.NEG else "~"}{self.value(entry)})', EXPRESSION, None))
+        elif op == vm.NOT:
+            entry = self.pop()
+            if entry[1] == CONDITION:
+                stack.append((f'(not {entry[0]})', CONDITION, None))
+            else:
+                stack.append((f'({entry[0]} == 0)', CONDITION, None))
+        elif op == vm.INDEX:
+            b = self.pop()
+            a = self.pop()
+            self.settle(depth, pc)
+            stack.append(self.temporary(f'{self.value(a)}[{self.value(b)}]', depth, pc))
+        elif op == vm.STORE_INDEX:
+            value = self.pop()
+            index = self.pop()
+            array = self.pop()
+            self.settle(depth, pc)
+            self.emit(f'{self.value(array)}[{self.value(index)}] = {self.value(value)}', depth, pc)
+        elif op == vm.ARRAY or op == vm.NEW_ARRAY:
+            values = [self.value(entry) for entry in stack[len(stack) - arg:]]
+            del stack[len(stack) - arg:]
+            self.settle(depth, pc)
+            text = '[' + ', '.join(values) + ']'
+            stack.append(self.temporary(text if op == vm.ARRAY else f'zero_array({text})', depth, pc))
+        elif op == vm.CALL:
+            count = self.code.calls[arg][1]
+            values = [self.value(entry) for entry in stack[len(stack) - count:]]
+            del stack[len(stack) - count:]
+            self.settle(depth, pc)
+            arguments = '[' + ', '.join(values) + ']'
+            stack.append(self.temporary(f'call{arg}({arguments})', depth, pc))
+        elif op == vm.PRINT:
+            value = self.pop()
+            self.settle(depth, pc)
+            self.emit(f'write(format_value({self.value(value)}))', depth, pc)
+        elif op == vm.RETURN:
+            value = self.value(self.pop())
+            if self.top_level:
+                value = self.temporary(value, depth, pc)[0]
+                self.finish(depth, pc)
+            self.emit(f'return {value}', depth, pc)
+        elif op == vm.HALT:
+            self.finish(depth, pc)
+            self.emit('return None' if self.top_level else 'return 0', depth, pc)
+        elif op == vm.MOVE:
+            self.settle(depth, pc, arg2)
+            self.emit(f'{self.target(arg2)} = {self.slot(arg)[0]}', depth, pc)
+        elif op == vm.INCREMENT or op == vm.DECREMENT:
+            self.settle(depth, pc, arg)
+            self.emit(f'{self.target(arg)} {"+" if op == vm.INCREMENT else "-"}= 1', depth, pc)
+        elif op == vm.SET_FLAGS or op == vm.POP_FLAGS:
+            if op == vm.SET_FLAGS:
+                right = self.slot(arg2)
+                left = self.slot(arg)
+            else:
+                right = self.pop()
+                left = self.pop()
+            self.settle(depth, pc)
+            following = pc + vm.WIDTH
+            if (following not in self.targets and self.words[following] in FLAG_OPERATORS
+                    and left[1] == SIMPLE and right[1] == SIMPLE):
+                # The usual case: the jump right after reads the flags
+                self.flags = (self.value(left), self.value(right))
+            else:
+                self.emit(f'left, right = {self.value(left)}, {self.value(right)}', depth, pc)
+                self.flags = ('left', 'right')
+        elif op in FLAG_OPERATORS:
+            left, right = self.flags or ('left', 'right')
+            self.settle(depth, pc)
+            self.emit(f'if {left} {FLAG_OPERATORS[op]} {right}:', depth, pc)
+            self.leave(arg, depth + 1, pc)
+        else:
+            raise Unsupported(f'opcode {vm.OPCODE_NAMES[op]}')
+
+
+def translate(code, shared):
+    # Source of a module defining make(environment), which returns the
+    # compiled function, and the IR line of each source line
+    translator = Translator(code, shared)
+    lines = ['def make(environment):']
+    ir_lines = [0]
+    names = ['machine', 'G', 'write', 'format_value', 'zero_array', 'divide', 'modulo']
+    names += [f'call{index}' for index in range(len(code.calls))]
+    for name in names:
+        lines.append(f'    {name} = environment[{name!r}]')
+        ir_lines.append(0)
+    lines += translator.translate()
+    ir_lines += translator.ir_lines
+    lines.append('    return run')
+    ir_lines.append(0)
+    return '\n'.join(lines) + '\n', ir_lines
+
+
+def compile_code(code, shared):
+    # (code object, IR line of each source line), from the cache if this
+    # bytecode was compiled before
+    global cache_hits, cache_misses
+    key = cache_key(code, shared)
+    entry = compiled_code.get(key)
+    if entry is not None:
+        cache_hits += 1
+        return entry
+    cache_misses += 1
+    source, ir_lines = translate(code, shared)
+    entry = (compile(source, f'<jit {code.describe()} {key[:12]}>', 'exec'), ir_lines)
+    if len(compiled_code) >= MAX_CACHED:
+        # Drop the oldest entry
+        del compiled_code[next(iter(compiled_code))]
+    compiled_code[key] = entry
+    return entry
+
+
+# Execution
+
+class JitMachine(vm.Machine):
+    def __init__(self, module, out=None, input=(), builtins=None, threshold=HOT_CALLS):
+        super().__init__(module, out, input, builtins)
+        self.threshold = threshold
+        self.shared = shared_globals(module)
+        # Per Code: None until compiled, then the function, or False when
+        # the translator cannot handle it
+        self.functions = [None] * len(module.codes)
+        self.ir_lines = [None] * len(module.codes)
+        self.entries = [0] * len(module.codes)
+        self.loops = [has_loop(code) for code in module.codes]
+        self.compile_seconds = 0.0
+        self.compiled = 0
+        self.unsupported = []
+
+    def execute(self, code, frame):
+        index = code.index
+        function = self.functions[index]
+        if function is None:
+            self.entries[index] += 1
+            if self.loops[index] or self.entries[index] >= self.threshold:
+                function = self.compile(code)
+        if not function:
+            return super().execute(code, frame)
+        try:
+            return function(frame)
+        except vm.RUNTIME_ERRORS as error:
+            raise self.compiled_error(code, error) from error
+
+    def compile(self, code):
+        start = time.perf_counter()
+        try:
+            code_object, ir_lines = compile_code(code, self.shared)
+        except (Unsupported, RecursionError, SyntaxError, MemoryError) as error:
+            # RecursionError and MemoryError come from compile() on deeply
+            # nested expressions; such functions stay on the interpreter
+            self.unsupported.append((code.describe(), str(error)))
+            self.functions[code.index] = False
+            return False
+        finally:
+            self.compile_seconds += time.perf_counter() - start
+        namespace = {}
+        exec(code_object, namespace)
+        function = namespace['make'](self.environment(code))
+        self.functions[code.index] = function
+        self.ir_lines[code.index] = ir_lines
+        self.compiled += 1
+        return function
+
+    def environment(self, code):
+        environment = {'machine': self, 'G': self.globals, 'write': self.out.write,
+                       'format_value': vm.format_value, 'zero_array': vm.zero_array,
+                       'divide': divide, 'modulo': modulo}
+        execute = self.execute
+        for index, (callee, builtin, count) in enumerate(self.calls[code.index]):
+            if builtin is None:
+                tail = callee.template[count:]
+                environment[f'call{index}'] = (
+                    lambda arguments, callee=callee, tail=tail: execute(callee, arguments + tail))
+            else:
+                environment[f'call{index}'] = (
+                    lambda arguments, builtin=builtin: builtin(self, arguments))
+        return environment
+
+    def compiled_error(self, code, error):
+        # The IR line of the innermost generated frame of this function
+        line = None
+        traceback = error.__traceback__
+        while traceback is not None:
+            if traceback.tb_frame.f_code.co_filename.startswith(f'<jit {code.describe()} '):
+                line = self.ir_lines[code.index][traceback.tb_lineno - 1]
+            traceback = traceback.tb_next
+        where = f' at IR line {line}' if line else ''
+        return vm.VMError(f'{type(error).__name__}: {error} in {code.describe()}{where}')
+
+    def summary(self, top=None):
+        lines = [f"{self.compiled} of {len(self.module.codes)} functions compiled in "
+                 f"{self.compile_seconds * 1000:.3f} ms, ran in {self.seconds * 1000:.3f} ms "
+                 f"(cache: {cache_hits} hits, {cache_misses} misses)"]
+        for name, reason in self.unsupported:
+            lines.append(f"interpreted {name}: {reason}")
+        return lines
+
+
+def run_program(program, repeat=1, out=None, threshold=HOT_CALLS):
+    # Like vm.run_program on a JitMachine; every run after the first finds
+    # its code in the cache
+    module = vm.assemble(program)
+    best = None
+    for attempt in range(repeat):
+        machine = JitMachine(module, out if attempt == 0 else io.StringIO(), threshold=threshold)
+        machine.run()
+        if best is None or machine.seconds < best.seconds:
+            best = machine
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a C++, Pascal or Rust program with hot functions '
+                                                 'compiled to Python, and compare with the interpreter.')
+    parser.add_argument('source', help='program to compile and run')
+    parser.add_argument('-O', dest='optimize', type=int, choices=[0, 1], default=1,
+                        help='-O0 runs the intermediate code unoptimized (default: -O1)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='runs to keep the fastest of (default: 3)')
+    parser.add_argument('--threshold', type=int, default=HOT_CALLS,
+                        help=f'calls before a function without loops is compiled (default: {HOT_CALLS})')
+    parser.add_argument('--quiet', action='store_true', help="discard the program's output")
+    args = parser.parse_args(argv)
+
+    out = io.StringIO() if args.quiet else sys.stdout
+    try:
+        program = vm.compile_program(args.source, bool(args.optimize))
+        jitted = run_program(program, args.repeat, out, args.threshold)
+        interpreted = vm.run_program(program, args.repeat, io.StringIO())
+    except (vm.VMError, SyntaxError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+    out.flush()
+
+    for line in jitted.summary():
+        print(line)
+    instructions = interpreted.instructions()
+    print(f"interpreter: {instructions} instructions in {interpreted.seconds * 1000:.3f} ms")
+    if jitted.seconds > 0:
+        print(f"speedup: {interpreted.seconds / jitted.seconds:.2f}x "
+              f"({instructions / jitted.seconds / 1e6:.2f} M IR instructions/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,624 @@
+import marshal
+import os
+from array import array
+
+from compilers import lexgen
+
+# Table-driven LALR(1) parser generator shared by the frontends.
+#
+# A language describes its syntax with a Grammar: an ordered list of
+# (nonterminal, right-hand side, action) rules and a yacc-style precedence
+# list. In a right-hand side, 'x' is a terminal matched by token text (a
+# keyword or operator), an UPPERCASE name is a terminal matched by token kind,
+# a lowercase name is a nonterminal and error is the recovery token.
+# %prec NAME at the end gives a rule the precedence of NAME.
+#
+# build_parser turns the grammar into LALR(1) action and goto tables once,
+# caches them on disk next to the lexer tables, and returns a Parser whose
+# loop does one table lookup per shift and per reduction. Actions are the
+# names of methods of an Actions object, called on each reduction with the
+# span of the rule (the positions of its first token and of the token after
+# it) and the values of its symbols: the value of a token is what the token
+# source paired with it, that of a rule without an action is the value of
+# its first symbol.
+#
+# Like the lexer, the parser is built lazily: build_parser only records the
+# grammar, and the tables are read from the cache the first time it parses.
+#
+# Syntax errors are reported to a Diagnostics (see compilers/diagnostics.py)
+# and recovered from as yacc does: states are popped until one that can
+# shift error, error is shifted, and tokens are skipped until one that can
+# follow it. Errors within three tokens of the last one are not reported.
+
+# Bump when the table format or construction changes to invalidate caches
+ENGINE_VERSION = 1
+
+CACHE_DIR = lexgen.CACHE_DIR
+
+# Terminal columns every grammar has: the end of input, the recovery token
+# and tokens the grammar does not know, such as the lexer's error tokens
+END = 0
+ERROR = 1
+INVALID = 2
+RESERVED_TERMINALS = ['$end', 'error', '$invalid']
+
+# Tokens shifted after an error before the next one is reported
+RECOVERY_TOKENS = 3
+
+# An error lists the terminals it expected when there are at most this many
+MAX_EXPECTED = 4
+
+
+class Grammar:
+    def __init__(self, name, rules, start=None, precedence=()):
+        self.name = name
+        # (nonterminal, right-hand side, action method name or None)
+        self.rules = [(lhs, rhs, action) for lhs, rhs, action in rules]
+        self.start = start or self.rules[0][0]
+        # (associativity, symbols) from the lowest precedence to the highest;
+        # associativity is 'left', 'right' or 'nonassoc'
+        self.precedence = list(precedence)
+
+    def key(self):
+        # Hash of everything that affects the generated tables; actions do not
+        import hashlib
+        text = repr((ENGINE_VERSION, [(lhs, rhs) for lhs, rhs, _ in self.rules], self.start, self.precedence))
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+def is_literal(symbol):
+    return len(symbol) > 2 and symbol[0] == "'" and symbol[-1] == "'"
+
+
+def is_named_terminal(symbol):
+    return symbol.isupper()
+
+
+# Step 1: number the symbols and productions
+
+class Symbols:
+    def __init__(self, grammar):
+        nonterminals = ['$accept']
+        for lhs, _, _ in grammar.rules:
+            if lhs not in nonterminals:
+                nonterminals.append(lhs)
+        defined = set(nonterminals)
+        # Production 0 is $accept -> start
+        productions = [('$accept', [grammar.start], None)]
+        terminals = list(RESERVED_TERMINALS)
+        precedence_of = {}
+        for level, (associativity, symbols) in enumerate(grammar.precedence, 1):
+            if associativity not in ('left', 'right', 'nonassoc'):
+                raise ValueError(f'Unknown associativity {associativity!r} in grammar {grammar.name!r}')
+            for symbol in symbols.split():
+                precedence_of[symbol] = (level, associativity)
+        production_precedence = [None]
+        for lhs, rhs, _ in grammar.rules:
+            symbols = rhs.split()
+            override = None
+            if '%prec' in symbols:
+                position = symbols.index('%prec')
+                if position != len(symbols) - 2:
+                    raise ValueError(f'%prec must end the rule {lhs}: {rhs}')
+                override = symbols[-1]
+                symbols = symbols[:position]
+            for symbol in symbols:
+                if symbol in defined or symbol in terminals:
+                    continue
+                if not (is_literal(symbol) or is_named_terminal(symbol)):
+                    raise ValueError(f'Undefined nonterminal {symbol!r} in the rule {lhs}: {rhs}')
+                terminals.append(symbol)
+            productions.append((lhs, symbols, None))
+            # A rule takes the precedence of its last terminal unless %prec says
+            if override is not None:
+                production_precedence.append(precedence_of.get(override))
+            else:
+                last = [symbol for symbol in symbols if symbol not in defined]
+                production_precedence.append(precedence_of.get(last[-1]) if last else None)
+        if grammar.start not in defined:
+            raise ValueError(f'Undefined start symbol {grammar.start!r}')
+
+        self.terminals = terminals
+        self.nonterminals = nonterminals
+        self.width = len(terminals) + len(nonterminals)
+        # Symbols are columns: terminals first, then nonterminals
+        self.columns = {symbol: column for column, symbol in enumerate(terminals)}
+        self.columns.update({symbol: len(terminals) + index for index, symbol in enumerate(nonterminals)})
+        self.productions = [(self.columns[lhs], [self.columns[symbol] for symbol in rhs])
+                            for lhs, rhs, _ in productions]
+        self.production_precedence = production_precedence
+        self.terminal_precedence = {self.columns[symbol]: value for symbol, value in precedence_of.items()
+                                    if symbol in self.columns and self.columns[symbol] < len(terminals)}
+        self.by_lhs = {}
+        for index, (lhs, _) in enumerate(self.productions):
+            self.by_lhs.setdefault(lhs, []).append(index)
+
+    def is_terminal(self, column):
+        return column < len(self.terminals)
+
+    def name(self, column):
+        if column < len(self.terminals):
+            return self.terminals[column]
+        return self.nonterminals[column - len(self.terminals)]
+
+
+# Step 2: FIRST sets
+
+def first_sets(symbols):
+    nullable = set()
+    first = {column: set() for column in symbols.by_lhs}
+    changed = True
+    while changed:
+        changed = False
+        for lhs, rhs in symbols.productions:
+            before = len(first[lhs])
+            for column in rhs:
+                if symbols.is_terminal(column):
+                    first[lhs].add(column)
+                    break
+                first[lhs] |= first[column]
+                if column not in nullable:
+                    break
+            else:
+                if lhs not in nullable:
+                    nullable.add(lhs)
+                    changed = True
+            if len(first[lhs]) != before:
+                changed = True
+    return first, nullable
+
+
+def sequence_firsts(symbols, first, nullable):
+    # For each item (production, dot): FIRST of the symbols after the symbol
+    # at the dot, and whether they can all derive the empty string
+    result = {}
+    for index, (_, rhs) in enumerate(symbols.productions):
+        for dot in range(len(rhs)):
+            terminals = set()
+            for column in rhs[dot + 1:]:
+                if symbols.is_terminal(column):
+                    terminals.add(column)
+                    break
+                terminals |= first[column]
+                if column not in nullable:
+                    break
+            else:
+                result[index, dot] = (frozenset(terminals), True)
+                continue
+            result[index, dot] = (frozenset(terminals), False)
+    return result
+
+
+# Step 3: the LR(0) automaton
+
+def lr0_closure(symbols, kernel):
+    items = list(kernel)
+    seen = set(kernel)
+    productions = symbols.productions
+    for production, dot in items:
+        rhs = productions[production][1]
+        if dot < len(rhs) and not symbols.is_terminal(rhs[dot]):
+            for next_production in symbols.by_lhs[rhs[dot]]:
+                item = (next_production, 0)
+                if item not in seen:
+                    seen.add(item)
+                    items.append(item)
+    return items
+
+
+def lr0_states(symbols):
+    kernels = [((0, 0),)]
+    state_ids = {kernels[0]: 0}
+    gotos = []
+    productions = symbols.productions
+    index = 0
+    while index < len(kernels):
+        moves = {}
+        for production, dot in lr0_closure(symbols, kernels[index]):
+            rhs = productions[production][1]
+            if dot < len(rhs):
+                moves.setdefault(rhs[dot], []).append((production, dot + 1))
+        transitions = {}
+        for column, items in moves.items():
+            kernel = tuple(sorted(set(items)))
+            if kernel not in state_ids:
+                state_ids[kernel] = len(kernels)
+                kernels.append(kernel)
+            transitions[column] = state_ids[kernel]
+        gotos.append(transitions)
+        index += 1
+    return kernels, gotos
+
+
+# Step 4: LALR(1) lookaheads by propagation through the LR(0) automaton
+
+PROPAGATE = -1
+
+
+def lr1_closure(symbols, firsts, items):
+    # items maps (production, dot) to its set of lookahead terminals
+    result = {item: set(lookaheads) for item, lookaheads in items.items()}
+    work = list(result)
+    productions = symbols.productions
+    while work:
+        production, dot = item = work.pop()
+        rhs = productions[production][1]
+        if dot == len(rhs) or symbols.is_terminal(rhs[dot]):
+            continue
+        terminals, nullable = firsts[item]
+        lookaheads = terminals | result[item] if nullable else terminals
+        for next_production in symbols.by_lhs[rhs[dot]]:
+            next_item = (next_production, 0)
+            existing = result.get(next_item)
+            if existing is None:
+                result[next_item] = set(lookaheads)
+                work.append(next_item)
+            elif not lookaheads <= existing:
+                existing |= lookaheads
+                work.append(next_item)
+    return result
+
+
+def lalr_lookaheads(symbols, firsts, kernels, gotos):
+    lookaheads = {(state, item): set() for state, kernel in enumerate(kernels) for item in kernel}
+    lookaheads[0, (0, 0)].add(END)
+    propagation = {}
+    productions = symbols.productions
+    for state, kernel in enumerate(kernels):
+        for kernel_item in kernel:
+            targets = []
+            for (production, dot), terminals in lr1_closure(symbols, firsts, {kernel_item: {PROPAGATE}}).items():
+                rhs = productions[production][1]
+                if dot == len(rhs):
+                    continue
+                target = (gotos[state][rhs[dot]], (production, dot + 1))
+                for terminal in terminals:
+                    if terminal == PROPAGATE:
+                        targets.append(target)
+                    else:
+                        lookaheads[target].add(terminal)
+            propagation[state, kernel_item] = targets
+    changed = True
+    while changed:
+        changed = False
+        for source, targets in propagation.items():
+            terminals = lookaheads[source]
+            for target in targets:
+                existing = lookaheads[target]
+                if not terminals <= existing:
+                    existing |= terminals
+                    changed = True
+    return lookaheads
+
+
+# Step 5: the action and goto table, with conflicts settled by precedence
+
+def describe_item(symbols, item):
+    production, dot = item
+    lhs, rhs = symbols.productions[production]
+    names = [symbols.name(column) for column in rhs]
+    return f"{symbols.name(lhs)}: {' '.join(names[:dot] + ['.'] + names[dot:])}"
+
+
+def generate_tables(grammar):
+    symbols = Symbols(grammar)
+    first, nullable = first_sets(symbols)
+    firsts = sequence_firsts(symbols, first, nullable)
+    kernels, gotos = lr0_states(symbols)
+    lookaheads = lalr_lookaheads(symbols, firsts, kernels, gotos)
+
+    # Shifts and gotos are the row offset of the target state, reductions
+    # ~production (accepting is ~0) and errors 0
+    width = symbols.width
+    table = [0] * (len(kernels) * width)
+    conflicts = []
+    for state, kernel in enumerate(kernels):
+        row = state * width
+        for column, target in gotos[state].items():
+            table[row + column] = target * width
+        items = lr1_closure(symbols, firsts, {item: lookaheads[state, item] for item in kernel})
+        reductions = {}
+        for (production, dot), terminals in items.items():
+            if dot != len(symbols.productions[production][1]):
+                continue
+            for terminal in terminals:
+                if terminal in reductions:
+                    other = reductions[terminal]
+                    conflicts.append(f'state {state}: reduce/reduce conflict on {symbols.name(terminal)} between '
+                                     f'{describe_item(symbols, (other, len(symbols.productions[other][1])))} and '
+                                     f'{describe_item(symbols, (production, dot))}')
+                    continue
+                reductions[terminal] = production
+        for terminal, production in reductions.items():
+            entry = ~production
+            if table[row + terminal] > 0:
+                # Shift/reduce: the higher precedence wins; at the same
+                # level, associativity decides
+                rule_precedence = symbols.production_precedence[production]
+                token_precedence = symbols.terminal_precedence.get(terminal)
+                if rule_precedence is None or token_precedence is None:
+                    rule = describe_item(symbols, (production, len(symbols.productions[production][1])))
+                    conflicts.append(f'state {state}: shift/reduce conflict on {symbols.name(terminal)} '
+                                     f'with {rule}')
+                    continue
+                if rule_precedence[0] > token_precedence[0] or (
+                        rule_precedence[0] == token_precedence[0] and rule_precedence[1] == 'left'):
+                    table[row + terminal] = entry
+                elif rule_precedence[0] == token_precedence[0] and rule_precedence[1] == 'nonassoc':
+                    table[row + terminal] = 0
+            else:
+                table[row + terminal] = entry
+    if conflicts:
+        shown = '\n  '.join(conflicts[:10])
+        more = f'\n  ... and {len(conflicts) - 10} more' if len(conflicts) > 10 else ''
+        raise ValueError(f'Grammar {grammar.name!r} is not LALR(1):\n  {shown}{more}')
+
+    return {
+        'version': ENGINE_VERSION,
+        'terminals': symbols.terminals,
+        'nonterminals': symbols.nonterminals,
+        'lhs': [lhs for lhs, _ in symbols.productions],
+        'lengths': [len(rhs) for _, rhs in symbols.productions],
+        # Stored as bytes, which marshal reads much faster than a list of ints
+        'table': array('i', table).tobytes(),
+    }
+
+
+# Step 6: the parse loop
+
+class Actions:
+    # Base of the objects whose methods are the grammar actions. location and
+    # text describe a token in syntax errors: position counts the tokens read
+    # from the start of the input, value is what the token source paired with
+    # the token
+    invalid_message = "Invalid character"
+
+    def location(self, position):
+        return None, None
+
+    def text(self, value):
+        return str(value)
+
+
+class Parser:
+    def __init__(self, grammar, tables):
+        self.grammar = grammar
+        self.terminals = tables['terminals']
+        self.nonterminals = tables['nonterminals']
+        self.width = len(self.terminals) + len(self.nonterminals)
+        table = array('i')
+        table.frombytes(tables['table'])
+        self.table = table.tolist()
+        self.lhs = tables['lhs']
+        self.lengths = tables['lengths']
+        self.action_names = [None] + [action for _, _, action in grammar.rules]
+        # Terminal columns by kind name and by token text
+        self.named = {name: column for column, name in enumerate(self.terminals) if is_named_terminal(name)}
+        self.literals = {name[1:-1]: column for column, name in enumerate(self.terminals) if is_literal(name)}
+
+    def column(self, name):
+        # Column of a terminal or nonterminal, by its name in the grammar
+        if name in self.terminals:
+            return self.terminals.index(name)
+        return len(self.terminals) + self.nonterminals.index(name)
+
+    def terminal(self, kind, text):
+        # Column of a token: by kind for the kinds the grammar names, else by
+        # text, else INVALID
+        column = self.named.get(kind)
+        if column is None:
+            column = self.literals.get(text, INVALID)
+        return column
+
+    def stream_columns(self, token_stream):
+        # Terminal column of every token of a TokenStream, without making
+        # Token views. Texts are looked up once per interned symbol
+        named = self.named
+        literals = self.literals
+        kind_columns = [named.get(kind, -1) for kind in token_stream.kind_names]
+        names = token_stream.symbols.names
+        symbol_columns = {}
+        columns = array('H')
+        append = columns.append
+        for index, (kind, symbol) in enumerate(zip(token_stream.kinds, token_stream.symbol_ids)):
+            column = kind_columns[kind]
+            if column < 0:
+                if symbol >= 0:
+                    column = symbol_columns.get(symbol)
+                    if column is None:
+                        column = symbol_columns[symbol] = literals.get(names[symbol], INVALID)
+                else:
+                    column = literals.get(token_stream.value(index), INVALID)
+            append(column)
+        return columns
+
+    def bind(self, actions):
+        return [getattr(actions, name) if name is not None else None for name in self.action_names]
+
+    def parse(self, tokens, actions, errors, items=None):
+        # Parses the (column, value) pairs of tokens and returns the value of
+        # the start symbol, or None when an error could not be recovered from
+        run = self.run(tokens, actions, errors, items)
+        try:
+            while True:
+                next(run)
+        except StopIteration as stop:
+            return stop.value
+
+    def run(self, tokens, actions, errors, items=None):
+        # Generator behind parse; with items, the value of each reduction to
+        # that nonterminal is yielded as soon as it is made
+        table = self.table
+        lhs = self.lhs
+        lengths = self.lengths
+        functions = self.bind(actions)
+        # Unit rules without an action only change the state
+        passes = [length == 1 and function is None for length, function in zip(lengths, functions)]
+        passes[0] = False
+        yields = [False] * len(lhs)
+        if items is not None:
+            item_column = self.column(items)
+            passes = [passing and column != item_column for passing, column in zip(passes, lhs)]
+            yields = [column == item_column for column in lhs]
+        error_column = ERROR
+
+        tokens = iter(tokens)
+        states = [0]
+        values = [None]
+        starts = [0]
+        position = 0
+        column, value = next(tokens, (END, None))
+        recovering = 0
+        while True:
+            action = table[states[-1] + column]
+            if action > 0:
+                states.append(action)
+                values.append(value)
+                starts.append(position)
+                position += 1
+                column, value = next(tokens, (END, None))
+                if recovering:
+                    recovering -= 1
+            elif action < 0:
+                production = ~action
+                if passes[production]:
+                    states[-1] = table[states[-2] + lhs[production]]
+                    continue
+                if production == 0:
+                    return values[-1]
+                length = lengths[production]
+                if length:
+                    start = starts[-length]
+                    arguments = values[-length:]
+                    del states[-length:], values[-length:], starts[-length:]
+                else:
+                    start = position
+                    arguments = ()
+                function = functions[production]
+                if function is not None:
+                    result = function(start, position, *arguments)
+                else:
+                    result = arguments[0] if length else None
+                states.append(table[states[-1] + lhs[production]])
+                values.append(result)
+                starts.append(start)
+                if yields[production]:
+                    yield result
+            elif column == INVALID:
+                # A token the grammar does not know is reported and dropped
+                errors.error(actions.invalid_message, *actions.location(position), actions.text(value))
+                position += 1
+                column, value = next(tokens, (END, None))
+            elif recovering == RECOVERY_TOKENS:
+                # Nothing shifted since the last error: skip this token
+                if column == END:
+                    return None
+                position += 1
+                column, value = next(tokens, (END, None))
+            else:
+                if not recovering:
+                    self.report(states, column, value, position, actions, errors)
+                recovering = RECOVERY_TOKENS
+                while table[states[-1] + error_column] <= 0:
+                    if len(states) == 1:
+                        return None
+                    del states[-1], values[-1], starts[-1]
+                states.append(table[states[-1] + error_column])
+                values.append(None)
+                starts.append(position)
+
+    def accepts(self, states, column):
+        # Whether the parser with this state stack would shift column, after
+        # the reductions it makes on it. Merged LALR states can reduce on
+        # terminals that no state below them shifts
+        table = self.table
+        states = list(states)
+        while True:
+            action = table[states[-1] + column]
+            if action > 0:
+                return True
+            if action == 0:
+                return False
+            production = ~action
+            if production == 0:
+                return column == END
+            if self.lengths[production]:
+                del states[-self.lengths[production]:]
+            states.append(table[states[-1] + self.lhs[production]])
+
+    def expected(self, states):
+        # Terminals the parser can go on with
+        return [self.terminals[column] for column in range(INVALID + 1, len(self.terminals))
+                if self.accepts(states, column)]
+
+    def report(self, states, column, value, position, actions, errors):
+        expected = self.expected(states)
+        if column == END:
+            if expected and len(expected) <= MAX_EXPECTED:
+                errors.error(f"Expected {' or '.join(expected)} at end of input")
+            else:
+                errors.error("Unexpected end of input")
+        elif expected and len(expected) <= MAX_EXPECTED:
+            errors.error(f"Expected {' or '.join(expected)} but found", *actions.location(position),
+                         actions.text(value))
+        else:
+            errors.error("Unexpected", *actions.location(position), actions.text(value))
+
+
+# Step 7: building with an on-disk cache of the tables
+
+parsers = {}
+
+
+def cache_path(grammar):
+    return os.path.join(CACHE_DIR, f'parser-{grammar.name}-{grammar.key()}.tables')
+
+
+def load_tables(path):
+    try:
+        with open(path, 'rb') as f:
+            tables = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(tables, dict) or tables.get('version') != ENGINE_VERSION:
+        return None
+    return tables
+
+
+def load_parser(grammar, use_cache=True):
+    # Parsers are built once per process and their tables once per grammar
+    key = grammar.key()
+    if key in parsers:
+        return parsers[key]
+    tables = None
+    path = cache_path(grammar)
+    if use_cache:
+        tables = load_tables(path)
+    if tables is None:
+        tables = generate_tables(grammar)
+        if use_cache:
+            lexgen.save_tables(path, tables)
+    parser = Parser(grammar, tables)
+    parsers[key] = parser
+    return parser
+
+
+class LazyParser(Parser):
+    # Stands in for the Parser of grammar until an attribute is first read,
+    # then becomes that Parser
+    def __init__(self, grammar, use_cache=True):
+        self.grammar = grammar
+        self.use_cache = use_cache
+
+    def __getattr__(self, name):
+        # Only called for attributes that are not set yet
+        if name in ('grammar', 'use_cache') or name.startswith('__'):
+            raise AttributeError(name)
+        parser = load_parser(self.grammar, self.use_cache)
+        self.__dict__.update(parser.__dict__)
+        self.__class__ = Parser
+        return getattr(self, name)
+
+
+def build_parser(grammar, use_cache=True):
+    return LazyParser(grammar, use_cache)
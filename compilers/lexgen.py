@@ -0,0 +1,525 @@
+import marshal
+import os
+
+from compilers import tokens
+
+# Table-driven lexer generator shared by all frontends.
+#
+# A language describes its tokens with a LexerSpec: an ordered list of
+# (kind, pattern) rules written in a small regex dialect, a keyword table and
+# the kinds to skip. build_lexer turns the spec into a minimized DFA over
+# bytes once, caches the tables on disk, and returns a Lexer whose scan loop
+# does maximal munch with one table lookup per input byte.
+#
+# The lexer is built lazily: build_lexer only records the spec, so importing a
+# frontend costs nothing here, and the tables are read from the cache the
+# first time the lexer is used.
+
+# Bump when the table format or construction changes to invalidate caches
+ENGINE_VERSION = 2
+
+CACHE_DIR = os.environ.get('COMPILERS_CACHE_DIR',
+                           os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache'))
+
+# Bytes >= 128 only occur inside UTF-8 sequences; patterns treat them as
+# "any other character", so negated classes and '.' accept them
+ALL_BYTES = frozenset(range(256))
+
+ESCAPE_CLASSES = {
+    'd': frozenset(b'0123456789'),
+    'w': frozenset(b'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_'),
+    's': frozenset(b' \t\n\r\f\v'),
+}
+ESCAPE_CHARS = {'n': '\n', 't': '\t', 'r': '\r', 'f': '\f', 'v': '\v', '0': '\0'}
+
+REGEX_SPECIAL = set('\\.[]()|*+?')
+
+
+# Escape a literal string (an operator or keyword) for use in a rule
+def literal(text):
+    return ''.join('\\' + char if char in REGEX_SPECIAL else char for char in text)
+
+
+class LexerSpec:
+    def __init__(self, name, rules, keywords=None, skip=(), identifier='IDENTIFIER', error='ERROR',
+                 literals=(), fold_keywords=False):
+        # Rules earlier in the list win when two rules match the same length
+        self.name = name
+        self.rules = list(rules)
+        # Identifier tokens whose text is in keywords get the mapped kind;
+        # with fold_keywords, whatever the case of the text, as in Pascal.
+        # The token text stays as written
+        self.keywords = dict(keywords or {})
+        self.fold_keywords = fold_keywords
+        self.skip = set(skip)
+        self.identifier = identifier
+        self.error = error
+        # Kinds whose text stays in the source instead of the symbol table
+        self.literals = set(literals)
+
+    def key(self):
+        # Hash of everything that affects the generated tables
+        import hashlib
+        text = repr((ENGINE_VERSION, self.rules, sorted(self.keywords.items()),
+                     sorted(self.skip), self.identifier, self.error, self.fold_keywords))
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+# Step 1: parse rule patterns into a Thompson NFA
+
+class NFA:
+    def __init__(self):
+        self.edges = []     # per state: list of (byte set, target)
+        self.epsilon = []   # per state: list of targets
+        self.accepts = {}   # state -> rule index
+
+    def new_state(self):
+        self.edges.append([])
+        self.epsilon.append([])
+        return len(self.edges) - 1
+
+
+class PatternParser:
+    def __init__(self, pattern, nfa):
+        self.pattern = pattern
+        self.pos = 0
+        self.nfa = nfa
+
+    def error(self, message):
+        return ValueError(f'{message} at offset {self.pos} in pattern {self.pattern!r}')
+
+    def peek(self):
+        if self.pos < len(self.pattern):
+            return self.pattern[self.pos]
+        return None
+
+    def parse(self):
+        fragment = self.parse_alternation()
+        if self.pos != len(self.pattern):
+            raise self.error('Unbalanced parenthesis')
+        return fragment
+
+    def parse_alternation(self):
+        fragments = [self.parse_sequence()]
+        while self.peek() == '|':
+            self.pos += 1
+            fragments.append(self.parse_sequence())
+        if len(fragments) == 1:
+            return fragments[0]
+        start = self.nfa.new_state()
+        end = self.nfa.new_state()
+        for fragment_start, fragment_end in fragments:
+            self.nfa.epsilon[start].append(fragment_start)
+            self.nfa.epsilon[fragment_end].append(end)
+        return start, end
+
+    def parse_sequence(self):
+        start = self.nfa.new_state()
+        end = start
+        while self.peek() not in (None, '|', ')'):
+            atom_start, atom_end = self.parse_repetition()
+            self.nfa.epsilon[end].append(atom_start)
+            end = atom_end
+        return start, end
+
+    def parse_repetition(self):
+        atom_start, atom_end = self.parse_atom()
+        while self.peek() in ('*', '+', '?'):
+            operator = self.pattern[self.pos]
+            self.pos += 1
+            start = self.nfa.new_state()
+            end = self.nfa.new_state()
+            self.nfa.epsilon[start].append(atom_start)
+            self.nfa.epsilon[atom_end].append(end)
+            if operator in ('*', '?'):
+                self.nfa.epsilon[start].append(end)
+            if operator in ('*', '+'):
+                self.nfa.epsilon[atom_end].append(atom_start)
+            atom_start, atom_end = start, end
+        return atom_start, atom_end
+
+    def parse_atom(self):
+        char = self.peek()
+        if char is None:
+            raise self.error('Unexpected end of pattern')
+        self.pos += 1
+        if char == '(':
+            if self.pattern.startswith('?:', self.pos):
+                self.pos += 2
+            fragment = self.parse_alternation()
+            if self.peek() != ')':
+                raise self.error('Missing )')
+            self.pos += 1
+            return fragment
+        if char == '[':
+            return self.symbol(self.parse_class())
+        if char == '.':
+            return self.symbol(ALL_BYTES - {ord('\n')})
+        if char == '\\':
+            return self.symbol(self.parse_escape())
+        if char in ('*', '+', '?', ')'):
+            raise self.error(f'Nothing to repeat before {char!r}')
+        return self.symbol(self.char_set(char))
+
+    def parse_escape(self):
+        char = self.peek()
+        if char is None:
+            raise self.error('Dangling backslash')
+        self.pos += 1
+        if char in ESCAPE_CLASSES:
+            return ESCAPE_CLASSES[char]
+        return self.char_set(ESCAPE_CHARS.get(char, char))
+
+    def parse_class(self):
+        negate = self.peek() == '^'
+        if negate:
+            self.pos += 1
+        members = set()
+        first = True
+        while True:
+            char = self.peek()
+            if char is None:
+                raise self.error('Missing ]')
+            if char == ']' and not first:
+                self.pos += 1
+                break
+            first = False
+            self.pos += 1
+            if char == '\\':
+                members |= self.parse_escape()
+                continue
+            low = self.char_set(char)
+            if self.peek() == '-' and self.pos + 1 < len(self.pattern) and self.pattern[self.pos + 1] != ']':
+                self.pos += 1
+                high_char = self.pattern[self.pos]
+                self.pos += 1
+                if high_char == '\\':
+                    high_char = ESCAPE_CHARS.get(self.pattern[self.pos], self.pattern[self.pos])
+                    self.pos += 1
+                members.update(range(ord(char), ord(high_char) + 1))
+            else:
+                members |= low
+        if negate:
+            return ALL_BYTES - members
+        return frozenset(members)
+
+    def char_set(self, char):
+        if ord(char) >= 128:
+            raise self.error(f'Non-ASCII character {char!r}')
+        return frozenset((ord(char),))
+
+    def symbol(self, byte_set):
+        start = self.nfa.new_state()
+        end = self.nfa.new_state()
+        self.nfa.edges[start].append((frozenset(byte_set), end))
+        return start, end
+
+
+def build_nfa(rules):
+    nfa = NFA()
+    start = nfa.new_state()
+    for index, (_, pattern) in enumerate(rules):
+        fragment_start, fragment_end = PatternParser(pattern, nfa).parse()
+        nfa.epsilon[start].append(fragment_start)
+        nfa.accepts[fragment_end] = index
+    return nfa, start
+
+
+# Step 2: subset construction over byte equivalence classes
+
+def byte_classes(nfa):
+    # Bytes that no edge tells apart share a class, which keeps the DFA rows
+    # narrow while it is built and minimized
+    byte_sets = list({byte_set for edges in nfa.edges for byte_set, _ in edges})
+    signatures = {}
+    classes = []
+    for byte in range(256):
+        signature = tuple(byte in byte_set for byte_set in byte_sets)
+        classes.append(signatures.setdefault(signature, len(signatures)))
+    return classes, len(signatures)
+
+
+def epsilon_closure(nfa, states):
+    closure = set(states)
+    stack = list(states)
+    while stack:
+        for target in nfa.epsilon[stack.pop()]:
+            if target not in closure:
+                closure.add(target)
+                stack.append(target)
+    return frozenset(closure)
+
+
+def build_dfa(nfa, start, classes, class_count):
+    representatives = [classes.index(cls) for cls in range(class_count)]
+    start_set = epsilon_closure(nfa, [start])
+    state_ids = {start_set: 0}
+    state_sets = [start_set]
+    transitions = []
+    accepts = []
+    index = 0
+    while index < len(state_sets):
+        current = state_sets[index]
+        index += 1
+        rule_indexes = [nfa.accepts[state] for state in current if state in nfa.accepts]
+        accepts.append(min(rule_indexes) if rule_indexes else -1)
+        row = []
+        for byte in representatives:
+            targets = [target for state in current for byte_set, target in nfa.edges[state] if byte in byte_set]
+            if not targets:
+                row.append(-1)
+                continue
+            target_set = epsilon_closure(nfa, targets)
+            if target_set not in state_ids:
+                state_ids[target_set] = len(state_sets)
+                state_sets.append(target_set)
+            row.append(state_ids[target_set])
+        transitions.append(row)
+    return transitions, accepts
+
+
+# Step 3: Moore partition refinement; states stay apart when they accept
+# different rules or disagree on any transition
+
+def minimize(transitions, accepts):
+    blocks = [accepts[state] for state in range(len(accepts))]
+    block_count = len(set(blocks))
+    while True:
+        signatures = {}
+        new_blocks = []
+        for state, row in enumerate(transitions):
+            signature = (blocks[state],) + tuple(blocks[target] if target >= 0 else -1 for target in row)
+            new_blocks.append(signatures.setdefault(signature, len(signatures)))
+        if len(signatures) == block_count:
+            blocks = new_blocks
+            break
+        blocks = new_blocks
+        block_count = len(signatures)
+
+    # Renumber so the start state stays 0 and accepting states come last,
+    # which lets the scan loop test for acceptance with one comparison
+    order = {blocks[0]: 0}
+    for accepting in (False, True):
+        for state in range(len(transitions)):
+            if (accepts[state] >= 0) == accepting:
+                order.setdefault(blocks[state], len(order))
+    minimized = [None] * len(order)
+    minimized_accepts = [-1] * len(order)
+    for state, row in enumerate(transitions):
+        new_state = order[blocks[state]]
+        if minimized[new_state] is None:
+            minimized[new_state] = [order[blocks[target]] if target >= 0 else -1 for target in row]
+            minimized_accepts[new_state] = accepts[state]
+    return minimized, minimized_accepts
+
+
+def generate_tables(spec):
+    nfa, start = build_nfa(spec.rules)
+    classes, class_count = byte_classes(nfa)
+    transitions, accepts = build_dfa(nfa, start, classes, class_count)
+    if accepts[0] >= 0:
+        raise ValueError(f'Rule {spec.rules[accepts[0]][0]!r} matches the empty string')
+    transitions, accepts = minimize(transitions, accepts)
+    return {
+        'version': ENGINE_VERSION,
+        'classes': classes,
+        'transitions': [target for row in transitions for target in row],
+        'class_count': class_count,
+        'accepts': accepts,
+    }
+
+
+# Step 4: the scanner
+
+class Lexer:
+    def __init__(self, spec, tables):
+        self.spec = spec
+        # Token kinds are small ints; rule kinds first, then keyword kinds
+        self.kinds = []
+        for kind, _ in spec.rules:
+            if kind not in self.kinds:
+                self.kinds.append(kind)
+        for kind in spec.keywords.values():
+            if kind not in self.kinds:
+                self.kinds.append(kind)
+        if spec.error not in self.kinds:
+            self.kinds.append(spec.error)
+        self.kind_ids = {kind: index for index, kind in enumerate(self.kinds)}
+        self.error_kind = self.kind_ids[spec.error]
+        self.identifier_kind = self.kind_ids.get(spec.identifier, -1)
+        self.keywords = {word.encode('ascii'): self.kind_ids[kind] for word, kind in spec.keywords.items()}
+        self.fold_keywords = spec.fold_keywords
+        self.skipped = {self.kind_ids[kind] for kind in spec.skip}
+        # Literal texts are read from the source, not interned
+        self.literal_kinds = {self.kind_ids[kind] for kind in spec.literals if kind in self.kind_ids}
+
+        # Expand the class-compressed tables into one 256-entry row per state
+        # so the scan loop indexes rows directly with input bytes
+        classes = tables['classes']
+        class_count = tables['class_count']
+        flat = tables['transitions']
+        self.rows = []
+        for state in range(len(tables['accepts'])):
+            base = state * class_count
+            self.rows.append([flat[base + classes[byte]] for byte in range(256)])
+        self.accept_kinds = [self.kind_ids[spec.rules[rule][0]] if rule >= 0 else -1
+                             for rule in tables['accepts']]
+        self.first_accepting = len(self.accept_kinds)
+        for state, kind in enumerate(self.accept_kinds):
+            if kind >= 0:
+                self.first_accepting = state
+                break
+
+    def scan(self, data, pos=0, end=None, lookahead=False):
+        # Yield (kind, start, end) for each token in a bytes-like buffer using
+        # maximal munch: keep stepping while the DFA lives and remember the
+        # last accepting position. With lookahead, each token also carries
+        # the furthest position examined so far (end when the DFA ran into
+        # it): a failed longer match, like an unterminated comment, reads
+        # past the token, and a change there can lex the token differently
+        rows = self.rows
+        accept_kinds = self.accept_kinds
+        first_accepting = self.first_accepting
+        keywords = self.keywords
+        fold_keywords = self.fold_keywords
+        identifier_kind = self.identifier_kind
+        skipped = self.skipped
+        error_kind = self.error_kind
+        if end is None:
+            end = len(data)
+        furthest = pos
+        while pos < end:
+            row = rows[0]
+            index = pos
+            last_state = -1
+            last_end = pos
+            while index < end:
+                state = row[data[index]]
+                if state < 0:
+                    break
+                index += 1
+                row = rows[state]
+                if state >= first_accepting:
+                    last_state = state
+                    last_end = index
+            if lookahead and index > furthest:
+                furthest = index
+            if last_state < 0:
+                # No rule matches: one character (with any UTF-8
+                # continuation bytes) becomes an error token
+                index = pos + 1
+                while index < end and 0x80 <= data[index] < 0xC0:
+                    index += 1
+                if error_kind not in skipped:
+                    yield (error_kind, pos, index, max(furthest, index)) if lookahead else (error_kind, pos, index)
+                pos = index
+                continue
+            kind = accept_kinds[last_state]
+            if kind == identifier_kind and keywords:
+                word = bytes(data[pos:last_end])
+                kind = keywords.get(word.lower() if fold_keywords else word, kind)
+            if kind not in skipped:
+                yield (kind, pos, last_end, furthest) if lookahead else (kind, pos, last_end)
+            pos = last_end
+
+    def stream(self, data, symbols=None, spans=None):
+        # Scan a bytes-like buffer into a compact TokenStream. spans are the
+        # (kind, start, end) tokens of data when they were scanned already
+        token_stream = tokens.TokenStream(data, self.kinds, symbols)
+        literal_kinds = self.literal_kinds
+        intern = token_stream.symbols.intern
+        append = token_stream.append
+        for kind, start, end in self.scan(data) if spans is None else spans:
+            if kind in literal_kinds:
+                append(kind, start, end)
+            else:
+                append(kind, start, end, intern(bytes(data[start:end])))
+        return token_stream
+
+    def iter_tokens(self, data):
+        # Lazily yield Token views over a bytes-like buffer such as an mmap,
+        # for pipelines that never hold the whole token list
+        kinds = self.kinds
+        for kind, start, end in self.scan(data):
+            yield tokens.Token(kinds[kind], bytes(data[start:end]).decode('utf-8'))
+
+    def tokenize(self, source_code):
+        # Convenience for the frontends: a TokenStream over a str
+        return self.stream(source_code.encode('utf-8'))
+
+
+# Step 5: building with an on-disk cache of the tables
+
+lexers = {}
+
+
+def cache_path(spec):
+    return os.path.join(CACHE_DIR, f'lexer-{spec.name}-{spec.key()}.tables')
+
+
+def load_tables(path):
+    # Tables are stored with marshal, which loads several times faster than
+    # JSON and needs no import
+    try:
+        with open(path, 'rb') as f:
+            tables = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(tables, dict) or tables.get('version') != ENGINE_VERSION:
+        return None
+    return tables
+
+
+def save_tables(path, tables):
+    # Write to a temporary file and rename so concurrent runs never see a
+    # partial table; failing to cache is not an error
+    temporary_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temporary_path, 'wb') as f:
+            marshal.dump(tables, f)
+        os.replace(temporary_path, path)
+    except OSError:
+        try:
+            os.remove(temporary_path)
+        except OSError:
+            pass
+
+
+def load_lexer(spec, use_cache=True):
+    # Lexers are built once per process and their tables once per spec
+    key = spec.key()
+    if key in lexers:
+        return lexers[key]
+    tables = None
+    path = cache_path(spec)
+    if use_cache:
+        tables = load_tables(path)
+    if tables is None:
+        tables = generate_tables(spec)
+        if use_cache:
+            save_tables(path, tables)
+    lexer = Lexer(spec, tables)
+    lexers[key] = lexer
+    return lexer
+
+
+class LazyLexer(Lexer):
+    # Stands in for the Lexer of spec until an attribute is first read, then
+    # becomes that Lexer
+    def __init__(self, spec, use_cache=True):
+        self.spec = spec
+        self.use_cache = use_cache
+
+    def __getattr__(self, name):
+        # Only called for attributes that are not set yet
+        if name in ('spec', 'use_cache') or name.startswith('__'):
+            raise AttributeError(name)
+        lexer = load_lexer(self.spec, self.use_cache)
+        self.__dict__.update(lexer.__dict__)
+        self.__class__ = Lexer
+        return getattr(self, name)
+
+
+def build_lexer(spec, use_cache=True):
+    return LazyLexer(spec, use_cache)
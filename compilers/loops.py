@@ -0,0 +1,722 @@
+from compilers import cfg, ir
+
+# Loop analysis and the loop passes of the optimizer (see compilers/passes.py
+# for the pass manager that runs them).
+#
+# A loop is a natural loop of the control-flow graph: a header block that
+# dominates the latch blocks jumping back to it, and every block that reaches
+# a latch without passing the header. The generators build every loop the
+# same way, with the test at the top:
+#
+#   C++ and Rust (stack code)          Pascal (register code)
+#       PUSH 0                             LOAD_CONSTANT 1, i
+#       STORE i                        LOOP_START:
+#   LOOP_START:                            COMPARE i, 10
+#       LOAD i                             JUMP_IF_GREATER END_LOOP
+#       PUSH 10                            ...body...
+#       COMPARE <                          INCREMENT i
+#       JUMP_IF_FALSE LOOP_BODY_END        JUMP LOOP_START
+#       ...body...                     END_LOOP:
+#       LOAD i
+#       PUSH 1
+#       ADD
+#       STORE i
+#       JUMP LOOP_START
+#   LOOP_BODY_END:
+#
+# An induction variable is assigned exactly once in the loop, by adding a
+# constant step to itself (the STORE i or INCREMENT i above). When the header
+# compares it with a constant and the preheader, the one block entering the
+# loop from outside, sets it to a constant, the trip count is known.
+#
+#   loop_invariant_code_motion  computes expressions whose inputs the loop
+#                               does not change into new variables before
+#                               the loop, and moves assignments of such
+#                               values there
+#   loop_unrolling              repeats the body of a one-block loop with a
+#                               known trip count up to the unroll factor
+#                               times, so the test runs once per group of
+#                               copies; a loop with no more iterations than
+#                               that disappears into straight code. Below a
+#                               factor of 2 only loops whose straight code is
+#                               no longer than the loop disappear
+#   strength_reduction          replaces i * c by a variable that steps by
+#                               step * c along with i, and the test of i by a
+#                               test of that variable when the loop reads i
+#                               for nothing else, so i goes away
+#   loop_rotation               moves the test to the bottom, so an iteration
+#                               runs one conditional jump back instead of the
+#                               test at the top and a JUMP; the test before
+#                               the first iteration goes when the first test
+#                               is known to pass
+#
+# Transforming a loop changes the blocks of the loops around it, so a pass
+# transforms the innermost loops first and sweeps again over a fresh
+# control-flow graph for the loops around them. The C frontend keeps its
+# loops as structured LOOP nodes around source text, which these passes
+# leave alone.
+
+# Copies of the body per iteration of an unrolled loop when unrolling is
+# asked for. The default pipeline (see compilers/passes.py) leaves it below 2,
+# since copies only pay off where the loop overhead dominates the body
+UNROLL_FACTOR = 4
+
+# Most real instructions the copies of an unrolled body may add up to
+MAX_UNROLLED_INSTRUCTIONS = 256
+
+# Longest test that rotation copies to the bottom of a loop, and most latches
+# it copies the test to
+MAX_TEST_INSTRUCTIONS = 8
+MAX_LATCHES = 4
+
+# Stack instructions an invariant expression is built from: they push one
+# value, have no other effect and cannot fail. ARRAY is left out since every
+# evaluation makes a new array
+INVARIANT_OPCODES = cfg.PURE_OPCODES - {ir.DUP, ir.ARRAY}
+
+# Opcodes only found in register code
+REGISTER_OPCODES = {ir.LOAD_CONSTANT, ir.MOVE, ir.INCREMENT, ir.DECREMENT} | ir.FLAG_JUMPS
+
+# Flag jump that leaves the loop -> the comparison under which it goes on
+FLAG_CONTINUES = {ir.JUMP_IF_GREATER: '<=', ir.JUMP_IF_GREATER_EQUAL: '<',
+                  ir.JUMP_IF_LESS: '>=', ir.JUMP_IF_LESS_EQUAL: '>'}
+
+
+# Loop analysis
+
+class Loop:
+    def __init__(self, header):
+        self.header = header
+        # Blocks jumping back to the header
+        self.latches = []
+        # Indices of the blocks in the loop, the header's included
+        self.blocks = {header.index}
+        # The one block outside the loop that enters it, or None
+        self.preheader = None
+        # Filled in by assignments
+        self.assigned = None
+        self.calls = False
+
+
+class LoopTest:
+    # A header that compares left with right, each a variable name or a
+    # number, and leaves the loop for the exit block unless
+    # 'left operator right' holds
+    def __init__(self, left, operator, right, exit):
+        self.left = left
+        self.operator = operator
+        self.right = right
+        self.exit = exit
+
+    def bound(self, name):
+        # (operator, bound) of the test written as 'name operator bound', or
+        # None when the test does not compare name
+        if self.left == name:
+            return self.operator, self.right
+        if self.right == name:
+            return ir.SWAPPED_COMPARISONS[self.operator], self.left
+        return None
+
+
+def find_loops(function):
+    # The natural loops of a function, innermost first; back edges to one
+    # header make one loop. A back edge goes to a block no later in reverse
+    # postorder, so only those edges pay for the walk up the dominator tree
+    order = function.control_flow()[1]
+    idom = function.dominators()
+    position = {block.index: number for number, block in enumerate(order)}
+    loops = {}
+    for number, block in enumerate(order):
+        for successor in block.successors:
+            if position[successor.index] <= number and cfg.dominates(idom, successor.index, block.index):
+                loop = loops.get(successor.index)
+                if loop is None:
+                    loop = loops[successor.index] = Loop(successor)
+                if block not in loop.latches:
+                    loop.latches.append(block)
+    for loop in loops.values():
+        pending = list(loop.latches)
+        while pending:
+            block = pending.pop()
+            if block.index in loop.blocks:
+                continue
+            loop.blocks.add(block.index)
+            pending.extend(predecessor for predecessor in block.predecessors if predecessor.index in idom)
+        entries = {predecessor.index: predecessor for predecessor in loop.header.predecessors
+                   if predecessor.index in idom and predecessor.index not in loop.blocks}
+        if len(entries) == 1:
+            loop.preheader = next(iter(entries.values()))
+    return sorted(loops.values(), key=lambda loop: len(loop.blocks))
+
+
+def test_operand(instr):
+    # The variable a LOAD reads or the number a PUSH pushes, else None
+    if instr.opcode == ir.LOAD:
+        return instr.operands[0]
+    if instr.opcode == ir.PUSH and cfg.is_number(instr.operands[0]):
+        return instr.operands[0]
+    return None
+
+
+def loop_test(loop):
+    # The LoopTest of a header that does nothing but test two operands, or
+    # None
+    header = loop.header
+    if len(header.successors) != 2:
+        return None
+    exit, following = header.successors
+    if exit.index in loop.blocks or following.index not in loop.blocks:
+        return None
+    code = [instr for instr in header.instructions if instr.opcode != ir.COMMENT]
+    jump = code[-1]
+    if jump.opcode in ir.FLAG_JUMPS:
+        if len(code) != 2 or code[0].opcode != ir.COMPARE or len(code[0].operands) != 2:
+            return None
+        left, right = code[0].operands
+        operator = FLAG_CONTINUES[jump.opcode]
+    else:
+        if len(code) != 4 or code[2].opcode != ir.COMPARE or len(code[2].operands) != 1:
+            return None
+        left = test_operand(code[0])
+        right = test_operand(code[1])
+        if left is None or right is None:
+            return None
+        operator = code[2].operands[0]
+        if jump.opcode == ir.JUMP_IF_TRUE:
+            operator = ir.NEGATED_COMPARISONS[operator]
+    return LoopTest(left, operator, right, exit)
+
+
+def assignments(loop, blocks):
+    # (variable -> [(block, position)] of its assignments in the loop,
+    # whether the loop calls anything)
+    if loop.assigned is None:
+        loop.assigned = {}
+        for index in loop.blocks:
+            block = blocks[index]
+            for position, instr in enumerate(block.instructions):
+                name = cfg.defined_variable(instr)
+                if name is not None:
+                    loop.assigned.setdefault(name, []).append((block, position))
+                elif instr.opcode == ir.CALL:
+                    loop.calls = True
+    return loop.assigned, loop.calls
+
+
+def update_step(instructions, position, name):
+    # The constant step of the update of name at position, or None when it
+    # is not name = name + step
+    instr = instructions[position]
+    if instr.opcode == ir.INCREMENT:
+        return 1
+    if instr.opcode == ir.DECREMENT:
+        return -1
+    if instr.opcode != ir.STORE or position < 3:
+        return None
+    first, second, operation = instructions[position - 3:position]
+    if operation.opcode != ir.ADD and operation.opcode != ir.SUB:
+        return None
+    if first.opcode == ir.LOAD and first.operands[0] == name and second.opcode == ir.PUSH:
+        step = second.operands[0]
+    elif (operation.opcode == ir.ADD and first.opcode == ir.PUSH
+          and second.opcode == ir.LOAD and second.operands[0] == name):
+        step = first.operands[0]
+    else:
+        return None
+    if type(step) is not int or step == 0:
+        return None
+    return -step if operation.opcode == ir.SUB else step
+
+
+def induction_variables(function, loop, blocks):
+    # Induction variable -> (block, position of its update, step). A call
+    # may assign any global, so globals only count in loops without calls
+    assigned, calls = assignments(loop, blocks)
+    inductions = {}
+    for name, places in assigned.items():
+        if len(places) != 1 or (calls and name in function.escaping):
+            continue
+        block, position = places[0]
+        step = update_step(block.instructions, position, name)
+        if step is not None:
+            inductions[name] = (block, position, step)
+    return inductions
+
+
+def initial_value(function, loop, name):
+    # The number the preheader leaves in name when it sets it to a constant,
+    # else None
+    if loop.preheader is None:
+        return None
+    instructions = loop.preheader.instructions
+    for position in range(len(instructions) - 1, -1, -1):
+        instr = instructions[position]
+        if instr.opcode == ir.CALL and name in function.escaping:
+            return None
+        if cfg.defined_variable(instr) != name:
+            continue
+        if instr.opcode == ir.LOAD_CONSTANT:
+            value = instr.operands[0]
+        elif instr.opcode == ir.STORE and position and instructions[position - 1].opcode == ir.PUSH:
+            value = instructions[position - 1].operands[0]
+        else:
+            return None
+        return value if cfg.is_number(value) else None
+    return None
+
+
+def trip_count(start, operator, bound, step):
+    # Iterations of 'for (i = start; i operator bound; i += step)', or None
+    # when the test never ends it
+    if type(start) is not int or type(bound) is not int:
+        return None
+    if not ir.COMPARE_OPERATORS[operator](start, bound):
+        return 0
+    if operator == '<' and step > 0:
+        return -(-(bound - start) // step)
+    if operator == '<=' and step > 0:
+        return (bound - start) // step + 1
+    if operator == '>' and step < 0:
+        return -(-(start - bound) // -step)
+    if operator == '>=' and step < 0:
+        return (start - bound) // -step + 1
+    if operator == '!=' and (bound - start) % step == 0 and (bound - start) // step > 0:
+        return (bound - start) // step
+    return None
+
+
+def first_test(function, loop, test):
+    # Whether the test passes on entry to the loop, or None when unknown
+    for name in (test.left, test.right):
+        if not cfg.is_variable(name):
+            continue
+        operator, bound = test.bound(name)
+        start = initial_value(function, loop, name)
+        if start is not None and cfg.is_number(bound):
+            return ir.COMPARE_OPERATORS[operator](start, bound)
+    return None
+
+
+def loop_exits(loop, blocks):
+    # Blocks outside the loop that its blocks jump or fall into
+    return {successor.index: successor for index in loop.blocks
+            for successor in blocks[index].successors if successor.index not in loop.blocks}.values()
+
+
+def enters_by_fallthrough(loop, blocks):
+    # Whether the preheader is laid out right before the header and falls
+    # into it, so code put in the header's place runs on the way in
+    preheader = loop.preheader
+    if preheader is None or preheader.index != loop.header.index - 1:
+        return False
+    last = preheader.instructions[-1] if preheader.instructions else None
+    return last is None or last.opcode not in ir.JUMPS or last.operands[0] not in loop.header.labels
+
+
+def latches_jump_back(loop):
+    # Whether every latch ends with an unconditional JUMP to the header
+    for latch in loop.latches:
+        last = latch.instructions[-1] if latch.instructions else None
+        if last is None or last.opcode != ir.JUMP or last.operands[0] not in loop.header.labels:
+            return False
+    return True
+
+
+def insertion_point(preheader):
+    # Where code moved out of a loop goes in its preheader: before the jump
+    # into the loop, or at the end when it falls in. None when it would come
+    # between a COMPARE and its flag jump
+    instructions = preheader.instructions
+    if instructions and instructions[-1].opcode in ir.JUMPS:
+        if instructions[-1].opcode in ir.FLAG_JUMPS:
+            return None
+        return len(instructions) - 1
+    return len(instructions)
+
+
+def is_register_code(instr):
+    return instr.opcode in REGISTER_OPCODES or (instr.opcode == ir.COMPARE and len(instr.operands) == 2)
+
+
+def has_backward_jump(instructions):
+    # Every cycle has a jump back to an earlier label, so code without one
+    # has no loops and needs no control-flow graph to tell
+    labels = set()
+    for instr in instructions:
+        if instr.opcode == ir.LABEL:
+            labels.add(instr.operands[0])
+        elif instr.opcode in ir.JUMPS and instr.operands[0] in labels:
+            return True
+    return False
+
+
+def transform_loops(function, transform):
+    # Applies transform(function, loop, blocks) to the loops, innermost
+    # first, and returns how many it changed. Loops around a changed one or
+    # entered from a changed preheader wait for the next sweep
+    if not has_backward_jump(function.instructions):
+        return 0
+    changes = 0
+    while True:
+        blocks = function.control_flow()[0]
+        touched = set()
+        sweep = 0
+        for loop in function.analysis('loops', find_loops):
+            if loop.blocks & touched or (loop.preheader is not None and loop.preheader.index in touched):
+                continue
+            if transform(function, loop, blocks):
+                sweep += 1
+                touched |= loop.blocks
+                if loop.preheader is not None:
+                    touched.add(loop.preheader.index)
+        if not sweep:
+            return changes
+        changes += sweep
+        function.instructions = cfg.layout(blocks)
+
+
+# Loop-invariant code motion
+
+def loop_invariant_code_motion(function):
+    return transform_loops(function, hoist_invariants)
+
+
+def hoist_invariants(function, loop, blocks):
+    preheader = loop.preheader
+    if preheader is None or function.new_temporary is None:
+        return False
+    insert = insertion_point(preheader)
+    if insert is None:
+        return False
+    assigned, calls = assignments(loop, blocks)
+
+    def invariant(name):
+        return name not in assigned and not (calls and name in function.escaping)
+
+    hoisted = []
+    for index in sorted(loop.blocks):
+        hoisted.extend(hoist_expressions(function, blocks[index], invariant))
+    # Assignments of the values just hoisted move on the next sweep
+    if not hoisted:
+        hoisted = hoist_assignments(function, loop, blocks, assigned, calls, invariant)
+    if not hoisted:
+        return False
+    preheader.instructions[insert:insert] = hoisted
+    return True
+
+
+def hoist_expressions(function, block, invariant):
+    # Replaces each largest invariant expression that computes something by
+    # a LOAD of a new variable, and returns the code that stores them
+    instructions = block.instructions
+    if any(is_register_code(instr) for instr in instructions):
+        return []
+    # (start, end, invariant, computed) of each value the block pushed
+    stack = []
+    found = []
+    for position, instr in enumerate(instructions):
+        opcode = instr.opcode
+        if opcode == ir.COMMENT:
+            continue
+        if opcode == ir.LOAD:
+            stack.append((position, position + 1, invariant(instr.operands[0]), False))
+            continue
+        if opcode == ir.PUSH:
+            stack.append((position, position + 1, True, False))
+            continue
+        popped, pushed = ir.stack_effect(instr)
+        if popped > len(stack):
+            # Reads values pushed before the block
+            operands = None
+            consumed = stack
+            stack = []
+        else:
+            operands = consumed = stack[len(stack) - popped:]
+            del stack[len(stack) - popped:]
+        if (operands is not None and opcode in INVARIANT_OPCODES and pushed == 1
+                and all(operand[2] for operand in operands)
+                and all(operand[1] == following[0] for operand, following in zip(operands, operands[1:]))
+                and (not operands or operands[-1][1] == position)):
+            stack.append((operands[0][0] if operands else position, position + 1, True, True))
+            continue
+        found.extend((start, end) for start, end, is_invariant, computed in consumed
+                     if is_invariant and computed)
+        stack.extend([(position, position + 1, False, False)] * pushed)
+    if not found:
+        return []
+    found.sort()
+    names = [function.new_temporary('loop.invariant') for _ in found]
+    hoisted = []
+    for (start, end), name in zip(found, names):
+        hoisted.extend(instructions[start:end])
+        hoisted.append(ir.Instr(ir.STORE, (name,)))
+    for (start, end), name in reversed(list(zip(found, names))):
+        instructions[start:end] = [ir.Instr(ir.LOAD, (name,))]
+    return hoisted
+
+
+def hoist_assignments(function, loop, blocks, assigned, calls, invariant):
+    # Removes the loop's only assignment of a variable from an invariant
+    # value, when the loop reads the variable only after that assignment and
+    # nothing reads it after the loop, and returns the removed code
+    preheader = loop.preheader
+    if len(preheader.successors) != 1:
+        # The variable may be read on the way past the loop
+        return []
+    # block index -> [(start, end, variable)] of the assignments to move
+    moves = {}
+    for name, places in assigned.items():
+        if len(places) != 1 or (calls and name in function.escaping):
+            continue
+        block, position = places[0]
+        instructions = block.instructions
+        instr = instructions[position]
+        if instr.opcode == ir.LOAD_CONSTANT or (instr.opcode == ir.MOVE and (
+                not cfg.is_variable(instr.operands[0]) or invariant(instr.operands[0]))):
+            start = position
+        elif instr.opcode == ir.STORE and position and (
+                instructions[position - 1].opcode == ir.PUSH
+                or (instructions[position - 1].opcode == ir.LOAD and invariant(instructions[position - 1].operands[0]))):
+            start = position - 1
+        else:
+            continue
+        moves.setdefault(block.index, []).append((start, position + 1, name))
+    if not moves:
+        return []
+
+    live_in = function.liveness()[0]
+    live = live_in[loop.header.index].union(*(live_in[exit.index] for exit in loop_exits(loop, blocks)))
+    hoisted = []
+    for index, block_moves in sorted(moves.items()):
+        instructions = blocks[index].instructions
+        block_moves = [(start, end) for start, end, name in sorted(block_moves) if name not in live]
+        for start, end in block_moves:
+            hoisted.extend(instructions[start:end])
+        for start, end in reversed(block_moves):
+            del instructions[start:end]
+    return hoisted
+
+
+# Loop unrolling
+
+def loop_unrolling(function, factor=UNROLL_FACTOR):
+    return transform_loops(function, lambda function, loop, blocks: unroll(function, loop, blocks, factor))
+
+
+def body_copies(body, count):
+    # count copies of body; comments stay with the first
+    code = []
+    for copy in range(count):
+        code.extend(body if copy == 0 else [instr for instr in body if instr.opcode != ir.COMMENT])
+    return code
+
+
+def unroll(function, loop, blocks, factor):
+    # Only a loop made of its header test and one body block that steps an
+    # induction variable and jumps back
+    header = loop.header
+    if len(loop.blocks) != 2 or len(loop.latches) != 1 or not enters_by_fallthrough(loop, blocks):
+        return False
+    latch = loop.latches[0]
+    if latch.index != header.index + 1 or not latches_jump_back(loop):
+        return False
+    test = loop_test(loop)
+    if test is None:
+        return False
+    count = None
+    for name, (block, position, step) in induction_variables(function, loop, blocks).items():
+        if test.bound(name) is not None:
+            operator, bound = test.bound(name)
+            count = trip_count(initial_value(function, loop, name), operator, bound, step)
+            break
+    if count is None:
+        return False
+    body = latch.instructions[:-1]
+    size = max(1, ir.count_instructions(body))
+    if factor < 2:
+        # Straight code no longer than the body, the test and the jump back
+        if count * size > size + ir.count_instructions(header.instructions) + 1:
+            return False
+        factor = count
+    factor = min(factor, MAX_UNROLLED_INSTRUCTIONS // size)
+    if factor < 2 and count > 1:
+        return False
+
+    jump = header.instructions[-1]
+    exit_label = jump.operands[0]
+    following = blocks[latch.index + 1] if latch.index + 1 < len(blocks) else None
+    if count <= factor:
+        # The body runs straight through count times
+        header.instructions = [instr for instr in header.instructions if instr.opcode == ir.COMMENT]
+        latch.instructions = body_copies(body, count)
+    else:
+        # The remainder runs before the loop, which then runs whole groups of
+        # copies at least once and tests at the bottom
+        test_code = [instr for instr in header.instructions[:-1] if instr.opcode != ir.COMMENT]
+        loop_label = header.labels[0]
+        header.instructions = body_copies(body, count % factor)
+        latch.labels = header.labels + latch.labels
+        header.labels = []
+        latch.instructions = (body_copies(body, factor) + test_code
+                              + [ir.Instr(ir.INVERTED_JUMPS[jump.opcode], (loop_label,))])
+    if following is None or exit_label not in following.labels:
+        latch.instructions.append(ir.Instr(ir.JUMP, (exit_label,)))
+    return True
+
+
+# Strength reduction
+
+def strength_reduction(function):
+    return transform_loops(function, reduce_strength)
+
+
+def scaled_variable(first, second):
+    # (variable, factor) when first and second push the two operands of
+    # variable * factor, else None
+    if first.opcode == ir.PUSH and second.opcode == ir.LOAD:
+        first, second = second, first
+    if first.opcode != ir.LOAD or second.opcode != ir.PUSH:
+        return None
+    factor = second.operands[0]
+    if type(factor) is not int or factor == 0:
+        return None
+    return first.operands[0], factor
+
+
+def reduce_strength(function, loop, blocks):
+    preheader = loop.preheader
+    if preheader is None or function.new_temporary is None:
+        return False
+    insert = insertion_point(preheader)
+    if insert is None:
+        return False
+    inductions = {name: induction for name, induction in induction_variables(function, loop, blocks).items()
+                  if induction[0].instructions[induction[1]].opcode == ir.STORE}
+    if not inductions:
+        return False
+
+    # (variable, factor) -> [(block, position of the MUL)], and the number of
+    # reads of each induction variable
+    products = {}
+    reads = dict.fromkeys(inductions, 0)
+    for index in sorted(loop.blocks):
+        instructions = blocks[index].instructions
+        for position, instr in enumerate(instructions):
+            if instr.opcode == ir.LOAD and instr.operands[0] in reads:
+                reads[instr.operands[0]] += 1
+            elif instr.opcode == ir.MUL and position >= 2:
+                product = scaled_variable(instructions[position - 2], instructions[position - 1])
+                if product is not None and product[0] in inductions:
+                    products.setdefault(product, []).append((blocks[index], position))
+
+    test = loop_test(loop)
+    assigned, calls = assignments(loop, blocks)
+    live_in = function.liveness()[0]
+    exits = loop_exits(loop, blocks)
+    # block index -> [(start, end, replacement)]
+    edits = {}
+    setup = []
+    for name, (update_block, update_position, step) in inductions.items():
+        factors = sorted(factor for variable, factor in products if variable == name)
+        if not factors:
+            continue
+        uses = sum(len(products[name, factor]) for factor in factors)
+        # The test can compare the scaled variable instead when the loop
+        # reads name only in the products, the test and its own update
+        replace_test = False
+        if (test is not None and test.bound(name) is not None and reads[name] == uses + 2
+                and not any(name in live_in[exit.index] for exit in exits)):
+            operator, bound = test.bound(name)
+            replace_test = cfg.is_number(bound) or (bound not in assigned
+                                                    and not (calls and bound in function.escaping))
+        # Without that, each product saves two instructions per iteration and
+        # the update of the new variable costs four
+        if not replace_test and uses <= 2:
+            continue
+
+        updates = []
+        scaled = {}
+        for factor in factors:
+            variable = scaled[factor] = function.new_temporary(f'{name}.scaled')
+            setup += [ir.Instr(ir.LOAD, (name,)), ir.Instr(ir.PUSH, (factor,)),
+                      ir.Instr(ir.MUL), ir.Instr(ir.STORE, (variable,))]
+            updates += [ir.Instr(ir.LOAD, (variable,)), ir.Instr(ir.PUSH, (step * factor,)),
+                        ir.Instr(ir.ADD), ir.Instr(ir.STORE, (variable,))]
+            for block, position in products[name, factor]:
+                edits.setdefault(block.index, []).append((position - 2, position + 1,
+                                                          [ir.Instr(ir.LOAD, (variable,))]))
+        edits.setdefault(update_block.index, []).append((update_position + 1, update_position + 1, updates))
+        if replace_test:
+            # The update of name itself goes, and the test compares the first
+            # scaled variable with the scaled bound
+            edits[update_block.index].append((update_position - 3, update_position + 1, []))
+            factor = factors[0]
+            if cfg.is_number(bound):
+                bound_code = ir.Instr(ir.PUSH, (bound * factor,))
+            else:
+                bound_variable = function.new_temporary(f'{name}.bound')
+                setup += [ir.Instr(ir.LOAD, (bound,)), ir.Instr(ir.PUSH, (factor,)),
+                          ir.Instr(ir.MUL), ir.Instr(ir.STORE, (bound_variable,))]
+                bound_code = ir.Instr(ir.LOAD, (bound_variable,))
+            if factor < 0:
+                operator = ir.SWAPPED_COMPARISONS[operator]
+            header = loop.header
+            header.instructions = ([instr for instr in header.instructions if instr.opcode == ir.COMMENT]
+                                   + [ir.Instr(ir.LOAD, (scaled[factor],)), bound_code,
+                                      ir.Instr(ir.COMPARE, (operator,)),
+                                      ir.Instr(ir.JUMP_IF_FALSE, (header.instructions[-1].operands[0],))])
+            # Only one variable's test can be replaced
+            test = None
+    if not setup:
+        return False
+    for index, block_edits in edits.items():
+        instructions = blocks[index].instructions
+        # Later edits first, so earlier positions still hold; an insertion
+        # after an update goes before the update's removal
+        for start, end, replacement in sorted(block_edits, key=lambda edit: (edit[0], edit[1]), reverse=True):
+            instructions[start:end] = replacement
+    preheader.instructions[insert:insert] = setup
+    return True
+
+
+# Loop rotation
+
+def loop_rotation(function):
+    return transform_loops(function, rotate)
+
+
+def rotate(function, loop, blocks):
+    header = loop.header
+    if len(loop.latches) > MAX_LATCHES or not enters_by_fallthrough(loop, blocks) \
+            or not latches_jump_back(loop):
+        return False
+    if len(header.successors) != 2 or header.index + 1 >= len(blocks):
+        return False
+    exit, following = header.successors
+    if exit.index in loop.blocks or following is not blocks[header.index + 1] \
+            or following.index not in loop.blocks:
+        return False
+    jump = header.instructions[-1]
+    test_code = [instr for instr in header.instructions[:-1] if instr.opcode != ir.COMMENT]
+    if len(test_code) > MAX_TEST_INSTRUCTIONS:
+        return False
+
+    test = loop_test(loop)
+    passes = first_test(function, loop, test) if test is not None else None
+    exit_label = jump.operands[0]
+    for latch in loop.latches:
+        back = ir.Instr(ir.INVERTED_JUMPS[jump.opcode], latch.instructions[-1].operands)
+        latch.instructions[-1:] = test_code + [back]
+        after = blocks[latch.index + 1] if latch.index + 1 < len(blocks) else None
+        if after is None or exit_label not in after.labels:
+            latch.instructions.append(ir.Instr(ir.JUMP, (exit_label,)))
+    # The loop now starts at the body; the test stays in front of it for
+    # the first iteration unless its outcome is known
+    following.labels = header.labels + following.labels
+    header.labels = []
+    comments = [instr for instr in header.instructions if instr.opcode == ir.COMMENT]
+    if passes is True:
+        header.instructions = comments
+    elif passes is False:
+        header.instructions = comments + [ir.Instr(ir.JUMP, (exit_label,))]
+    return True
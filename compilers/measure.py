@@ -0,0 +1,14 @@
+import resource
+import sys
+
+# Process-level measurements shared by the compiler scripts and the benchmark
+# suite.
+
+
+def max_rss_kilobytes():
+    # Peak resident set size of this process so far. ru_maxrss is reported
+    # in kilobytes on Linux but in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        max_rss //= 1024
+    return max_rss
@@ -0,0 +1,641 @@
+import functools
+import math
+import operator
+import time
+
+from compilers import cfg, ir, loops, trace
+
+# Optimization passes over the linear IR (see compilers/ir.py).
+#
+# The pass manager splits a program into functions (the code before the first
+# FUNCTION counts as one), runs every pass over a function and repeats the
+# round until no pass changes anything. Passes that need control flow build
+# basic blocks and a control-flow graph from the instructions (see
+# compilers/cfg.py), rewrite the blocks and lay them out again in their
+# original order. Every pass returns the number of changes it made; the
+# manager keeps runs, changes and time per pass for its summary.
+#
+#   jump_threading          retargets jumps to jumps, inverts conditions that
+#                           jump over a jump, drops jumps to the next block
+#                           and labels nothing jumps to
+#   constant_folding        evaluates operators on constants and branches on
+#                           constant conditions
+#   copy_propagation        replaces reads of variables known to hold a
+#                           constant or a copy of another variable
+#   load_store_elimination  removes stores that are overwritten before being
+#                           read, values computed only to be dropped, and
+#                           reloads of a value just stored
+#   dead_code_elimination   removes stores to variables never read again,
+#                           unused flag tests and unreachable blocks
+#
+# The loop passes follow them (see compilers/loops.py): loop-invariant code
+# motion, unrolling of loops with a known trip count, strength reduction of
+# induction variables and rotation of the test to the bottom of the loop. By
+# default unrolling only replaces loops whose straight code is no longer
+# than the loop; a PassManager with a larger unroll factor makes copies.
+#
+# Variables that outlive a function are the globals, which are the variables
+# stored by the code before the first FUNCTION; in a program without
+# functions every variable outlives it except the temporaries. A call may
+# read and write any global.
+
+# Rounds of all passes per function before giving up on a fixed point, and
+# rounds in a row that may leave the code as long as it was
+MAX_ROUNDS = 12
+MAX_IDLE_ROUNDS = 2
+
+# Unroll factor of the default pipeline: below 2, no copies are made
+DEFAULT_UNROLL_FACTOR = 1
+
+# Folded integers must fit the 32-bit int of the source languages
+INT_MIN = -2 ** 31
+INT_MAX = 2 ** 31 - 1
+
+# What the propagation pass knows about a variable: (CONSTANT, value, type)
+# or (COPY, name). The type keeps 1 and 1.0 apart
+CONSTANT = 'constant'
+COPY = 'copy'
+
+# Flag jump -> whether it is taken for COMPARE a, b
+FLAG_TESTS = {ir.JUMP_IF_GREATER: operator.gt, ir.JUMP_IF_GREATER_EQUAL: operator.ge,
+              ir.JUMP_IF_LESS: operator.lt, ir.JUMP_IF_LESS_EQUAL: operator.le}
+
+BINARY_OPCODES = {ir.ADD, ir.SUB, ir.MUL, ir.DIV, ir.MOD, ir.BIT_AND, ir.BIT_OR, ir.BIT_XOR,
+                  ir.SHIFT_LEFT, ir.SHIFT_RIGHT, ir.COMPARE}
+UNARY_OPCODES = {ir.NEG, ir.NOT, ir.BIT_NOT}
+
+# x op c that leaves x unchanged
+IDENTITIES = {ir.ADD: 0, ir.SUB: 0, ir.MUL: 1, ir.DIV: 1}
+
+POP = ir.Instr(ir.POP)
+DUP = ir.Instr(ir.DUP)
+
+
+def truncating_divide(a, b):
+    quotient = abs(a) // abs(b)
+    return -quotient if (a < 0) != (b < 0) else quotient
+
+
+def fold(opcode, operands, values):
+    # The constant result of opcode on constant values, or None when it
+    # cannot be computed at compile time
+    if not all(cfg.is_number(value) for value in values):
+        return None
+    integers = all(isinstance(value, int) for value in values)
+    a = values[0]
+    b = values[1] if len(values) > 1 else None
+    if opcode == ir.ADD:
+        result = a + b
+    elif opcode == ir.SUB:
+        result = a - b
+    elif opcode == ir.MUL:
+        result = a * b
+    elif opcode == ir.DIV:
+        if b == 0:
+            return None
+        result = truncating_divide(a, b) if integers else a / b
+    elif opcode == ir.MOD:
+        if not integers or b == 0:
+            return None
+        result = a - b * truncating_divide(a, b)
+    elif opcode == ir.COMPARE:
+        result = int(ir.COMPARE_OPERATORS[operands[0]](a, b))
+    elif opcode == ir.NEG:
+        result = -a
+    elif opcode == ir.NOT:
+        result = int(a == 0)
+    elif not integers:
+        return None
+    elif opcode == ir.BIT_AND:
+        result = a & b
+    elif opcode == ir.BIT_OR:
+        result = a | b
+    elif opcode == ir.BIT_XOR:
+        result = a ^ b
+    elif opcode == ir.BIT_NOT:
+        result = ~a
+    elif opcode == ir.SHIFT_LEFT or opcode == ir.SHIFT_RIGHT:
+        if not 0 <= b < 32:
+            return None
+        result = a << b if opcode == ir.SHIFT_LEFT else a >> b
+    else:
+        return None
+    if isinstance(result, int):
+        return result if INT_MIN <= result <= INT_MAX else None
+    return result if math.isfinite(result) else None
+
+
+def is_true(value):
+    # Conditions are numbers; anything else, such as a string, is true
+    return value != 0 if cfg.is_number(value) else True
+
+
+# Passes. Each takes a Function, updates its instructions and returns the
+# number of changes
+
+def constant_folding(function):
+    changes = 0
+    out = []
+    for instr in function.instructions:
+        opcode = instr.opcode
+        operands = instr.operands
+        if opcode in BINARY_OPCODES and (opcode != ir.COMPARE or len(operands) == 1) \
+                or opcode in UNARY_OPCODES:
+            count = 1 if opcode in UNARY_OPCODES else 2
+            if len(out) >= count and all(previous.opcode == ir.PUSH for previous in out[-count:]):
+                result = fold(opcode, operands, [previous.operands[0] for previous in out[-count:]])
+                if result is not None:
+                    del out[-count:]
+                    out.append(ir.Instr(ir.PUSH, (result,)))
+                    changes += 1
+                    continue
+            if (opcode in IDENTITIES and out and out[-1].opcode == ir.PUSH
+                    and type(out[-1].operands[0]) is int and out[-1].operands[0] == IDENTITIES[opcode]):
+                out.pop()
+                changes += 1
+                continue
+            if opcode == ir.NOT and out and out[-1].opcode == ir.COMPARE and len(out[-1].operands) == 1:
+                out[-1] = ir.Instr(ir.COMPARE, (ir.NEGATED_COMPARISONS[out[-1].operands[0]],))
+                changes += 1
+                continue
+        elif (opcode == ir.JUMP_IF_FALSE or opcode == ir.JUMP_IF_TRUE) and out:
+            previous = out[-1]
+            if previous.opcode == ir.PUSH:
+                # A constant condition either always or never jumps
+                out.pop()
+                if is_true(previous.operands[0]) == (opcode == ir.JUMP_IF_TRUE):
+                    out.append(ir.Instr(ir.JUMP, operands))
+                changes += 1
+                continue
+            if previous.opcode == ir.NOT:
+                out[-1] = ir.Instr(ir.JUMP_IF_TRUE if opcode == ir.JUMP_IF_FALSE else ir.JUMP_IF_FALSE,
+                                   operands)
+                changes += 1
+                continue
+        elif opcode in ir.FLAG_JUMPS:
+            # Look past earlier jumps on the same flags for the COMPARE
+            position = len(out) - 1
+            while position >= 0 and out[position].opcode in ir.FLAG_JUMPS:
+                position -= 1
+            compare = out[position] if position >= 0 else None
+            if (compare is not None and compare.opcode == ir.COMPARE and len(compare.operands) == 2
+                    and all(cfg.is_number(operand) for operand in compare.operands)):
+                if FLAG_TESTS[opcode](*compare.operands):
+                    out.append(ir.Instr(ir.JUMP, operands))
+                changes += 1
+                continue
+        out.append(instr)
+    if changes:
+        function.instructions = out
+    return changes
+
+
+def meet(fact_sets):
+    # Facts that hold on every incoming path
+    result = dict(fact_sets[0])
+    for facts in fact_sets[1:]:
+        for name, fact in list(result.items()):
+            if facts.get(name) != fact:
+                del result[name]
+    return result
+
+
+def entry_facts(block, facts_out, live):
+    # Facts about variables that are dead on entry are dropped; nothing
+    # reads them before they are set again, and they would only grow the
+    # fact sets of long functions
+    if block.index == 0:
+        return {}
+    incoming = [facts_out[predecessor.index] for predecessor in block.predecessors
+                if facts_out[predecessor.index] is not None]
+    if not incoming:
+        return {}
+    return {name: fact for name, fact in meet(incoming).items() if name in live}
+
+
+def constant_fact(value):
+    return CONSTANT, value, type(value)
+
+
+def assign(facts, stack, name, value):
+    # name now holds value, a fact or None when unknown. Facts and stacked
+    # values that copied its old value no longer hold
+    copy = (COPY, name)
+    facts.pop(name, None)
+    for other in [other for other, fact in facts.items() if fact == copy]:
+        del facts[other]
+    for position, fact in enumerate(stack):
+        if fact == copy:
+            stack[position] = None
+    if value is not None and value != copy:
+        facts[name] = value
+
+
+def forget_globals(facts, stack, escaping):
+    # After a call nothing is known about the globals
+    for name in [name for name, fact in facts.items()
+                 if name in escaping or (fact[0] == COPY and fact[1] in escaping)]:
+        del facts[name]
+    for position, fact in enumerate(stack):
+        if fact is not None and fact[0] == COPY and fact[1] in escaping:
+            stack[position] = None
+
+
+def propagate(block, facts, escaping, rewrite):
+    # Runs facts through the block, updating them in place, and returns the
+    # number of reads of variables with a known value. With rewrite, those
+    # reads are replaced
+    stack = []  # Facts about the values this block pushed, None if unknown
+    changes = 0
+    instructions = block.instructions
+    for position, instr in enumerate(instructions):
+        opcode = instr.opcode
+        operands = instr.operands
+        if opcode == ir.LOAD:
+            fact = facts.get(operands[0])
+            if fact is None:
+                stack.append((COPY, operands[0]))
+                continue
+            if rewrite:
+                instructions[position] = ir.Instr(ir.PUSH if fact[0] == CONSTANT else ir.LOAD, (fact[1],))
+            changes += 1
+            stack.append(fact)
+        elif opcode == ir.PUSH:
+            stack.append(constant_fact(operands[0]))
+        elif opcode == ir.DUP:
+            stack.append(stack[-1] if stack else None)
+        elif opcode == ir.STORE:
+            assign(facts, stack, operands[0], stack.pop() if stack else None)
+        elif opcode == ir.LOAD_CONSTANT:
+            assign(facts, stack, operands[1], constant_fact(operands[0]))
+        elif opcode == ir.MOVE:
+            source, target = operands
+            fact = facts.get(source) if cfg.is_variable(source) else constant_fact(source)
+            if fact is not None:
+                if rewrite:
+                    instructions[position] = (ir.Instr(ir.LOAD_CONSTANT, (fact[1], target))
+                                              if fact[0] == CONSTANT else ir.Instr(ir.MOVE, (fact[1], target)))
+                changes += 1
+            assign(facts, stack, target, fact or (COPY, source))
+        elif opcode == ir.INCREMENT or opcode == ir.DECREMENT:
+            name = operands[0]
+            fact = facts.get(name)
+            value = None
+            if fact is not None and fact[0] == CONSTANT and fact[2] is int:
+                value = fact[1] + (1 if opcode == ir.INCREMENT else -1)
+            if value is not None and INT_MIN <= value <= INT_MAX:
+                if rewrite:
+                    instructions[position] = ir.Instr(ir.LOAD_CONSTANT, (value, name))
+                changes += 1
+                assign(facts, stack, name, constant_fact(value))
+            else:
+                assign(facts, stack, name, None)
+        elif opcode == ir.COMPARE and len(operands) == 2:
+            replaced = tuple(facts[operand][1] if cfg.is_variable(operand) and operand in facts else operand
+                             for operand in operands)
+            if replaced != operands:
+                if rewrite:
+                    instructions[position] = ir.Instr(ir.COMPARE, replaced)
+                changes += 1
+        elif opcode == ir.CALL:
+            del stack[max(0, len(stack) - operands[1]):]
+            forget_globals(facts, stack, escaping)
+            stack.append(None)
+        elif opcode in ir.FLAG_JUMPS or opcode == ir.COMMENT:
+            pass
+        else:
+            popped, pushed = ir.stack_effect(instr)
+            del stack[max(0, len(stack) - popped):]
+            stack.extend([None] * pushed)
+    return changes
+
+
+def copy_propagation(function):
+    blocks, order = function.control_flow()
+    live_in = function.liveness()[0]
+    # Forward data flow to a fixed point, visiting again only the blocks
+    # whose predecessors changed, then one rewriting sweep
+    facts_out = [None] * len(blocks)
+    # Reads with a known value per block, as of the last visit, which saw
+    # the final facts
+    reads = [0] * len(blocks)
+    dirty = {block.index for block in order}
+    while dirty:
+        for block in order:
+            if block.index not in dirty:
+                continue
+            dirty.discard(block.index)
+            facts = entry_facts(block, facts_out, live_in[block.index])
+            reads[block.index] = propagate(block, facts, function.escaping, False)
+            if facts != facts_out[block.index]:
+                facts_out[block.index] = facts
+                dirty.update(successor.index for successor in block.successors)
+    changes = 0
+    for block in order:
+        if reads[block.index]:
+            facts = entry_facts(block, facts_out, live_in[block.index])
+            changes += propagate(block, facts, function.escaping, True)
+    if changes:
+        function.instructions = cfg.layout(blocks)
+    return changes
+
+
+def load_store_elimination(function):
+    changes = 0
+    out = []
+    for instr in function.instructions:
+        opcode = instr.opcode
+        previous = out[-1] if out else None
+        if opcode == ir.STORE and previous is not None and previous.opcode == ir.LOAD \
+                and previous.operands == instr.operands:
+            # x = x
+            out.pop()
+            changes += 1
+        elif opcode == ir.LOAD and previous is not None and previous.opcode == ir.STORE \
+                and previous.operands == instr.operands:
+            # A value stored and read straight back stays on the stack
+            out[-1] = DUP
+            out.append(previous)
+            changes += 1
+        elif opcode == ir.POP and len(out) >= 2 and previous.opcode == ir.STORE and out[-2].opcode == ir.DUP:
+            out[-2:] = [previous]
+            changes += 1
+        elif opcode == ir.POP and previous is not None and cfg.is_pure(previous):
+            # Drop the computation of an unused value along with its inputs,
+            # unless that takes more POPs than it saves
+            removed = []
+            pending = 1
+            while pending and out and cfg.is_pure(out[-1]):
+                removed.append(out.pop())
+                popped, pushed = ir.stack_effect(removed[-1])
+                pending += popped - pushed
+            if pending < len(removed) + 1:
+                out.extend([POP] * pending)
+                changes += len(removed) + 1 - pending
+            else:
+                out.extend(reversed(removed))
+                out.append(instr)
+        elif opcode == ir.MOVE and instr.operands[0] == instr.operands[1]:
+            changes += 1
+        else:
+            out.append(instr)
+
+    # Stores overwritten later in the same block before anything reads them
+    overwritten = set()
+    for position in range(len(out) - 1, -1, -1):
+        instr = out[position]
+        opcode = instr.opcode
+        if opcode == ir.STORE or opcode == ir.LOAD_CONSTANT or opcode == ir.MOVE:
+            name = instr.operands[-1]
+            if name in overwritten:
+                out[position] = POP if opcode == ir.STORE else None
+                changes += 1
+                continue
+            overwritten.add(name)
+            if opcode == ir.MOVE:
+                overwritten.discard(instr.operands[0])
+        elif opcode == ir.CALL:
+            overwritten.difference_update(function.escaping)
+        elif opcode == ir.LABEL or opcode in ir.JUMPS or opcode == ir.RETURN:
+            overwritten.clear()
+        else:
+            overwritten.difference_update(cfg.used_variables(instr, ()))
+    if changes:
+        function.instructions = [instr for instr in out if instr is not None]
+    return changes
+
+
+def dead_code_elimination(function):
+    blocks, order = function.control_flow()
+    escaping = function.escaping
+    live_out = function.liveness()[1]
+
+    changes = 0
+    for block in order:
+        live = set(live_out[block.index])
+        kept = []
+        next_opcode = None
+        for instr in reversed(block.instructions):
+            opcode = instr.opcode
+            name = cfg.defined_variable(instr)
+            if name is not None and name not in live:
+                changes += 1
+                if opcode != ir.STORE:
+                    continue
+                # The stored value still has to come off the stack
+                instr = POP
+                name = None
+            elif opcode == ir.COMPARE and len(instr.operands) == 2 and next_opcode not in ir.FLAG_JUMPS:
+                # Flags nobody tests
+                changes += 1
+                continue
+            if name is not None:
+                live.discard(name)
+            live.update(cfg.used_variables(instr, escaping))
+            kept.append(instr)
+            if opcode != ir.COMMENT:
+                next_opcode = opcode
+        kept.reverse()
+        block.instructions = kept
+
+    reachable = [block for block in blocks if block.index in live_out]
+    for block in blocks:
+        if block.index not in live_out:
+            changes += len(block.labels) + sum(1 for instr in block.instructions if instr.opcode != ir.COMMENT)
+    if changes:
+        function.instructions = cfg.layout(reachable)
+    return changes
+
+
+def jump_threading(function):
+    blocks = function.control_flow()[0]
+    targets = {label: block for block in blocks for label in block.labels}
+
+    def final_label(label):
+        # Follows blocks that do nothing but jump on
+        seen = set()
+        while label not in seen:
+            seen.add(label)
+            block = targets.get(label)
+            body = [instr for instr in block.instructions if instr.opcode != ir.COMMENT] if block else ()
+            if len(body) != 1 or body[0].opcode != ir.JUMP:
+                break
+            label = body[0].operands[0]
+        return label
+
+    changes = 0
+    for block in blocks:
+        last = block.instructions[-1] if block.instructions else None
+        if last is None or last.opcode not in ir.JUMPS:
+            continue
+        label = final_label(last.operands[0])
+        if label != last.operands[0]:
+            last = ir.Instr(last.opcode, (label,))
+            block.instructions[-1] = last
+            changes += 1
+        following = blocks[block.index + 1] if block.index + 1 < len(blocks) else None
+        if (last.opcode in ir.INVERTED_JUMPS and following is not None and not following.labels
+                and following.index + 1 < len(blocks) and label in blocks[following.index + 1].labels):
+            # 'if c goto L; goto M; L:' becomes 'if not c goto M; L:'
+            body = [instr for instr in following.instructions if instr.opcode != ir.COMMENT]
+            if len(body) == 1 and body[0].opcode == ir.JUMP:
+                last = ir.Instr(ir.INVERTED_JUMPS[last.opcode], (final_label(body[0].operands[0]),))
+                block.instructions[-1] = last
+                following.instructions.remove(body[0])
+                changes += 1
+                continue
+        if following is not None and label in following.labels:
+            # Jumping to where control goes anyway; a stack condition still
+            # has to be dropped
+            if last.opcode == ir.JUMP_IF_FALSE or last.opcode == ir.JUMP_IF_TRUE:
+                block.instructions[-1] = POP
+            else:
+                block.instructions.pop()
+            changes += 1
+
+    referenced = {block.instructions[-1].operands[0] for block in blocks
+                  if block.instructions and block.instructions[-1].opcode in ir.JUMPS}
+    for block in blocks:
+        labels = [label for label in block.labels if label in referenced]
+        changes += len(block.labels) - len(labels)
+        block.labels = labels
+    if changes:
+        function.instructions = cfg.layout(blocks)
+    return changes
+
+
+def default_passes(unroll_factor=DEFAULT_UNROLL_FACTOR):
+    # Jump threading goes first so the labels the generator leaves unused
+    # are gone and the other passes see whole blocks. The loop passes come
+    # last, when the scalar passes have cleaned up the loops; unrolling
+    # needs the test at the top, so it runs before rotation moves it
+    return [
+        ('jump_threading', jump_threading),
+        ('constant_folding', constant_folding),
+        ('copy_propagation', copy_propagation),
+        ('load_store_elimination', load_store_elimination),
+        ('dead_code_elimination', dead_code_elimination),
+        ('loop_invariant_code_motion', loops.loop_invariant_code_motion),
+        ('loop_unrolling', functools.partial(loops.loop_unrolling, factor=unroll_factor)),
+        ('strength_reduction', loops.strength_reduction),
+        ('loop_rotation', loops.loop_rotation),
+    ]
+
+
+def split_functions(instructions):
+    # [(FUNCTION instruction or None, body)], starting with the code before
+    # the first FUNCTION
+    units = [(None, [])]
+    for instr in instructions:
+        if instr.opcode == ir.FUNCTION:
+            units.append((instr, []))
+        else:
+            units[-1][1].append(instr)
+    return units
+
+
+def escaping_variables(units, temporaries):
+    if len(units) == 1:
+        return frozenset(cfg.variables(units[0][1]) - set(temporaries))
+    return frozenset(cfg.defined_variable(instr) for instr in units[0][1]) - {None}
+
+
+class PassManager:
+    def __init__(self, passes=None, max_rounds=MAX_ROUNDS, unroll_factor=DEFAULT_UNROLL_FACTOR):
+        self.passes = list(default_passes(unroll_factor) if passes is None else passes)
+        self.max_rounds = max_rounds
+        self.unroll_factor = unroll_factor
+        # Names new variables when the caller has no ir.Program for them
+        self.names = ir.Program()
+        # Pass name -> [runs, changes, seconds]
+        self.statistics = {name: [0, 0, 0.0] for name, _ in self.passes}
+        self.functions = 0
+        self.rounds = 0
+        self.instructions_before = 0
+        self.instructions_after = 0
+
+    def run(self, program):
+        # Optimizes an ir.Program in place and returns it
+        program.instructions = self.run_instructions(program.instructions, program.temporaries, program)
+        return program
+
+    def run_instructions(self, instructions, temporaries=(), program=None):
+        # Variables the passes introduce are temporaries of program; a
+        # streamed piece has none, so the manager numbers them itself
+        new_temporary = (program or self.names).new_temporary
+        with trace.span('optimize') as counters:
+            units = split_functions(instructions)
+            escaping = escaping_variables(units, temporaries)
+            optimized = []
+            for header, body in units:
+                if header is not None:
+                    optimized.append(header)
+                if body:
+                    optimized.extend(self.optimize_function(cfg.Function(body, escaping, new_temporary)))
+            before = ir.count_instructions(instructions)
+            after = ir.count_instructions(optimized)
+            self.instructions_before += before
+            self.instructions_after += after
+            counters['ir_instructions'] = after
+            counters['removed_instructions'] = before - after
+        return optimized
+
+    def optimize_function(self, function):
+        self.functions += 1
+        # The code changes version with every pass that changes it. Each
+        # pass leaves the code at its own fixed point, so a pass is not run
+        # again until another one has changed the code. After
+        # MAX_IDLE_ROUNDS rounds in a row that leave the code as long as it
+        # was, the passes are only rewriting it and the manager stops
+        version = 0
+        settled = {}
+        size = ir.count_instructions(function.instructions)
+        idle = 0
+        for _ in range(self.max_rounds):
+            ran = False
+            for name, run_pass in self.passes:
+                if settled.get(name) == version:
+                    continue
+                ran = True
+                start = time.perf_counter()
+                changes = run_pass(function)
+                statistics = self.statistics[name]
+                statistics[0] += 1
+                statistics[1] += changes
+                statistics[2] += time.perf_counter() - start
+                if changes:
+                    version += 1
+                settled[name] = version
+            if not ran:
+                break
+            self.rounds += 1
+            previous, size = size, ir.count_instructions(function.instructions)
+            idle = idle + 1 if size == previous else 0
+            if idle == MAX_IDLE_ROUNDS:
+                break
+        return function.instructions
+
+    def summary(self):
+        lines = [f"{'pass':<28} {'runs':>7} {'changes':>9} {'total ms':>11}"]
+        for name, (runs, changes, seconds) in self.statistics.items():
+            lines.append(f"{name:<28} {runs:>7} {changes:>9} {seconds * 1000:>11.3f}")
+        before = self.instructions_before
+        after = self.instructions_after
+        # Unrolling can make the code longer
+        removed = 100 * (before - after) / before if before else 0.0
+        lines.append(f"{self.functions} functions in {self.rounds} rounds: {before} -> {after} "
+                     f"instructions ({abs(removed):.1f}% {'fewer' if removed >= 0 else 'more'})")
+        return lines
+
+
+def manager_for(optimize):
+    # Frontends take optimize=True for the default passes, or a PassManager
+    # whose statistics the caller wants to read
+    return optimize if isinstance(optimize, PassManager) else PassManager()
+
+
+def cache_tag(optimize):
+    # Goes into the compile cache key, since the options change the output
+    if not optimize:
+        return 'O0'
+    return f'O1-unroll{manager_for(optimize).unroll_factor}'
@@ -0,0 +1,708 @@
+import os
+import sys
+
+from compilers import lexgen, stream, tokens
+
+# C preprocessor shared by the C and C++ frontends.
+#
+#   python -m compilers.preprocess [-I DIR]... [-D NAME[=VALUE]]... [--stats] FILE...
+#
+# It runs on the frontend's own tokens: the frontend lexer skips directives,
+# so a second lexer built from the same spec keeps them as DIRECTIVE tokens
+# (one per logical line, backslash continuations included). Supported are
+# #include, #define and #undef with object-like and function-like macros
+# (variadic, '#' and '##'), the #if/#ifdef/#ifndef/#elif/#else/#endif
+# conditionals with full integer expressions, #pragma once and #error.
+#
+# "FILE" is looked for next to the including file, then on the include path;
+# <FILE> only on the include path, and a system header that is not found is
+# left out, since the frontends already know the standard names. The include
+# path is -I/include_dirs followed by the directories in COMPILERS_INCLUDE.
+#
+# Every header is lexed once per process: its token stream is memoized by
+# path and modification time, so all translation units of a batch worker
+# (or of the compile server) share it. A header whose whole content sits in
+# an #ifndef guard is recorded as guarded and not even walked again once its
+# guard macro is defined; #pragma once headers are skipped by path.
+#
+# Tokens that come from a header or a macro expansion carry the span of the
+# #include line or the macro invocation in the main file, so line numbers in
+# diagnostics point at the main file.
+
+# Deepest #include nesting before an include loop is assumed
+MAX_INCLUDE_DEPTH = 200
+
+# Binary operators in #if expressions by precedence
+BINARY_PRECEDENCE = {'||': 1, '&&': 2, '|': 3, '^': 4, '&': 5, '==': 6, '!=': 6, '<': 7, '>': 7,
+                     '<=': 7, '>=': 7, '<<': 8, '>>': 8, '+': 9, '-': 9, '*': 10, '/': 10, '%': 10}
+
+CHARACTER_ESCAPES = {'n': 10, 't': 9, 'r': 13, '0': 0, 'a': 7, 'b': 8, 'f': 12, 'v': 11,
+                     '\\': 92, "'": 39, '"': 34, '?': 63}
+
+
+def include_path(include_dirs=None):
+    # The search path for <FILE>, and for "FILE" after the includer's own
+    # directory
+    dirs = list(include_dirs or [])
+    dirs.extend(path for path in os.environ.get('COMPILERS_INCLUDE', '').split(os.pathsep) if path)
+    return dirs
+
+
+def directive_lexer(lexer):
+    # The frontend's lexer with directives kept instead of skipped
+    spec = lexer.spec
+    return lexgen.build_lexer(lexgen.LexerSpec(spec.name + '-pp', spec.rules, spec.keywords,
+                                               spec.skip - {'DIRECTIVE'}, spec.identifier, spec.error,
+                                               spec.literals, spec.fold_keywords))
+
+
+def cache_tag(source, path, include_dirs):
+    # What besides the source text decides the output of a file that uses
+    # the preprocessor: where its headers are searched for. Files without
+    # directives keep a content-only cache key
+    if isinstance(source, str):
+        source = source.encode('utf-8')
+    if b'#' not in source:
+        return ''
+    directory = os.path.dirname(os.path.abspath(path)) if path is not None else ''
+    return '\0' + os.pathsep.join([directory] + list(include_dirs))
+
+
+def dependencies_current(depends):
+    # True while every header recorded as (mtime_ns, size) is unchanged
+    for path, (mtime_ns, size) in depends.items():
+        try:
+            info = os.stat(path)
+        except OSError:
+            return False
+        if info.st_mtime_ns != mtime_ns or info.st_size != size:
+            return False
+    return True
+
+
+class Header:
+    __slots__ = ('path', 'mtime_ns', 'size', 'tokens', 'guard')
+
+    def __init__(self, path, mtime_ns, size, token_stream, guard):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.tokens = token_stream
+        # Macro whose #ifndef wraps the whole header, if any
+        self.guard = guard
+
+
+class HeaderCache:
+    def __init__(self):
+        # (lexer name, path) -> Header
+        self.headers = {}
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, lexer, path):
+        info = os.stat(path)
+        key = (lexer.spec.name, path)
+        header = self.headers.get(key)
+        if header is not None and header.mtime_ns == info.st_mtime_ns and header.size == info.st_size:
+            self.hits += 1
+            return header
+        with open(path, 'rb') as f:
+            data = f.read()
+        token_stream = lexer.stream(data)
+        header = Header(path, info.st_mtime_ns, info.st_size, token_stream, find_guard(lexer, token_stream))
+        self.headers[key] = header
+        self.misses += 1
+        return header
+
+
+# Headers lexed in this process
+headers = HeaderCache()
+
+
+def find_guard(lexer, token_stream):
+    # The X of a header laid out as #ifndef X ... #endif with no tokens
+    # outside, and no #else or #elif for the outer condition
+    directive_kind = lexer.kind_ids['DIRECTIVE']
+    kinds = token_stream.kinds
+    if len(kinds) < 2 or kinds[0] != directive_kind or kinds[-1] != directive_kind:
+        return None
+    first = directive_words(token_stream, 0)
+    if len(first) != 2 or first[0] != 'ifndef':
+        return None
+    depth = 0
+    for index, kind in enumerate(kinds):
+        if kind != directive_kind:
+            continue
+        words = directive_words(token_stream, index)
+        name = words[0] if words else ''
+        if name in ('if', 'ifdef', 'ifndef'):
+            depth += 1
+        elif name == 'endif':
+            depth -= 1
+            if depth == 0:
+                return first[1] if index == len(kinds) - 1 else None
+        elif name in ('else', 'elif') and depth == 1:
+            return None
+    return None
+
+
+def directive_words(token_stream, index):
+    start, end = token_stream.span(index)
+    return token_stream.data[start + 1:end].decode('utf-8').split()
+
+
+class Macro:
+    __slots__ = ('name', 'parameters', 'body')
+
+    def __init__(self, name, parameters, body):
+        self.name = name
+        # None for an object-like macro; a variadic macro ends in __VA_ARGS__
+        self.parameters = parameters
+        # (kind, text) pairs
+        self.body = body
+
+
+class Preprocessor:
+    def __init__(self, lexer, path=None, include_dirs=None, defines=None, header_cache=None):
+        self.lexer = directive_lexer(lexer)
+        self.path = path
+        # The whole search path; None is the default one
+        self.include_dirs = include_path() if include_dirs is None else list(include_dirs)
+        self.headers = header_cache if header_cache is not None else headers
+        kind_ids = self.lexer.kind_ids
+        self.directive_kind = kind_ids['DIRECTIVE']
+        # Macro names can be identifiers or keywords
+        self.name_kinds = {self.lexer.identifier_kind} | set(self.lexer.keywords.values())
+        self.string_kind = next(self.lexer.scan(b'""'))[0]
+        self.number_kind = next(self.lexer.scan(b'0'))[0]
+        self.macros = {}
+        for name, value in (defines or {}).items():
+            self.macros[name] = Macro(name, None, self.line_tokens(str(value).encode('utf-8')))
+        # Included headers -> (mtime_ns, size), for compile cache validation
+        self.depends = {}
+        self.once = set()
+        # Where the directive or macro call being handled is, for errors
+        self.where = (b'', 0, path)
+
+    def error(self, message):
+        data, offset, path = self.where
+        line, _ = stream.line_and_column(data, offset)
+        return SyntaxError(f"{path or '<input>'}:{line}: {message}")
+
+    def tokens(self, data):
+        # Yield (kind, start, end, text) for the preprocessed main file.
+        # text is None when the token is data[start:end] itself
+        return self.source_tokens(data, self.lexer.scan(data), self.path, None, 0)
+
+    def source_tokens(self, data, spans, path, anchor, depth):
+        # anchor is the span in the main file that stands for this file: the
+        # #include line, or None for the main file itself
+        directive_kind = self.directive_kind
+        name_kinds = self.name_kinds
+        macros = self.macros
+        # [active before the #if, some branch taken] per open conditional
+        conditions = []
+        active = True
+        spans = iter(spans)
+        pending = []
+        while True:
+            if pending:
+                kind, start, end = pending.pop()
+            else:
+                span = next(spans, None)
+                if span is None:
+                    break
+                kind, start, end = span
+            if kind == directive_kind:
+                self.where = (data, start, path)
+                words = self.line_tokens(data[start + 1:end])
+                name = words[0][1] if words else ''
+                arguments = words[1:]
+                if name in ('if', 'ifdef', 'ifndef'):
+                    taken = active and self.condition(name, arguments)
+                    conditions.append([active, taken])
+                    active = taken
+                elif name in ('elif', 'else', 'endif'):
+                    if not conditions:
+                        raise self.error(f"#{name} without #if")
+                    outer, taken = conditions[-1]
+                    if name == 'endif':
+                        conditions.pop()
+                        active = outer
+                    elif taken or not outer:
+                        active = False
+                    else:
+                        active = name == 'else' or self.condition('if', arguments)
+                        conditions[-1][1] = active
+                elif not active:
+                    continue
+                elif name == 'include':
+                    yield from self.include(data, start, end, path, anchor or (start, end), depth)
+                elif name == 'define':
+                    self.define(data[start + 1:end], arguments)
+                elif name == 'undef':
+                    if arguments:
+                        macros.pop(arguments[0][1], None)
+                elif name == 'pragma':
+                    if arguments and arguments[0][1] == 'once' and path is not None:
+                        self.once.add(path)
+                elif name == 'error':
+                    raise self.error('#error ' + ' '.join(text for _, text in arguments))
+                # #line, #warning and unknown directives are ignored
+                continue
+            if not active:
+                continue
+            if kind in name_kinds and macros:
+                name = bytes(data[start:end]).decode('utf-8')
+                macro = macros.get(name)
+                if macro is not None:
+                    self.where = (data, start, path)
+                    call = [(kind, name)]
+                    call_end = end
+                    if macro.parameters is not None:
+                        span = next(spans, None) if not pending else pending.pop()
+                        if span is None or bytes(data[span[1]:span[2]]) != b'(':
+                            # A function-like macro name without arguments
+                            if span is not None:
+                                pending.append(span)
+                            call = None
+                        else:
+                            call_end = self.collect_call(data, span, spans, call)
+                    if call is not None:
+                        start, end = anchor or (start, call_end)
+                        for kind, text in self.expand(call, frozenset()):
+                            yield kind, start, end, text
+                        continue
+            if anchor is None:
+                yield kind, start, end, None
+            else:
+                yield kind, anchor[0], anchor[1], bytes(data[start:end]).decode('utf-8')
+        if conditions:
+            raise self.error("unterminated #if")
+
+    def collect_call(self, data, span, spans, call):
+        # Append the tokens of a macro call from its '(' to the matching ')'
+        # and return where it ends
+        depth = 0
+        while span is not None:
+            kind, start, end = span
+            text = bytes(data[start:end]).decode('utf-8')
+            call.append((kind, text))
+            if text == '(':
+                depth += 1
+            elif text == ')':
+                depth -= 1
+                if depth == 0:
+                    return end
+            span = next(spans, None)
+        raise self.error(f"unterminated call of macro {call[0][1]}")
+
+    def line_tokens(self, line):
+        # (kind, text) tokens of a directive line. A '#' or '##' inside the
+        # line comes back from the lexer as a directive running to the end
+        # of the line, so it is split off and the rest is lexed again
+        line = bytes(line).replace(b'\\\r\n', b'   ').replace(b'\\\n', b'  ')
+        result = []
+        for kind, start, end in self.lexer.scan(line):
+            if kind == self.directive_kind:
+                hashes = 2 if line.startswith(b'##', start) else 1
+                result.append((kind, '#' * hashes))
+                result.extend(self.line_tokens(line[start + hashes:end]))
+                break
+            result.append((kind, line[start:end].decode('utf-8')))
+        return result
+
+    def define(self, line, arguments):
+        if not arguments or arguments[0][0] not in self.name_kinds:
+            raise self.error("#define needs a macro name")
+        name = arguments[0][1]
+        # A function-like macro has '(' right after its name, with no space
+        spans = self.lexer.scan(bytes(line))
+        next(spans)
+        name_end = next(spans)[2]
+        parenthesis = next(spans, None)
+        if parenthesis is not None and parenthesis[1] == name_end and arguments[1][1] == '(':
+            parameters = []
+            index = 2
+            while index < len(arguments) and arguments[index][1] != ')':
+                text = arguments[index][1]
+                if text == '...':
+                    parameters.append('__VA_ARGS__')
+                elif text != ',':
+                    parameters.append(text)
+                index += 1
+            if index == len(arguments):
+                raise self.error(f"missing ')' in the parameters of macro {name}")
+            self.macros[name] = Macro(name, parameters, arguments[index + 1:])
+        else:
+            self.macros[name] = Macro(name, None, arguments[1:])
+
+    def include(self, data, start, end, path, anchor, depth):
+        text = bytes(data[start + 1:end]).decode('utf-8').strip()[len('include'):].strip()
+        if not text.startswith(('"', '<')):
+            # #include MACRO
+            text = ''.join(text for _, text in self.expand(self.line_tokens(text.encode('utf-8')), frozenset()))
+        if text.startswith('"') and '"' in text[1:]:
+            name, quoted = text[1:text.index('"', 1)], True
+        elif text.startswith('<') and '>' in text:
+            name, quoted = text[1:text.index('>')], False
+        else:
+            raise self.error('#include expects "FILE" or <FILE>')
+        resolved = self.resolve(name, quoted, path)
+        if resolved is None:
+            if quoted:
+                raise self.error(f"include file {name!r} not found")
+            return
+        if depth >= MAX_INCLUDE_DEPTH:
+            raise self.error(f"#include nested more than {MAX_INCLUDE_DEPTH} levels deep")
+        header = self.headers.load(self.lexer, resolved)
+        self.depends[resolved] = (header.mtime_ns, header.size)
+        if resolved in self.once or (header.guard is not None and header.guard in self.macros):
+            return
+        token_stream = header.tokens
+        yield from self.source_tokens(token_stream.data,
+                                      zip(token_stream.kinds, token_stream.starts, token_stream.ends),
+                                      resolved, anchor, depth + 1)
+
+    def resolve(self, name, quoted, path):
+        dirs = self.include_dirs
+        if quoted:
+            dirs = [os.path.dirname(os.path.abspath(path)) if path is not None else os.getcwd()] + dirs
+        for directory in dirs:
+            candidate = os.path.join(directory, name)
+            if os.path.isfile(candidate):
+                return os.path.abspath(candidate)
+        return None
+
+    # Macro expansion
+
+    def expand(self, items, disabled):
+        # Fully expand a list of (kind, text) tokens. A macro is not expanded
+        # again inside its own expansion
+        macros = self.macros
+        result = []
+        index = 0
+        while index < len(items):
+            kind, text = items[index]
+            macro = macros.get(text) if kind in self.name_kinds else None
+            if macro is None or text in disabled:
+                result.append(items[index])
+                index += 1
+            elif macro.parameters is None:
+                result.extend(self.expand(macro.body, disabled | {text}))
+                index += 1
+            elif index + 1 < len(items) and items[index + 1][1] == '(':
+                arguments, index = self.split_arguments(items, index + 1, macro)
+                result.extend(self.expand(self.substitute(macro, arguments, disabled), disabled | {text}))
+            else:
+                result.append(items[index])
+                index += 1
+        return result
+
+    def split_arguments(self, items, index, macro):
+        # The arguments of the call whose '(' is at index, and the index
+        # after its ')'
+        arguments = [[]]
+        depth = 0
+        for index in range(index, len(items)):
+            text = items[index][1]
+            if text == '(':
+                depth += 1
+                if depth == 1:
+                    continue
+            elif text == ')':
+                depth -= 1
+                if depth == 0:
+                    break
+            elif text == ',' and depth == 1 and not (macro.parameters[-1:] == ['__VA_ARGS__']
+                                                     and len(arguments) == len(macro.parameters)):
+                arguments.append([])
+                continue
+            arguments[-1].append(items[index])
+        else:
+            raise self.error(f"unterminated call of macro {macro.name}")
+        if arguments == [[]] and not macro.parameters:
+            arguments = []
+        if len(arguments) == len(macro.parameters) - 1 and macro.parameters[-1:] == ['__VA_ARGS__']:
+            arguments.append([])
+        if len(arguments) != len(macro.parameters):
+            raise self.error(f"macro {macro.name} takes {len(macro.parameters)} arguments, "
+                             f"{len(arguments)} given")
+        return dict(zip(macro.parameters, arguments)), index + 1
+
+    def substitute(self, macro, arguments, disabled):
+        # The body with parameters replaced: stringized after '#', as written
+        # next to '##', fully expanded elsewhere; then '##' pastes
+        body = macro.body
+        directive_kind = self.directive_kind
+        result = []
+        index = 0
+        while index < len(body):
+            kind, text = body[index]
+            if kind == directive_kind and text == '#' and index + 1 < len(body) and body[index + 1][1] in arguments:
+                result.append((self.string_kind, stringize(arguments[body[index + 1][1]])))
+                index += 2
+                continue
+            if text in arguments and kind in self.name_kinds:
+                pasted = (index > 0 and body[index - 1][1] == '##'
+                          or index + 1 < len(body) and body[index + 1][1] == '##')
+                argument = arguments[text]
+                result.extend(argument if pasted else self.expand(argument, disabled))
+                if pasted and not argument:
+                    # An empty argument pastes as nothing
+                    result.append((directive_kind, ''))
+            else:
+                result.append((kind, text))
+            index += 1
+        return self.paste(result)
+
+    def paste(self, items):
+        directive_kind = self.directive_kind
+        result = []
+        index = 0
+        while index < len(items):
+            kind, text = items[index]
+            if kind == directive_kind and text == '##' and result and index + 1 < len(items):
+                left = result.pop()[1]
+                right = items[index + 1][1]
+                result.extend((kind, text) for kind, text in self.line_tokens((left + right).encode('utf-8')))
+                index += 2
+                continue
+            if not (kind == directive_kind and text == ''):
+                result.append((kind, text))
+            index += 1
+        return [item for item in result if item[1]]
+
+    # #if expressions
+
+    def condition(self, name, arguments):
+        if name in ('ifdef', 'ifndef'):
+            if not arguments:
+                raise self.error(f"#{name} needs a macro name")
+            return (arguments[0][1] in self.macros) == (name == 'ifdef')
+        # defined X and defined(X) are answered before expansion
+        items = []
+        index = 0
+        while index < len(arguments):
+            text = arguments[index][1]
+            if text != 'defined':
+                items.append(arguments[index])
+                index += 1
+                continue
+            parenthesized = index + 1 < len(arguments) and arguments[index + 1][1] == '('
+            name_index = index + 2 if parenthesized else index + 1
+            if name_index >= len(arguments):
+                raise self.error("defined needs a macro name")
+            items.append((self.number_kind, '1' if arguments[name_index][1] in self.macros else '0'))
+            index = name_index + (2 if parenthesized else 1)
+        values = []
+        for kind, text in self.expand(items, frozenset()):
+            # Names left after expansion are 0, true is 1
+            if kind in self.name_kinds:
+                text = '1' if text == 'true' else '0'
+            values.append(text)
+        if not values:
+            raise self.error(f"#{name} with no expression")
+        return Condition(values, self.error).parse() != 0
+
+
+def stringize(items):
+    texts = []
+    for _, text in items:
+        if text.startswith(('"', "'")):
+            text = text.replace('\\', '\\\\').replace('"', '\\"')
+        texts.append(text)
+    return '"' + ' '.join(texts) + '"'
+
+
+class Condition:
+    # Precedence climbing over the tokens of an #if expression
+    def __init__(self, values, error):
+        self.values = values
+        self.index = 0
+        self.error = error
+
+    def peek(self):
+        return self.values[self.index] if self.index < len(self.values) else None
+
+    def advance(self):
+        value = self.peek()
+        if value is None:
+            raise self.error("unexpected end of #if expression")
+        self.index += 1
+        return value
+
+    def parse(self):
+        value = self.conditional()
+        if self.peek() is not None:
+            raise self.error(f"unexpected {self.peek()!r} in #if expression")
+        return value
+
+    def conditional(self):
+        value = self.binary(1)
+        if self.peek() != '?':
+            return value
+        self.advance()
+        if_true = self.conditional()
+        if self.advance() != ':':
+            raise self.error("expected ':' in #if expression")
+        if_false = self.conditional()
+        return if_true if value else if_false
+
+    def binary(self, minimum_precedence):
+        left = self.unary()
+        while True:
+            operator = self.peek()
+            precedence = BINARY_PRECEDENCE.get(operator)
+            if precedence is None or precedence < minimum_precedence:
+                return left
+            self.advance()
+            right = self.binary(precedence + 1)
+            left = self.apply(operator, left, right)
+
+    def apply(self, operator, left, right):
+        if operator in ('/', '%'):
+            if right == 0:
+                raise self.error("division by zero in #if expression")
+            quotient = abs(left) // abs(right)
+            if (left < 0) != (right < 0):
+                quotient = -quotient
+            return quotient if operator == '/' else left - quotient * right
+        if operator == '||':
+            return int(bool(left or right))
+        if operator == '&&':
+            return int(bool(left and right))
+        return {
+            '|': lambda: left | right, '^': lambda: left ^ right, '&': lambda: left & right,
+            '==': lambda: int(left == right), '!=': lambda: int(left != right),
+            '<': lambda: int(left < right), '>': lambda: int(left > right),
+            '<=': lambda: int(left <= right), '>=': lambda: int(left >= right),
+            '<<': lambda: left << right, '>>': lambda: left >> right,
+            '+': lambda: left + right, '-': lambda: left - right, '*': lambda: left * right,
+        }[operator]()
+
+    def unary(self):
+        value = self.advance()
+        if value == '(':
+            result = self.conditional()
+            if self.advance() != ')':
+                raise self.error("expected ')' in #if expression")
+            return result
+        if value == '!':
+            return int(not self.unary())
+        if value == '~':
+            return ~self.unary()
+        if value == '-':
+            return -self.unary()
+        if value == '+':
+            return self.unary()
+        return self.number(value)
+
+    def number(self, text):
+        if text.startswith("'") and text.endswith("'") and len(text) > 2:
+            body = text[1:-1]
+            if body.startswith('\\'):
+                if body[1:] in CHARACTER_ESCAPES:
+                    return CHARACTER_ESCAPES[body[1:]]
+                if body[1:2] in ('x', 'X'):
+                    return int(body[2:], 16)
+                return int(body[1:], 8)
+            return ord(body)
+        digits = text.rstrip('uUlL')
+        try:
+            if digits[:2] in ('0x', '0X'):
+                return int(digits[2:], 16)
+            if len(digits) > 1 and digits[0] == '0':
+                return int(digits[1:], 8)
+            return int(digits)
+        except ValueError:
+            raise self.error(f"{text!r} is not an integer in #if expression") from None
+
+
+def preprocess(lexer, source, path=None, include_dirs=None, defines=None):
+    # Returns the TokenStream of the preprocessed source and the headers it
+    # depends on. A source without any '#' is lexed as it is
+    data = source.encode('utf-8') if isinstance(source, str) else source
+    if b'#' not in data:
+        return lexer.stream(data), {}
+    preprocessor = Preprocessor(lexer, path, include_dirs, defines)
+    token_stream = tokens.TokenStream(data, preprocessor.lexer.kinds)
+    intern = token_stream.symbols.intern
+    append = token_stream.append
+    literal_kinds = lexer.literal_kinds
+    for kind, start, end, text in preprocessor.tokens(data):
+        if text is not None:
+            append(kind, start, end, intern(text.encode('utf-8')))
+        elif kind in literal_kinds:
+            append(kind, start, end)
+        else:
+            append(kind, start, end, intern(bytes(data[start:end])))
+    return token_stream, preprocessor.depends
+
+
+def iter_tokens(lexer, data, path=None, include_dirs=None, defines=None):
+    # Lazily yield Token views of a preprocessed bytes-like buffer such as an
+    # mmap, for the streaming pipelines
+    if data.find(b'#') == -1:
+        yield from lexer.iter_tokens(data)
+        return
+    kinds = lexer.kinds
+    for kind, start, end, text in Preprocessor(lexer, path, include_dirs, defines).tokens(data):
+        yield tokens.Token(kinds[kind], text if text is not None else bytes(data[start:end]).decode('utf-8'))
+
+
+def iter_spans(lexer, data, path=None, include_dirs=None, defines=None):
+    # Lazily yield (kind, start, end, text) for a preprocessed bytes-like
+    # buffer, as Preprocessor.tokens does, for pipelines that locate tokens
+    if data.find(b'#') == -1:
+        return ((kind, start, end, None) for kind, start, end in lexer.scan(data))
+    return Preprocessor(lexer, path, include_dirs, defines).tokens(data)
+
+
+def main(argv=None):
+    # Imported here: the frontends import this module on every run
+    import argparse
+    parser = argparse.ArgumentParser(description='Preprocess C or C++ files and print their tokens.')
+    parser.add_argument('inputs', nargs='+', help='C or C++ files')
+    parser.add_argument('-I', dest='include_dirs', action='append', default=[],
+                        help='add a directory to the include path')
+    parser.add_argument('-D', dest='defines', action='append', default=[],
+                        help='define NAME or NAME=VALUE')
+    parser.add_argument('--stats', action='store_true',
+                        help='print the header cache counters at the end')
+    args = parser.parse_args(argv)
+
+    from compilers import batch
+    defines = dict(define.split('=', 1) if '=' in define else (define, '1') for define in args.defines)
+    status = 0
+    for path in args.inputs:
+        module_name = batch.frontend_for(path)
+        if module_name not in ('C.c_compiler', 'CPP.cpp_compiler'):
+            print(f"Error: {path} is not a C or C++ file", file=sys.stderr)
+            status = 1
+            continue
+        try:
+            with open(path, 'rb') as f:
+                token_stream, _ = preprocess(batch.load_frontend(module_name).lexer, f.read(), path,
+                                             include_path(args.include_dirs), defines)
+        except (OSError, SyntaxError) as error:
+            print(f"Error: {error}", file=sys.stderr)
+            status = 1
+            continue
+        line = None
+        words = []
+        for index in range(len(token_stream)):
+            if token_stream.line(index) != line and words:
+                print(' '.join(words))
+                words = []
+            line = token_stream.line(index)
+            words.append(token_stream.value(index))
+        if words:
+            print(' '.join(words))
+    if args.stats:
+        print(f"Headers: {headers.hits} cache hits, {headers.misses} lexed", file=sys.stderr)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
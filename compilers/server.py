@@ -0,0 +1,310 @@
+import argparse
+import asyncio
+import collections
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from compilers import batch, cache
+from compilers.client import DEFAULT_SOCKET
+
+# Compile server: a long-running daemon that keeps the frontends imported and
+# their lexer tables and compile caches warm, so small files do not pay for
+# interpreter startup on every compile.
+#
+#   python -m compilers.server [--socket PATH] [-j WORKERS] [--cache-dir DIR | --no-cache]
+#
+# It listens on a Unix socket for newline-delimited JSON requests from any
+# number of clients. Compiles run in a pool of worker processes, each of
+# which imports all four frontends once when it starts. Requests:
+#
+#   {"op": "compile", "path": ..., "output": ..., "optimize": true, "streaming": null}
+#   {"op": "stats"}      per-language latency percentiles and counters
+#   {"op": "ping"}
+#   {"op": "shutdown"}
+#
+# Every response is one JSON line with "ok" set and the request's "id", if it
+# had one; requests on one connection are answered as they finish. A compile
+# response carries the frontend's printed output and the queue, compile and
+# total latency of the request in milliseconds. compilers/client.py is the
+# matching client.
+
+# Frontend module -> language name in the metrics
+LANGUAGES = batch.LANGUAGES
+
+# Latencies kept per language for the percentiles
+LATENCY_WINDOW = 1024
+
+# Longest request line accepted
+MAX_REQUEST_BYTES = 1024 * 1024
+
+# Seconds open connections get to finish when the server stops
+SHUTDOWN_SECONDS = 5
+
+
+def warm_worker():
+    # Pool initializer: import every frontend, which builds or loads its
+    # lexer tables, before the first request arrives
+    for module_name in LANGUAGES:
+        batch.load_frontend(module_name)
+
+
+def compile_request(path, output_path, optimize, streaming, cache_dir, cache_size):
+    # Runs in a worker process. Whatever the frontend prints is returned to
+    # the client instead of going to the server's stdout
+    started = time.monotonic()
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        _, size, seconds, error, cached = batch.compile_job(path, output_path, streaming, optimize,
+                                                            cache_dir, cache_size)
+    return {'started': started, 'bytes': size, 'seconds': seconds, 'error': error, 'cached': cached,
+            'output': output.getvalue()}
+
+
+def percentile(ordered, fraction):
+    index = min(len(ordered) - 1, int(fraction * len(ordered)))
+    return ordered[index]
+
+
+class Metrics:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Language -> recent request latencies in milliseconds, and totals
+        self.latencies = collections.defaultdict(lambda: collections.deque(maxlen=LATENCY_WINDOW))
+        self.counts = collections.Counter()
+        self.total_ms = collections.Counter()
+
+    def record(self, language, latency_ms, error, cached):
+        self.requests += 1
+        self.errors += bool(error)
+        if cached is not None:
+            if cached:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+        self.latencies[language].append(latency_ms)
+        self.counts[language] += 1
+        self.total_ms[language] += latency_ms
+
+    def summary(self):
+        languages = {}
+        for language, latencies in sorted(self.latencies.items()):
+            ordered = sorted(latencies)
+            languages[language] = {
+                'requests': self.counts[language],
+                'mean_ms': round(self.total_ms[language] / self.counts[language], 3),
+                'p50_ms': round(percentile(ordered, 0.50), 3),
+                'p95_ms': round(percentile(ordered, 0.95), 3),
+                'max_ms': round(ordered[-1], 3),
+            }
+        return {
+            'uptime_seconds': round(time.monotonic() - self.started, 3),
+            'requests': self.requests,
+            'errors': self.errors,
+            'in_flight': self.in_flight,
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'languages': languages,
+        }
+
+
+class CompileServer:
+    def __init__(self, socket_path=DEFAULT_SOCKET, workers=None, cache_dir=None,
+                 cache_size=cache.DEFAULT_MAX_BYTES):
+        self.socket_path = socket_path
+        self.workers = workers
+        self.cache_dir = os.path.abspath(cache_dir) if cache_dir is not None else None
+        self.cache_size = cache_size
+        self.metrics = Metrics()
+        self.executor = None
+        self.server = None
+        self.stopping = None
+        self.connections = set()
+
+    async def serve(self):
+        self.stopping = asyncio.Event()
+        remove_stale_socket(self.socket_path)
+        # Forked workers would inherit the client connections open at the
+        # time and keep them from closing, so they start from a fork server
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        workers = self.workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=warm_worker)
+        loop = asyncio.get_running_loop()
+        # Start and warm every worker before the first request
+        await asyncio.gather(*(loop.run_in_executor(self.executor, int) for _ in range(workers)))
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signal_number, self.stopping.set)
+        self.server = await asyncio.start_unix_server(self.handle_client, path=self.socket_path,
+                                                      limit=MAX_REQUEST_BYTES)
+        print(f"Compile server listening on {self.socket_path}", flush=True)
+        try:
+            async with self.server:
+                await self.stopping.wait()
+                self.server.close()
+                # Requests already received are answered before stopping
+                if self.connections:
+                    await asyncio.wait(self.connections, timeout=SHUTDOWN_SECONDS)
+                for connection in self.connections:
+                    connection.cancel()
+        finally:
+            self.executor.shutdown(cancel_futures=True)
+            with contextlib.suppress(OSError):
+                os.remove(self.socket_path)
+        print("Compile server stopped", flush=True)
+
+    async def handle_client(self, reader, writer):
+        # Requests on one connection run concurrently; each response echoes
+        # the "id" of its request and may arrive out of order
+        lock = asyncio.Lock()
+        tasks = set()
+        connection = asyncio.current_task()
+        self.connections.add(connection)
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    await self.respond(writer, lock, {'ok': False, 'error': 'request too long'})
+                    break
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError('a request is a JSON object')
+                except ValueError as error:
+                    await self.respond(writer, lock, {'ok': False, 'error': f'bad request: {error}'})
+                    continue
+                task = asyncio.create_task(self.answer(request, writer, lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+        except (ConnectionError, asyncio.CancelledError):
+            # The client went away, or the server is stopping
+            pass
+        finally:
+            self.connections.discard(connection)
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def answer(self, request, writer, lock):
+        response = await self.dispatch(request)
+        if 'id' in request:
+            response['id'] = request['id']
+        await self.respond(writer, lock, response)
+
+    async def respond(self, writer, lock, response):
+        async with lock:
+            writer.write(json.dumps(response).encode('utf-8') + b'\n')
+            await writer.drain()
+
+    async def dispatch(self, request):
+        op = request.get('op', 'compile')
+        if op == 'compile':
+            return await self.compile(request)
+        if op == 'stats':
+            return {'ok': True, 'stats': self.metrics.summary()}
+        if op == 'ping':
+            return {'ok': True}
+        if op == 'shutdown':
+            self.stopping.set()
+            return {'ok': True}
+        return {'ok': False, 'error': f'unknown op {op!r}'}
+
+    async def compile(self, request):
+        received = time.monotonic()
+        path = request.get('path')
+        if not isinstance(path, str) or not os.path.isabs(path):
+            return {'ok': False, 'error': 'compile needs an absolute "path"'}
+        module_name = batch.frontend_for(path)
+        if module_name is None:
+            return {'ok': False, 'error': f'no frontend for {path}'}
+        output_path = request.get('output') or path + batch.OUTPUT_SUFFIX
+        if not os.path.isabs(output_path):
+            return {'ok': False, 'error': '"output" must be an absolute path'}
+        streaming = request.get('streaming') if module_name in batch.STREAMING_FRONTENDS else None
+        cache_dir = self.cache_dir if not streaming else None
+
+        self.metrics.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self.executor, compile_request, path, output_path,
+                                                bool(request.get('optimize', True)), streaming,
+                                                cache_dir, self.cache_size)
+        finally:
+            self.metrics.in_flight -= 1
+        finished = time.monotonic()
+
+        latency_ms = (finished - received) * 1000
+        self.metrics.record(LANGUAGES[module_name], latency_ms, result['error'], result['cached'])
+        return {
+            'ok': result['error'] is None,
+            'error': result['error'],
+            'output': result['output'],
+            'path': path,
+            'output_path': output_path,
+            'bytes': result['bytes'],
+            'cached': result['cached'],
+            'queue_ms': round(max(result['started'] - received, 0.0) * 1000, 3),
+            'compile_ms': round(result['seconds'] * 1000, 3),
+            'latency_ms': round(latency_ms, 3),
+        }
+
+
+def remove_stale_socket(socket_path):
+    # A socket file left by a server that died is removed; a live server
+    # keeps its socket and this one refuses to start
+    if not os.path.exists(socket_path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except OSError:
+        os.remove(socket_path)
+        return
+    finally:
+        probe.close()
+    raise FileExistsError(f"a compile server is already listening on {socket_path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve compile requests for C, C++, Pascal and Rust files.')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET,
+                        help=f'Unix socket to listen on (default: {DEFAULT_SOCKET})')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='worker processes (default: one per CPU)')
+    parser.add_argument('--cache-dir', default=cache.DEFAULT_DIRECTORY,
+                        help='compile cache directory (default: %(default)s)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='compile every request from scratch')
+    parser.add_argument('--cache-size', type=int, default=256,
+                        help='compile cache size limit in MB; with several processes sharing the '
+                             'directory, what the others store between two scans can exceed it (default: 256)')
+    args = parser.parse_args(argv)
+
+    server = CompileServer(args.socket, args.workers, None if args.no_cache else args.cache_dir,
+                           args.cache_size * 1024 * 1024)
+    try:
+        asyncio.run(server.serve())
+    except FileExistsError as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+import mmap
+import os
+from contextlib import contextmanager
+
+from compilers import irbin
+
+# Helpers for the streaming compile pipelines. The source is memory-mapped
+# and lexed in place, tokens flow through generators, and IR is written
+# through a large output buffer as it is produced, so peak memory does not
+# grow with the input size.
+
+# Inputs at least this large are compiled in streaming mode by default
+STREAMING_THRESHOLD = 32 * 1024 * 1024
+
+OUTPUT_BUFFER_SIZE = 1024 * 1024
+
+
+def should_stream(path, streaming=None):
+    if streaming is not None:
+        return streaming
+    return os.path.getsize(path) >= STREAMING_THRESHOLD
+
+
+@contextmanager
+def map_source(path):
+    # Read-only mapping of the whole file; pages are loaded on demand and can
+    # be dropped by the OS, so they do not count against the heap
+    with open(path, 'rb') as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            yield b''
+            return
+        with mapped:
+            yield mapped
+
+
+def open_output(path):
+    # A .irb path gets the binary IR container, anything else the text form
+    if irbin.is_binary(path):
+        return irbin.Writer(open(path, 'wb', buffering=OUTPUT_BUFFER_SIZE))
+    return open(path, 'w', buffering=OUTPUT_BUFFER_SIZE)
+
+
+def line_and_column(data, offset, block_size=OUTPUT_BUFFER_SIZE):
+    # Position of offset in a mapped buffer, counted block by block so no
+    # large copy of the prefix is made; only used for error messages
+    line = 1
+    line_start = 0
+    for block_start in range(0, offset, block_size):
+        block_end = min(block_start + block_size, offset)
+        block = data[block_start:block_end]
+        newlines = block.count(b'\n')
+        if newlines:
+            line += newlines
+            line_start = block_start + block.rfind(b'\n') + 1
+    return line, offset - line_start + 1
+
+
+def count_newlines(data, start, end, block_size=OUTPUT_BUFFER_SIZE):
+    # mmap objects have no count(), so bounded blocks are copied and counted
+    newlines = 0
+    for block_start in range(start, end, block_size):
+        newlines += data[block_start:min(block_start + block_size, end)].count(b'\n')
+    return newlines
+
+
+class LineCounter:
+    # line_and_column for a series of offsets in a mapped buffer. Counting
+    # resumes from the previous offset, in either direction, so locating the
+    # errors of a whole pass reads the buffer about once
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+        self.line = 1
+
+    def locate(self, offset):
+        if offset >= self.offset:
+            self.line += count_newlines(self.data, self.offset, offset)
+        else:
+            self.line -= count_newlines(self.data, offset, self.offset)
+        self.offset = offset
+        line_start = self.data.rfind(b'\n', 0, offset) + 1
+        return self.line, offset - line_start + 1
@@ -0,0 +1,120 @@
+import sys
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+
+# Compact token storage shared by the frontends.
+#
+# A TokenStream keeps one small int kind and the start/end byte offsets of
+# each token in parallel arrays over the original source bytes. Identifier,
+# keyword and operator texts are interned in a SymbolTable, so every
+# occurrence of a name shares one string; literal texts are decoded from the
+# source only when asked for.
+
+# What the parsers and code generators see for one token: it unpacks like the
+# old (type, value) tuples and has the .type/.value attributes of the old
+# Token class, without a per-instance __dict__
+Token = namedtuple('Token', ['type', 'value'])
+
+
+class SymbolTable:
+    def __init__(self):
+        self.ids = {}      # source bytes -> symbol id
+        self.names = []    # symbol id -> str
+
+    def intern(self, text):
+        # text is the raw bytes of the token
+        symbol = self.ids.get(text)
+        if symbol is None:
+            symbol = len(self.names)
+            self.ids[text] = symbol
+            self.names.append(text.decode('utf-8'))
+        return symbol
+
+    def __len__(self):
+        return len(self.names)
+
+
+class TokenStream:
+    def __init__(self, data, kind_names, symbols=None):
+        self.data = data
+        self.kind_names = kind_names
+        self.symbols = symbols if symbols is not None else SymbolTable()
+        # 32-bit offsets unless the source is larger than 4 GB
+        offset_type = 'I' if len(data) < 2 ** 32 else 'Q'
+        self.kinds = array('B')
+        self.starts = array(offset_type)
+        self.ends = array(offset_type)
+        # Symbol id per token, or -1 when the text is read from the source
+        self.symbol_ids = array('i')
+        self.line_starts = None
+
+    def append(self, kind, start, end, symbol=-1):
+        self.kinds.append(kind)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.symbol_ids.append(symbol)
+
+    def __len__(self):
+        return len(self.kinds)
+
+    # Cheap per-token accessors
+
+    def kind(self, index):
+        return self.kinds[index]
+
+    def type(self, index):
+        return self.kind_names[self.kinds[index]]
+
+    def value(self, index):
+        symbol = self.symbol_ids[index]
+        if symbol >= 0:
+            return self.symbols.names[symbol]
+        return self.data[self.starts[index]:self.ends[index]].decode('utf-8')
+
+    def span(self, index):
+        return self.starts[index], self.ends[index]
+
+    def line(self, index):
+        # 1-based line of the token, found by bisecting the line start table
+        if self.line_starts is None:
+            line_starts = array('Q', [0])
+            data = self.data
+            position = data.find(b'\n')
+            while position != -1:
+                line_starts.append(position + 1)
+                position = data.find(b'\n', position + 1)
+            self.line_starts = line_starts
+        return bisect_right(self.line_starts, self.starts[index])
+
+    def column(self, index):
+        line = self.line(index)
+        return self.starts[index] - self.line_starts[line - 1] + 1
+
+    def location(self, index):
+        # (line, column) of the token, for diagnostics
+        line = self.line(index)
+        return line, self.starts[index] - self.line_starts[line - 1] + 1
+
+    # Tuple-compatible view
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        return Token(self.kind_names[self.kinds[index]], self.value(index))
+
+    def __iter__(self):
+        kind_names = self.kind_names
+        names = self.symbols.names
+        data = self.data
+        for kind, start, end, symbol in zip(self.kinds, self.starts, self.ends, self.symbol_ids):
+            if symbol >= 0:
+                yield Token(kind_names[kind], names[symbol])
+            else:
+                yield Token(kind_names[kind], data[start:end].decode('utf-8'))
+
+    def memory_usage(self):
+        # Bytes held by the per-token arrays (the source itself is not counted)
+        return sum(sys.getsizeof(column) for column in (self.kinds, self.starts, self.ends, self.symbol_ids))
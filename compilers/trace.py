@@ -0,0 +1,159 @@
+import atexit
+import contextlib
+import functools
+import os
+import sys
+import threading
+import time
+
+# Lightweight tracing for the compile phases.
+#
+# Frontends mark their phases with the traced decorator or a span block and
+# report sizes (tokens, AST nodes, IR instructions, bytes written) as span
+# counters. While no tracer is active each hook is one global lookup and a
+# call, so tracing can stay compiled in. An active tracer records Chrome
+# trace events, which load in Perfetto (ui.perfetto.dev) or chrome://tracing,
+# and can print a flat per-phase summary.
+#
+# Set COMPILERS_TRACE=trace.json to trace any compiler script; the trace is
+# written and the summary printed to stderr when the process exits. The
+# batch driver takes --trace and merges the events of all its workers.
+
+# The active Tracer, or None when tracing is off
+tracer = None
+
+
+class Tracer:
+    def __init__(self):
+        self.events = []
+        self.pid = os.getpid()
+
+    @contextlib.contextmanager
+    def span(self, name, category='compile', **args):
+        # Yields the args dict so the traced code can attach counters
+        start = time.perf_counter_ns()
+        try:
+            yield args
+        finally:
+            end = time.perf_counter_ns()
+            self.events.append({'name': name, 'cat': category, 'ph': 'X',
+                                'ts': start / 1000, 'dur': (end - start) / 1000,
+                                'pid': self.pid, 'tid': threading.get_ident(), 'args': args})
+
+    def extend(self, events):
+        # Events recorded by another process, such as a batch worker
+        self.events.extend(events)
+
+    def write(self, path):
+        trace = {'traceEvents': self.process_names() + self.events, 'displayTimeUnit': 'ms'}
+        import json
+        with open(path, 'w') as f:
+            json.dump(trace, f)
+
+    def process_names(self):
+        # Metadata events labelling each process track in the viewer
+        pids = sorted({event['pid'] for event in self.events})
+        return [{'name': 'process_name', 'ph': 'M', 'pid': pid,
+                 'args': {'name': 'compiler' if pid == self.pid else f'worker {pid}'}}
+                for pid in pids]
+
+    def summary(self):
+        # Per span name: calls, total and mean milliseconds, and the summed
+        # counters, slowest phase first
+        phases = {}
+        for event in self.events:
+            if event['ph'] != 'X':
+                continue
+            phase = phases.setdefault(event['name'], {'calls': 0, 'us': 0.0, 'counters': {}})
+            phase['calls'] += 1
+            phase['us'] += event['dur']
+            for key, value in event['args'].items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    phase['counters'][key] = phase['counters'].get(key, 0) + value
+        lines = [f"{'phase':<24} {'calls':>7} {'total ms':>11} {'mean ms':>9}  counters"]
+        for name, phase in sorted(phases.items(), key=lambda item: -item[1]['us']):
+            counters = ', '.join(f"{key}={value}" for key, value in phase['counters'].items())
+            lines.append(f"{name:<24} {phase['calls']:>7} {phase['us'] / 1000:>11.3f} "
+                         f"{phase['us'] / 1000 / phase['calls']:>9.3f}  {counters}")
+        return lines
+
+
+def enabled():
+    return tracer is not None
+
+
+def start():
+    # Starts a fresh tracer, replacing any active one, and returns it
+    global tracer
+    tracer = Tracer()
+    return tracer
+
+
+def stop():
+    # Stops tracing and returns the recorded events
+    global tracer
+    events = tracer.events if tracer is not None else []
+    tracer = None
+    return events
+
+
+@contextlib.contextmanager
+def recording():
+    # Records into a fresh tracer for the duration of the block and then
+    # puts back whichever tracer was active before
+    global tracer
+    previous = tracer
+    tracer = Tracer()
+    try:
+        yield tracer
+    finally:
+        tracer = previous
+
+
+def span(name, category='compile', **args):
+    if tracer is None:
+        return contextlib.nullcontext(args)
+    return tracer.span(name, category, **args)
+
+
+def traced(name, counter=None, measure=len):
+    # Decorator recording each call as a span; with a counter name, the
+    # return value is measured and attached to the span
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if tracer is None:
+                return func(*args, **kwargs)
+            with tracer.span(name) as span_args:
+                result = func(*args, **kwargs)
+                if counter is not None:
+                    span_args[counter] = measure(result)
+            return result
+        return wrapper
+    return decorate
+
+
+def write_summary(lines, file=None):
+    for line in lines:
+        print(line, file=file or sys.stderr)
+
+
+def trace_at_exit(path):
+    def finish():
+        active = tracer
+        if active is None or active.pid != os.getpid():
+            return
+        active.write(path)
+        write_summary(active.summary())
+        print(f"Trace written to {path}", file=sys.stderr)
+    atexit.register(finish)
+
+
+# Tracing requested through the environment covers the whole process. Child
+# processes (batch workers) hand their events back to the parent instead.
+# multiprocessing is only imported when tracing is asked for
+if os.environ.get('COMPILERS_TRACE'):
+    import multiprocessing
+    if multiprocessing.parent_process() is None:
+        start()
+        trace_at_exit(os.environ['COMPILERS_TRACE'])
@@ -0,0 +1,766 @@
+import argparse
+import array
+import io
+import math
+import os
+import sys
+import time
+
+from compilers import batch, ir, passes, trace
+
+# Bytecode virtual machine for the linear IR (see compilers/ir.py).
+#
+#   python -m compilers.vm [-O0] [--repeat N] [--compare] [--quiet] [--top N] FILE
+#
+# assemble turns the stack code of the C++ and Rust frontends and the
+# register code of the Pascal frontend into one Code object per function.
+# Its instructions are three words of an array('i'): the opcode and two
+# operands. Variables are slots of the function's frame, constants are
+# slots that start out holding their value, globals are slots of the frame
+# of the code before the first FUNCTION, and jumps hold the offset of their
+# target, so nothing is looked up by name while running. Labels and
+# comments take no space.
+#
+# A Machine runs the code before the first FUNCTION, then main if there is
+# one. Each call gets a new frame copied from the callee's template with the
+# arguments in the first slots. Calls to functions the program does not
+# define go to BUILTINS. Variables read before they are stored are 0, and
+# numbers are Python numbers, so integers do not wrap at 32 bits.
+#
+# The dispatch loop is a chain of comparisons on the opcode, ordered by how
+# often the generated code uses each one. Functions made only of register
+# code run in a shorter loop of their own. Counting every instruction would
+# slow the loop down by about a fifth, so the machine counts straight-line
+# runs instead: each taken jump, call and return records the run from where
+# execution last arrived to where it leaves. The total and the per-opcode
+# counts are expanded from the runs afterwards.
+
+# Words per instruction: the opcode and two operands
+WIDTH = 3
+
+# Bytecode opcodes. LOAD and PUSH must stay 0 and 1, since they share the
+# first branch of the dispatch loop
+LOAD = 0
+PUSH = 1
+STORE = 2
+LOAD_GLOBAL = 3
+STORE_GLOBAL = 4
+DUP = 5
+POP = 6
+ADD = 7
+SUB = 8
+MUL = 9
+DIV = 10
+MOD = 11
+NEG = 12
+NOT = 13
+BIT_AND = 14
+BIT_OR = 15
+BIT_XOR = 16
+BIT_NOT = 17
+SHIFT_LEFT = 18
+SHIFT_RIGHT = 19
+EQUAL = 20
+NOT_EQUAL = 21
+LESS = 22
+LESS_EQUAL = 23
+GREATER = 24
+GREATER_EQUAL = 25
+JUMP = 26
+JUMP_IF_FALSE = 27
+JUMP_IF_TRUE = 28
+INDEX = 29
+STORE_INDEX = 30
+ARRAY = 31
+NEW_ARRAY = 32
+CALL = 33
+PRINT = 34
+RETURN = 35
+MOVE = 36
+SET_FLAGS = 37
+POP_FLAGS = 38
+JUMP_IF_GREATER = 39
+JUMP_IF_GREATER_EQUAL = 40
+JUMP_IF_LESS = 41
+JUMP_IF_LESS_EQUAL = 42
+INCREMENT = 43
+DECREMENT = 44
+HALT = 45
+
+OPCODE_NAMES = ('LOAD', 'PUSH', 'STORE', 'LOAD_GLOBAL', 'STORE_GLOBAL', 'DUP', 'POP', 'ADD', 'SUB',
+                'MUL', 'DIV', 'MOD', 'NEG', 'NOT', 'BIT_AND', 'BIT_OR', 'BIT_XOR', 'BIT_NOT',
+                'SHIFT_LEFT', 'SHIFT_RIGHT', 'EQUAL', 'NOT_EQUAL', 'LESS', 'LESS_EQUAL', 'GREATER',
+                'GREATER_EQUAL', 'JUMP', 'JUMP_IF_FALSE', 'JUMP_IF_TRUE', 'INDEX', 'STORE_INDEX',
+                'ARRAY', 'NEW_ARRAY', 'CALL', 'PRINT', 'RETURN', 'MOVE', 'SET_FLAGS', 'POP_FLAGS',
+                'JUMP_IF_GREATER', 'JUMP_IF_GREATER_EQUAL', 'JUMP_IF_LESS', 'JUMP_IF_LESS_EQUAL',
+                'INCREMENT', 'DECREMENT', 'HALT')
+
+# IR opcode -> bytecode opcode, for instructions that carry over one to one
+SIMPLE_OPCODES = {
+    ir.DUP: DUP, ir.POP: POP, ir.ADD: ADD, ir.SUB: SUB, ir.MUL: MUL, ir.DIV: DIV, ir.MOD: MOD,
+    ir.NEG: NEG, ir.NOT: NOT, ir.BIT_AND: BIT_AND, ir.BIT_OR: BIT_OR, ir.BIT_XOR: BIT_XOR,
+    ir.BIT_NOT: BIT_NOT, ir.SHIFT_LEFT: SHIFT_LEFT, ir.SHIFT_RIGHT: SHIFT_RIGHT, ir.INDEX: INDEX,
+    ir.STORE_INDEX: STORE_INDEX, ir.PRINT: PRINT, ir.RETURN: RETURN,
+}
+
+COMPARISON_OPCODES = {'==': EQUAL, '!=': NOT_EQUAL, '<': LESS, '<=': LESS_EQUAL,
+                      '>': GREATER, '>=': GREATER_EQUAL}
+
+JUMP_OPCODES = {ir.JUMP: JUMP, ir.JUMP_IF_FALSE: JUMP_IF_FALSE, ir.JUMP_IF_TRUE: JUMP_IF_TRUE,
+                ir.JUMP_IF_GREATER: JUMP_IF_GREATER, ir.JUMP_IF_GREATER_EQUAL: JUMP_IF_GREATER_EQUAL,
+                ir.JUMP_IF_LESS: JUMP_IF_LESS, ir.JUMP_IF_LESS_EQUAL: JUMP_IF_LESS_EQUAL}
+
+# Opcodes the register loop runs (see Machine.execute_register)
+REGISTER_OPCODES = {MOVE, SET_FLAGS, JUMP_IF_GREATER, JUMP_IF_GREATER_EQUAL, JUMP_IF_LESS,
+                    JUMP_IF_LESS_EQUAL, INCREMENT, DECREMENT, JUMP, HALT}
+
+# Errors of the running program, which the machine reports as a VMError
+RUNTIME_ERRORS = (ArithmeticError, IndexError, TypeError, ValueError, RecursionError)
+
+
+class VMError(Exception):
+    pass
+
+
+def constant_value(operand):
+    # String constants keep their quotes and escapes in the IR
+    if isinstance(operand, str) and len(operand) >= 2 and operand[0] == operand[-1] and operand[0] in '"\'':
+        return operand[1:-1].encode('latin-1', 'backslashreplace').decode('unicode_escape')
+    return operand
+
+
+def format_value(value):
+    # Floats print with six significant digits, as cout does
+    if isinstance(value, float):
+        return f'{value:g}'
+    return str(value)
+
+
+def zero_array(dimensions):
+    if len(dimensions) == 1:
+        return [0] * dimensions[0]
+    return [zero_array(dimensions[1:]) for _ in range(dimensions[0])]
+
+
+# Assembly
+
+class Code:
+    # One function as bytecode. name is None for the code before the first
+    # FUNCTION, whose frame holds the globals
+    def __init__(self, index, name, parameters):
+        self.index = index
+        self.name = name
+        self.parameters = parameters
+        self.words = array.array('i')
+        # IR instruction index of each bytecode instruction, for errors
+        self.lines = array.array('i')
+        # Initial frame: 0 for variables, the value for constants
+        self.template = []
+        # Variable name or (type, constant) -> slot
+        self.slots = {}
+        # (function name, argument count) of each CALL
+        self.calls = []
+        # Whether every instruction is one the register loop runs
+        self.register = True
+        for name in parameters:
+            self.slot(name)
+
+    def __len__(self):
+        return len(self.words) // WIDTH
+
+    def slot(self, name):
+        slot = self.slots.get(name)
+        if slot is None:
+            slot = self.slots[name] = len(self.template)
+            self.template.append(0)
+        return slot
+
+    def constant(self, value):
+        # The type keeps 1 and 1.0 apart
+        value = constant_value(value)
+        key = (type(value), value)
+        slot = self.slots.get(key)
+        if slot is None:
+            slot = self.slots[key] = len(self.template)
+            self.template.append(value)
+        return slot
+
+    def emit(self, opcode, line, a=0, b=0):
+        self.words.extend((opcode, a, b))
+        self.lines.append(line)
+        if opcode not in REGISTER_OPCODES:
+            self.register = False
+
+    def describe(self):
+        return 'the top level' if self.name is None else self.name
+
+
+class Module:
+    def __init__(self):
+        # Code objects, the top level first
+        self.codes = []
+        # Function name -> Code
+        self.functions = {}
+
+    def __len__(self):
+        return sum(len(code) for code in self.codes)
+
+
+class Assembler:
+    def __init__(self):
+        self.module = Module()
+        self.code = self.new_code(None, ())
+        self.globals = self.code
+
+    def new_code(self, name, parameters):
+        code = Code(len(self.module.codes), name, parameters)
+        self.module.codes.append(code)
+        if name is not None:
+            self.module.functions[name] = code
+        # Label -> instruction offset, and (word, label) of jumps to patch
+        self.labels = {}
+        self.jumps = []
+        return code
+
+    def finish_code(self, line):
+        code = self.code
+        code.emit(HALT, line)
+        for word, label in self.jumps:
+            target = self.labels.get(label)
+            if target is None:
+                raise VMError(f'Jump to unknown label {label} in {code.describe()}')
+            code.words[word] = target
+
+    def is_global(self, name):
+        # Functions share the variables the top level uses, except where a
+        # parameter hides one
+        return (self.code is not self.globals and name in self.globals.slots
+                and name not in self.code.parameters)
+
+    def load(self, operand, line):
+        if not isinstance(operand, str) or operand[:1] in '"\'':
+            self.code.emit(PUSH, line, self.code.constant(operand))
+        elif self.is_global(operand):
+            self.code.emit(LOAD_GLOBAL, line, self.globals.slots[operand])
+        else:
+            self.code.emit(LOAD, line, self.code.slot(operand))
+
+    def store(self, name, line):
+        if self.is_global(name):
+            self.code.emit(STORE_GLOBAL, line, self.globals.slots[name])
+        else:
+            self.code.emit(STORE, line, self.code.slot(name))
+
+    def register_operand(self, operand):
+        # Frame slot of a register code operand, a variable or a constant
+        if isinstance(operand, str) and operand[:1] not in '"\'':
+            return self.code.slot(operand)
+        return self.code.constant(operand)
+
+    def instruction(self, instr, line):
+        code = self.code
+        opcode = instr.opcode
+        operands = instr.operands
+        simple = SIMPLE_OPCODES.get(opcode)
+        if simple is not None:
+            code.emit(simple, line)
+        elif opcode == ir.PUSH:
+            code.emit(PUSH, line, code.constant(operands[0]))
+        elif opcode == ir.LOAD:
+            self.load(operands[0], line)
+        elif opcode == ir.STORE:
+            self.store(operands[0], line)
+        elif opcode == ir.COMPARE and len(operands) == 1:
+            code.emit(COMPARISON_OPCODES[operands[0]], line)
+        elif opcode in JUMP_OPCODES:
+            self.jumps.append((len(code.words) + 1, operands[0]))
+            code.emit(JUMP_OPCODES[opcode], line)
+        elif opcode == ir.LABEL:
+            self.labels[operands[0]] = len(code.words)
+        elif opcode == ir.COMMENT:
+            pass
+        elif opcode == ir.ARRAY or opcode == ir.NEW_ARRAY:
+            code.emit(ARRAY if opcode == ir.ARRAY else NEW_ARRAY, line, operands[0])
+        elif opcode == ir.CALL:
+            code.emit(CALL, line, len(code.calls))
+            code.calls.append((operands[0], operands[1]))
+        elif opcode in (ir.LOAD_CONSTANT, ir.MOVE, ir.COMPARE, ir.INCREMENT, ir.DECREMENT):
+            self.register_instruction(instr, line)
+        else:
+            raise VMError(f'Cannot execute {opcode} in {code.describe()}; '
+                          f'only stack and register code run on the machine')
+
+    def register_instruction(self, instr, line):
+        code = self.code
+        opcode = instr.opcode
+        operands = instr.operands
+        if any(isinstance(operand, str) and self.is_global(operand) for operand in operands):
+            # Register code in a function that touches a global becomes
+            # stack code, since only the stack loop reaches the globals
+            if opcode == ir.COMPARE:
+                self.load(operands[0], line)
+                self.load(operands[1], line)
+                code.emit(POP_FLAGS, line)
+            elif opcode == ir.INCREMENT or opcode == ir.DECREMENT:
+                self.load(operands[0], line)
+                code.emit(PUSH, line, code.constant(1))
+                code.emit(ADD if opcode == ir.INCREMENT else SUB, line)
+                self.store(operands[0], line)
+            else:
+                self.load(operands[0], line)
+                self.store(operands[1], line)
+        elif opcode == ir.COMPARE:
+            code.emit(SET_FLAGS, line, self.register_operand(operands[0]),
+                      self.register_operand(operands[1]))
+        elif opcode == ir.INCREMENT or opcode == ir.DECREMENT:
+            code.emit(INCREMENT if opcode == ir.INCREMENT else DECREMENT, line, code.slot(operands[0]))
+        else:
+            code.emit(MOVE, line, self.register_operand(operands[0]), code.slot(operands[1]))
+
+
+def assemble(instructions):
+    # Bytecode for an ir.Program or a list of instructions
+    assembler = Assembler()
+    line = 0
+    for line, instr in enumerate(instructions):
+        if instr.opcode == ir.FUNCTION:
+            assembler.finish_code(line)
+            name = instr.operands[0]
+            if name in assembler.module.functions:
+                raise VMError(f'Function {name} is defined twice')
+            assembler.code = assembler.new_code(name, tuple(instr.operands[1:]))
+        else:
+            assembler.instruction(instr, line)
+    assembler.finish_code(line)
+    return assembler.module
+
+
+# Builtins: called with the machine and the list of arguments, they return
+# the value of the call
+
+def builtin_print(machine, arguments, end=''):
+    # println!("{} {}", a, b) fills each {} with the next argument
+    if not arguments:
+        machine.out.write(end)
+        return 0
+    pieces = str(arguments[0]).split('{}')
+    values = [format_value(value) for value in arguments[1:]]
+    text = pieces[0] + ''.join(values[index] + piece if index < len(values) else '{}' + piece
+                               for index, piece in enumerate(pieces[1:]))
+    machine.out.write(text + end)
+    return 0
+
+
+def builtin_println(machine, arguments):
+    return builtin_print(machine, arguments, '\n')
+
+
+def builtin_printf(machine, arguments):
+    text = str(arguments[0]) % tuple(arguments[1:]) if arguments else ''
+    machine.out.write(text)
+    return len(text)
+
+
+def builtin_read(machine, arguments):
+    # cin >> x takes the next input value, or 0 once the input runs out
+    return next(machine.input, 0)
+
+
+BUILTINS = {
+    'print!': builtin_print,
+    'println!': builtin_println,
+    'printf': builtin_printf,
+    'read': builtin_read,
+    'len': lambda machine, arguments: len(arguments[0]),
+    # The int of the source languages is 32 bits wide
+    'sizeof': lambda machine, arguments: 4,
+}
+
+
+# Execution
+
+class Machine:
+    def __init__(self, module, out=None, input=(), builtins=None):
+        self.module = module
+        self.out = sys.stdout if out is None else out
+        self.input = iter(input)
+        self.builtins = BUILTINS if builtins is None else builtins
+        self.calls = [self.link(code) for code in module.codes]
+        # Bytecode as lists, which index twice as fast as the arrays
+        self.words = [code.words.tolist() for code in module.codes]
+        # Straight-line runs of each Code: first * len(words) + last -> count,
+        # where first and last are word offsets of instructions
+        self.runs = [{} for _ in module.codes]
+        self.seconds = 0.0
+        self.globals = None
+
+    def link(self, code):
+        # (Code, None, argument count) of each call to a function of the
+        # program, (None, builtin, argument count) of each builtin call
+        calls = []
+        for name, count in code.calls:
+            callee = self.module.functions.get(name)
+            if callee is not None:
+                if count != len(callee.parameters):
+                    raise VMError(f'{name} takes {len(callee.parameters)} arguments but '
+                                  f'{code.describe()} passes {count}')
+                calls.append((callee, None, count))
+            elif name in self.builtins:
+                calls.append((None, self.builtins[name], count))
+            else:
+                raise VMError(f'{code.describe()} calls undefined function {name}')
+        return calls
+
+    def run(self):
+        # Runs the top level and then main; returns what main returned, or
+        # None without a main
+        codes = self.module.codes
+        main = self.module.functions.get('main')
+        with trace.span('execute') as counters:
+            start = time.perf_counter()
+            try:
+                self.globals = list(codes[0].template)
+                self.execute(codes[0], self.globals)
+                result = None
+                if main is not None:
+                    if main.parameters:
+                        raise VMError('main must not take parameters')
+                    result = self.execute(main, list(main.template))
+            finally:
+                self.seconds += time.perf_counter() - start
+                if trace.enabled():
+                    counters['vm_instructions'] = self.instructions()
+        return result
+
+    def execute(self, code, frame):
+        if code.register:
+            return self.execute_register(code, frame)
+        words = self.words[code.index]
+        size = len(words)
+        calls = self.calls[code.index]
+        runs = self.runs[code.index]
+        count = runs.get
+        globals_ = self.globals
+        write = self.out.write
+        divide = passes.truncating_divide
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        left = right = 0
+        start = pc = 0
+        try:
+            while True:
+                op = words[pc]
+                arg = words[pc + 1]
+                pc += WIDTH
+                if op <= PUSH:
+                    push(frame[arg])
+                elif op == STORE:
+                    frame[arg] = pop()
+                elif op == ADD:
+                    b = pop()
+                    stack[-1] = stack[-1] + b
+                elif op == JUMP_IF_FALSE:
+                    if pop() == 0:
+                        key = start * size + pc - WIDTH
+                        runs[key] = count(key, 0) + 1
+                        start = pc = arg
+                elif op == LESS:
+                    b = pop()
+                    stack[-1] = 1 if stack[-1] < b else 0
+                elif op == JUMP_IF_TRUE:
+                    if pop() != 0:
+                        key = start * size + pc - WIDTH
+                        runs[key] = count(key, 0) + 1
+                        start = pc = arg
+                elif op == JUMP:
+                    key = start * size + pc - WIDTH
+                    runs[key] = count(key, 0) + 1
+                    start = pc = arg
+                elif op == LOAD_GLOBAL:
+                    push(globals_[arg])
+                elif op == STORE_GLOBAL:
+                    globals_[arg] = pop()
+                elif op == SUB:
+                    b = pop()
+                    stack[-1] = stack[-1] - b
+                elif op == MUL:
+                    b = pop()
+                    stack[-1] = stack[-1] * b
+                elif op == DUP:
+                    push(stack[-1])
+                elif op == POP:
+                    pop()
+                elif op == INDEX:
+                    b = pop()
+                    stack[-1] = stack[-1][b]
+                elif op <= GREATER_EQUAL and op >= EQUAL:
+                    b = pop()
+                    a = stack[-1]
+                    if op == EQUAL:
+                        stack[-1] = 1 if a == b else 0
+                    elif op == NOT_EQUAL:
+                        stack[-1] = 1 if a != b else 0
+                    elif op == LESS_EQUAL:
+                        stack[-1] = 1 if a <= b else 0
+                    elif op == GREATER:
+                        stack[-1] = 1 if a > b else 0
+                    else:
+                        stack[-1] = 1 if a >= b else 0
+                elif op == STORE_INDEX:
+                    value = pop()
+                    b = pop()
+                    pop()[b] = value
+                elif op == CALL:
+                    callee, builtin, arguments = calls[arg]
+                    values = stack[len(stack) - arguments:]
+                    del stack[len(stack) - arguments:]
+                    key = start * size + pc - WIDTH
+                    runs[key] = count(key, 0) + 1
+                    start = pc
+                    if builtin is None:
+                        push(self.execute(callee, values + callee.template[arguments:]))
+                    else:
+                        push(builtin(self, values))
+                elif op == PRINT:
+                    write(format_value(pop()))
+                elif op == RETURN:
+                    key = start * size + pc - WIDTH
+                    runs[key] = count(key, 0) + 1
+                    return pop()
+                elif op == DIV:
+                    b = pop()
+                    a = stack[-1]
+                    if type(a) is int and type(b) is int:
+                        stack[-1] = divide(a, b)
+                    else:
+                        stack[-1] = a / b
+                elif op == MOD:
+                    b = pop()
+                    a = stack[-1]
+                    if type(a) is int and type(b) is int:
+                        stack[-1] = a - b * divide(a, b)
+                    else:
+                        stack[-1] = math.fmod(a, b)
+                elif op == NEG:
+                    stack[-1] = -stack[-1]
+                elif op == NOT:
+                    stack[-1] = 1 if stack[-1] == 0 else 0
+                elif op == BIT_AND:
+                    b = pop()
+                    stack[-1] = stack[-1] & b
+                elif op == BIT_OR:
+                    b = pop()
+                    stack[-1] = stack[-1] | b
+                elif op == BIT_XOR:
+                    b = pop()
+                    stack[-1] = stack[-1] ^ b
+                elif op == BIT_NOT:
+                    stack[-1] = ~stack[-1]
+                elif op == SHIFT_LEFT:
+                    b = pop()
+                    stack[-1] = stack[-1] << b
+                elif op == SHIFT_RIGHT:
+                    b = pop()
+                    stack[-1] = stack[-1] >> b
+                elif op == ARRAY:
+                    values = stack[len(stack) - arg:]
+                    del stack[len(stack) - arg:]
+                    push(values)
+                elif op == NEW_ARRAY:
+                    dimensions = stack[len(stack) - arg:]
+                    del stack[len(stack) - arg:]
+                    push(zero_array(dimensions))
+                # Register code, in functions that also have stack code
+                elif op == MOVE:
+                    frame[words[pc - 1]] = frame[arg]
+                elif op == SET_FLAGS:
+                    left = frame[arg]
+                    right = frame[words[pc - 1]]
+                elif op == POP_FLAGS:
+                    right = pop()
+                    left = pop()
+                elif op == INCREMENT:
+                    frame[arg] += 1
+                elif op == DECREMENT:
+                    frame[arg] -= 1
+                elif op >= JUMP_IF_GREATER and op <= JUMP_IF_LESS_EQUAL:
+                    if op == JUMP_IF_GREATER:
+                        taken = left > right
+                    elif op == JUMP_IF_GREATER_EQUAL:
+                        taken = left >= right
+                    elif op == JUMP_IF_LESS:
+                        taken = left < right
+                    else:
+                        taken = left <= right
+                    if taken:
+                        key = start * size + pc - WIDTH
+                        runs[key] = count(key, 0) + 1
+                        start = pc = arg
+                else:
+                    key = start * size + pc - WIDTH
+                    runs[key] = count(key, 0) + 1
+                    return None if code.name is None else 0
+        except RUNTIME_ERRORS as error:
+            raise self.error(code, pc, error) from error
+
+    def execute_register(self, code, frame):
+        # The loop for functions made only of register code
+        words = self.words[code.index]
+        size = len(words)
+        runs = self.runs[code.index]
+        count = runs.get
+        left = right = 0
+        start = pc = 0
+        try:
+            while True:
+                op = words[pc]
+                arg = words[pc + 1]
+                pc += WIDTH
+                if op == MOVE:
+                    frame[words[pc - 1]] = frame[arg]
+                elif op == SET_FLAGS:
+                    left = frame[arg]
+                    right = frame[words[pc - 1]]
+                elif op == INCREMENT:
+                    frame[arg] += 1
+                elif op == JUMP:
+                    key = start * size + pc - WIDTH
+                    runs[key] = count(key, 0) + 1
+                    start = pc = arg
+                elif op == DECREMENT:
+                    frame[arg] -= 1
+                elif op == HALT:
+                    key = start * size + pc - WIDTH
+                    runs[key] = count(key, 0) + 1
+                    return None if code.name is None else 0
+                else:
+                    if op == JUMP_IF_GREATER:
+                        taken = left > right
+                    elif op == JUMP_IF_LESS_EQUAL:
+                        taken = left <= right
+                    elif op == JUMP_IF_LESS:
+                        taken = left < right
+                    else:
+                        taken = left >= right
+                    if taken:
+                        key = start * size + pc - WIDTH
+                        runs[key] = count(key, 0) + 1
+                        start = pc = arg
+        except RUNTIME_ERRORS as error:
+            raise self.error(code, pc, error) from error
+
+    def error(self, code, pc, error):
+        # pc is already past the failing instruction
+        line = code.lines[pc // WIDTH - 1] + 1
+        return VMError(f'{type(error).__name__}: {error} in {code.describe()} at IR line {line}')
+
+    # Statistics
+
+    def instruction_counts(self, code):
+        # Times each instruction of code ran, expanded from the runs
+        size = len(code.words)
+        counts = [0] * (len(code) + 1)
+        for key, runs in self.runs[code.index].items():
+            first, last = divmod(key, size)
+            counts[first // WIDTH] += runs
+            counts[last // WIDTH + 1] -= runs
+        total = 0
+        for index in range(len(counts)):
+            total += counts[index]
+            counts[index] = total
+        counts.pop()
+        return counts
+
+    def opcode_counts(self):
+        # Opcode name -> instructions run, most frequent first
+        totals = {}
+        for code in self.module.codes:
+            if not self.runs[code.index]:
+                continue
+            words = code.words
+            for index, count in enumerate(self.instruction_counts(code)):
+                if count:
+                    name = OPCODE_NAMES[words[index * WIDTH]]
+                    totals[name] = totals.get(name, 0) + count
+        return dict(sorted(totals.items(), key=lambda item: -item[1]))
+
+    def instructions(self):
+        return sum(self.opcode_counts().values())
+
+    def summary(self, top=None):
+        counts = self.opcode_counts()
+        total = sum(counts.values())
+        rate = total / self.seconds if self.seconds > 0 else 0.0
+        lines = [f"{total} instructions in {self.seconds * 1000:.3f} ms "
+                 f"({rate / 1e6:.2f} M instructions/s)",
+                 f"{'opcode':<22} {'count':>12} {'share':>7}"]
+        for name, count in list(counts.items())[:top]:
+            lines.append(f"{name:<22} {count:>12} {100 * count / total:>6.1f}%")
+        return lines
+
+
+def compile_program(path, optimize=True):
+    # The ir.Program of a C++, Pascal or Rust source file
+    module_name = batch.frontend_for(path)
+    if module_name not in batch.OPTIMIZING_FRONTENDS:
+        raise VMError(f'{path}: only C++, Pascal and Rust programs run on the machine')
+    frontend = batch.load_frontend(module_name)
+    options = {'optimize': optimize}
+    if module_name == 'Rust.rust_compiler':
+        options['streaming'] = False
+    return frontend.compile_file(path, os.devnull, **options)
+
+
+def run_program(program, repeat=1, out=None):
+    # Assembles program and runs it repeat times; returns the fastest
+    # Machine. Only the first run writes to out
+    module = assemble(program)
+    best = None
+    for attempt in range(repeat):
+        machine = Machine(module, out if attempt == 0 else io.StringIO())
+        machine.run()
+        if best is None or machine.seconds < best.seconds:
+            best = machine
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a C++, Pascal or Rust program on the IR bytecode machine.')
+    parser.add_argument('source', help='program to compile and run')
+    parser.add_argument('-O', dest='optimize', type=int, choices=[0, 1], default=1,
+                        help='-O0 runs the intermediate code unoptimized (default: -O1)')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='runs to keep the fastest of (default: 1)')
+    parser.add_argument('--compare', action='store_true',
+                        help='also run the code of the other -O level and compare')
+    parser.add_argument('--quiet', action='store_true', help="discard the program's output")
+    parser.add_argument('--top', type=int, default=15, help='opcodes to list (default: 15)')
+    args = parser.parse_args(argv)
+
+    out = io.StringIO() if args.quiet else sys.stdout
+    try:
+        machine = run_program(compile_program(args.source, bool(args.optimize)), args.repeat, out)
+        other = None
+        if args.compare:
+            other = run_program(compile_program(args.source, not args.optimize), args.repeat,
+                                io.StringIO())
+    except (VMError, SyntaxError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+    out.flush()
+
+    print(f"-O{args.optimize}: ", end='')
+    for line in machine.summary(args.top):
+        print(line)
+    if other is not None:
+        ours, theirs = machine.instructions(), other.instructions()
+        print(f"-O{1 - args.optimize}: {theirs} instructions in {other.seconds * 1000:.3f} ms")
+        if ours and machine.seconds > 0:
+            print(f"-O{1 - args.optimize} runs {theirs / ours:.2f}x the instructions "
+                  f"in {other.seconds / machine.seconds:.2f}x the time")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,14 @@
+import io
+
+import compilers
+
+c = compilers.frontend('c')
+
+
+def test_verbose_output_goes_to_out(capsys):
+    out = io.StringIO()
+    c.Compiler(verbose=True, out=out).compile('int main() { int x = 1; return x; }')
+    assert capsys.readouterr().out == ''
+    text = out.getvalue()
+    assert text.index('Parsed AST:') < text.index('Intermediate code:')
+    assert 'RETURN x' in text
@@ -0,0 +1,30 @@
+import os
+import pickle
+
+from compilers import cache
+
+
+def directory_size(directory):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(directory) for name in files)
+
+
+def test_store_never_leaves_the_cache_past_its_limit(tmp_path):
+    entry = {'tokens': None, 'ast': None, 'ir': 'x' * 1000, 'depends': None, 'output': None}
+    entry_size = len(pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL))
+    compile_cache = cache.CompileCache(str(tmp_path), max_bytes=10 * entry_size)
+    stores = cache.EVICTION_INTERVAL + 10
+    for number in range(stores):
+        compile_cache.put(compile_cache.key(str(number), 'test'), ir='x' * 1000)
+        assert directory_size(tmp_path) <= compile_cache.max_bytes
+    assert compile_cache.evictions == stores - 10
+    # The least recently used entries went first
+    assert compile_cache.get(compile_cache.key(str(stores - 1), 'test')) is not None
+    assert compile_cache.get(compile_cache.key('0', 'test')) is None
+
+
+def test_replacing_an_entry_does_not_count_twice(tmp_path):
+    compile_cache = cache.CompileCache(str(tmp_path))
+    key = compile_cache.key('same', 'test')
+    compile_cache.put(key, ir='x' * 1000)
+    compile_cache.put(key, ir='x' * 1000)
+    assert compile_cache.total == directory_size(tmp_path)
@@ -0,0 +1,78 @@
+import io
+import shutil
+import subprocess
+
+import pytest
+
+import compilers
+from compilers import passes, vm
+
+cpp = compilers.frontend('cpp')
+
+SHADOWING = """#include <iostream>
+int g = 10;
+int twice(int x) {
+    int g = x * 2;
+    return g;
+}
+int main() {
+    int w = 1;
+    {
+        int w = 5;
+        w = w + 1;
+        std::cout << w << std::endl;
+        {
+            int w = 100;
+            std::cout << w << std::endl;
+        }
+        std::cout << w << std::endl;
+    }
+    std::cout << w << std::endl;
+    for (int w = 0; w < 3; w++) {
+        std::cout << w << std::endl;
+    }
+    int items[3] = {7, 8, 9};
+    for (int w : items) {
+        int i = w + 1;
+        std::cout << i << std::endl;
+    }
+    switch (w) {
+    case 1: {
+        int w = 42;
+        std::cout << w << std::endl;
+        break;
+    }
+    default:
+        break;
+    }
+    std::cout << twice(4) << " " << g << std::endl;
+    std::cout << w << std::endl;
+    return 0;
+}
+"""
+
+EXPECTED = '6\n100\n6\n1\n0\n1\n2\n8\n9\n10\n42\n8 10\n1\n'
+
+
+def run(source, optimize):
+    program = cpp.generate_intermediate_code(cpp.lex(io.StringIO(source)))
+    if optimize:
+        program = passes.manager_for(True).run(program)
+    out = io.StringIO()
+    vm.run_program(program, out=out)
+    return out.getvalue()
+
+
+@pytest.mark.parametrize('optimize', [False, True])
+def test_block_scopes_keep_shadowed_variables_apart(optimize):
+    assert run(SHADOWING, optimize) == EXPECTED
+
+
+@pytest.mark.skipif(shutil.which('g++') is None, reason='needs g++')
+def test_block_scopes_match_gcc(tmp_path):
+    source = tmp_path / 'shadowing.cpp'
+    source.write_text(SHADOWING)
+    binary = tmp_path / 'shadowing'
+    subprocess.run(['g++', '-o', str(binary), str(source)], check=True)
+    expected = subprocess.run([str(binary)], check=True, capture_output=True, text=True).stdout
+    assert run(SHADOWING, False) == expected
@@ -0,0 +1,17 @@
+import pickle
+
+import pytest
+
+from compilers import diagnostics
+
+
+def test_compile_error_keeps_the_syntax_error_fields():
+    errors = diagnostics.Diagnostics('p.pas')
+    errors.error('Unexpected', 1, 5, "';'")
+    with pytest.raises(diagnostics.CompileError) as raised:
+        errors.check()
+    error = raised.value
+    # pytest and traceback read SyntaxError.text as the source line
+    assert error.text is None
+    assert str(error) == error.report() == error.args[0]
+    assert str(pickle.loads(pickle.dumps(error))) == str(error)
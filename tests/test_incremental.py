@@ -0,0 +1,62 @@
+from compilers import incremental
+
+FUNCTION = """int f{0}(int a) {{
+    T *p = 0;
+    int c = (T) a + {0};
+    return c;
+}}
+"""
+
+
+def source(count=10, typedef='typedef int T;\n'):
+    return typedef + ''.join(FUNCTION.format(number) for number in range(count))
+
+
+def assert_matches_full_compile(document):
+    fresh = incremental.Document(bytes(document.data))
+    assert document.intermediate_code() == fresh.intermediate_code()
+
+
+def test_breaking_and_restoring_a_typedef_reparses_the_units_using_it():
+    document = incremental.Document(source())
+    document.edit(5, 5, '7')
+    assert_matches_full_compile(document)
+    assert document.rebuilt_units == 11
+    document.edit(5, 6, '')
+    assert_matches_full_compile(document)
+    assert document.rebuilt_units == 11
+
+
+def test_a_typedef_only_changes_the_units_after_it():
+    text = source(typedef='')
+    document = incremental.Document(text)
+    middle = text.index('int f5')
+    document.edit(middle, middle, 'typedef int T;\n')
+    assert_matches_full_compile(document)
+    # the edited units plus f5 to f9, which see T as a type name now
+    assert document.rebuilt_units == 7
+
+
+def test_a_typedef_declared_twice_stays_in_scope_when_one_goes():
+    text = source(typedef='typedef int T;\ntypedef int T;\n')
+    document = incremental.Document(text)
+    document.edit(0, len('typedef int T;\n'), '')
+    assert_matches_full_compile(document)
+    # only the edited unit, T is still a type name for every function
+    assert document.rebuilt_units == 1
+
+
+def test_a_typedef_of_a_typedef_follows_it():
+    text = 'typedef int T;\ntypedef T U;\n' + ''.join(FUNCTION.replace('T', 'U').format(n) for n in range(3))
+    document = incremental.Document(text)
+    document.edit(0, 1, 'x')
+    assert_matches_full_compile(document)
+    document.edit(0, 1, 't')
+    assert_matches_full_compile(document)
+
+
+def test_random_edits_match_a_full_compile(tmp_path):
+    path = tmp_path / 'typedefs.c'
+    path.write_text(source(60))
+    for seed in range(4):
+        assert incremental.replay_edits(str(path), 200, seed) == 0
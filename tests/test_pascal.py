@@ -0,0 +1,50 @@
+import io
+import os
+
+import compilers
+from compilers import ir, vm
+
+pascal = compilers.frontend('pascal')
+
+UPPERCASE = """PROGRAM T;
+CONST N = 3;
+VAR I, S: INTEGER;
+FUNCTION Sq(A: INTEGER): INTEGER; BEGIN Sq := A * A END;
+Begin
+  S := 0;
+  FOR I := 1 TO N DO S := S + Sq(I);
+  FOR I := N DownTo 1 Do
+    IF I MOD 2 = 1 THEN WriteLn(I) ELSE WriteLn(0);
+  WriteLn('sum ', S)
+END.
+"""
+
+LOWERCASE = """program T;
+const N = 3;
+var I, S: INTEGER;
+function Sq(A: INTEGER): INTEGER; begin Sq := A * A end;
+begin
+  S := 0;
+  for I := 1 to N do S := S + Sq(I);
+  for I := N downto 1 do
+    if I mod 2 = 1 then WriteLn(I) else WriteLn(0);
+  WriteLn('sum ', S)
+end.
+"""
+
+
+def compile_source(tmp_path, name, source):
+    path = tmp_path / name
+    path.write_text(source)
+    return pascal.compile_file(str(path), os.devnull)
+
+
+def test_keywords_in_any_case(tmp_path):
+    out = io.StringIO()
+    vm.run_program(compile_source(tmp_path, 'upper.pas', UPPERCASE), out=out)
+    assert out.getvalue() == '3\n0\n1\nsum 14\n'
+
+
+def test_keyword_case_does_not_change_the_code(tmp_path):
+    assert (ir.to_text(compile_source(tmp_path, 'upper.pas', UPPERCASE))
+            == ir.to_text(compile_source(tmp_path, 'lower.pas', LOWERCASE)))
@@ -0,0 +1,23 @@
+import pytest
+
+import compilers
+from compilers import diagnostics
+
+rust = compilers.frontend('rust')
+
+
+def test_iter_tokens_counts_lines_and_columns():
+    source = 'fn main() {\n    // loop\n    for i in 1..3 {\n        println!("x");\n    }\n}\n'
+    tokens = list(rust.iter_tokens(source))
+    assert tokens[0] == ('FN', 'fn', 1, 1)
+    assert ('FOR', 'for', 3, 5) in tokens
+    assert ('STRING_LITERAL', '"x"', 4, 18) in tokens
+    assert [token[:2] for token in tokens] == list(rust.tokenize(source))
+
+
+def test_iter_tokens_reads_a_buffer_lazily():
+    tokens = rust.iter_tokens(b'fn f() {}\n$')
+    assert next(tokens) == ('FN', 'fn', 1, 1)
+    with pytest.raises(diagnostics.CompileError) as error:
+        list(tokens)
+    assert error.value.diagnostics[0][:2] == (2, 1)